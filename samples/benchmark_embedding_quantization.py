@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: upload size and encoding time of quantized embedding uploads
+
+Compares the default in-memory embedding upload (%.7g CSV + gzip) with the
+opt-in quantized encodings (quantization='float16' / 'int8') on synthetic
+L2-normalized embeddings. Runs offline (no server or API key needed): it
+measures the same conversion that basemap_embedding() / addplot_embedding()
+perform before uploading, and estimates the transfer time at a given
+bandwidth.
+
+Error columns:
+  max_abs_err   largest per-value error
+  rel_l2_err    mean of |x_hat - x| per vector (the vectors have unit length)
+  pair_dist_err largest relative change of the distance between random pairs
+                of vectors (what the map engine sees)
+
+Usage:
+  python samples/benchmark_embedding_quantization.py --rows 20000 --dims 768 --mbps 100
+"""
+import argparse
+import gzip
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from toorpia import toorPIA
+
+
+def synthetic_embeddings(rows, dims, seed=0):
+    # a few hundred latent directions plus noise, L2-normalized like typical text embeddings
+    rng = np.random.default_rng(seed)
+    latent = rng.normal(size=(rows, min(dims, 128))) @ rng.normal(size=(min(dims, 128), dims))
+    X = latent + 0.3 * rng.normal(size=(rows, dims))
+    return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--dims', type=int, default=768)
+    parser.add_argument('--mbps', type=float, default=100.0, help="uplink bandwidth for the transfer-time estimate")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    client = toorPIA(api_key="offline-benchmark")  # no request is sent
+    X = synthetic_embeddings(args.rows, args.dims)
+    rng = np.random.default_rng(1)
+    pairs = rng.integers(len(X), size=(5000, 2))
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    base_pair = np.linalg.norm(X[pairs[:, 0]] - X[pairs[:, 1]], axis=1)
+
+    print(f"{args.rows} x {args.dims} embeddings, {args.mbps:g} Mbit/s uplink")
+    print(f"{'encoding':<10}{'csv MB':>9}{'gzip MB':>9}{'ratio':>7}{'encode s':>10}{'upload s':>10}"
+          f"{'max_abs_err':>13}{'rel_l2_err':>12}{'pair_dist_err':>15}")
+    baseline = None
+    for quantization in (None, 'float16', 'int8'):
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            path = client._convert_inmemory_embedding(X, quantization)
+            timings.append(time.perf_counter() - started)
+            size = os.path.getsize(path)
+            with gzip.open(path, 'rb') as f:
+                text_size = len(f.read())
+            # the values the server actually parses
+            Y = pd.read_csv(path, header=None).to_numpy(dtype=float)
+            os.remove(path)
+        baseline = baseline or size
+        pair = np.linalg.norm(Y[pairs[:, 0]] - Y[pairs[:, 1]], axis=1)
+        print(f"{str(quantization):<10}{text_size / 1e6:>9.2f}{size / 1e6:>9.2f}{size / baseline:>7.2f}"
+              f"{min(timings):>10.2f}{size * 8 / (args.mbps * 1e6):>10.2f}"
+              f"{np.abs(Y - X).max():>13.2e}{np.mean(np.linalg.norm(Y - X, axis=1)):>12.2e}"
+              f"{np.max(np.abs(pair - base_pair) / base_pair):>15.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""オフラインの単体テストで共有する擬似サーバーの部品"""
+import pytest
+
+
+class FakeResponse:
+    """requests.Response の代わりに擬似サーバーが返すレスポンス"""
+
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body or {}
+        self.text = str(self._body)
+
+    def json(self):
+        return self._body
+
+
+@pytest.fixture
+def fake_api(monkeypatch):
+    """requests.request を擬似サーバーに差し替える関数を返す fixture
+
+    返り値の関数に handler(method, url, **kwargs) を渡すと、クライアントのリクエストを
+    handler に送る。login=True（既定）なら /auth/login には handler を呼ばずに
+    セッションキー session_key を返す。
+
+    Example:
+        def test_upload(fake_api):
+            fake_api(lambda method, url, **kwargs: FakeResponse(200, {'resdata': []}))
+    """
+    def install(handler, login=True, session_key='key'):
+        def fake_request(method, url, **kwargs):
+            if login and url.endswith("/auth/login"):
+                return FakeResponse(200, {'sessionKey': session_key})
+            return handler(method, url, **kwargs)
+
+        monkeypatch.setattr("toorpia.client.requests.request", fake_request)
+        return fake_request
+    return install
@@ -3,17 +3,19 @@ import os
 
 import pytest
 
+from toorpia.busy_retry import BusyRetryCoordinator
 from toorpia.client import toorPIA
 
+from .conftest import FakeResponse
 
-class FakeResponse:
-    def __init__(self, status_code, headers=None):
-        self.status_code = status_code
-        self.headers = headers or {}
 
-
-def make_client(max_busy_wait_min=None):
-    return toorPIA(api_key="dummy_api_key", max_busy_wait_min=max_busy_wait_min)
+def make_client(max_busy_wait_min=None, coordinator=None):
+    # 既定の共有コーディネーターはジッターを加えるため、待ち時間を検証するテストでは
+    # ジッターとトークンバケットを無効にした個別インスタンスを使う
+    if coordinator is None:
+        coordinator = BusyRetryCoordinator(rate=None, jitter=0)
+    return toorPIA(api_key="dummy_api_key", max_busy_wait_min=max_busy_wait_min,
+                   busy_retry_coordinator=coordinator)
 
 
 def make_sequence(responses, calls):
@@ -53,8 +55,8 @@ def test_retries_on_503_honoring_retry_after(monkeypatch):
     calls = []
     resets = []
     responses = [
-        FakeResponse(503, {"Retry-After": "7"}),
-        FakeResponse(503, {"Retry-After": "3"}),
+        FakeResponse(503, headers={"Retry-After": "7"}),
+        FakeResponse(503, headers={"Retry-After": "3"}),
         FakeResponse(200),
     ]
     response = client._post_with_busy_retry(
@@ -83,7 +85,7 @@ def test_gives_up_when_budget_exhausted(monkeypatch):
     client = make_client(max_busy_wait_min=0.5)
     calls = []
     response = client._post_with_busy_retry(
-        make_sequence([FakeResponse(503, {"Retry-After": "60"})], calls))
+        make_sequence([FakeResponse(503, headers={"Retry-After": "60"})], calls))
     assert response.status_code == 503
     assert len(calls) == 1
     assert sleeps == []
@@ -95,7 +97,7 @@ def test_zero_budget_disables_retry(monkeypatch):
     client = make_client(max_busy_wait_min=0)
     calls = []
     response = client._post_with_busy_retry(
-        make_sequence([FakeResponse(503, {"Retry-After": "1"})], calls))
+        make_sequence([FakeResponse(503, headers={"Retry-After": "1"})], calls))
     assert response.status_code == 503
     assert len(calls) == 1
     assert sleeps == []
@@ -110,3 +112,45 @@ def test_max_busy_wait_min_configuration(monkeypatch):
     assert make_client(max_busy_wait_min=10).max_busy_wait_min == 10.0
     monkeypatch.setenv("TOORPIA_MAX_BUSY_WAIT_MIN", "not-a-number")
     assert make_client().max_busy_wait_min == 30.0
+
+
+def test_busy_wait_is_reported_per_call(monkeypatch):
+    monkeypatch.setattr("toorpia.client.time.sleep", lambda s: None)
+    client = make_client(max_busy_wait_min=30)
+    calls = []
+    responses = [FakeResponse(503, headers={"Retry-After": "4"}), FakeResponse(200)]
+    response = client._post_with_busy_retry(make_sequence(responses, calls))
+    assert response.busy_wait_seconds == 4
+    assert client._local.last_busy_wait == 4
+
+
+def test_clients_share_the_default_coordinator():
+    a = toorPIA(api_key="dummy_api_key")
+    b = toorPIA(api_key="dummy_api_key")
+    assert a.busy_retry_coordinator is b.busy_retry_coordinator
+
+
+def test_jitter_spreads_retries_within_bounds():
+    coordinator = BusyRetryCoordinator(rate=None, jitter=0.5)
+    delays = [coordinator.reserve(10, deadline=float("inf")) for _ in range(50)]
+    assert all(10 <= d <= 15 for d in delays)
+    assert len(set(round(d, 6) for d in delays)) > 1
+
+
+def test_token_bucket_spaces_simultaneous_retries(monkeypatch):
+    monkeypatch.setattr("toorpia.busy_retry.time.monotonic", lambda: 1000.0)
+    coordinator = BusyRetryCoordinator(rate=2.0, burst=3, jitter=0)
+    # 同じ瞬間に 503 を受けた6スレッド: 3件は即時（バースト）、残りは 0.5 秒間隔
+    delays = [coordinator.reserve(10, deadline=float("inf")) for _ in range(6)]
+    assert delays == [10, 10, 10, 10.5, 11, 11.5]
+    assert coordinator.stats()['waits'] == 6
+
+
+def test_coordinator_respects_deadline(monkeypatch):
+    monkeypatch.setattr("toorpia.busy_retry.time.monotonic", lambda: 0.0)
+    coordinator = BusyRetryCoordinator(rate=1.0, burst=1, jitter=1.0)
+    # Retry-After だけで上限を超えるなら予約しない
+    assert coordinator.reserve(10, deadline=5) is None
+    # ジッターやバケットの分は上限で打ち切る
+    assert coordinator.reserve(10, deadline=12) <= 12
+    assert coordinator.reserve(10, deadline=12) == 12
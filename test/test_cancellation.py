@@ -0,0 +1,142 @@
+"""タイムアウトと CancelToken による中断の単体テスト（サーバー不要・オフラインで実行可能）"""
+import os
+import threading
+
+import numpy as np
+import pytest
+import requests
+
+from toorpia.busy_retry import BusyRetryCoordinator
+from toorpia.cancellation import CancelToken, RequestCancelled
+from toorpia.client import DEFAULT_TIMEOUT, toorPIA
+from toorpia.job import Job
+
+from .conftest import FakeResponse
+
+
+def make_client(**kwargs):
+    return toorPIA(api_key="dummy_api_key", api_url="http://a:3000",
+                   busy_retry_coordinator=BusyRetryCoordinator(rate=None, jitter=0), **kwargs)
+
+
+def fake_server(fake_api, on_upload=None):
+    """リクエストを記録し、ボディがあれば送信時と同様にブロックごとに読み出す擬似サーバー"""
+    calls = []
+
+    def fake_request(method, url, **kwargs):
+        calls.append((url, kwargs))
+        if url.endswith("/auth/login"):
+            return FakeResponse(200, {'sessionKey': 'key'})
+        body = kwargs.get('data')
+        if hasattr(body, 'read'):
+            while True:
+                if on_upload is not None:
+                    on_upload()
+                if not body.read(16384):
+                    break
+        return FakeResponse(200, [])
+
+    fake_api(fake_request, login=False)
+    return calls
+
+
+def test_every_request_carries_a_timeout(fake_api):
+    calls = fake_server(fake_api)
+    client = make_client()
+    client.list_map()
+    assert [kwargs['timeout'] for _, kwargs in calls] == [DEFAULT_TIMEOUT, DEFAULT_TIMEOUT]
+    # 既定では接続だけを制限し、読み取り（同期実行の処理時間）は制限しない
+    assert DEFAULT_TIMEOUT[1] is None
+
+    calls.clear()
+    client = make_client(timeout=(5, 60))
+    client.list_map(timeout=2.5)
+    assert calls[-1][1]['timeout'] == 2.5
+
+
+def test_timeout_from_environment(monkeypatch):
+    monkeypatch.setenv("TOORPIA_TIMEOUT", "10, none")
+    assert make_client().timeout == (10.0, None)
+    monkeypatch.setenv("TOORPIA_TIMEOUT", "45")
+    assert make_client().timeout == 45.0
+
+
+def test_total_timeout_caps_each_request_and_busy_wait(fake_api, monkeypatch):
+    calls = fake_server(fake_api)
+    client = make_client(timeout=(30, 3600), total_timeout=20)
+    client.list_map()
+    connect, read = calls[-1][1]['timeout']
+    assert connect <= 20 and read <= 20
+
+    # Retry-After が残り時間を超える 503 は待たずに Timeout にする
+    sleeps = []
+    monkeypatch.setattr("toorpia.client.time.sleep", sleeps.append)
+    with client._call_scope():
+        with pytest.raises(requests.exceptions.Timeout):
+            client._post_with_busy_retry(lambda: FakeResponse(503, headers={'Retry-After': '60'}))
+    assert sleeps == []
+
+
+def test_cancel_aborts_an_upload_in_flight(fake_api):
+    token = CancelToken()
+    reads = []
+
+    def on_upload():
+        reads.append(1)
+        if len(reads) == 2:
+            token.cancel()  # 別スレッドからの cancel() に相当
+
+    fake_server(fake_api, on_upload)
+    client = make_client()
+    client.session_key = 'key'
+    with client._call_scope(cancel_token=token):
+        with pytest.raises(RequestCancelled):
+            client._request('post', "/data/addplot", json={'data': [[0.0] * 10] * 5000},
+                            headers={'Content-Type': 'application/json', 'session-key': 'key'})
+    assert len(reads) == 2
+    assert client.endpoints.get("http://a:3000").in_flight == 0
+    assert client.endpoints.get("http://a:3000").failures == 0
+
+
+def test_cancelled_embedding_upload_removes_temp_file(fake_api, monkeypatch):
+    pytest.importorskip("pandas")
+    token = CancelToken()
+    fake_server(fake_api, on_upload=token.cancel)
+    client = make_client()
+    temp_paths = []
+    convert = client._convert_inmemory_embedding
+
+    def tracking_convert(data, quantization=None):
+        path = convert(data, quantization)
+        temp_paths.append(path)
+        return path
+
+    monkeypatch.setattr(client, "_convert_inmemory_embedding", tracking_convert)
+    result = client.addplot_embedding(np.random.rand(2000, 8), mapNo=1, cancel_token=token)
+    assert result is None
+    assert temp_paths and not os.path.exists(temp_paths[0])
+
+
+def test_cancel_interrupts_busy_retry_wait():
+    token = CancelToken()
+    client = make_client()
+    threading.Timer(0.05, token.cancel).start()
+    with client._call_scope(cancel_token=token):
+        with pytest.raises(RequestCancelled):
+            client._post_with_busy_retry(lambda: FakeResponse(503, headers={'Retry-After': '30'}))
+
+
+def test_cancel_stops_job_wait():
+    token = CancelToken()
+    polls = []
+
+    class FakeClient:
+        def _poll_job(self, job_id, params=None, endpoint=None):
+            polls.append(job_id)
+            return {'status': 'running'}, {}
+
+    job = Job(FakeClient(), 'job_1', parser=lambda response: response.json())
+    threading.Timer(0.05, token.cancel).start()
+    assert job.wait(poll_interval=30, cancel_token=token) is None
+    assert len(polls) == 1
+    assert job.status == 'running'
@@ -0,0 +1,127 @@
+"""addplot_chunked() の分割・結果統合の単体テスト（サーバー不要・オフラインで実行可能）"""
+import threading
+
+import numpy as np
+import pytest
+
+from toorpia.chunking import estimate_row_bytes, frame_json, merge_addplot_results, plan_chunks
+from toorpia.client import toorPIA
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def fake_addplot_server(fake_api, rg=2.0):
+    """各点の座標を (x, 0) とし、距離 |x| で判定する擬似 addplot サーバー"""
+    lock = threading.Lock()
+    bodies = []
+
+    def fake_request(method, url, **kwargs):
+        body = kwargs['json']
+        x = np.array([row[0] for row in body['data']], dtype=float)
+        with lock:
+            bodies.append(body)
+            addplot_no = len(bodies)
+        d = np.abs(x)
+        abnormal = bool((d > 2 * rg).any())
+        return FakeResponse(200, {
+            'resdata': [[v, 0.0] for v in x],
+            'addPlotNo': addplot_no,
+            'shareUrl': f"http://share/{addplot_no}",
+            'abnormalityStatus': 'abnormal' if abnormal else 'normal',
+            'abnormalityScore': 0.1 if abnormal else 0.9,
+            'diagnosticScore': {
+                'detabn': {'normalityScore': 0.1 if abnormal else 0.9},
+                'distance': {
+                    'meanDistance': float(d.mean()), 'distanceStd': float(d.std()),
+                    'radiusOfGyration': rg, 'normalizedDistance': float(d.mean() / rg),
+                    'exceedanceRatio': float(np.mean(d > 2 * rg)), 'threshold': 2 * rg,
+                    'status': 'danger' if abnormal else 'normal',
+                    'distancesPerPoint': d.tolist(),
+                    'normalizedDistancesPerPoint': (d / rg).tolist(),
+                },
+                'compositeStatus': 'danger' if abnormal else 'normal',
+            },
+        })
+
+    fake_api(fake_request)
+    return bodies
+
+
+def test_plan_chunks_bounds_rows_and_bytes():
+    df = pd.DataFrame({'a': np.arange(10000, dtype=float), 'b': np.arange(10000) * 0.5})
+    chunks = plan_chunks(df, max_rows=3000, max_bytes=None)
+    assert chunks == [(0, 3000), (3000, 6000), (6000, 9000), (9000, 10000)]
+    chunks = plan_chunks(df, max_bytes=20000)
+    assert chunks[0][0] == 0 and chunks[-1][1] == 10000
+    for start, stop in chunks:
+        assert len(frame_json(df.iloc[start:stop])) <= 20000
+
+
+def test_row_estimate_uses_the_uploaded_date_format():
+    import warnings
+
+    df = pd.DataFrame({'t': pd.date_range("2024-01-01", periods=50, freq="h"), 'x': np.arange(50.0)})
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        per_row = estimate_row_bytes(df)
+        body = frame_json(df)
+    assert '"2024-01-01T00:00:00.000"' in body
+    assert per_row * len(df) == pytest.approx(len(body) - len(frame_json(df.iloc[:0])))
+
+
+def test_addplot_chunked_merges_in_original_order(fake_api):
+    bodies = fake_addplot_server(fake_api)
+    x = np.linspace(-3, 3, 1000)
+    x[777] = 50.0  # 1点だけ 2×Rg を超える
+    df = pd.DataFrame({'x': x, 'y': np.zeros_like(x)})
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    result = client.addplot_chunked(df, 7, max_rows=128, max_workers=3)
+
+    assert result['chunks'] == len(bodies) == 8
+    assert all(body['mapNo'] == 7 for body in bodies)
+    # 重み・型オプションは全体から1回だけ生成され、全チャンクで共通
+    assert len({(b['weight_option_str'], b['type_option_str']) for b in bodies}) == 1
+    np.testing.assert_allclose(result['xyData'][:, 0], x)
+    assert result['abnormalityStatus'] == 'abnormal'
+    assert result['abnormalityScore'] == 0.1
+    ds = result['diagnosticScore']
+    assert ds['compositeStatus'] == 'danger'
+    np.testing.assert_allclose(ds['distance']['distancesPerPoint'], np.abs(x))
+    assert ds['distance']['meanDistance'] == pytest.approx(np.abs(x).mean())
+    assert ds['distance']['distanceStd'] == pytest.approx(np.abs(x).std())
+    assert ds['distance']['exceedanceRatio'] == pytest.approx(1 / 1000)
+    assert sorted(result['addPlotNos']) == list(range(1, 9))
+    assert client.currentAddPlotNo == result['addPlotNo']
+
+
+def test_merge_without_per_point_fields_uses_pooled_statistics():
+    a, b = np.array([1.0, 2.0, 3.0]), np.array([10.0, 20.0])
+
+    def part(values, no):
+        return {'xyData': np.c_[values, np.zeros_like(values)], 'addPlotNo': no,
+                'abnormalityStatus': 'normal', 'abnormalityScore': 0.8, 'shareUrl': None,
+                'diagnosticScore': {'compositeStatus': 'normal', 'distance': {
+                    'meanDistance': values.mean(), 'distanceStd': values.std(),
+                    'radiusOfGyration': 5.0, 'threshold': 10.0, 'status': 'normal',
+                    'exceedanceRatio': float(np.mean(values > 10.0))}}}
+
+    merged = merge_addplot_results([part(a, 1), part(b, 2)])
+    both = np.r_[a, b]
+    distance = merged['diagnosticScore']['distance']
+    assert distance['meanDistance'] == pytest.approx(both.mean())
+    assert distance['distanceStd'] == pytest.approx(both.std())
+    assert distance['normalizedDistance'] == pytest.approx(both.mean() / 5.0)
+    assert distance['exceedanceRatio'] == pytest.approx(1 / 5)
+    assert merged['abnormalityStatus'] == 'normal'
+
+
+def test_failed_chunk_fails_the_whole_call(fake_api, monkeypatch):
+    fake_addplot_server(fake_api)
+    df = pd.DataFrame({'x': np.arange(10, dtype=float)})
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    original = client.addplot
+    monkeypatch.setattr(client, "addplot",
+                        lambda data, *args, **kwargs: None if data.index[0] == 4 else original(data, *args, **kwargs))
+    assert client.addplot_chunked(df, 1, max_rows=2) is None
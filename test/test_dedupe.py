@@ -0,0 +1,81 @@
+"""重複行の除去と結果の展開の単体テスト（サーバー不要・オフラインで実行可能）"""
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+from toorpia.dedupe import collapse_duplicates, expand_addplot_result
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def fake_server(fake_api):
+    """各行の先頭の値を x 座標・距離として返す擬似サーバー"""
+    bodies = []
+
+    def fake_request(method, url, **kwargs):
+        body = kwargs['json']
+        bodies.append(body)
+        xy = [[row[0], 0.0] for row in body['data']]
+        if url.endswith("/data/fit_transform"):
+            return FakeResponse(200, {'resdata': {'baseXyData': xy, 'mapNo': 3}})
+        d = [abs(row[0]) for row in body['data']]
+        return FakeResponse(200, {
+            'resdata': xy, 'addPlotNo': 1, 'abnormalityStatus': 'normal', 'abnormalityScore': 0.9,
+            'diagnosticScore': {'compositeStatus': 'normal', 'distance': {
+                'radiusOfGyration': 2.0, 'threshold': 2.5, 'status': 'normal',
+                'meanDistance': float(np.mean(d)), 'distanceStd': float(np.std(d)),
+                'distancesPerPoint': d, 'normalizedDistancesPerPoint': [v / 2.0 for v in d]}},
+        })
+
+    fake_api(fake_request)
+    return bodies
+
+
+def test_collapse_keeps_first_occurrence_order():
+    df = pd.DataFrame({'a': [3.0, 1.0, 3.0, 3.0, 2.0, 1.0], 'b': ['x', 'y', 'x', 'z', 'x', 'y']},
+                      index=[10, 11, 12, 13, 14, 15])
+    unique, inverse = collapse_duplicates(df)
+    assert unique.index.tolist() == [10, 11, 13, 14]
+    assert inverse.tolist() == [0, 1, 0, 2, 3, 1]
+    pd.testing.assert_frame_equal(unique.iloc[inverse].reset_index(drop=True), df.reset_index(drop=True))
+
+
+def test_expand_recomputes_distance_aggregates_over_all_rows():
+    result = {'xyData': np.array([[1.0, 0.0], [3.0, 0.0]]), 'diagnosticScore': {'distance': {
+        'radiusOfGyration': 2.0, 'threshold': 2.5, 'distancesPerPoint': [1.0, 3.0],
+        'normalizedDistancesPerPoint': [0.5, 1.5]}}}
+    expanded = expand_addplot_result(result, np.array([0, 0, 0, 1]))
+    distance = expanded['diagnosticScore']['distance']
+    assert expanded['xyData'][:, 0].tolist() == [1.0, 1.0, 1.0, 3.0]
+    assert distance['normalizedDistancesPerPoint'] == [0.5, 0.5, 0.5, 1.5]
+    assert distance['meanDistance'] == pytest.approx(1.5)
+    assert distance['exceedanceRatio'] == pytest.approx(0.25)
+    assert result['diagnosticScore']['distance']['distancesPerPoint'] == [1.0, 3.0]
+
+
+def test_addplot_uploads_distinct_rows_and_expands(fake_api):
+    bodies = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    df = pd.DataFrame({'a': [1.0] * 50 + [4.0] * 30 + [1.0] * 20, 'b': [0] * 100})
+    result = client.addplot(df, 3, dedupe=True)
+
+    assert bodies[0]['data'] == [[1.0, 0], [4.0, 0]]
+    assert result['xyData'].shape == (100, 2)
+    assert np.array_equal(result['xyData'][:, 0], df['a'].to_numpy())
+    assert result['diagnosticScore']['distance']['meanDistance'] == pytest.approx(df['a'].mean())
+    stats = result['dedupe']
+    assert stats['rows'] == 100 and stats['uniqueRows'] == 2 and stats['duplicateRows'] == 98
+    assert stats['estimatedBytesSaved'] > 0
+    assert client.dedupeStats is stats
+
+
+def test_fit_transform_expands_coordinates(fake_api):
+    bodies = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    df = pd.DataFrame({'a': [2.0, 2.0, 5.0, 2.0]})
+    xy = client.fit_transform(df, dedupe=True)
+    assert len(bodies[0]['data']) == 2
+    assert xy[:, 0].tolist() == [2.0, 2.0, 5.0, 2.0]
+    assert client.dedupeStats['uniqueRows'] == 2
@@ -0,0 +1,57 @@
+"""addplot の距離の指標（diagnosticScore['distance']）の手元での計算の単体テスト（オフラインで実行可能）"""
+import numpy as np
+import pytest
+
+from toorpia.chunking import _summarize_distances
+from toorpia.diagnostics import (addplot_metrics, basemap_geometry, distance_metrics, subset_metrics,
+                                 window_metrics)
+
+
+def maps(seed=0):
+    rng = np.random.default_rng(seed)
+    base = rng.normal(size=(500, 2))
+    base -= base.mean(axis=0)
+    return base, rng.normal(scale=1.5, size=(200, 2))
+
+
+def test_metrics_match_server_definitions():
+    base, add = maps()
+    metrics = distance_metrics(base, add)
+    _, rg = basemap_geometry(base)
+    assert rg == pytest.approx(np.sqrt(np.mean(np.sum(base ** 2, axis=1))))
+    assert np.allclose(metrics['distancesPerPoint'], np.linalg.norm(add, axis=1))
+    assert np.allclose(metrics['normalizedDistancesPerPoint'], metrics['distancesPerPoint'] / rg)
+    assert metrics['threshold'] == pytest.approx(2 * rg)
+    # 集計値はチャンクの結合で使う再計算と一致する
+    expected = _summarize_distances({'radiusOfGyration': rg, 'threshold': 2 * rg}, metrics['distancesPerPoint'])
+    for key in ('meanDistance', 'distanceStd', 'normalizedDistance', 'exceedanceRatio'):
+        assert metrics[key] == pytest.approx(expected[key])
+    assert distance_metrics(base, add, threshold=0.5)['exceedanceRatio'] > metrics['exceedanceRatio']
+
+
+def test_windows_subsets_and_many_addplots_agree_with_single_calls():
+    base, add = maps()
+    windows = window_metrics(base, add, window=25, step=10)
+    assert list(windows['start']) == list(range(0, 176, 10))
+    for i, start in enumerate(windows['start']):
+        single = distance_metrics(base, add[start:start + 25])
+        assert windows['meanDistance'][i] == pytest.approx(single['meanDistance'])
+        assert windows['distanceStd'][i] == pytest.approx(single['distanceStd'])
+        assert windows['exceedanceRatio'][i] == pytest.approx(single['exceedanceRatio'])
+        assert windows['maxNormalizedDistance'][i] == pytest.approx(single['normalizedDistancesPerPoint'].max())
+    assert len(window_metrics(base, add[:3], window=5)['start']) == 0
+
+    labels = np.where(np.arange(200) < 50, 'a', 'b')
+    by_label = subset_metrics(base, add, labels)
+    assert list(by_label['groups']) == ['a', 'b'] and list(by_label['count']) == [50, 150]
+    overlapping = subset_metrics(base, add, [np.arange(0, 50), np.arange(25, 200)])
+    assert overlapping['meanDistance'][0] == pytest.approx(by_label['meanDistance'][0])
+    assert overlapping['meanDistance'][1] == pytest.approx(distance_metrics(base, add[25:])['meanDistance'])
+
+    results = [{'xyData': add[:80]}, add[80:], {'xyData': add[:0]}]
+    many = addplot_metrics(base, results, threshold_factor=1.0)
+    assert many['normalizedDistance'][1] == pytest.approx(
+        distance_metrics(base, add[80:], threshold_factor=1.0)['normalizedDistance'])
+    assert many['exceedanceRatio'][0] == pytest.approx(
+        distance_metrics(base, add[:80], threshold_factor=1.0)['exceedanceRatio'])
+    assert many['count'][2] == 0 and np.isnan(many['meanDistance'][2])
@@ -0,0 +1,189 @@
+"""複数エンドポイントの振り分け・サーキットブレーカー・フェイルオーバーの単体テスト
+（サーバー不要・オフラインで実行可能）"""
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from toorpia.client import toorPIA
+from toorpia.endpoints import EndpointPool
+
+from .conftest import FakeResponse
+
+A = "http://a:3000"
+B = "http://b:3000"
+
+
+def refused(url):
+    """接続できなかったときに requests が送出する例外"""
+    return requests.exceptions.ConnectionError(MaxRetryError(None, url, NewConnectionError(None, "refused")))
+
+
+def test_routes_to_endpoint_with_lower_latency_and_fewer_503():
+    pool = EndpointPool([A, B])
+    a, b = pool.get(A), pool.get(B)
+    for _ in range(5):
+        pool.begin(a)
+        pool.record(a, latency=0.1, status_code=200)
+        pool.begin(b)
+        pool.record(b, latency=1.0, status_code=200)
+    assert pool.select() is a
+    for _ in range(10):
+        pool.begin(a)
+        pool.record(a, latency=0.1, status_code=503)
+    assert pool.select() is b
+
+
+def test_circuit_breaker_opens_and_probes_after_recovery(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("toorpia.endpoints.time.monotonic", lambda: now[0])
+    pool = EndpointPool([A, B], failure_threshold=2, recovery_timeout=30)
+    a, b = pool.get(A), pool.get(B)
+    for _ in range(2):
+        pool.begin(a)
+        pool.record(a, error=True)
+    assert a.state == 'open'
+    assert all(pool.select() is b for _ in range(5))
+
+    # 回復待ち時間の経過後は1件だけ試験的に通す
+    now[0] += 31
+    pool.begin(b)
+    pool.record(b, latency=5.0, status_code=200)  # b を遅くして a を選ばせる
+    probe = pool.select()
+    assert probe is a and a.state == 'half_open'
+    assert pool.select() is b  # 試験中は他のリクエストを a に送らない
+    pool.begin(a)
+    pool.record(a, latency=0.1, status_code=200)
+    assert a.state == 'closed'
+
+
+def test_half_open_failure_reopens_breaker(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("toorpia.endpoints.time.monotonic", lambda: now[0])
+    pool = EndpointPool([A, B], failure_threshold=1, recovery_timeout=10)
+    a = pool.get(A)
+    pool.begin(a)
+    pool.record(a, status_code=502)
+    now[0] = 11
+    pool.get(B).latency = 100.0
+    assert pool.select() is a
+    pool.begin(a)
+    pool.record(a, error=True)
+    assert a.state == 'open' and a.opened_at == 11
+
+
+def test_single_endpoint_is_always_selected():
+    pool = EndpointPool([A], failure_threshold=1)
+    a = pool.get(A)
+    pool.begin(a)
+    pool.record(a, error=True)
+    assert pool.select() is a
+
+
+def test_client_fails_over_on_connection_error_and_keeps_session_per_endpoint(fake_api):
+    calls = []
+
+    def fake_request(method, url, **kwargs):
+        calls.append((url, (kwargs.get('headers') or {}).get('session-key')))
+        if url.startswith(A):
+            raise refused(url)
+        if url.endswith("/auth/login"):
+            return FakeResponse(200, {'sessionKey': 'key-b'})
+        return FakeResponse(200, [{'mapNo': 1}])
+
+    fake_api(fake_request, login=False)
+    client = toorPIA(api_key="dummy_api_key", api_url=[A, B])
+    # 最初は a を選ばせる
+    client.endpoints.get(B).latency = 1.0
+    assert client.list_map() == [{'mapNo': 1}]
+    assert calls[0][0] == f"{A}/auth/login"
+    assert calls[-1] == (f"{B}/maps", 'key-b')
+    assert client._session_keys == {B: 'key-b'}
+    assert client.endpoints.get(A).failures == 1
+
+
+def test_job_polling_stays_on_issuing_endpoint(fake_api):
+    urls = []
+
+    def fake_request(method, url, **kwargs):
+        urls.append(url)
+        if url.endswith("/auth/login"):
+            return FakeResponse(200, {'sessionKey': 'key-' + url[7]})
+        if url.endswith("/data/addplot"):
+            return FakeResponse(202, {'jobId': 'job_1'})
+        if status[0] is None:
+            return FakeResponse(404, {'message': 'job not found'})
+        return FakeResponse(200, {'status': status[0], 'expiresAt': '2030-01-01T00:00:00Z'})
+
+    status = ['running']
+    fake_api(fake_request, login=False)
+    client = toorPIA(api_key="dummy_api_key", api_url=[A, B])
+    client.endpoints.get(B).latency = 1.0
+    pd = pytest.importorskip("pandas")
+    job = client.addplot(pd.DataFrame({'x': [1.0]}), 1, async_mode=True)
+    assert job.endpoint == A
+    # 投入後に b の方が空いていても、問い合わせは a に送られる
+    client.endpoints.get(A).latency = 10.0
+    client.endpoints.get(B).latency = 0.0
+    assert job.refresh() == 'running'
+    assert urls[-1] == f"{A}/jobs/job_1"
+
+    # 完了後も結果の保持期限までは記録を残し、get_job() も発行したエンドポイントに送る
+    status[0] = 'done'
+    assert job.refresh() == 'done' and client._job_endpoints == {'job_1': A}
+    assert client._job_expiry == {'job_1': 1893456000.0}
+    assert client.get_job('job_1')['status'] == 'done' and urls[-1] == f"{A}/jobs/job_1"
+
+    # 期限切れ（404）で記録を消す
+    status[0] = None
+    assert client.get_job('job_1') is None and client._job_endpoints == {}
+
+
+def test_failover_rewinds_files_given_as_tuples(fake_api, tmp_path):
+    bodies = []
+
+    def fake_request(method, url, **kwargs):
+        files = kwargs['files']
+        entries = files.values() if isinstance(files, dict) else [value for _, value in files]
+        bodies.append((url, [value[1].read() if isinstance(value, tuple) else value.read() for value in entries]))
+        if url.startswith(A):
+            raise refused(url)
+        return FakeResponse(200)
+
+    fake_api(fake_request, login=False)
+    client = toorPIA(api_key="dummy_api_key", api_url=[A, B])
+    client.endpoints.get(B).latency = 1.0
+    (tmp_path / "a.csv").write_bytes(b"x\n1\n")
+    (tmp_path / "b.csv").write_bytes(b"y\n2\n")
+    with open(tmp_path / "a.csv", 'rb') as a, open(tmp_path / "b.csv", 'rb') as b:
+        with client._endpoint_scope():
+            client._request('post', "/data/upload",
+                            files=[('files', ('a.csv', a, 'text/csv')), ('files', b)])
+    assert bodies == [(f"{A}/data/upload", [b"x\n1\n", b"y\n2\n"]), (f"{B}/data/upload", [b"x\n1\n", b"y\n2\n"])]
+
+
+
+def test_fails_over_only_before_the_request_reaches_the_server(fake_api):
+    calls = []
+
+    def fake_request(method, url, **kwargs):
+        calls.append(url)
+        if url.startswith(A):
+            raise error[0]
+        return FakeResponse(200)
+
+    fake_api(fake_request, login=False)
+    error = [requests.exceptions.ConnectTimeout("timed out")]
+    client = toorPIA(api_key="dummy_api_key", api_url=[A, B])
+    client.endpoints.get(B).latency = 1.0
+    with client._endpoint_scope():
+        assert client._request('post', "/data/addplot", data=b"{}").status_code == 200
+    assert calls == [f"{A}/data/addplot", f"{B}/data/addplot"]
+
+    # 送信後の切断ではサーバーが処理を始めている可能性があるため POST を送り直さない
+    calls.clear()
+    error[0] = requests.exceptions.ConnectionError("Connection aborted.")
+    client = toorPIA(api_key="dummy_api_key", api_url=[A, B])
+    client.endpoints.get(B).latency = 1.0
+    with client._endpoint_scope(), pytest.raises(requests.exceptions.ConnectionError):
+        client._request('post', "/data/addplot", data=b"{}")
+    assert calls == [f"{A}/data/addplot"]
@@ -0,0 +1,137 @@
+"""addplot_fanout() の単体テスト（サーバー不要・オフラインで実行可能）"""
+import gzip
+import json
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+from toorpia.schema import basemap_schema
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def fake_server(fake_api, failing_maps=()):
+    """mapNo が大きいマップほど遠い（異常な）結果を返す擬似サーバー"""
+    lock = threading.Lock()
+    requests_seen = []
+
+    def fake_request(method, url, **kwargs):
+        if url.endswith("/data/addplot"):
+            # mapNo を含むすべてのフィールドが gzip 圧縮した JSON ボディに入っている
+            assert kwargs['headers']['Content-Encoding'] == 'gzip'
+            body = json.loads(gzip.decompress(kwargs['data']))
+            map_no = body['mapNo']
+        else:
+            map_no = int(kwargs['data']['mapNo'])
+            body = {'file': kwargs['files'][0][1].name}
+        with lock:
+            requests_seen.append((url, map_no, body))
+
+        if map_no in failing_maps:
+            return FakeResponse(500, {'message': 'engine failed'})
+        abnormal = map_no >= 3
+        return FakeResponse(200, {
+            'resdata': [[0.0, 0.0]] * len(body.get('data', [0])), 'addPlotNo': 100 + map_no, 'shareUrl': f"http://share/{map_no}",
+            'abnormalityStatus': 'abnormal' if abnormal else 'normal',
+            'abnormalityScore': 1.0 / map_no,
+            'diagnosticScore': {'compositeStatus': 'danger' if abnormal else 'normal',
+                                'distance': {'normalizedDistance': float(map_no), 'exceedanceRatio': 0.0}},
+        })
+
+    fake_api(fake_request)
+    return requests_seen
+
+
+def test_fanout_serializes_dataframe_once(fake_api, monkeypatch):
+    seen = fake_server(fake_api, failing_maps=(4,))
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    builds = []
+    build = client._build_addplot_payload
+    monkeypatch.setattr(client, "_build_addplot_payload",
+                        lambda *args, **kwargs: builds.append(1) or build(*args, **kwargs))
+    df = pd.DataFrame({'a': [1.0, 2.0], 'b': ['x', 'y']})
+    table = client.addplot_fanout(df, [1, 2, 3, 4, 5], max_parallel=2, detabn_max_window=1)
+
+    assert len(builds) == 1
+    assert sorted(map_no for _, map_no, _ in seen) == [1, 2, 3, 4, 5]
+    # mapNo 以外のボディは全マップで同一
+    bodies = [{k: v for k, v in body.items() if k != 'mapNo'} for _, _, body in seen]
+    assert all(body == bodies[0] for body in bodies)
+    assert bodies[0]['data'] == [[1.0, 'x'], [2.0, 'y']]
+    assert bodies[0]['detabn_max_window'] == 1
+
+    assert table['mapNo'].tolist() == [1, 2, 3, 4, 5]
+    assert table['ok'].tolist() == [True, True, True, False, True]
+    assert table['abnormalityStatus'].tolist()[:3] == ['normal', 'normal', 'abnormal']
+    assert table.loc[table['mapNo'] == 5, 'compositeStatus'].item() == 'danger'
+    assert table.loc[table['mapNo'] == 2, 'normalizedDistance'].item() == 2.0
+    assert table.attrs['results'][4] is None
+
+
+def test_fanout_converts_embedding_once_and_cleans_up(fake_api, monkeypatch):
+    seen = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    paths = []
+    convert = client._convert_inmemory_embedding
+    monkeypatch.setattr(client, "_convert_inmemory_embedding",
+                        lambda data, quantization=None: paths.append(convert(data, quantization)) or paths[-1])
+    table = client.addplot_fanout(np.random.rand(20, 4), range(1, 7), max_parallel=3)
+
+    assert len(paths) == 1
+    assert {body['file'] for _, _, body in seen} == {paths[0]}
+    assert all(url.endswith("/data/addplot_embedding") for url, _, _ in seen)
+    assert table['ok'].all() and len(table) == 6
+    assert not os.path.exists(paths[0])
+
+
+def test_fanout_requires_method_for_file_paths():
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    client.session_key = 'key'
+    assert client.addplot_fanout(["data.csv"], [1, 2]) is None
+
+
+def test_fanout_applies_addplot_preflight_and_dedupe(fake_api):
+    seen = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    df = pd.DataFrame({'a': [1.0, 2.0, 1.0], 'b': ['x', 'y', 'x']})
+    client.map_schemas.put(2, basemap_schema('dataframe', df[['a']], {}))
+    table = client.addplot_fanout(df, [1, 2, 3], dedupe=True)
+
+    # マップ2のスキーマ（列 a のみ）には合わないので送らない
+    assert sorted(map_no for _, map_no, _ in seen) == [1, 3]
+    assert table['ok'].tolist() == [True, False, True]
+    # 重複を除いた2行だけを送り、結果は元の3行に展開する
+    assert all(len(body['data']) == 2 for _, _, body in seen)
+    assert table.attrs['results'][1]['dedupe']['uniqueRows'] == 2
+
+
+def test_fanout_rejects_column_pruning_for_shared_body():
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    client.session_key = 'key'
+    df = pd.DataFrame({'a': [1.0, 2.0], 'id': ['x', 'y']})
+    with pytest.raises(ValueError, match="prune_columns"):
+        client.addplot_fanout(df, [1, 2], prune_columns=True)
+
+
+def test_fanout_falls_back_to_uncompressed_body_on_415(fake_api):
+    seen = []
+
+    def fake_request(method, url, **kwargs):
+        if kwargs['headers'].get('Content-Encoding') == 'gzip':
+            return FakeResponse(415, {'message': 'unsupported encoding'})
+        body = json.loads(kwargs['data'])
+        seen.append(body)
+        return FakeResponse(200, {'resdata': [[0.0, 0.0]] * len(body['data']), 'addPlotNo': 1})
+
+    fake_api(fake_request)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    df = pd.DataFrame({'a': [1.0, 2.0]})
+    table = client.addplot_fanout(df, [7, 8], identna_resolution=50)
+    assert table['ok'].all()
+    assert sorted(body['mapNo'] for body in seen) == [7, 8]
+    assert all(body['identnaParams'] == {'resolution': 50} and body['data'] == [[1.0], [2.0]] for body in seen)
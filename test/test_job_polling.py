@@ -0,0 +1,102 @@
+"""Job.wait() の適応的ポーリングの単体テスト（サーバー不要・オフラインで実行可能）"""
+import pytest
+
+from toorpia.job import AdaptivePolling, Job
+
+
+class FakeClient:
+    """_poll_job が呼ばれるたびに (info, headers) を順に返すクライアント"""
+
+    def __init__(self, polls):
+        self.polls = list(polls)
+        self.params = []
+
+    def _poll_job(self, job_id, params=None, endpoint=None):
+        self.params.append(params)
+        return self.polls.pop(0)
+
+
+def running(**extra):
+    info = {'status': 'running'}
+    info.update(extra)
+    return info, {}
+
+
+def done():
+    return {'status': 'done', 'httpStatus': 200, 'result': {'value': 1}}, {}
+
+
+def make_job(polls):
+    client = FakeClient(polls)
+    return Job(client, 'job_1', parser=lambda response: response.json()), client
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr("toorpia.job.time.sleep", recorded.append)
+    return recorded
+
+
+def test_adaptive_polling_backs_off_up_to_max_interval(sleeps):
+    job, _ = make_job([running()] * 6 + [done()])
+    polling = AdaptivePolling(initial_interval=1, max_interval=4, backoff=2, jitter=0)
+    assert job.wait(polling=polling) == {'value': 1}
+    assert sleeps == [1, 2, 4, 4, 4, 4]
+
+
+def test_default_wait_starts_fast(sleeps):
+    job, _ = make_job([running(), done()])
+    assert job.wait() == {'value': 1}
+    assert len(sleeps) == 1
+    assert sleeps[0] <= 0.5 * 1.2  # 既定の初回間隔 0.5 秒 ± 20% ジッター
+
+
+def test_fixed_poll_interval_is_kept(sleeps):
+    job, client = make_job([running(), running(), done()])
+    assert job.wait(poll_interval=2) == {'value': 1}
+    assert sleeps == [2, 2]
+    assert client.params == [None, None, None]
+
+
+def test_jitter_stays_within_bounds(sleeps):
+    job, _ = make_job([running()] * 20 + [done()])
+    polling = AdaptivePolling(initial_interval=10, max_interval=10, jitter=0.2)
+    job.wait(polling=polling)
+    assert all(8 <= s <= 12 for s in sleeps)
+    assert len(set(sleeps)) > 1
+
+
+def test_retry_after_header_is_honoured(sleeps):
+    job, _ = make_job([({'status': 'queued'}, {'Retry-After': '7'}), done()])
+    polling = AdaptivePolling(initial_interval=1, jitter=0)
+    job.wait(polling=polling)
+    assert sleeps == [7]
+
+
+def test_eta_seconds_from_body(sleeps):
+    job, _ = make_job([running(etaSeconds=3), running(etaSeconds=100), done()])
+    polling = AdaptivePolling(initial_interval=0.5, max_interval=30, jitter=0)
+    job.wait(polling=polling)
+    assert sleeps == [3, 30]
+
+
+def test_long_poll_parameter_and_immediate_repoll(sleeps, monkeypatch):
+    job, client = make_job([running(), running(), done()])
+    polling = AdaptivePolling(initial_interval=1, jitter=0, long_poll=True, long_poll_timeout=20)
+    # 1回目の問い合わせはサーバーが保留した（20秒掛かった）、2回目は即応答した
+    clock = iter([0, 0, 20, 20, 20, 20, 20, 20, 20, 20])
+    monkeypatch.setattr("toorpia.job.time.monotonic", lambda: next(clock))
+    job.wait(polling=polling)
+    assert client.params == [{'wait': '20'}] * 3
+    assert sleeps == [1]
+
+
+def test_timeout_caps_last_sleep(sleeps, monkeypatch):
+    job, _ = make_job([running(), running(), running()])
+    now = [0.0]
+    monkeypatch.setattr("toorpia.job.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("toorpia.job.time.sleep", lambda s: (sleeps.append(s), now.__setitem__(0, now[0] + s)))
+    polling = AdaptivePolling(initial_interval=8, jitter=0)
+    assert job.wait(timeout=10, polling=polling) is None
+    assert sleeps == [8, 2]
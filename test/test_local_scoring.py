@@ -0,0 +1,97 @@
+"""LocalScorer（addplot の手元での一次判定）の単体テスト
+
+サーバーの abnormalityStatus との一致率を測るテストは TOORPIA_API_KEY が設定されている場合のみ実行する。
+"""
+import base64
+import os
+
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+from toorpia.local_scoring import LocalScorer, _brute_force_knn, abnormality_status, scoring_columns
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def basemap(n=600, d=6, seed=0):
+    X = np.random.default_rng(seed).normal(size=(n, d))
+    return X, X[:, :2] * 10.0
+
+
+def test_knn_positions_and_scores():
+    X, xy = basemap()
+    scorer = LocalScorer(X, xy, k=5, vector_normalization=False)
+    # 総当たりの探索は全件の並べ替えと一致する
+    queries = scorer.points[:20] + 0.01
+    distances, positions = _brute_force_knn(scorer.points, queries, 5)
+    exact = np.linalg.norm(queries[:, None, :] - scorer.points[None, :, :], axis=2)
+    assert np.array_equal(positions, np.argsort(exact, axis=1)[:, :5])
+    assert np.allclose(distances, np.sort(exact, axis=1)[:, :5])
+
+    normal = scorer.score(X[:50] + 0.01)
+    assert np.median(np.linalg.norm(normal['xyData'] - xy[:50], axis=1)) < 0.5
+    assert normal['abnormalityStatus'] == 'normal' and normal['abnormalityRate'] < 0.1
+    far = scorer.score(X[:50] + 8.0)
+    assert far['abnormal'].all() and far['abnormalityStatus'] == 'abnormal'
+    assert np.all(far['score'] > normal['score'].max())
+    # ベースマップ自身の点のうち、しきい値を超えるのは分位点の外側だけ
+    assert np.mean(scorer.baseline > scorer.threshold) <= 0.011
+
+
+def test_window_status_and_column_selection():
+    assert abnormality_status([0, 1, 1, 1, 1, 1, 0], max_window=5) == 'abnormal'
+    assert abnormality_status([1, 1, 0, 1, 1, 1, 1], max_window=5) == 'normal'
+    assert abnormality_status([1, 1, 0, 1], max_window=5, rate_threshold=0.7) == 'abnormal'
+    assert abnormality_status([]) == 'unknown'
+    assert scoring_columns(['id', 'a', 'b', 'c'], "1:0,2:1,3:2", drop_columns=['c']) == (['a', 'b'], [1.0, 2.0])
+    with pytest.raises(ValueError):
+        LocalScorer(np.zeros((3, 2)), np.zeros((4, 2)))
+
+
+def test_client_builds_scorer_from_exported_input(fake_api, tmp_path):
+    X, xy = basemap(n=200, d=3)
+    frame = pd.DataFrame(X, columns=['a', 'b', 'c'])
+    frame.insert(0, 'label', ['x'] * len(frame))
+    csv = base64.b64encode(frame.to_csv(index=False).encode()).decode()
+
+    def fake_request(method, url, **kwargs):
+        if url.endswith("/xy"):
+            return FakeResponse(200, {'mapNo': 4, 'processMethod': 'csvform', 'xyData': xy.tolist()})
+        if "/maps/export/" in url:
+            return FakeResponse(200, {'mapData': {'input__base.csv': csv, 'xy.dat': ''}})
+        raise AssertionError(url)
+
+    fake_api(fake_request)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    client.map_schemas.put(4, {'processMethod': 'csvform', 'columns': ['label', 'a', 'b', 'c'],
+                               'weightOptions': "1:0,2:1,3:1,4:0"})
+    scorer = client.local_scorer(4, export_dir=str(tmp_path))
+    assert scorer.columns == ['a', 'b'] and scorer.vector_normalization
+    assert os.path.exists(tmp_path / "input" / "base.csv")
+    assert scorer.score(frame.iloc[:10])['xyData'].shape == (10, 2)
+
+
+@pytest.mark.skipif(not os.environ.get("TOORPIA_API_KEY"), reason="requires TOORPIA_API_KEY (online)")
+def test_agreement_with_server_abnormality_status():
+    client = toorPIA()
+    df = pd.read_csv("./test/rawdata/biopsy.csv")
+    benign = df[df["Diagnosis"] == "benign"].drop(columns=["No", "ID", "Diagnosis"]).reset_index(drop=True)
+    malignant = df[df["Diagnosis"] != "benign"].drop(columns=["No", "ID", "Diagnosis"]).reset_index(drop=True)
+    base, held_out = benign.iloc[:-50], benign.iloc[-50:]
+    client.fit_transform(base)
+    scorer = client.local_scorer(data=base)
+    assert scorer is not None
+
+    batches = [held_out.iloc[i:i + 10] for i in range(0, 50, 10)] + \
+              [malignant.iloc[i:i + 10] for i in range(0, 50, 10)]
+    agree = 0
+    for batch in batches:
+        server = client.addplot(batch)
+        local = scorer.score(batch)
+        agree += server['abnormalityStatus'] == local['abnormalityStatus']
+    rate = agree / len(batches)
+    print(f"local/server abnormalityStatus agreement: {rate:.0%} over {len(batches)} batches")
+    assert rate >= 0.6
@@ -0,0 +1,88 @@
+"""AddplotMicroBatcher の単体テスト（サーバー不要・オフラインで実行可能）"""
+import threading
+
+import numpy as np
+import pytest
+
+from toorpia.microbatch import AddplotMicroBatcher
+
+
+class FakeClient:
+    """送られたバッチを記録し、各行の先頭の値を x 座標・距離とする擬似クライアント"""
+
+    mapNo = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = []
+
+    def addplot_embedding(self, data, mapNo=None, **kwargs):
+        with self.lock:
+            self.batches.append((mapNo, len(data)))
+        d = np.abs(data[:, 0])
+        return {
+            'xyData': np.c_[data[:, 0], np.zeros(len(data))],
+            'addPlotNo': len(self.batches),
+            'abnormalityStatus': 'normal',
+            'abnormalityScore': 0.9,
+            'diagnosticScore': {
+                'compositeStatus': 'normal',
+                'distance': {'radiusOfGyration': 2.0, 'threshold': 4.0, 'status': 'normal',
+                             'meanDistance': float(d.mean()), 'distanceStd': float(d.std()),
+                             'distancesPerPoint': d.tolist(),
+                             'normalizedDistancesPerPoint': (d / 2.0).tolist()},
+            },
+            'shareUrl': None,
+        }
+
+
+def test_batches_by_size_and_splits_results_per_caller():
+    client = FakeClient()
+    with AddplotMicroBatcher(client, max_rows=4, max_latency_ms=10_000) as batcher:
+        futures = [batcher.submit(np.array([float(i), 0.0]), mapNo=1) for i in range(10)]
+        # max_rows に達した2バッチはすぐに送信される
+        assert futures[0].result(timeout=5)['xyData'].tolist() == [[0.0, 0.0]]
+    assert [size for _, size in client.batches] == [4, 4, 2]
+    for i, future in enumerate(futures):
+        result = future.result()
+        assert result['xyData'].tolist() == [[float(i), 0.0]]
+        distance = result['diagnosticScore']['distance']
+        assert distance['distancesPerPoint'] == [float(i)]
+        assert distance['meanDistance'] == float(i)
+        assert result['batchOffset'] == i % 4
+    stats = batcher.stats()
+    assert stats['batches'] == 3 and stats['rows'] == 10 and stats['submitted'] == 10
+
+
+def test_flushes_after_latency_budget():
+    client = FakeClient()
+    with AddplotMicroBatcher(client, max_rows=1000, max_latency_ms=20) as batcher:
+        first = batcher.submit(np.array([[1.0, 0.0], [2.0, 0.0]]), mapNo=1)
+        second = batcher.submit(np.array([3.0, 0.0]), mapNo=1)
+        assert second.result(timeout=5)['xyData'].tolist() == [[3.0, 0.0]]
+        assert first.result()['xyData'][:, 0].tolist() == [1.0, 2.0]
+        assert client.batches == [(1, 3)]
+
+
+def test_batches_are_kept_per_map():
+    client = FakeClient()
+    with AddplotMicroBatcher(client, max_rows=3, max_latency_ms=10_000) as batcher:
+        futures = [batcher.submit(np.array([float(i)]), mapNo=i % 2) for i in range(6)]
+    assert sorted(client.batches) == [(0, 3), (1, 3)]
+    assert [f.result()['xyData'][0, 0] for f in futures] == [float(i) for i in range(6)]
+
+
+def test_failed_batch_resolves_every_caller_with_none():
+    client = FakeClient()
+    client.addplot_embedding = lambda data, mapNo=None, **kwargs: None
+    with AddplotMicroBatcher(client, max_rows=2) as batcher:
+        futures = [batcher.submit(np.array([1.0]), mapNo=1) for _ in range(2)]
+    assert [f.result() for f in futures] == [None, None]
+    assert batcher.stats()['failedBatches'] == 1
+
+
+def test_submit_after_close_is_rejected():
+    batcher = AddplotMicroBatcher(FakeClient())
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(np.array([1.0]), mapNo=1)
@@ -0,0 +1,134 @@
+"""WaveformMonitor（ライブ音声の監視）の単体テスト（サーバー不要・オフラインで実行可能）"""
+import threading
+import time
+import wave
+
+import numpy as np
+import pytest
+
+from toorpia.monitor import WaveformMonitor
+from toorpia.schema import MapSchemaCache
+
+from .conftest import FakeResponse
+
+
+class FakeClient:
+    """送られた窓の WAV を読み戻して記録し、振幅の大きい窓を abnormal とする擬似クライアント"""
+
+    mapNo = 5
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.uploads = []
+        self.map_schemas = MapSchemaCache()
+        self.map_schemas.put(5, {'processMethod': 'waveform', 'sampleRates': [8000],
+                                 'mkfftseg': {'wl': 1024, 'ol': 50.0, 'sr': 48000}})
+
+    def addplot_waveform(self, files, mapNo=None, **kwargs):
+        with wave.open(files[0].open()) as w:
+            samples = np.frombuffer(w.readframes(w.getnframes()), dtype='<i2') / 32768.0
+            rate = w.getframerate()
+        time.sleep(self.delay)
+        with self.lock:
+            self.uploads.append((files[0].start, samples, rate, mapNo, kwargs))
+        status = 'abnormal' if np.abs(samples).max() > 0.8 else 'normal'
+        return {'xyData': np.zeros((1, 2)), 'addPlotNo': len(self.uploads), 'abnormalityStatus': status,
+                'abnormalityScore': 0.1 if status == 'abnormal' else 0.9}
+
+
+def generator(seconds, rate=8000, burst=None, seed=0):
+    """正弦波に雑音を加えた合成の入力。burst=(開始秒, 終了秒) の間は振幅を大きくする"""
+    t = np.arange(int(seconds * rate)) / rate
+    signal = 0.3 * np.sin(2 * np.pi * 440 * t) + 0.01 * np.random.default_rng(seed).normal(size=len(t))
+    if burst is not None:
+        signal[int(burst[0] * rate):int(burst[1] * rate)] *= 3.0
+    return signal
+
+
+def feed_in_blocks(monitor, signal, seed=0):
+    rng = np.random.default_rng(seed)
+    position = 0
+    while position < len(signal):
+        size = int(rng.integers(1, 3000))
+        monitor.feed(signal[position:position + size])
+        position += size
+
+
+def test_windows_follow_basemap_segments_and_emit_events():
+    client = FakeClient()
+    signal = generator(6.0, burst=(3.0, 3.2))
+    with WaveformMonitor(client, max_pending=100, detabn_max_window=3) as monitor:
+        # wl=1024, ol=50% → 区間のずらし幅 512、8区間の窓は 1024 + 7 * 512 サンプルで 8 * 512 ずつずらす
+        assert (monitor.sample_rate, monitor.window_samples, monitor.hop_samples) == (8000, 4608, 4096)
+        feed_in_blocks(monitor, signal)
+    events = sorted(monitor.events(timeout=1), key=lambda e: e['windows'][0])
+    starts = [k * 4096 for k in range((len(signal) - 4608) // 4096 + 1)]
+    assert [e['windows'] for e in events] == [[k] for k in range(len(starts))]
+    for event, start in zip(events, starts):
+        assert event['type'] == 'result' and event['startSeconds'] == start / 8000
+        assert event['latencyMs'] >= 0
+    for start_seconds, samples, rate, map_no, kwargs in client.uploads:
+        start = int(round(start_seconds * 8000))
+        assert rate == 8000 and map_no == 5 and kwargs == {'detabn_max_window': 3}
+        assert np.allclose(samples, signal[start:start + 4608], atol=1 / 32768 + 1e-6)
+    abnormal = [e['startSeconds'] for e in events if e['abnormalityStatus'] == 'abnormal']
+    assert abnormal and all(2.4 <= s <= 3.2 for s in abnormal)
+    stats = monitor.stats()
+    assert stats['windows'] == stats['uploads'] == len(starts) and stats['dropped'] == 0
+    assert stats['samples'] == len(signal) and stats['maxLatencyMs'] >= stats['meanLatencyMs'] > 0
+
+
+@pytest.mark.parametrize("overflow", ['drop', 'coalesce'])
+def test_backpressure_drops_or_coalesces(overflow):
+    client = FakeClient(delay=0.05)
+    signal = generator(12.0)
+    monitor = WaveformMonitor(client, max_in_flight=1, max_pending=1, overflow=overflow, segments_per_window=2)
+    seen = []
+    monitor.on_event = seen.append
+    monitor.feed(signal)   # サーバーより速く届く
+    monitor.close()
+    events = list(monitor.events(timeout=1))
+    stats = monitor.stats()
+    results = [e for e in events if e['type'] == 'result']
+    dropped = [e for e in events if e['type'] == 'dropped']
+    assert len(seen) == len(events)
+    assert sum(len(e['windows']) for e in events) == stats['windows']
+    assert stats['uploads'] == len(results) < stats['windows']
+    if overflow == 'drop':
+        assert stats['dropped'] == len(dropped) > 0 and stats['coalesced'] == 0
+    else:
+        # 捨てるのは max_coalesce 件までまとめ終えた窓だけ
+        assert stats['coalesced'] > 0 and all(len(e['windows']) == 4 for e in dropped)
+        merged = max(results, key=lambda e: len(e['windows']))
+        assert 1 < len(merged['windows']) <= 4
+        # まとめた窓は連続したサンプルのまま1回で送る
+        start_seconds, samples, _, _, _ = next(u for u in client.uploads if u[0] == merged['startSeconds'])
+        start = int(round(start_seconds * 8000))
+        assert np.allclose(samples, signal[start:start + len(samples)], atol=1 / 32768 + 1e-6)
+        assert len(samples) == pytest.approx((merged['endSeconds'] - merged['startSeconds']) * 8000)
+    with pytest.raises(RuntimeError):
+        monitor.feed(signal[:10])
+
+
+def test_monitor_uploads_through_client(fake_api):
+    from toorpia.client import toorPIA
+
+    names = []
+
+    def fake_request(method, url, **kwargs):
+        names.append(kwargs['files'][0][1].name)
+        return FakeResponse(200, {'resdata': [[0.0, 0.0]], 'addPlotNo': 1, 'abnormalityStatus': 'normal'})
+
+    fake_api(fake_request)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    client.map_schemas.put(7, {'processMethod': 'waveform', 'sampleRates': [16000], 'mkfftseg': {'wl': 2048}})
+    with WaveformMonitor(client, mapNo=7, sample_rate=8000, segments_per_window=1, max_pending=10) as monitor:
+        monitor.feed(generator(1.0))
+    # サンプリング周波数がベースマップと違う窓は事前検証で送らずに失敗にする
+    assert not names and monitor.stats()['failed'] == monitor.stats()['windows'] > 0
+    with WaveformMonitor(client, mapNo=7, segments_per_window=1, max_pending=10) as monitor:
+        monitor.feed(generator(0.5, rate=16000))
+    # 窓は 2048 サンプル、区間のずらし幅 1024 サンプルずつ
+    assert sorted(names) == sorted(f"live@{k * 0.064:g}s.wav" for k in range(6))
+    assert [e['abnormalityStatus'] for e in monitor.events(timeout=1)] == ['normal'] * 6
@@ -0,0 +1,94 @@
+"""正常領域（normal_area.dat）の索引の単体テスト（サーバー不要・オフラインで実行可能）"""
+import base64
+import warnings
+
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+from toorpia.normal_area import NormalAreaIndex, parse_normal_area
+
+from .conftest import FakeResponse
+
+
+def density_grid(n=41):
+    nodes = np.linspace(-2.0, 2.0, n)
+    gx, gy = np.meshgrid(nodes, nodes)
+    # 中心からずれた正常領域（向きを取り違えると判定が変わる）
+    return nodes, np.exp(-((gx - 0.8) ** 2 + (gy - 0.4) ** 2) / 0.5)
+
+
+def base_points(n=2000, seed=0):
+    return np.random.default_rng(seed).normal(loc=(0.8, 0.4), scale=0.5, size=(n, 2))
+
+
+def test_parser_accepts_triplets_and_matrices():
+    text = "# normal area\nx,y,value\n\n0,0,1\n1,0,2\n\n0,1,3\n1,1,4\n"
+    values, x_nodes, y_nodes = parse_normal_area(text)
+    assert values.tolist() == [[1, 2], [3, 4]] and x_nodes.tolist() == [0, 1] and y_nodes.tolist() == [0, 1]
+    values, x_nodes, _ = parse_normal_area("% matrix\n1\t2\t3\n4 5 6 \n7,8,9\n1e-3 nan 0\n")
+    assert x_nodes is None and values.shape == (4, 3) and np.isnan(values[3, 1])
+    with pytest.raises(ValueError):
+        parse_normal_area("1 2\n3\n")
+    with pytest.raises(ValueError):
+        parse_normal_area("# only comments\n")
+
+
+def test_lookup_threshold_and_orientation(tmp_path):
+    nodes, grid = density_grid()
+    base = base_points()
+    triplets = tmp_path / "normal_area.dat"
+    gx, gy = np.meshgrid(nodes, nodes)
+    np.savetxt(triplets, np.column_stack([gx.ravel(), gy.ravel(), grid.ravel()]))
+    index = NormalAreaIndex.from_file(str(triplets), base_xy=base)
+    # 既定のしきい値ではベースマップの点の 90% が正常領域に入る
+    assert index.contains(base).mean() == pytest.approx(0.90, abs=0.005)
+    assert index.lookup([[0.8, 0.4]])[0] == pytest.approx(1.0)
+    assert index.contains([[0.8, 0.4], [-1.5, 0.0], [9.0, 9.0]]).tolist() == [True, False, False]
+
+    # 座標を持たない行列（転置して y を降順に保存）は、範囲と並び方を指定して読む
+    matrix = tmp_path / "matrix.dat"
+    np.savetxt(matrix, grid[::-1].T)
+    extent = (-2.0, 2.0, -2.0, 2.0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        oriented = NormalAreaIndex.from_file(str(matrix), extent=extent, orientation='transposed-y-down',
+                                             threshold=index.threshold)
+    assert np.array_equal(oriented.bitmap, index.bitmap)
+    # 省略するとベースマップの点から推定し、推定したことを警告する
+    with pytest.warns(UserWarning, match="orientation='transposed-y-down'"):
+        guessed = NormalAreaIndex.from_file(str(matrix), base_xy=base, extent=extent, threshold=index.threshold)
+    assert np.array_equal(guessed.bitmap, index.bitmap)
+    with pytest.warns(UserWarning, match="extent="):
+        NormalAreaIndex.from_file(str(matrix), base_xy=base, orientation='transposed-y-down')
+    with pytest.raises(ValueError):
+        NormalAreaIndex.from_file(str(matrix), extent=extent)
+    with pytest.raises(ValueError, match="unknown orientation"):
+        NormalAreaIndex.from_file(str(matrix), extent=extent, orientation='sideways')
+
+    inside = np.tile([[0.8, 0.4]], (10, 1))
+    outside = np.tile([[-1.8, 1.8]], (10, 1))
+    assert index.classify(inside)['abnormalityStatus'] == 'normal'
+    verdict = index.classify(np.vstack([inside, outside]), max_window=5)
+    assert verdict['abnormalityStatus'] == 'abnormal' and verdict['abnormalityRate'] == 0.5
+
+
+def test_client_loads_exported_normal_area(fake_api, tmp_path):
+    nodes, grid = density_grid()
+    gx, gy = np.meshgrid(nodes, nodes)
+    content = "\n".join(f"{x} {y} {v}" for x, y, v in zip(gx.ravel(), gy.ravel(), grid.ravel()))
+    base = base_points(500)
+
+    def fake_request(method, url, **kwargs):
+        if url.endswith("/xy"):
+            return FakeResponse(200, {'mapNo': 9, 'processMethod': 'dataframe', 'xyData': base.tolist()})
+        if "/maps/export/" in url:
+            return FakeResponse(200, {'mapData': {'normal_area.dat': base64.b64encode(content.encode()).decode()}})
+        raise AssertionError(url)
+
+    fake_api(fake_request)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    index = client.normal_area_index(9, threshold=0.5)
+    assert index.threshold == 0.5 and index.bitmap.shape == (41, 41)
+    assert client.normal_area_index(9, export_dir=str(tmp_path)) is not None
+    assert (tmp_path / "normal_area.dat").exists()
@@ -0,0 +1,92 @@
+"""クライアント側の次元削減（EmbeddingProjection）の単体テスト（サーバー不要・オフラインで実行可能）"""
+import gzip
+
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+from toorpia.projection import EmbeddingProjection, ProjectionStore
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def low_rank(n=400, d=96, rank=6, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(size=(n, rank)) @ rng.normal(size=(rank, d)) + 0.01 * rng.normal(size=(n, d))
+
+
+def fake_server(fake_api):
+    """アップロードされた CSV の先頭行と列数を記録する擬似サーバー"""
+    uploads = []
+
+    def fake_request(method, url, **kwargs):
+        handle = kwargs['files'][0][1]
+        raw = handle.read()
+        lines = (gzip.decompress(raw) if handle.name.endswith('.gz') else raw).decode().splitlines()
+        uploads.append((url, lines[0], len(lines[-1].split(','))))
+        if url.endswith("/data/basemap_embedding"):
+            return FakeResponse(200, {'resdata': {'baseXyData': [[0.0, 0.0]], 'mapNo': 21}})
+        return FakeResponse(200, {'resdata': [[0.0, 0.0]], 'addPlotNo': 1, 'abnormalityStatus': 'normal'})
+
+    fake_api(fake_request)
+    return uploads
+
+
+def test_pca_captures_low_rank_variance():
+    X = low_rank()
+    exact = EmbeddingProjection('pca', 0.99, normalize=False).fit(X)
+    assert exact.output_dim <= 6 and exact.explained_variance_ratio.sum() >= 0.99
+    fast = EmbeddingProjection('pca', 6, normalize=False).fit(X)   # 乱択 SVD
+    assert fast.explained_variance_ratio.sum() == pytest.approx(exact.explained_variance_ratio[:6].sum(), rel=1e-3)
+    # 射影後の点間距離はほぼ保たれる
+    Z = fast.transform(X)
+    assert np.allclose(np.linalg.norm(Z[0] - Z[1:], axis=1), np.linalg.norm(X[0] - X[1:], axis=1), rtol=0.02)
+    with pytest.raises(ValueError):
+        fast.transform(X[:, :10])
+
+
+def test_random_projection_is_reproducible_and_roundtrips(tmp_path):
+    X = np.random.default_rng(1).normal(size=(50, 300))
+    a = EmbeddingProjection('random', 64, seed=5).fit(X)
+    b = EmbeddingProjection('random', 64, seed=5).fit(X[:3])
+    assert np.array_equal(a.transform(X), b.transform(X))
+    store = ProjectionStore(str(tmp_path / "store"))
+    a.header, a.id_columns = True, 1
+    store.save(4, a)
+    loaded = store.load(4)
+    assert np.array_equal(loaded.transform(X), a.transform(X))
+    assert (loaded.method, loaded.n_components, loaded.header, loaded.id_columns) == ('random', 64, True, 1)
+    assert store.load(5) is None
+
+
+def test_basemap_projection_is_applied_to_addplot(fake_api, tmp_path):
+    uploads = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    client.projections = ProjectionStore(str(tmp_path))
+    X = low_rank()
+    result = client.basemap_embedding(X, projection=8)
+    assert result['mapNo'] == 21
+    assert result['projection']['inputDim'] == 96 and result['projection']['outputDim'] == 8
+    assert uploads[-1][2] == 8 and 'pc1' not in uploads[-1][1]
+
+    client.addplot_embedding(low_rank(n=20, seed=2), mapNo=21)
+    assert uploads[-1][0].endswith("/data/addplot_embedding") and uploads[-1][2] == 8
+    client.addplot_embedding(low_rank(n=20, seed=2), mapNo=21, projection=False)
+    assert uploads[-1][2] == 96
+
+
+def test_projection_keeps_id_columns_and_header(fake_api, tmp_path):
+    uploads = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    client.projections = ProjectionStore(str(tmp_path))
+    frame = pd.DataFrame(low_rank(n=100, d=32), columns=[f"d{i}" for i in range(32)])
+    frame.insert(0, 'doc', [f"doc{i}" for i in range(100)])
+    path = tmp_path / "emb.csv"
+    frame.to_csv(path, index=False)
+    client.basemap_embedding(str(path), projection={'method': 'random', 'n_components': 4})
+    assert uploads[-1][1] == "doc,pc1,pc2,pc3,pc4"
+
+    client.addplot_embedding(frame.iloc[:5])
+    assert uploads[-1][1] == "doc,pc1,pc2,pc3,pc4"
@@ -0,0 +1,95 @@
+"""重み 0 の列の取り除き（prune_columns）の単体テスト（サーバー不要・オフラインで実行可能）"""
+import io
+
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+from toorpia.pruning import parse_option_str, reindex_options, zero_weight_columns
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def fake_server(fake_api):
+    sent = []
+
+    def fake_request(method, url, **kwargs):
+        if 'json' in kwargs:
+            sent.append(kwargs['json'])
+            rows = len(kwargs['json']['data'])
+        else:
+            frame = pd.read_csv(io.BytesIO(kwargs['files'][0][1].read()))
+            sent.append(dict(kwargs['data'], columns=list(frame.columns)))
+            rows = len(frame)
+        if '/addplot' in url:
+            return FakeResponse(200, {'resdata': [[0.0, 0.0]] * rows, 'addPlotNo': 1,
+                                      'abnormalityStatus': 'normal'})
+        return FakeResponse(200, {'resdata': {'baseXyData': [[0.0, 0.0]] * rows, 'mapNo': 5}})
+
+    fake_api(fake_request)
+    return sent
+
+
+def sensor_frame(n=20):
+    return pd.DataFrame({
+        'id': [f"unit-{i:04d}" for i in range(n)],
+        'time': pd.date_range("2024-01-01", periods=n, freq="min"),
+        'temp': np.linspace(20, 30, n),
+        'note': ["long free-text maintenance note"] * n,
+        'rpm': np.arange(n),
+    })
+
+
+def test_option_helpers():
+    assert parse_option_str("1:0, 2:1,3:float") == {1: '0', 2: '1', 3: 'float'}
+    assert zero_weight_columns(['a', 'b', 'c', 'd'], "1:0,2:1,3:0", keep_columns=['c']) == [0]
+    assert zero_weight_columns(['a', 'b', 'c'], "1:1", drop_columns=['b']) == [1]
+    assert reindex_options("1:0,2:1,3:0,4:1", 4, [0, 2]) == "1:1,2:1"
+    with pytest.raises(ValueError):
+        parse_option_str("a:1")
+
+
+def test_fit_transform_prunes_and_regenerates_options(fake_api):
+    sent = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    df = sensor_frame()
+    client.fit_transform(df, prune_columns=True, keep_columns=['id'])
+    assert sent[0]['columns'] == ['id', 'temp', 'rpm']
+    assert sent[0]['weight_option_str'] == "1:0,2:1,3:1"
+    assert client.prunedColumns == ['time', 'note']
+    assert str(client.prunedAttributes['note'].dtype) == 'category'
+    assert len(client.prunedAttributes) == len(df)
+
+    # keep_columns を省略すると、ベースマップのスキーマにある列（id）を残す
+    client.addplot(df, 5, weight_option_str="1:0,2:0,3:1,4:0,5:1",
+                   type_option_str="1:none,2:date,3:float,4:none,5:int", prune_columns=True)
+    assert sent[1]['columns'] == ['id', 'temp', 'rpm']
+    assert sent[1]['weight_option_str'] == "1:0,2:1,3:1"
+    assert sent[1]['type_option_str'] == "1:none,2:float,3:int"
+
+    # 明示したオプション文字列は列番号を詰め直して送る（位置引数でも可）
+    client.map_schemas.remove(5)
+    client.addplot(df, 5, weight_option_str="1:0,2:0,3:1,4:0,5:1",
+                   type_option_str="1:none,2:date,3:float,4:none,5:int", prune_columns=True)
+    assert sent[2]['columns'] == ['temp', 'rpm']
+    assert sent[2]['weight_option_str'] == "1:1,2:1"
+    assert sent[2]['type_option_str'] == "1:float,2:int"
+
+
+def test_csvform_prunes_files_and_drop_columns(fake_api, tmp_path):
+    sent = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    path = tmp_path / "log.csv"
+    sensor_frame().to_csv(path, index=False)
+    result = client.basemap_csvform(str(path), "1:0,2:0,3:1,4:0,5:1", drop_columns=['rpm', 'id'],
+                                    keep_columns=['id'], prune_columns=True)
+    assert sent[0]['columns'] == ['id', 'temp']
+    assert sent[0]['weight_option_str'] == "1:0,2:1"
+    assert sent[0]['drop_columns'] == '["id"]'
+    assert result['prunedColumns'] == ['time', 'note', 'rpm']
+    assert len(list(tmp_path.iterdir())) == 1
+
+    client.addplot_csvform(str(path), prune_columns=result['prunedColumns'])
+    assert sent[1]['columns'] == ['id', 'temp']
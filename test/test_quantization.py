@@ -0,0 +1,86 @@
+"""量子化した埋め込みのアップロード（float16 / int8）の単体テスト（サーバー不要・オフラインで実行可能）"""
+import gzip
+import io
+
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+from toorpia.quantization import (FLOAT_FORMATS, int8_scales, quantize, quantize_float16, quantize_int8,
+                                  write_quantized_csv)
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def embeddings(n=300, d=64, seed=0):
+    X = np.random.default_rng(seed).normal(size=(n, d))
+    return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+def test_error_bounds():
+    X = embeddings() * np.logspace(-3, 2, 64)
+    assert np.all(np.abs(quantize_float16(X) - X) <= 2.0 ** -11 * np.abs(X) + 2.0 ** -25)
+    codes, scales = quantize_int8(X)
+    assert codes.dtype == np.int8 and np.abs(codes).max() == 127
+    assert np.all(np.abs(codes * scales - X) <= scales / 2 + 1e-12)
+    # スケールは有効2桁に切り上げた max|x_j| / 127
+    peak = np.abs(X).max(axis=0) / 127
+    assert np.all((scales >= peak) & (scales <= 1.1 * peak))
+    mantissa = scales / 10.0 ** np.floor(np.log10(scales) - 1)
+    assert np.allclose(mantissa, np.round(mantissa))
+    with pytest.raises(ValueError):
+        quantize_float16(np.array([[1e5]]))
+    assert int8_scales(np.zeros((3, 2))).tolist() == [1.0, 1.0]
+
+
+@pytest.mark.parametrize("quantization", ['float16', 'int8'])
+def test_table_encoder_matches_pandas(tmp_path, quantization):
+    X = embeddings(n=50)
+    X[3, 7] = np.nan
+    path = str(tmp_path / "q.csv.gz")
+    write_quantized_csv(path, X, quantization, header="h", block_rows=16)
+    expected = "h\n" + pd.DataFrame(quantize(X, quantization)).to_csv(
+        index=False, header=False, float_format=FLOAT_FORMATS[quantization], lineterminator='\n')
+    with gzip.open(path, 'rt', newline='') as f:
+        assert f.read() == expected
+
+
+def fake_server(fake_api):
+    uploads = []
+
+    def fake_request(method, url, **kwargs):
+        uploads.append(gzip.decompress(kwargs['files'][0][1].read()).decode())
+        return FakeResponse(200, {'resdata': [[0.0, 0.0]], 'addPlotNo': 1, 'abnormalityStatus': 'normal'})
+
+    fake_api(fake_request)
+    return uploads
+
+
+def test_addplot_embedding_uploads_quantized_values(fake_api):
+    uploads = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    X = embeddings()
+    client.addplot_embedding(X, mapNo=1, quantization='int8')
+    uploaded = np.loadtxt(io.StringIO(uploads[-1]), delimiter=',')
+    assert np.array_equal(uploaded, np.round(quantize(X, 'int8'), 12))
+    assert len(uploads[-1]) < 0.7 * len(pd.DataFrame(X).to_csv(index=False, header=False, float_format='%.7g'))
+
+    frame = pd.DataFrame(X[:, :4], columns=list('abcd'))
+    frame.insert(0, 'id', [f"doc{i}" for i in range(len(frame))])
+    client.addplot_embedding(frame, mapNo=1, quantization='float16')
+    uploaded = pd.read_csv(io.StringIO(uploads[-1]))
+    assert list(uploaded.columns) == ['id', 'a', 'b', 'c', 'd'] and uploaded['id'][2] == 'doc2'
+    # 5桁の文字列は float16 の値を一意に表す（読み戻して float16 にすると一致する）
+    assert np.array_equal(uploaded[list('abcd')].to_numpy().astype(np.float16), X[:, :4].astype(np.float16))
+    assert np.all(np.abs(uploaded[list('abcd')].to_numpy() - X[:, :4]) <= 5.4e-4 * np.abs(X[:, :4]))
+
+
+def test_invalid_quantization_is_reported(fake_api, capsys):
+    uploads = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    assert client.addplot_embedding(embeddings(), mapNo=1, quantization='int4') is None
+    assert client.addplot_embedding(embeddings() * 1e6, mapNo=1, quantization='float16') is None
+    assert uploads == []
+    assert "float16 range" in capsys.readouterr().out
@@ -0,0 +1,132 @@
+"""select_rows() とベースマップ作成前の縮約の単体テスト（サーバー不要・オフラインで実行可能）"""
+import gzip
+import io
+import os
+
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+from toorpia.sampling import select_rows
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def clustered(n_major=5000, n_rare=20, seed=0):
+    """大きなクラスタ1つと、遠く離れた小さなクラスタ1つ"""
+    rng = np.random.default_rng(seed)
+    major = rng.normal(0.0, 1.0, size=(n_major, 3))
+    rare = rng.normal(12.0, 0.5, size=(n_rare, 3))
+    return np.vstack([major, rare])
+
+
+@pytest.mark.parametrize("method", ['random', 'stratified', 'coreset', 'grid'])
+def test_select_rows_returns_sorted_unique_positions(method):
+    data = clustered()
+    indices = select_rows(data, 200, method=method, seed=3)
+    assert len(indices) == 200
+    assert np.all(np.diff(indices) > 0)
+    assert indices.min() >= 0 and indices.max() < len(data)
+    assert np.array_equal(indices, select_rows(data, 200, method=method, seed=3))
+    assert np.array_equal(select_rows(data, 0.5, method=method), select_rows(data, 2510, method=method))
+    assert np.array_equal(select_rows(data, len(data) + 1, method=method), np.arange(len(data)))
+
+
+def test_select_rows_treats_float_one_as_all_rows():
+    data = clustered()
+    assert np.array_equal(select_rows(data, 1.0), np.arange(len(data)))
+    assert len(select_rows(data, 200.0, method='random')) == 200
+    with pytest.raises(ValueError):
+        select_rows(data, 1.5)
+
+
+def test_coreset_and_grid_keep_rare_region():
+    data = clustered()
+    rare = np.arange(5000, 5020)
+    uniform = np.mean([np.isin(rare, select_rows(data, 100, 'random', seed=s)).sum() for s in range(5)])
+    for method in ('coreset', 'grid'):
+        kept = np.mean([np.isin(rare, select_rows(data, 100, method, seed=s)).sum() for s in range(5)])
+        assert kept >= 5 and kept > 4 * uniform
+
+
+def test_stratified_keeps_proportions_and_rare_strata():
+    df = pd.DataFrame({'x': np.arange(1001, dtype=float),
+                       'mode': ['run'] * 900 + ['idle'] * 100 + ['fault']})
+    indices = select_rows(df, 101, method='stratified')
+    modes = df['mode'].iloc[indices].value_counts()
+    assert modes['fault'] == 1
+    assert abs(modes['run'] - 90) <= 1 and abs(modes['idle'] - 10) <= 1
+    # strata に行ごとのラベルを渡すこともできる
+    by_label = select_rows(df, 101, method='stratified', strata=df['mode'].to_numpy())
+    assert np.array_equal(indices, by_label)
+    with pytest.raises(ValueError):
+        select_rows(df, 10, method='kmeans')
+
+
+def fake_basemap_server(fake_api):
+    uploads = []
+
+    def fake_request(method, url, **kwargs):
+        if 'json' in kwargs:
+            rows = len(kwargs['json']['data'])
+        else:
+            rows = 0
+            for _, handle in kwargs['files']:
+                raw = handle.read()
+                if handle.name.endswith('.gz'):
+                    raw = gzip.decompress(raw)
+                rows += len(raw.splitlines()) - ('basemap_csvform' in url)
+                uploads.append((url, os.path.basename(handle.name), raw))
+        return FakeResponse(200, {'resdata': {'baseXyData': [[0.0, 0.0]] * rows, 'mapNo': 7}})
+
+    fake_api(fake_request)
+    return uploads
+
+
+def test_fit_transform_uploads_subset_and_records_positions(fake_api):
+    fake_basemap_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    df = pd.DataFrame(clustered(n_major=500), columns=['a', 'b', 'c'])
+    xy = client.fit_transform(df, subsample={'size': 50, 'method': 'grid'})
+    assert xy.shape == (50, 2)
+    assert np.array_equal(client.sampleIndices, select_rows(df, 50, method='grid'))
+
+
+def test_basemap_csvform_subsamples_across_files(fake_api, tmp_path):
+    uploads = fake_basemap_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    paths = []
+    for i in range(2):
+        path = tmp_path / f"part{i}.csv"
+        pd.DataFrame({'t': np.arange(100) + 100 * i, 'v': np.sin(np.arange(100) + i)}).to_csv(path, index=False)
+        paths.append(str(path))
+    result = client.basemap_csvform(paths, drop_columns=['t'], subsample=30)
+
+    assert len(result['xyData']) == 30 and len(result['sampleIndices']) == 30
+    # 選んだ行を元のファイルから同じ名前のファイルへそのままコピーして送る
+    assert [name for _, name, _ in uploads] == ["part0.csv", "part1.csv"]
+    originals = [open(path, 'rb').read().splitlines(keepends=True) for path in paths]
+    for (_, _, raw), lines in zip(uploads, originals):
+        assert raw.splitlines(keepends=True)[0] == lines[0]
+        assert set(raw.splitlines(keepends=True)[1:]) <= set(lines[1:])
+    uploaded = pd.concat([pd.read_csv(io.BytesIO(raw)) for _, _, raw in uploads])
+    assert list(uploaded.columns) == ['t', 'v']
+    # 位置はファイルを連結した行の通し番号
+    assert uploaded['t'].tolist() == result['sampleIndices'].tolist()
+    assert len(list(tmp_path.iterdir())) == 2
+
+
+def test_basemap_embedding_keeps_headerless_files_headerless(fake_api, tmp_path):
+    uploads = fake_basemap_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    path = tmp_path / "emb.csv"
+    np.savetxt(path, clustered(n_major=300), delimiter=',')
+    result = client.basemap_embedding(str(path), subsample=0.1)
+
+    assert len(result['sampleIndices']) == 32
+    assert uploads[0][1] == "emb.csv"
+    uploaded = np.loadtxt(io.BytesIO(uploads[0][2]), delimiter=',')
+    assert uploaded.shape == (32, 3)
+    assert np.allclose(uploaded, clustered(n_major=300)[result['sampleIndices']], atol=1e-5)
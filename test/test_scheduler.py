@@ -0,0 +1,131 @@
+"""JobScheduler の単体テスト（サーバー不要・オフラインで実行可能）"""
+import concurrent.futures
+import threading
+
+import pytest
+
+from toorpia.job import Job
+from toorpia.scheduler import JobScheduler
+
+
+class FakeServer:
+    """アクティブジョブ数の上限を持つ擬似サーバーと、それを呼ぶ擬似クライアント"""
+
+    def __init__(self, limit=5, polls_until_done=3, reject_first=0):
+        self._local = threading.local()
+        self.limit = limit
+        self.polls_until_done = polls_until_done
+        self.reject_first = reject_first
+        self.lock = threading.Lock()
+        self.active = {}
+        self.max_active_seen = 0
+        self.order = []
+        self.rejections = 0
+
+    def addplot(self, value, async_mode=False):
+        assert async_mode is True
+        with self.lock:
+            if self.rejections < self.reject_first or len(self.active) >= self.limit:
+                self.rejections += 1
+                self._local.last_submission_status = 429
+                self._local.last_submission_retry_after = None
+                return None
+            job_id = f"job_{value}"
+            self.active[job_id] = self.polls_until_done
+            self.max_active_seen = max(self.max_active_seen, len(self.active))
+            self.order.append(value)
+            self._local.last_submission_status = 202
+        return Job(self, job_id, parser=lambda response: response.json())
+
+    def failing(self, async_mode=False):
+        self._local.last_submission_status = 400
+        return None
+
+    def _poll_job(self, job_id, params=None, endpoint=None):
+        with self.lock:
+            self.active[job_id] -= 1
+            if self.active[job_id] > 0:
+                return {'status': 'running'}, {}
+            del self.active[job_id]
+        return {'status': 'done', 'httpStatus': 200, 'result': {'id': job_id}}, {}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr("toorpia.job.time.sleep", lambda s: None)
+    monkeypatch.setattr("toorpia.scheduler.time.sleep", lambda s: None)
+
+
+def test_keeps_at_most_max_active_jobs_in_flight():
+    server = FakeServer(limit=100)
+    with JobScheduler(server, max_active=3) as scheduler:
+        handles = [scheduler.submit('addplot', i) for i in range(20)]
+    assert [h.result() for h in handles] == [{'id': f"job_{i}"} for i in range(20)]
+    assert server.max_active_seen <= 3
+    stats = scheduler.stats()
+    assert stats['submitted'] == 20
+    assert stats['completed'] == 20
+    assert stats['inFlight'] == 0
+    assert stats['queued'] == 0
+
+
+def test_retries_429_until_a_slot_frees_up():
+    server = FakeServer(limit=5, reject_first=2)
+    with JobScheduler(server, max_active=2) as scheduler:
+        handle = scheduler.submit('addplot', 1)
+    assert handle.result() == {'id': 'job_1'}
+    assert handle.submit_attempts == 3
+    assert scheduler.stats()['retries429'] == 2
+
+
+def test_gives_up_after_max_submit_retries():
+    server = FakeServer(limit=5, reject_first=100)
+    with JobScheduler(server, max_active=1, max_submit_retries=2) as scheduler:
+        handle = scheduler.submit('addplot', 1)
+    assert handle.result() is None
+    assert handle.submit_attempts == 3
+    assert scheduler.stats()['failed'] == 1
+
+
+def test_non_429_errors_are_not_retried():
+    server = FakeServer()
+    with JobScheduler(server, max_active=1) as scheduler:
+        handle = scheduler.submit('failing')
+    assert handle.result() is None
+    assert handle.submit_attempts == 1
+
+
+def test_higher_priority_jobs_are_submitted_first():
+    server = FakeServer(limit=100)
+    scheduler = JobScheduler(server, max_active=1)
+    gate = threading.Event()
+    # 最初のジョブでワーカーを塞いでいる間に優先度の異なるジョブを積む
+    blocker = scheduler.submit(lambda async_mode: gate.wait() and None, name='blocker')
+    low = [scheduler.submit('addplot', i, priority=0) for i in range(3)]
+    high = scheduler.submit('addplot', 99, priority=10)
+    gate.set()
+    scheduler.shutdown(wait=True)
+    assert blocker.result() is None
+    assert server.order == [99, 0, 1, 2]
+    assert high.queue_wait >= 0
+    assert all(h.run_time is not None for h in low)
+
+
+def test_cancel_pending_on_shutdown():
+    server = FakeServer(limit=100)
+    scheduler = JobScheduler(server, max_active=1)
+    started, gate = threading.Event(), threading.Event()
+    scheduler.submit(lambda async_mode: started.set() or gate.wait() and None)
+    pending = [scheduler.submit('addplot', i) for i in range(3)]
+    # ワーカーが最初のジョブで塞がっている間に停止し、キューに残った3件をキャンセルする
+    assert started.wait(timeout=5)
+    scheduler.shutdown(wait=False, cancel_pending=True)
+    gate.set()
+    assert scheduler.join(timeout=5)
+    for handle in pending:
+        with pytest.raises(concurrent.futures.CancelledError):
+            handle.result(timeout=0)
+    stats = scheduler.stats()
+    assert stats['cancelled'] == 3 and stats['submitted'] == 1
+    # キャンセルしたジョブはサーバーに一度も投入されない
+    assert server.order == []
@@ -0,0 +1,158 @@
+"""weight/type オプションの自動推定とそのキャッシュ、addplot の事前検証の単体テスト
+（サーバー不要・オフラインで実行可能）"""
+import wave
+
+import numpy as np
+import pytest
+
+from toorpia import schema
+from toorpia.client import toorPIA
+from toorpia.schema import MapSchemaCache, OptionInferenceCache, infer_type_weight_options
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def mixed_frame(n=200):
+    return pd.DataFrame({
+        'f': np.random.rand(n),
+        'i': np.arange(n),
+        'dt': pd.date_range('2020-01-01', periods=n),
+        'ds': pd.date_range('2020-01-01', periods=n).astype(str).astype(object),
+        's': ['abc'] * n,
+        'mostly_dates': (['2020-01-01'] * 9 + ['hello']) * (n // 10),
+        'cat': pd.Categorical(['a', 'b'] * (n // 2)),
+        'b': [True, False] * (n // 2),
+        'empty': [None] * n,
+        'late_dates': [None] * 150 + ['2021-03-04'] * 50,
+        'late_text': [None] * 150 + ['x'] * 50,
+        'td': pd.to_timedelta(np.arange(n), 's'),
+    })
+
+
+def test_inference_follows_dtype_rules():
+    weight, types = infer_type_weight_options(mixed_frame())
+    assert types == ("1:float,2:int,3:date,4:date,5:none,6:none,7:enum,8:enum,"
+                     "9:none,10:date,11:none,12:none")
+    assert weight == "1:1,2:1,3:0,4:0,5:0,6:0,7:0,8:0,9:0,10:0,11:0,12:0"
+
+
+def test_wide_frame_parses_dates_in_one_call(monkeypatch):
+    wide = pd.DataFrame({f"c{i}": (np.random.rand(5) if i % 2 else ['2024-05-01'] * 5) for i in range(400)})
+    calls = []
+    to_datetime = pd.to_datetime
+    monkeypatch.setattr(pd, "to_datetime", lambda *a, **k: calls.append(1) or to_datetime(*a, **k))
+    weight, types = infer_type_weight_options(wide)
+    assert len(calls) == 1
+    assert types.split(',')[:2] == ['1:date', '2:float'] and weight.split(',')[:2] == ['1:0', '2:1']
+
+
+def test_cache_skips_inference_for_same_schema(monkeypatch):
+    runs = []
+    infer = schema.infer_type_weight_options
+    monkeypatch.setattr(schema, "infer_type_weight_options", lambda df: runs.append(1) or infer(df))
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    df = mixed_frame()
+    first = client._generate_type_weight_options(df)
+    assert client._generate_type_weight_options(df.iloc[:10]) == first
+    assert len(runs) == 1
+    client._generate_type_weight_options(df.astype({'i': float}))
+    assert len(runs) == 2
+    assert (client.options_cache.hits, client.options_cache.misses) == (1, 2)
+
+    cache = OptionInferenceCache(max_entries=1)
+    cache.options(df)
+    cache.options(df[['f']])
+    assert len(cache) == 1
+
+
+def fake_server(fake_api, xy=None):
+    requests = []
+
+    def fake_request(method, url, **kwargs):
+        requests.append(url)
+        if url.endswith("/xy"):
+            return FakeResponse(200, dict(xy, xyData=[[0.0, 0.0]]))
+        if '/addplot' in url:
+            return FakeResponse(200, {'resdata': [[0.0, 0.0]], 'addPlotNo': 1, 'abnormalityStatus': 'normal'})
+        return FakeResponse(200, {'resdata': {'baseXyData': [[0.0, 0.0]], 'mapNo': 7}})
+
+    fake_api(fake_request)
+    return requests
+
+
+def write_wav(path, rate):
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(np.zeros(64, dtype=np.int16).tobytes())
+    return str(path)
+
+
+def test_addplot_is_checked_against_basemap_schema(fake_api, capsys):
+    requests = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    df = mixed_frame()[['f', 'i', 's']].iloc[:20]
+    client.fit_transform(df)
+    assert client.map_schemas.get(7)['columns'] == ['f', 'i', 's']
+
+    assert client.addplot(df.drop(columns='s')) is None
+    assert client.addplot(df.astype({'i': str})) is None
+    assert client.addplot_embedding(np.zeros((3, 4)), mapNo=7) is None
+    out = capsys.readouterr().out
+    assert "has 2 columns but the basemap has 3; missing: s" in out
+    assert "column 'i' has dtype" in out and "but the basemap uses it as int" in out
+    assert "use addplot() instead of addplot_embedding()" in out
+    assert len(requests) == 1
+
+    client.addplot(df.iloc[:5])
+    client.addplot(df.drop(columns='s'), preflight=False)
+    assert len(requests) == 3
+
+
+def test_embedding_and_waveform_preflight(fake_api, tmp_path, capsys):
+    requests = fake_server(fake_api)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    path = tmp_path / "base.csv"
+    path.write_text("id,e1,e2,e3\na,0.1,0.2,0.3\nb,0.4,0.5,0.6\n")
+    client.basemap_embedding(str(path))
+    assert client.map_schemas.get(7)['nDimension'] == 3
+    assert client.addplot_embedding(np.zeros((2, 5))) is None
+    client.addplot_embedding(np.zeros((2, 3)))
+
+    client.basemap_waveform([write_wav(tmp_path / "a.wav", 48000)], mkfftseg_wl=1024)
+    assert client.map_schemas.get(7)['mkfftseg']['wl'] == 1024
+    assert client.map_schemas.get(7)['sampleRates'] == [48000]
+    assert client.addplot_waveform([write_wav(tmp_path / "b.wav", 16000)]) is None
+    assert "sampled at 16000 Hz" in capsys.readouterr().out
+    client.addplot_waveform([write_wav(tmp_path / "c.wav", 48000)])
+    assert [url.rsplit('/', 1)[-1] for url in requests] == [
+        'basemap_embedding', 'addplot_embedding', 'basemap_waveform', 'addplot_waveform']
+
+
+def test_get_map_xy_seeds_cache_and_persistence(fake_api, tmp_path):
+    fake_server(fake_api, xy={'mapNo': 3, 'nRecord': 1, 'nDimension': 16, 'processMethod': 'embedding'})
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    client.map_schemas = MapSchemaCache(str(tmp_path / "schemas.json"))
+    client.get_map_xy(3)
+    assert client.map_schemas.get(3) == {'processMethod': 'embedding', 'nDimension': 16}
+    assert client.addplot_embedding(np.zeros((2, 8)), mapNo=3) is None
+    assert MapSchemaCache(str(tmp_path / "schemas.json")).get(3)['nDimension'] == 16
+
+
+def test_cache_file_is_replaced_atomically(tmp_path, monkeypatch, capsys):
+    path = tmp_path / "nested" / "schemas.json"
+    cache = MapSchemaCache(str(path))
+    cache.put(1, {'processMethod': 'dataframe'})
+    assert MapSchemaCache(str(path)).get(1) == {'processMethod': 'dataframe'}
+
+    # 置き換えに失敗しても前回の内容が残り、一時ファイルは消える
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr("toorpia.utils.files.os.replace", fail)
+    cache.put(2, {'processMethod': 'embedding'})
+    assert "could not write map schema cache" in capsys.readouterr().out
+    assert MapSchemaCache(str(path)).get(2) is None
+    assert [p.name for p in path.parent.iterdir()] == ["schemas.json"]
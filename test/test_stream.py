@@ -0,0 +1,75 @@
+"""addplot_stream() の単体テスト（サーバー不要・オフラインで実行可能）"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def fake_server(fake_api, delays):
+    """チャンクの先頭の値ごとに異なる処理時間をとる擬似サーバー（同時実行数を記録する）"""
+    state = {'active': 0, 'max_active': 0, 'lock': threading.Lock()}
+
+    def fake_request(method, url, **kwargs):
+        with state['lock']:
+            state['active'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+        try:
+            values = [row[0] for row in kwargs['json']['data']]
+            time.sleep(delays.get(int(values[0]), 0.0))
+            return FakeResponse(200, {'resdata': [[v, 0.0] for v in values], 'addPlotNo': int(values[0]),
+                                      'abnormalityStatus': 'normal', 'abnormalityScore': 0.9})
+        finally:
+            with state['lock']:
+                state['active'] -= 1
+
+    fake_api(fake_request)
+    return state
+
+
+def test_stream_yields_in_order_with_bounded_concurrency(fake_api):
+    # 先に投入したチャンクほど遅く終わるようにしても、結果は入力順に返る
+    state = fake_server(fake_api, {0: 0.15, 10: 0.10, 20: 0.05})
+    pulled = []
+
+    def chunks():
+        for i in range(6):
+            pulled.append(i)
+            yield pd.DataFrame({'x': np.arange(i * 10, i * 10 + 10, dtype=float)})
+
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    results = []
+    for result in client.addplot_stream(chunks(), mapNo=3, max_in_flight=2):
+        # バックプレッシャー: 読み込み済みで未返却のチャンクは max_in_flight + 1 件以下
+        assert len(pulled) - len(results) <= 3
+        results.append(result)
+    assert [r['addPlotNo'] for r in results] == [0, 10, 20, 30, 40, 50]
+    np.testing.assert_allclose(results[2]['xyData'][:, 0], np.arange(20, 30))
+    assert state['max_active'] <= 2
+
+
+def test_stream_can_be_closed_early(fake_api):
+    fake_server(fake_api, {})
+    pulled = []
+
+    def chunks():
+        for i in range(100):
+            pulled.append(i)
+            yield pd.DataFrame({'x': [float(i)]})
+
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    stream = client.addplot_stream(chunks(), mapNo=3, max_in_flight=2)
+    assert next(stream)['addPlotNo'] == 0
+    stream.close()
+    assert len(pulled) <= 3
+
+
+def test_stream_requires_a_map():
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    assert list(client.addplot_stream(iter([pd.DataFrame({'x': [1.0]})]))) == []
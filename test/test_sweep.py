@@ -0,0 +1,129 @@
+"""addplot_sweep() とパラメータキャッシュの単体テスト（サーバー不要・オフラインで実行可能）"""
+import gzip
+import itertools
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+from toorpia.sweep import SweepCache, expand_grid
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+class FakeAsyncServer:
+    """非同期ジョブモードの擬似サーバー（ジョブは2回目の問い合わせで完了する）"""
+
+    def __init__(self, fake_api, monkeypatch):
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.submitted = []
+        self.uploads = []
+        self.max_active = 0
+        self.ids = itertools.count(1)
+        fake_api(self.request)
+        monkeypatch.setattr("toorpia.job.time.sleep", lambda s: None)
+
+    def request(self, method, url, **kwargs):
+        with self.lock:
+            if '/jobs/' in url:
+                job = self.jobs[url.rsplit('/', 1)[1]]
+                job['polls'] += 1
+                if job['polls'] < 2:
+                    return FakeResponse(200, {'status': 'running'})
+                del self.jobs[url.rsplit('/', 1)[1]]
+                return FakeResponse(200, {'status': 'done', 'httpStatus': 200, 'result': job['result']})
+            assert kwargs['params'] == {'async': 'true'}
+            body = json.loads(gzip.decompress(kwargs['data']))
+            self.submitted.append(body)
+            self.uploads.append(kwargs['data'])
+            threshold = body.get('detabn_threshold', 0.0)
+            resolution = body.get('identnaParams', {}).get('resolution', 0)
+            job_id = f"job_{next(self.ids)}"
+            self.jobs[job_id] = {'polls': 0, 'result': {
+                'resdata': [[0.0, 0.0]] * len(body['data']), 'addPlotNo': len(self.submitted),
+                'abnormalityStatus': 'abnormal' if threshold > 0.3 else 'normal',
+                'abnormalityScore': resolution / 1000 + threshold,
+                'diagnosticScore': {'compositeStatus': 'warning' if threshold > 0.3 else 'normal',
+                                    'detabn': {'status': 'abnormal' if threshold > 0.3 else 'normal'},
+                                    'distance': {'normalizedDistance': 1.5, 'meanDistance': 0.3}},
+            }}
+            self.max_active = max(self.max_active, len(self.jobs))
+            return FakeResponse(202, {'jobId': job_id})
+
+
+def test_expand_grid():
+    combos = expand_grid({'detabn_threshold': [0.1, 0.5], 'identna_resolution': np.array([50, 100])})
+    assert combos == [{'detabn_threshold': 0.1, 'identna_resolution': 50},
+                      {'detabn_threshold': 0.1, 'identna_resolution': 100},
+                      {'detabn_threshold': 0.5, 'identna_resolution': 50},
+                      {'detabn_threshold': 0.5, 'identna_resolution': 100}]
+    assert type(combos[1]['identna_resolution']) is int
+    with pytest.raises(ValueError):
+        expand_grid({'unknown_param': [1]})
+
+
+def test_sweep_runs_grid_as_async_jobs_under_quota(fake_api, monkeypatch):
+    server = FakeAsyncServer(fake_api, monkeypatch)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    df = pd.DataFrame({'a': np.arange(5, dtype=float)})
+    grid = {'identna_resolution': [50, 100, 200], 'detabn_threshold': [0.1, 0.3, 0.5, 0.7]}
+    table = client.addplot_sweep(df, grid, mapNo=9, max_active=3, detabn_max_window=1)
+
+    assert len(table) == 12 and table['ok'].all() and not table['cached'].any()
+    assert server.max_active <= 3
+    assert all(body['mapNo'] == 9 and body['detabn_max_window'] == 1 for body in server.submitted)
+    row = table[(table['identna_resolution'] == 200) & (table['detabn_threshold'] == 0.5)].iloc[0]
+    assert row['abnormalityStatus'] == 'abnormal'
+    assert row['abnormalityScore'] == pytest.approx(0.7)
+    assert row['compositeStatus'] == 'warning'
+    assert row['normalizedDistance'] == 1.5
+
+
+def test_sweep_encodes_data_once_and_sends_parameters_in_the_body(fake_api, monkeypatch):
+    server = FakeAsyncServer(fake_api, monkeypatch)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    dumps = []
+    encode = json.dumps
+    monkeypatch.setattr("toorpia.client.json.dumps",
+                        lambda obj, **kwargs: dumps.append(obj) or encode(obj, **kwargs))
+    df = pd.DataFrame({'a': [1.0, 2.0, 1.0]})
+    table = client.addplot_sweep(df, {'detabn_threshold': [0.1, 0.5, 0.9], 'identna_resolution': [50]},
+                                 mapNo=2, dedupe=True, detabn_max_window=3)
+
+    assert table['ok'].all()
+    # 行データを含むボディのエンコードは1回だけで、組み合わせごとのフィールドはボディに入る
+    assert sum(1 for obj in dumps if isinstance(obj, dict) and 'columns' in obj) == 1
+    assert sorted(body['detabn_threshold'] for body in server.submitted) == [0.1, 0.5, 0.9]
+    assert all(body['mapNo'] == 2 and body['identnaParams'] == {'resolution': 50}
+               and body['detabn_max_window'] == 3 for body in server.submitted)
+    uploads = [gzip.decompress(upload) for upload in server.uploads]
+    prefix = uploads[0][:uploads[0].index(b'"identnaParams"')]
+    assert all(upload.startswith(prefix) for upload in uploads)
+    assert all(len(body['data']) == 2 for body in server.submitted)
+
+
+def test_sweep_reuses_cached_combinations(fake_api, monkeypatch, tmp_path):
+    server = FakeAsyncServer(fake_api, monkeypatch)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    df = pd.DataFrame({'a': np.arange(5, dtype=float)})
+    path = str(tmp_path / "sweep.json")
+    client.addplot_sweep(df, {'detabn_threshold': [0.1, 0.5]}, mapNo=1, cache=path)
+    assert len(server.submitted) == 2
+
+    # グリッドを広げると差分だけ投入される（ファイルのキャッシュは別インスタンスでも使える）
+    table = toorPIA(api_key="dummy_api_key", api_url="http://a:3000").addplot_sweep(
+        df, {'detabn_threshold': [0.1, 0.5, 0.9]}, mapNo=1, cache=path)
+    assert len(server.submitted) == 3
+    assert table['cached'].tolist() == [True, True, False]
+    assert len(SweepCache(path)) == 3
+
+    # データが変わればキャッシュは使われない
+    client.addplot_sweep(df + 1, {'detabn_threshold': [0.1]}, mapNo=1)
+    assert len(server.submitted) == 4
+    client.addplot_sweep(df + 1, {'detabn_threshold': [0.1]}, mapNo=1)
+    assert len(server.submitted) == 4
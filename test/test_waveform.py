@@ -0,0 +1,413 @@
+"""クライアント側の mkfftSeg 特徴量の抽出（toorpia.waveform）の単体テスト（サーバー不要・オフラインで実行可能）"""
+import gzip
+import struct
+import wave
+
+import numpy as np
+import pytest
+
+from toorpia.client import toorPIA
+from toorpia import waveform
+from toorpia.waveform import (MKFFTSEG_DEFAULTS, downmix, extract_features, frame_signal, inspect_waveform_file,
+                              mkfftseg_features, preprocess_waveform, read_wav, read_waveform, resample,
+                              validate_waveform_files, wav_format, wav_windows)
+
+from .conftest import FakeResponse
+
+pd = pytest.importorskip("pandas")
+
+
+def tone(frequency, seconds=1.0, rate=8000, amplitude=0.5):
+    t = np.arange(int(seconds * rate)) / rate
+    return amplitude * np.sin(2 * np.pi * frequency * t)
+
+
+def write_pcm16(path, samples, rate=8000):
+    samples = np.atleast_2d(np.asarray(samples).T).T
+    with wave.open(str(path), 'wb') as w:
+        w.setnchannels(samples.shape[1])
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+
+
+def write_wav(path, payload, code, bits, channels=1, rate=8000):
+    align = max(channels * bits // 8, 1)
+    fmt = struct.pack('<HHIIHH', code, channels, rate, rate * align, align, bits)
+    body = b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'LIST' + struct.pack('<I', 3) + b'abc\x00' + \
+        b'data' + struct.pack('<I', len(payload)) + payload
+    path.write_bytes(b'RIFF' + struct.pack('<I', len(body)) + body)
+
+
+def test_segmentation_follows_window_and_overlap():
+    frames, step = frame_signal(np.arange(10000.0), 1024, 50.0)
+    assert step == 512 and frames.shape == (1 + (10000 - 1024) // 512, 1024)
+    assert frames[3, 0] == 3 * 512 and not frames.flags.writeable
+    frames, step = frame_signal(np.arange(10000.0), 1000, 75.0)
+    assert step == 250 and frames.shape[0] == 37
+    # 窓より短い波形は 0 で埋めた1区間
+    frames, _ = frame_signal(np.ones(100), 256, 50.0)
+    assert frames.shape == (1, 256) and frames[0, 100:].sum() == 0
+
+
+def test_tone_peak_band_limits_and_averaging():
+    rate, wl = 8000, 1024
+    signal = tone(1000.0, rate=rate) + tone(3000.0, rate=rate, amplitude=0.4)
+    features, frequencies, starts = mkfftseg_features(signal, rate, wl=wl, ol=50.0, nm=1)
+    assert features.shape == (len(starts), wl // 2 + 1) and frequencies[1] == rate / wl
+    peaks = frequencies[np.argsort(features.mean(axis=0))[-2:]]
+    assert sorted(peaks) == [1000.0, 3000.0]
+    # 振幅 A の正弦波のピークは A（ビンの中心に乗る周波数）
+    assert features[:, np.argmin(np.abs(frequencies - 1000.0))].mean() == pytest.approx(0.5, rel=1e-3)
+
+    band, band_frequencies, _ = mkfftseg_features(signal, rate, wl=wl, hp=500.0, lp=2000.0, nm=1)
+    assert band_frequencies.min() >= 500.0 and band_frequencies.max() <= 2000.0
+    assert band.max() == pytest.approx(0.5, rel=1e-3)
+    averaged, centers, _ = mkfftseg_features(signal, rate, wl=wl, hp=500.0, lp=2000.0, nm=4)
+    assert averaged.shape[1] == band.shape[1] // 4
+    assert np.allclose(averaged, band[:, :averaged.shape[1] * 4].reshape(len(band), -1, 4).mean(axis=2))
+    assert np.allclose(centers, band_frequencies[:averaged.shape[1] * 4].reshape(-1, 4).mean(axis=1))
+    # nm=0 は次元数を AUTO_FEATURE_BINS 以下にする
+    auto, _, _ = mkfftseg_features(signal, rate, wl=4096)
+    assert auto.shape[1] <= 512
+    hamming, _, _ = mkfftseg_features(signal, rate, wl=wl, wf='hamming', nm=1)
+    assert not np.allclose(hamming, features)
+    with pytest.raises(ValueError):
+        mkfftseg_features(signal, rate, wl=wl, wf='blackman')
+    with pytest.raises(ValueError):
+        mkfftseg_features(signal, rate, wl=wl, hp=5000.0)
+
+
+def test_wav_encodings_and_csv_columns(tmp_path):
+    samples = np.array([0.0, 0.5, -0.5, -1.0])
+    write_pcm16(tmp_path / "pcm16.wav", np.column_stack([samples, samples / 2]))
+    data, rate = read_wav(str(tmp_path / "pcm16.wav"))
+    assert rate == 8000 and data.shape == (4, 2) and np.allclose(data[:, 0], samples, atol=1e-4)
+
+    int24 = (samples * (1 << 23)).clip(-(1 << 23), (1 << 23) - 1).astype('<i4').view('u1').reshape(-1, 4)[:, :3]
+    write_wav(tmp_path / "pcm24.wav", int24.tobytes(), 1, 24)
+    assert np.allclose(read_wav(str(tmp_path / "pcm24.wav"))[0][:, 0], samples)
+    write_wav(tmp_path / "float.wav", samples.astype('<f4').tobytes(), 3, 32)
+    assert wav_format(str(tmp_path / "float.wav"))['dataSize'] == 16
+    assert np.allclose(read_wav(str(tmp_path / "float.wav"))[0][:, 0], samples)
+    write_wav(tmp_path / "adpcm.wav", b'\x00' * 16, 2, 4)
+    with pytest.raises(ValueError):
+        read_wav(str(tmp_path / "adpcm.wav"))
+
+    pd.DataFrame({'time': np.arange(4), 'value': samples}).to_csv(tmp_path / "signal.csv", index=False)
+    signal, rate = read_waveform(str(tmp_path / "signal.csv"), data_index=2, sample_rate=1000)
+    assert rate == 1000 and np.allclose(signal, samples)
+
+
+def test_wav_windows_are_views_of_one_mapping(tmp_path):
+    rate = 1000
+    samples = np.column_stack([np.linspace(-1, 1, 10500), np.linspace(1, -1, 10500)])
+    write_pcm16(tmp_path / "long.wav", samples, rate=rate)
+    windows = wav_windows(str(tmp_path / "long.wav"), window_seconds=4.0, overlap_seconds=1.0)
+    assert [(w.start, w.duration) for w in windows] == [(0.0, 4.0), (3.0, 4.0), (6.0, 4.0), (9.0, 1.5)]
+    assert np.shares_memory(windows[0].data, windows[1].data) and not windows[1].data.flags.owndata
+    assert np.allclose(windows[1].samples(), samples[3000:7000], atol=1e-4)
+    assert len(wav_windows(str(tmp_path / "long.wav"), 4.0, 1.0, drop_partial=True)) == 3
+
+    # 区間はそのまま WAV ファイルとして読める（巻き戻して読み直せる）
+    stream = windows[3].open()
+    stream.read(10)
+    stream.seek(0)
+    with wave.open(stream) as w:
+        assert (w.getnchannels(), w.getframerate(), w.getnframes()) == (2, rate, 1500)
+        frames = np.frombuffer(w.readframes(1500), dtype='<i2').reshape(-1, 2) / 32768.0
+    assert np.allclose(frames, samples[9000:], atol=1e-4)
+    assert windows[3].filename == "long@9s.wav"
+    with pytest.raises(ValueError):
+        wav_windows(str(tmp_path / "long.wav"), 1.0, 1.0)
+
+
+def test_batch_validation_reads_headers_and_fails_on_inconsistencies(tmp_path):
+    paths = []
+    for i in range(12):
+        path = tmp_path / f"ok{i}.wav"
+        write_pcm16(path, np.zeros((4000 + 1000 * i, 1 + i % 2)))
+        paths.append(str(path))
+    pd.DataFrame({'t': [0, 1], 'v': [0.1, 0.2]}).to_csv(tmp_path / "vib.csv", index=False)
+    summary = validate_waveform_files(paths + [str(tmp_path / "vib.csv")], data_index=2, max_workers=4)
+    assert (summary['files'], summary['wavFiles'], summary['csvFiles']) == (13, 12, 1)
+    assert summary['sampleRates'] == [8000] and summary['channels'] == [1, 2] and summary['bitsPerSample'] == [16]
+    assert summary['totalDurationSeconds'] == pytest.approx(sum(4000 + 1000 * i for i in range(12)) / 8000)
+    assert [d['path'] for d in summary['details']] == paths + [str(tmp_path / "vib.csv")]
+
+    # 途中で切れたファイル（data チャンクのサイズより短い）
+    truncated = tmp_path / "truncated.wav"
+    truncated.write_bytes((tmp_path / "ok3.wav").read_bytes()[:-100])
+    with pytest.raises(ValueError, match="truncated"):
+        validate_waveform_files(paths + [str(truncated)])
+    # サンプリング周波数の違うファイル
+    write_pcm16(tmp_path / "fast.wav", np.zeros(100), rate=16000)
+    with pytest.raises(ValueError, match="16000 Hz"):
+        validate_waveform_files(paths[:3] + [str(tmp_path / "fast.wav")])
+    with pytest.raises(ValueError, match="basemap"):
+        validate_waveform_files([str(tmp_path / "fast.wav")], sample_rates=[8000])
+    (tmp_path / "noise.wav").write_bytes(b"not a wav file")
+    with pytest.raises(ValueError, match="RIFF"):
+        validate_waveform_files(paths + [str(tmp_path / "noise.wav")])
+    with pytest.raises(ValueError, match="column 3"):
+        inspect_waveform_file(str(tmp_path / "vib.csv"), data_index=3)
+    with pytest.raises(ValueError, match="cannot read"):
+        inspect_waveform_file(str(tmp_path / "missing.wav"))
+    # 圧縮形式の長さは fact チャンクがなければわからない
+    write_wav(tmp_path / "adpcm.wav", b'\x00' * 64, 2, 4)
+    assert inspect_waveform_file(str(tmp_path / "adpcm.wav"))['durationSeconds'] is None
+
+
+def spectrum_peak(signal, rate, frequency, wl=4800):
+    """信号の frequency Hz 付近の振幅（mkfftseg_features の区間の平均。48 kHz では 10 Hz ごとのビン）"""
+    features, frequencies, _ = mkfftseg_features(signal, rate, wl=wl, ol=50.0, nm=1)
+    spectrum = features.mean(axis=0)
+    near = np.abs(frequencies - frequency) <= 2 * rate / wl
+    return spectrum[near].max() if near.any() else 0.0
+
+
+def test_downmix_and_resample_preserve_the_spectrum(tmp_path, monkeypatch):
+    # 96 kHz ステレオ: 両チャンネルの 1 kHz と、48 kHz では折り返す 30 kHz の成分
+    rate = 96000
+    left = tone(1000.0, seconds=1.0, rate=rate, amplitude=0.5) + tone(30000.0, seconds=1.0, rate=rate, amplitude=0.2)
+    right = tone(1000.0, seconds=1.0, rate=rate, amplitude=0.3) + tone(5000.0, seconds=1.0, rate=rate, amplitude=0.1)
+    write_pcm16(tmp_path / "stereo.wav", np.column_stack([left, right]), rate=rate)
+
+    window = preprocess_waveform(str(tmp_path / "stereo.wav"), 48000)
+    assert window.filename == "stereo.wav" and window.sample_rate == 48000 and window.info['channels'] == 1
+    mono = window.samples()[:, 0]
+    assert len(mono) == 48000
+    assert spectrum_peak(mono, 48000, 1000.0) == pytest.approx(0.4, rel=0.01)
+    assert spectrum_peak(mono, 48000, 5000.0) == pytest.approx(0.05, rel=0.02)
+    # 30 kHz は捨てられ、18 kHz（48 kHz での折り返し先）にも現れない
+    assert spectrum_peak(mono, 48000, 18000.0) < 1e-3
+    # 1 始まりのチャンネル番号で片方だけを使う
+    right_only = preprocess_waveform(str(tmp_path / "stereo.wav"), 48000, channel=2).samples()[:, 0]
+    assert spectrum_peak(right_only, 48000, 1000.0) == pytest.approx(0.3, rel=0.01)
+    assert spectrum_peak(right_only, 48000, 5000.0) == pytest.approx(0.1, rel=0.02)
+    with pytest.raises(ValueError, match="out of range"):
+        downmix(np.zeros((4, 2)), channel=3)
+
+    # 周波数の比が整数でない変換（44.1 kHz -> 48 kHz）をブロックごとの FFT で行っても、
+    # 1回の FFT と同じく正弦波をそのまま再現する
+    signal = tone(440.0, seconds=2.0, rate=44100, amplitude=0.8)
+    whole = resample(signal, 44100, 48000)
+    monkeypatch.setattr(waveform, "FFT_BLOCK_SAMPLES", 20000)
+    monkeypatch.setattr(waveform, "RESAMPLE_MARGIN", 4000)
+    blocks = resample(signal, 44100, 48000)
+    expected = tone(440.0, seconds=2.0, rate=48000, amplitude=0.8)
+    assert len(whole) == len(blocks) == len(expected) == 96000
+    inner = slice(2000, -2000)  # 波形の両端は周期の境目の影響を受ける
+    assert np.abs(whole[inner] - expected[inner]).max() < 1e-3
+    assert np.abs(blocks[inner] - expected[inner]).max() < 2e-3
+    assert spectrum_peak(blocks, 48000, 440.0) == pytest.approx(spectrum_peak(whole, 48000, 440.0), rel=1e-3)
+    # 周波数を下げる変換もブロックの境目で食い違わない（16 bit に量子化した後で比べる）
+    decoded, decode = [], waveform._decode
+    monkeypatch.setattr(waveform, "_decode", lambda raw, *args: decoded.append(len(raw)) or decode(raw, *args))
+    blocked = preprocess_waveform(str(tmp_path / "stereo.wav"), 48000)
+    # 元のファイルは一度に FFT_BLOCK_SAMPLES 個のサンプル（16 bit）ずつしか読まない
+    assert len(decoded) > 1 and max(decoded) <= 20000 * 2
+    assert np.abs(blocked.samples()[:, 0] - mono)[2000:-2000].max() < 1e-3
+
+
+def fake_server(fake_api):
+    """アップロードされたエンドポイントと CSV の行を記録する擬似サーバー"""
+    uploads = []
+
+    def fake_request(method, url, **kwargs):
+        if method == 'get':
+            return FakeResponse(200, {'processMethod': 'waveform', 'xy': [[0.0, 0.0]]})
+        handle = kwargs['files'][0][1]
+        raw = handle.read()
+        lines = (gzip.decompress(raw) if handle.name.endswith('.gz') else raw).splitlines()
+        uploads.append((url.rsplit('/', 1)[-1], kwargs['data'], lines))
+        if '/data/basemap_' in url:
+            return FakeResponse(200, {'resdata': {'baseXyData': [[0.0, 0.0]], 'mapNo': 31}})
+        return FakeResponse(200, {'resdata': [[0.0, 0.0]], 'addPlotNo': 1, 'abnormalityStatus': 'normal'})
+
+    fake_api(fake_request)
+    return uploads
+
+
+def test_client_uploads_features_and_falls_back_to_raw(fake_api, tmp_path):
+    uploads = fake_server(fake_api)
+    write_pcm16(tmp_path / "base.wav", tone(1000.0, seconds=2.0))
+    write_pcm16(tmp_path / "new.wav", tone(1500.0))
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+
+    result = client.basemap_waveform([str(tmp_path / "base.wav")], mkfftseg_wl=1024, mkfftseg_nm=8,
+                                     vector_normalization=False, label="pump", client_features=True)
+    endpoint, form, lines = uploads[-1]
+    assert endpoint == 'basemap_embedding' and form['l2_normalization'] == 'false' and form['label'] == 'pump'
+    assert result['waveformFeatures']['segments'] == len(lines) - 1 == 1 + (16000 - 1024) // 512
+    assert result['waveformFeatures']['dimensions'] == 513 // 8
+    assert lines[1].startswith(b'base.wav@0s,')
+    entry = client.map_schemas.get(31)
+    assert entry['processMethod'] == 'embedding' and entry['waveformFeatures']['wl'] == 1024
+
+    # 同じマップへの addplot_waveform は同じ設定で特徴量を作って送る
+    added = client.addplot_waveform([str(tmp_path / "new.wav")], detabn_max_window=3)
+    endpoint, form, lines = uploads[-1]
+    assert endpoint == 'addplot_embedding' and form['mapNo'] == '31' and '"maxWindow": 3' in form['detabn_options']
+    assert added['waveformFeatures']['dimensions'] == 513 // 8 and len(lines) - 1 == 1 + (8000 - 1024) // 512
+
+    # 読めない WAV の形式: 特徴量のマップへの addplot は送らずにエラー、ベースマップは元のファイルを送る
+    write_wav(tmp_path / "adpcm.wav", b'\x00' * 64, 2, 4)
+    assert client.addplot_waveform([str(tmp_path / "adpcm.wav")], mapNo=31) is None
+    assert client.basemap_waveform([str(tmp_path / "adpcm.wav")], client_features=True) is not None
+    assert uploads[-1][0] == 'basemap_waveform'
+
+
+def test_features_require_one_sample_rate_and_a_recorded_map(fake_api, tmp_path, capsys):
+    write_pcm16(tmp_path / "a.wav", tone(1000.0))
+    write_pcm16(tmp_path / "b.wav", tone(1000.0), rate=16000)
+    options = dict(MKFFTSEG_DEFAULTS, wl=1024, sr=8000)
+    assert len(extract_features([str(tmp_path / "a.wav")], options)) == 1 + (8000 - 1024) // 512
+    with pytest.raises(ValueError, match="16000 Hz"):
+        extract_features([str(tmp_path / "a.wav"), str(tmp_path / "b.wav")], options)
+
+    # 別のプロセスで特徴量から作ったマップ: 設定が分からないので生の WAV を送らずにエラー
+    requests_seen = []
+
+    def fake_request(method, url, **kwargs):
+        requests_seen.append((method, url.split(':3000', 1)[-1]))
+        return FakeResponse(200, {'processMethod': 'embedding', 'nDimension': 64, 'xy': [[0.0, 0.0]]})
+
+    fake_api(fake_request)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    assert client.addplot_waveform([str(tmp_path / "a.wav")], mapNo=31) is None
+    assert requests_seen == [('get', '/maps/31/xy')]
+    assert "mkfftSeg settings" in capsys.readouterr().out
+
+
+def test_client_sends_windows_concurrently_with_offsets(fake_api, tmp_path):
+    import threading
+    import time
+
+    active, peak, uploads = [0], [0], []
+    lock = threading.Lock()
+
+    def fake_request(method, url, **kwargs):
+        if method == 'get':
+            return FakeResponse(200, {'processMethod': 'waveform', 'xy': [[0.0, 0.0]]})
+        handle = kwargs['files'][0][1]
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+            uploads.append((handle.name, len(handle.read()), kwargs['data']['mapNo']))
+        status = 'abnormal' if handle.name == "long@20s.wav" else 'normal'
+        return FakeResponse(200, {'resdata': [[0.0, 0.0]], 'addPlotNo': len(uploads), 'abnormalityStatus': status})
+
+    fake_api(fake_request)
+    write_pcm16(tmp_path / "long.wav", tone(50.0, seconds=30.0, rate=1000), rate=1000)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    results = client.addplot_waveform_windows(str(tmp_path / "long.wav"), window_seconds=10.0,
+                                              overlap_seconds=5.0, mapNo=8, max_workers=3)
+    assert [(r['window'], r['startSeconds'], r['endSeconds']) for r in results] == \
+        [(0, 0.0, 10.0), (1, 5.0, 15.0), (2, 10.0, 20.0), (3, 15.0, 25.0), (4, 20.0, 30.0)]
+    assert [r['abnormalityStatus'] for r in results] == ['normal'] * 4 + ['abnormal']
+    assert peak[0] > 1 and {size for _, size, _ in uploads} == {44 + 2 * 10000}
+    assert {map_no for _, _, map_no in uploads} == {'8'}
+    assert client.addplot_waveform_windows(str(tmp_path / "missing.wav"), mapNo=8) is None
+
+
+def test_client_validates_whole_batch_before_upload(fake_api, tmp_path, capsys):
+    uploads = fake_server(fake_api)
+    paths = []
+    for i in range(5):
+        write_pcm16(tmp_path / f"ok{i}.wav", tone(440.0, seconds=2.0))
+        paths.append(str(tmp_path / f"ok{i}.wav"))
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    assert client.basemap_waveform(paths) is not None and len(uploads) == 1
+    assert client.waveformValidation['totalDurationSeconds'] == pytest.approx(10.0)
+    assert "5 waveform file(s): 10.0 s of audio" in capsys.readouterr().out
+
+    write_pcm16(tmp_path / "other.wav", tone(440.0), rate=16000)
+    assert client.addplot_waveform(paths + [str(tmp_path / "other.wav")], preflight=False) is None
+    assert client.basemap_waveform(paths + [str(tmp_path / "other.wav")]) is None
+    assert len(uploads) == 1
+
+
+def test_client_features_reject_mixed_rates_before_upload(fake_api, tmp_path):
+    uploads = fake_server(fake_api)
+    write_pcm16(tmp_path / "a.wav", tone(1000.0))
+    write_pcm16(tmp_path / "b.wav", tone(1000.0), rate=16000)
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    mixed = [str(tmp_path / "a.wav"), str(tmp_path / "b.wav")]
+    assert client.basemap_waveform(mixed, mkfftseg_wl=1024, client_features=True) is None
+    assert uploads == []
+
+    assert client.basemap_waveform(mixed[:1], mkfftseg_wl=1024, client_features=True) is not None
+    assert client.map_schemas.get(31)['waveformFeatures']['sr'] == 8000
+    del uploads[:]
+    assert client.addplot_waveform(mixed, mapNo=31) is None
+    assert client.addplot_waveform(mixed[1:], mapNo=31) is None
+    assert uploads == []
+
+
+def test_client_reads_each_header_once_before_opening_files(fake_api, tmp_path, monkeypatch):
+    fake_server(fake_api)
+    paths = []
+    for i in range(3):
+        write_pcm16(tmp_path / f"ok{i}.wav", tone(440.0))
+        paths.append(str(tmp_path / f"ok{i}.wav"))
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+    assert client.basemap_waveform(paths) is not None
+
+    events = []
+    wav_format = waveform.wav_format
+    monkeypatch.setattr(waveform, "wav_format", lambda path: events.append(('header', path)) or wav_format(path))
+    monkeypatch.setattr("toorpia.client.open", lambda path, mode='r': events.append(('open', path)) or open(path, mode),
+                        raising=False)
+    assert client.addplot_waveform(paths) is not None
+    # 事前検証もヘッダの並行検証の結果を使い、すべてのヘッダを読んでからファイルを開く
+    assert sorted(path for kind, path in events if kind == 'header') == paths
+    assert [kind for kind, _ in events] == ['header'] * 3 + ['open'] * 3
+
+    events.clear()
+    write_pcm16(tmp_path / "other.wav", tone(440.0), rate=16000)
+    assert client.addplot_waveform(paths + [str(tmp_path / "other.wav")], preflight=False) is None
+    assert not [path for kind, path in events if kind == 'open']
+
+
+def test_client_preprocesses_before_upload_and_addplot_inherits(fake_api, tmp_path, capsys):
+    uploads = []
+
+    def fake_request(method, url, **kwargs):
+        uploads.append((url.rsplit('/', 1)[-1], kwargs['data'], [handle.read() for _, handle in kwargs['files']]))
+        if '/data/basemap_' in url:
+            return FakeResponse(200, {'resdata': {'baseXyData': [[0.0, 0.0]], 'mapNo': 31}})
+        return FakeResponse(200, {'resdata': [[0.0, 0.0]], 'addPlotNo': 1, 'abnormalityStatus': 'normal'})
+
+    fake_api(fake_request)
+    write_pcm16(tmp_path / "base.wav", np.column_stack([tone(1000.0, rate=16000), tone(2000.0, rate=16000)]),
+                rate=16000)
+    write_pcm16(tmp_path / "mono.wav", tone(1000.0, rate=8000))
+    client = toorPIA(api_key="dummy_api_key", api_url="http://a:3000")
+
+    result = client.basemap_waveform([str(tmp_path / "base.wav"), str(tmp_path / "mono.wav")],
+                                     mkfftseg_sr=8000, preprocess=True)
+    assert result['mapNo'] == 31
+    endpoint, form, bodies = uploads[-1]
+    assert endpoint == 'basemap_waveform' and '"sr": 8000' in form['mkfftseg_options']
+    # ステレオ 16 kHz は 1チャンネル 8 kHz に変換し、すでに 1チャンネル 8 kHz のファイルはそのまま送る
+    assert [struct.unpack('<HI', body[22:28]) for body in bodies] == [(1, 8000), (1, 8000)]
+    assert bodies[0][-2 * 8000:] != bodies[1][-2 * 8000:] and len(bodies[0]) == 44 + 2 * 8000
+    assert bodies[1] == (tmp_path / "mono.wav").read_bytes()
+    stats = client.waveformPreprocessing
+    assert stats['converted'] == 1 and stats['inputBytes'] == 4 * 16000 and stats['uploadBytes'] == 2 * 8000
+    assert "Preprocessed 1 WAV file(s) to 1 channel at 8000 Hz" in capsys.readouterr().out
+    # ヘッダの検証は元のファイルについて行い、スキーマは変換後のサンプリング周波数を記録する
+    assert client.waveformValidation['files'] == 2 and client.waveformValidation['sampleRates'] == [8000, 16000]
+    entry = client.map_schemas.get(31)
+    assert entry['sampleRates'] == [8000] and entry['waveformPreprocess'] == {'channel': 'mean', 'sampleRate': 8000}
+
+    # 前処理して作ったマップへの addplot は指定しなくても同じ前処理をする（preflight も通る）
+    assert client.addplot_waveform([str(tmp_path / "base.wav")]) is not None
+    assert uploads[-1][2][0] == bodies[0]
+    assert client.addplot_waveform([str(tmp_path / "base.wav")], preprocess=False) is None
+    assert client.addplot_waveform([str(tmp_path / "missing.wav")]) is None
+    assert len(uploads) == 2
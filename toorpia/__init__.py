@@ -1,2 +1,13 @@
 from .client import toorPIA
-from .job import Job
\ No newline at end of file
+from .job import Job, AdaptivePolling
+from .local_scoring import LocalScorer
+from .normal_area import NormalAreaIndex
+from .scheduler import JobScheduler, ScheduledJob
+from .busy_retry import BusyRetryCoordinator
+from .cancellation import CancelToken, RequestCancelled
+from .microbatch import AddplotMicroBatcher
+from .monitor import WaveformMonitor
+from .projection import EmbeddingProjection
+from .sampling import select_rows
+from .schema import MapSchemaCache
+from .sweep import SweepCache
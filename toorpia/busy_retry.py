@@ -0,0 +1,74 @@
+import random
+import threading
+import time
+
+
+class BusyRetryCoordinator:
+    """503 (SERVER_BUSY) 再試行のタイミングをプロセス全体で調整する
+
+    多数のスレッドが同時に 503 を受けると、各自が Retry-After 秒だけ眠って同じ
+    瞬間に一斉に再送し、再びサーバーを混雑させてしまう。このクラスは全スレッド・
+    全クライアントインスタンスで共有され、以下の2つで再送を分散させる。
+
+    - ジッター: Retry-After 秒に 0〜(jitter × Retry-After) 秒のランダムな待ちを加える
+    - トークンバケット: 再送の許可を rate 件/秒（最大 burst 件まで一度に許可）に制限する。
+      バケットは GCRA（仮想スケジューリング）で実装しており、ループで待たずに
+      各再送の送信時刻を一度に決められる
+
+    Args:
+        rate (float or None): 再送を許可する平均レート（件/秒）。None でバケット無効
+        burst (int): 一度に許可できる再送の最大数（バケット容量）
+        jitter (float): Retry-After に対するランダムな追加待ちの割合（0 で無効）
+    """
+
+    def __init__(self, rate=1.0, burst=5, jitter=0.5):
+        self.rate = float(rate) if rate else None
+        self.burst = max(int(burst), 1)
+        self.jitter = max(float(jitter), 0.0)
+        self._lock = threading.Lock()
+        self._tat = 0.0  # GCRA の理論到着時刻 (theoretical arrival time)
+        self._waits = 0
+        self._total_wait = 0.0
+
+    def reserve(self, retry_after, deadline):
+        """次の再送までの待ち時間を予約する
+
+        Args:
+            retry_after (float): サーバーが指定した Retry-After 秒
+            deadline (float): time.monotonic() 基準の待ち時間上限
+
+        Returns:
+            float: 再送前に待つべき秒数。Retry-After だけで上限を超える場合は None
+                   （この場合は何も予約しない）
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now + retry_after > deadline:
+                return None
+            # 待ち時間は now からの相対値で計算する（絶対時刻の引き算による丸め誤差を避ける）
+            delay = retry_after
+            if self.jitter > 0:
+                delay += random.uniform(0, self.jitter * retry_after)
+            if self.rate is not None:
+                interval = 1.0 / self.rate
+                delay = max(delay, self._tat - (self.burst - 1) * interval - now)
+            # ジッターやバケットの分で上限を超える場合は上限ちょうどまで待つ
+            delay = min(delay, deadline - now)
+            if self.rate is not None:
+                self._tat = max(self._tat, now + delay) + interval
+            self._waits += 1
+            self._total_wait += delay
+            return delay
+
+    def stats(self):
+        """これまでに予約した再送待ちの件数と合計秒数を返す"""
+        with self._lock:
+            return {'waits': self._waits, 'totalWaitSeconds': self._total_wait}
+
+
+_default_coordinator = BusyRetryCoordinator()
+
+
+def get_default_coordinator():
+    """プロセス全体で共有される既定の BusyRetryCoordinator を返す"""
+    return _default_coordinator
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import requests
+
+
+class RequestCancelled(requests.exceptions.RequestException):
+    """CancelToken によってリクエスト（アップロード・再試行待ち）が中断された"""
+
+
+class CancelToken:
+    """別スレッドから処理を中断するためのトークン
+
+    クライアントのメソッドに cancel_token=token として渡すと、token.cancel() の
+    呼び出しで送信中の multipart アップロード / JSON ボディの送信、503 再試行の待ち、
+    Job.wait() のポーリング待ちが中断される。中断されたリクエストは
+    RequestCancelled（requests.exceptions.RequestException のサブクラス）として
+    扱われ、各メソッドの通常のネットワークエラー処理と一時ファイルの後始末が行われる。
+
+    Example:
+        token = CancelToken()
+        threading.Timer(10, token.cancel).start()
+        result = client.addplot_embedding(big_array, mapNo=12, cancel_token=token)
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def __repr__(self):
+        return f"<toorPIA CancelToken cancelled={self.cancelled}>"
+
+    def cancel(self):
+        """中断を要求する（何度呼んでもよい）"""
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise RequestCancelled("request cancelled")
+
+    def wait(self, timeout=None):
+        """最大 timeout 秒待つ。途中で中断された場合は True を返す"""
+        return self._event.wait(timeout)
+
+
+class _UploadAborted(Exception):
+    """送信中のボディの読み出しを打ち切ったことを _request に伝える内部例外
+
+    urllib3 は送信中の OSError（requests の例外を含む）を接続エラーに包み直すため、
+    OSError を継承しない例外で送出し、_request で RequestCancelled / Timeout に変換する。
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _CancellableBody:
+    """送信ブロックごとに中断要求と全体の期限を確認するリクエストボディ
+
+    requests / urllib3 はファイルライクなボディを read() でブロックごとに読みながら
+    送信するため、大きなアップロードでもブロック単位で打ち切れる。
+    """
+
+    def __init__(self, data, cancel_token=None, deadline=None):
+        self._data = memoryview(data)
+        self._pos = 0
+        self.cancel_token = cancel_token
+        self.deadline = deadline
+
+    def __len__(self):
+        return len(self._data)
+
+    def read(self, size=-1):
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            raise _UploadAborted('cancelled')
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise _UploadAborted('timeout')
+        end = len(self._data) if size is None or size < 0 else min(self._pos + size, len(self._data))
+        chunk = self._data[self._pos:end].tobytes()
+        self._pos = end
+        return chunk
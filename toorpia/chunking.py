@@ -0,0 +1,190 @@
+import numpy as np
+
+# addplot_chunked() の既定の1リクエストあたりの JSON ボディ上限（バイト）
+DEFAULT_MAX_CHUNK_BYTES = 8 * 1024 * 1024
+
+# 複合診断ステータスの深刻度順
+_COMPOSITE_SEVERITY = {'normal': 0, 'warning': 1, 'danger': 2}
+
+
+def frame_json(df):
+    """DataFrame を送信に使う JSON 文字列（orient='split'、日時は ISO 8601 の文字列）にする
+
+    日時を ISO 8601 にするのは、CSV でアップロードした場合と同じ表記にするため
+    （pandas の既定の epoch ミリ秒は非推奨）。
+    """
+    return df.to_json(orient='split', date_format='iso')
+
+
+def estimate_row_bytes(df, sample_rows=1000):
+    """DataFrame 1行あたりの JSON（frame_json）のおおよそのバイト数を見積もる
+
+    先頭と末尾から最大 sample_rows 行ずつを実際にシリアライズして平均をとる。
+    """
+    n = len(df)
+    if n == 0:
+        return 0.0
+    if n <= 2 * sample_rows:
+        sample = df
+    else:
+        sample = df.iloc[np.r_[0:sample_rows, n - sample_rows:n]]
+    header = len(frame_json(df.iloc[:0]))
+    return max(len(frame_json(sample)) - header, 1) / len(sample)
+
+
+def plan_chunks(df, max_rows=None, max_bytes=DEFAULT_MAX_CHUNK_BYTES):
+    """DataFrame を size-bounded なチャンクに分ける行範囲のリストを返す
+
+    Args:
+        df (pandas.DataFrame): 分割するデータ
+        max_rows (int, optional): 1チャンクの最大行数
+        max_bytes (int, optional): 1チャンクの JSON ボディの目安上限（バイト）。
+            見積もりの誤差を見込んで2割の余裕をとる
+
+    Returns:
+        list: (start, stop) の行範囲のリスト（元の行順）
+    """
+    n = len(df)
+    rows = n if n > 0 else 1
+    if max_bytes:
+        row_bytes = estimate_row_bytes(df)
+        if row_bytes > 0:
+            rows = min(rows, max(int(max_bytes / (row_bytes * 1.2)), 1))
+    if max_rows:
+        rows = min(rows, int(max_rows))
+    return [(start, min(start + rows, n)) for start in range(0, n, rows)]
+
+
+def _summarize_distances(distance, values):
+    """diagnosticScore['distance'] の集計値を点ごとの距離 values から計算し直す"""
+    distance['meanDistance'] = float(values.mean()) if len(values) else 0.0
+    distance['distanceStd'] = float(values.std()) if len(values) else 0.0
+    if distance.get('radiusOfGyration'):
+        distance['normalizedDistance'] = distance['meanDistance'] / distance['radiusOfGyration']
+    if distance.get('threshold') is not None and len(values):
+        distance['exceedanceRatio'] = float(np.mean(values > distance['threshold']))
+    return distance
+
+
+def _merge_distance(distances, counts):
+    """チャンクごとの diagnosticScore['distance'] を全点分の1つにまとめる"""
+    merged = dict(distances[0])
+    total = sum(counts)
+    rg = merged.get('radiusOfGyration')
+    per_point = [d.get('distancesPerPoint') for d in distances]
+    if all(p is not None for p in per_point):
+        values = np.concatenate([np.asarray(p, dtype=float) for p in per_point])
+        merged['distancesPerPoint'] = values.tolist()
+        normalized = [d.get('normalizedDistancesPerPoint') for d in distances]
+        if all(p is not None for p in normalized):
+            merged['normalizedDistancesPerPoint'] = [v for p in normalized for v in p]
+        _summarize_distances(merged, values)
+    else:
+        # 点ごとの値を返さない旧サーバー: 件数で重み付けした平均と合成分散でまとめる
+        means = np.array([d.get('meanDistance') or 0.0 for d in distances], dtype=float)
+        stds = np.array([d.get('distanceStd') or 0.0 for d in distances], dtype=float)
+        weights = np.asarray(counts, dtype=float) / total if total else np.zeros(len(counts))
+        mean = float(np.sum(weights * means))
+        std = float(np.sqrt(np.sum(weights * (stds ** 2 + (means - mean) ** 2))))
+        ratios = [d.get('exceedanceRatio') for d in distances]
+        if all(r is not None for r in ratios):
+            merged['exceedanceRatio'] = float(np.sum(weights * np.asarray(ratios, dtype=float)))
+        merged['meanDistance'] = mean
+        merged['distanceStd'] = std
+        if rg:
+            merged['normalizedDistance'] = mean / rg
+    statuses = [d.get('status') for d in distances]
+    merged['status'] = max(statuses, key=lambda s: _COMPOSITE_SEVERITY.get(s, -1))
+    return merged
+
+
+def merge_addplot_results(results):
+    """addplot_chunked() のチャンクごとの結果を、1回の addplot と同じ形の辞書にまとめる
+
+    - xyData と点ごとの距離（distancesPerPoint など）は元の行順に連結する
+    - abnormalityStatus はいずれかのチャンクが 'abnormal' なら 'abnormal'、
+      すべて 'normal' なら 'normal'、それ以外は 'unknown'
+    - abnormalityScore と diagnosticScore['detabn'] は最も正常度の低いチャンクのもの
+    - 距離の集計値（meanDistance 等）は全点から計算し直し、
+      compositeStatus / distance.status は最も深刻なものをとる
+
+    Args:
+        results (list): チャンク順の addplot の返り値（dict）のリスト
+
+    Returns:
+        dict: addplot と同じキーに addPlotNos（チャンクごとの追加プロット番号）と
+            chunks（チャンク数）を加えた辞書
+    """
+    xy = [np.asarray(r['xyData']).reshape(-1, 2) for r in results]
+    statuses = [r.get('abnormalityStatus') for r in results]
+    if 'abnormal' in statuses:
+        status = 'abnormal'
+    elif statuses and all(s == 'normal' for s in statuses):
+        status = 'normal'
+    else:
+        status = 'unknown'
+    scored = [r for r in results if r.get('abnormalityScore') is not None]
+    worst = min(scored, key=lambda r: r['abnormalityScore']) if scored else None
+
+    diagnostics = [r.get('diagnosticScore') for r in results]
+    diagnostic = None
+    if diagnostics and all(d for d in diagnostics):
+        diagnostic = dict(diagnostics[0])
+        if worst is not None and worst.get('diagnosticScore', {}).get('detabn') is not None:
+            diagnostic['detabn'] = worst['diagnosticScore']['detabn']
+        if all(d.get('distance') for d in diagnostics):
+            diagnostic['distance'] = _merge_distance([d['distance'] for d in diagnostics],
+                                                     [len(a) for a in xy])
+        composite = [d.get('compositeStatus') for d in diagnostics]
+        diagnostic['compositeStatus'] = max(composite, key=lambda s: _COMPOSITE_SEVERITY.get(s, -1))
+
+    return {
+        'xyData': np.concatenate(xy) if xy else np.empty((0, 2)),
+        'addPlotNo': results[-1].get('addPlotNo') if results else None,
+        'addPlotNos': [r.get('addPlotNo') for r in results],
+        'abnormalityStatus': status,
+        'abnormalityScore': worst['abnormalityScore'] if worst is not None else None,
+        'diagnosticScore': diagnostic,
+        'shareUrl': results[-1].get('shareUrl') if results else None,
+        'chunks': len(results),
+    }
+
+
+def split_addplot_result(result, sizes):
+    """1回の addplot の結果を、連結前の入力ごとの結果に分ける（merge_addplot_results の逆）
+
+    xyData と点ごとの距離（distancesPerPoint / normalizedDistancesPerPoint）は各入力の
+    行範囲で切り出し、距離の集計値はその点だけから計算し直す。detabn の判定
+    （abnormalityStatus / abnormalityScore / detabn / compositeStatus）はバッチ全体に
+    対するもので、点ごとには分けられないためそのまま共有する。
+
+    Args:
+        result (dict): addplot 系メソッドの返り値
+        sizes (list): 連結した各入力の行数（連結順）
+
+    Returns:
+        list: 入力ごとの結果の dict。各 dict には batchOffset（バッチ内の先頭行）と
+            batchRows（バッチ全体の行数）が加わる
+    """
+    xy = np.asarray(result['xyData']).reshape(-1, 2)
+    diagnostic = result.get('diagnosticScore')
+    distance = diagnostic.get('distance') if diagnostic else None
+    per_point = distance.get('distancesPerPoint') if distance else None
+    normalized = distance.get('normalizedDistancesPerPoint') if distance else None
+    parts = []
+    offset = 0
+    for size in sizes:
+        part = dict(result)
+        part['xyData'] = xy[offset:offset + size]
+        part['batchOffset'] = offset
+        part['batchRows'] = len(xy)
+        if distance is not None and per_point is not None:
+            part_distance = dict(distance)
+            values = np.asarray(per_point[offset:offset + size], dtype=float)
+            part_distance['distancesPerPoint'] = values.tolist()
+            if normalized is not None:
+                part_distance['normalizedDistancesPerPoint'] = list(normalized[offset:offset + size])
+            part['diagnosticScore'] = dict(diagnostic, distance=_summarize_distances(part_distance, values))
+        parts.append(part)
+        offset += size
+    return parts
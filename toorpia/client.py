@@ -2,37 +2,452 @@ import requests
 import json
 import os
 import base64
+import collections
+import contextlib
 import functools
+import inspect
+import threading
 import time
-from .config import API_URL
+from datetime import datetime
+from urllib3.exceptions import NewConnectionError
+from .busy_retry import get_default_coordinator
+from .cancellation import RequestCancelled, _CancellableBody, _UploadAborted
+from .chunking import DEFAULT_MAX_CHUNK_BYTES, estimate_row_bytes, frame_json, merge_addplot_results, plan_chunks
+from .config import API_URLS
+from .dedupe import collapse_duplicates, dedupe_stats, expand_addplot_result
+from .endpoints import EndpointPool
 from .job import Job
+from .local_scoring import LocalScorer, scoring_columns
+from .normal_area import DEFAULT_COVERAGE, NormalAreaIndex
+from .projection import EmbeddingProjection, ProjectionStore
+from .pruning import compact_attributes, reindex_options, zero_weight_columns
+from .quantization import FLOAT_FORMATS, QUANTIZATIONS, quantize, write_quantized_csv
+from .sampling import select_rows
+from .schema import MapSchemaCache, OptionInferenceCache, basemap_schema, check_addplot
+from .scheduler import JobScheduler
+from .sweep import SweepCache, expand_grid, fingerprint_data, parameter_hash, summarize_result
+from .waveform import (MKFFTSEG_DEFAULTS, WavWindow, extract_features, preprocess_waveform, validate_waveform_files,
+                       wav_format, wav_windows)
 from .utils.authentication import get_api_key
 import numpy as np
 import hashlib
 import glob
 
+# 既定のタイムアウト（秒）: (接続, 読み取り)。読み取りは同期実行の処理時間を含むため既定では制限しない
+# （従来どおり）。必要なら timeout= や TOORPIA_TIMEOUT で指定する
+DEFAULT_TIMEOUT = (30.0, None)
+
+# pre_authentication が各メソッドの呼び出しごとに受け付けるキーワード引数
+CALL_OPTIONS = ('timeout', 'total_timeout', 'cancel_token')
+
+# ジョブIDと発行したエンドポイントの対応を覚えておく件数の上限。対応はジョブの保持期限
+# （expiresAt）まで残し、上限を超えたときは期限切れのものから、次に古いものから消す
+JOB_ENDPOINTS_LIMIT = 100000
+
+
+def _parse_timeout(value):
+    """タイムアウト指定を requests に渡せる形（秒の float または (接続, 読み取り) の tuple）にする
+
+    "30" や "10,600" のような文字列（環境変数 TOORPIA_TIMEOUT 用）も受け付ける。
+    tuple の要素に None を指定すると、その段階のタイムアウトは無効になる。
+    """
+    if isinstance(value, str):
+        parts = [part.strip() for part in value.split(',')]
+        value = tuple(None if part.lower() in ('', 'none') else float(part) for part in parts)
+        if len(value) == 1:
+            value = value[0]
+    if isinstance(value, (list, tuple)):
+        if len(value) != 2:
+            raise ValueError("timeout must be a number or a (connect, read) pair")
+        return tuple(None if v is None else float(v) for v in value)
+    return None if value is None else float(value)
+
+
+def _rewind_files(files):
+    """requests の files 引数のファイルオブジェクトを先頭に戻す
+
+    リスト・dict のどちらでも、値は fileobj そのものか (filename, fileobj, ...) の tuple を受け付ける。
+    """
+    entries = files.values() if isinstance(files, dict) else (value for _, value in files)
+    for value in entries:
+        handle = value[1] if isinstance(value, (tuple, list)) and len(value) > 1 else value
+        if hasattr(handle, 'seek'):
+            handle.seek(0)
+
+
+def _connect_failed(error):
+    """ConnectionError が接続の確立前（リクエストがサーバーに届く前）に起きたものなら True
+
+    接続タイムアウトと、接続できなかったこと（名前解決の失敗・接続拒否など、urllib3 の
+    NewConnectionError）だけが該当する。送信後の切断ではサーバーが処理を始めている
+    ことがあるため、別のエンドポイントに送り直してはならない。
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, 'reason', reason), NewConnectionError)
+
+
+def _parse_expiry(value):
+    """ジョブ情報の expiresAt（ISO 8601 の文字列または UNIX 時刻）を UNIX 時刻の秒にする（読めなければ None）"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value / 1000.0 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+        except ValueError:
+            return None
+    return None
+
+
 # デコレータを定義
 def pre_authentication(method):
     @functools.wraps(method)
     def wrapper(self, *args, **kwargs):
-        if not self.session_key:
-            self.session_key = self.authenticate()
+        # timeout / total_timeout / cancel_token はメソッド本体ではなくこの呼び出し中の
+        # すべてのリクエストに適用する
+        call_options = {key: kwargs.pop(key) for key in CALL_OPTIONS if key in kwargs}
+        # 呼び出し全体（入れ子の呼び出しを含む）を1つのエンドポイントに紐付ける
+        with self._endpoint_scope(), self._call_scope(**call_options):
             if not self.session_key:
-                print("Error: Authentication failed. Cannot proceed.")
+                self.session_key = self.authenticate()
+                if not self.session_key:
+                    print("Error: Authentication failed. Cannot proceed.")
+                    return None
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def subsampling(kind):
+    """ベースマップ作成メソッドに subsample= オプション（アップロード前の行の縮約）を追加するデコレータ
+
+    subsample を指定すると、入力から代表的な行を選んで（toorpia.sampling.select_rows）
+    その部分集合だけをアップロードし、選んだ行の位置を結果の 'sampleIndices' と
+    client.sampleIndices に記録する。
+
+    Args:
+        kind (str): 入力の種類。'dataframe'（fit_transform）、'csv'（basemap_csvform のファイル）、
+            'embedding'（basemap_embedding の ndarray / DataFrame / ファイル）
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, data, *args, subsample=None, **kwargs):
+            if subsample is None:
+                return method(self, data, *args, **kwargs)
+            prepared = self._prepare_subsample(data, subsample, kind, kwargs)
+            if prepared is None:
                 return None
-        return method(self, *args, **kwargs)
+            subset, indices, temp_dir = prepared
+            try:
+                result = method(self, subset, *args, **kwargs)
+            finally:
+                if temp_dir is not None:
+                    import shutil
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+            return self._attach_sample_indices(result, indices)
+        return wrapper
+    return decorator
+
+
+def pruning(kind, role='basemap'):
+    """重み 0 の列をアップロード前に取り除く prune_columns= / keep_columns= オプションを追加するデコレータ
+
+    ID・文字列・日付など重み 0 の列はマップの計算に使われないが、幅の広いテキスト列で
+    あることが多い。prune_columns=True のとき、keep_columns（Map Inspector で使う属性列など）
+    以外の重み 0 の列を取り除き、weight_option_str / type_option_str の列番号を詰め直して
+    送る。取り除いた列は省メモリな DataFrame として client.prunedAttributes に残す。
+    role='addplot' で keep_columns を省略した場合は、対象のマップの記録済みスキーマ
+    （client.map_schemas）にある列を残し、ベースマップと同じ列で送る。
+
+    Args:
+        kind (str): 'dataframe'（fit_transform / addplot）、'csv'（basemap_csvform）、
+            'csv_add'（addplot_csvform。prune_columns に取り除く列名のリストも渡せる）
+        role (str): 'basemap' または 'addplot'
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+        parameters = signature.parameters
+        data_name = list(parameters)[1]
+
+        @functools.wraps(method)
+        def wrapper(self, data, *args, prune_columns=False, keep_columns=None, **kwargs):
+            if prune_columns is False or prune_columns is None:
+                return method(self, data, *args, **kwargs)
+            if role == 'addplot' and keep_columns is None:
+                schema_kind = 'dataframe' if kind == 'dataframe' else 'csvform'
+                map_no = self._addplot_target(schema_kind, signature, data, args, kwargs)
+                entry = self.map_schemas.get(map_no) if map_no is not None else None
+                keep_columns = (entry or {}).get('columns')
+            # 位置引数で渡されたオプション文字列も扱えるように、元のメソッドの引数名に割り当てる
+            extra = {name: kwargs.pop(name) for name in list(kwargs) if name not in parameters}
+            bound = signature.bind(self, data, *args, **kwargs)
+            prepared = self._prune_columns(kind, data, bound.arguments, prune_columns, keep_columns)
+            if prepared is None:
+                return None
+            pruned_data, names, attributes, temp_path = prepared
+            bound.arguments[data_name] = pruned_data
+            try:
+                result = method(*bound.args, **bound.kwargs, **extra)
+            finally:
+                if temp_path is not None:
+                    try:
+                        os.remove(temp_path)
+                    except:
+                        pass
+            return self._attach_pruned_columns(result, names, attributes)
+        return wrapper
+    return decorator
+
+
+def collapsing_duplicates(method):
+    """fit_transform / addplot に dedupe= オプション（同一行の重複除去）を追加するデコレータ
+
+    dedupe=True のとき、同一の行を1つにまとめてからアップロードし、返ってきた座標
+    （と点ごとの距離）を元の行順・行数に展開する。削減量は結果の 'dedupe'
+    （fit_transform は client.dedupeStats のみ）に記録する。
+    """
+    @functools.wraps(method)
+    def wrapper(self, data, *args, dedupe=False, **kwargs):
+        if not dedupe:
+            return method(self, data, *args, **kwargs)
+        unique, inverse = collapse_duplicates(data)
+        print(f"Collapsed {len(data)} rows to {len(unique)} distinct rows before upload.")
+        started = time.monotonic()
+        result = method(self, unique, *args, **kwargs)
+        return self._expand_duplicates(result, data, unique, inverse, started)
     return wrapper
 
+
+def projecting(role):
+    """basemap_embedding / addplot_embedding にクライアント側の次元削減（projection=）を追加するデコレータ
+
+    role='basemap' では projection を指定したときに射影を学習して低次元のデータを
+    アップロードし、作成されたマップ番号に対応付けて client.projections に保存する。
+    role='addplot' では対象のマップに保存された射影があれば自動で適用する
+    （projection=False で無効、EmbeddingProjection を渡すとそれを使う）。projection=False の
+    入力は射影後の次元数で記録されたスキーマと比べられないため、preflight の検証を省く。
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, files, *args, projection=None, **kwargs):
+            if role == 'basemap':
+                if projection is None or projection is False:
+                    return method(self, files, *args, **kwargs)
+                projection = self._make_projection(projection, kwargs.get('l2_normalization'))
+                projected = self._project_embedding(files, projection, kwargs.get('id_columns'), fit=True)
+                if projected is None:
+                    return None
+                return self._remember_projection(method(self, projected, *args, **kwargs), projection)
+
+            if projection is False:
+                # 記録済みスキーマの次元数は射影後のものなので、射影しない入力は検証しない
+                kwargs.setdefault('preflight', False)
+                return method(self, files, *args, **kwargs)
+            if projection is None:
+                map_no = args[0] if args else kwargs.get('mapNo')
+                map_no = map_no if map_no is not None else self.mapNo
+                projection = self.projections.load(map_no) if map_no is not None else None
+                if projection is None:
+                    return method(self, files, *args, **kwargs)
+            projected = self._project_embedding(files, projection, projection.id_columns, fit=False)
+            if projected is None:
+                return None
+            return method(self, projected, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def extracting_features(role):
+    """basemap_waveform / addplot_waveform にクライアント側の mkfftSeg 特徴量の抽出を追加するデコレータ
+
+    role='basemap' では client_features=True のときに WAV / CSV を手元で区間ごとの
+    振幅スペクトル（toorpia.waveform）にして basemap_embedding でアップロードし、
+    作成されたマップのスキーマに mkfftSeg の設定（waveformFeatures）を記録する。
+    特徴量を作れない入力（対応していない WAV の形式など）は元の波形のアップロードに戻す。
+    role='addplot' では対象のマップが特徴量で作られていれば、同じ設定で特徴量を作って
+    addplot_embedding でアップロードする。
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, files, *args, **kwargs):
+            if role == 'basemap' and not kwargs.pop('client_features', False):
+                return method(self, files, *args, **kwargs)
+            try:
+                bound = signature.bind(self, files, *args, **kwargs)
+            except TypeError:
+                return method(self, files, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            if role == 'basemap':
+                options = {name[len('mkfftseg_'):]: value for name, value in arguments.items()
+                           if name.startswith('mkfftseg_')}
+            else:
+                map_no = arguments.get('mapNo') if arguments.get('mapNo') is not None else self.mapNo
+                if map_no is not None and map_no not in self.map_schemas:
+                    # 別のプロセスで作ったマップ: 特徴量のマップ（埋め込み）かどうかをサーバーに問い合わせる
+                    self._fetch_map_schema(map_no)
+                entry = self.map_schemas.get(map_no) if map_no is not None else None
+                options = (entry or {}).get('waveformFeatures')
+                if options is None:
+                    if (entry or {}).get('processMethod') == 'embedding':
+                        print(f"Error: map {map_no} is an embedding map, but the mkfftSeg settings of its "
+                              "client-side waveform features are not recorded in client.map_schemas. "
+                              "Load the MapSchemaCache the map was created with, or use addplot_embedding().")
+                        return None
+                    return method(self, files, *args, **kwargs)
+                arguments['mapNo'] = map_no
+
+            # 特徴量を作る前にバッチのヘッダを並行して検証する（生の波形のアップロードと同じ検査）
+            if isinstance(files, list) and files:
+                summary = self._validate_waveform_files(
+                    files, options.get('di', MKFFTSEG_DEFAULTS['di']),
+                    sample_rates=[options['sr']] if role == 'addplot' and options.get('sr') else None)
+                if summary is None:
+                    return None
+                if role == 'basemap' and len(summary['sampleRates']) == 1 and not summary['csvFiles']:
+                    # WAV だけのバッチは実際のサンプリング周波数で周波数ビンが決まる
+                    options['sr'] = summary['sampleRates'][0]
+
+            try:
+                features = extract_features(files if isinstance(files, list) else [files], options)
+            except (OSError, ValueError) as e:
+                if role == 'addplot':
+                    print(f"Error: map {map_no} was built from client-side waveform features, "
+                          f"which could not be extracted: {str(e)}")
+                    return None
+                print(f"Warning: client-side waveform features unavailable ({str(e)}); "
+                      "uploading the raw waveform files instead.")
+                return method(self, files, *args, **kwargs)
+            return self._upload_waveform_features(role, features, options, arguments)
+        return wrapper
+    return decorator
+
+
+def preprocessing_waveform(role):
+    """basemap_waveform / addplot_waveform に preprocess= オプション（アップロード前のモノラル化と
+    リサンプリング）を追加するデコレータ
+
+    preprocess=True のとき、バッチのヘッダを検証したうえで WAV ファイルを1チャンネルにまとめ
+    （既定は全チャンネルの平均）、mkfftSeg が使うサンプリング周波数（ベースマップでは mkfftseg_sr）に
+    FFT でリサンプリングして、16 bit PCM の WAV としてメモリから送る（toorpia.waveform.preprocess_waveform）。
+    preprocess={'channel': 1, 'sample_rate': 16000} のように、使うチャンネルと周波数も指定できる。
+    すでに1チャンネルで目的のサンプリング周波数の WAV と CSV はそのまま送る。
+    前処理して作ったマップへの addplot_waveform は、指定しなくても同じ前処理をする。
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+        parameters = signature.parameters
+
+        @functools.wraps(method)
+        def wrapper(self, files, *args, preprocess=None, **kwargs):
+            if not isinstance(files, list) or preprocess is False:
+                return method(self, files, *args, **kwargs)
+            try:
+                arguments = signature.bind_partial(
+                    self, files, *args, **{k: v for k, v in kwargs.items() if k in parameters}).arguments
+            except TypeError:
+                return method(self, files, *args, **kwargs)
+            if role == 'basemap':
+                if not preprocess:
+                    return method(self, files, *args, **kwargs)
+                data_index = arguments.get('mkfftseg_di', MKFFTSEG_DEFAULTS['di'])
+                options = {'channel': 'mean', 'sampleRate': arguments.get('mkfftseg_sr', MKFFTSEG_DEFAULTS['sr'])}
+            else:
+                map_no = arguments.get('mapNo') if arguments.get('mapNo') is not None else self.mapNo
+                entry = (self.map_schemas.get(map_no) if map_no is not None else None) or {}
+                if not preprocess and entry.get('waveformPreprocess') is None:
+                    return method(self, files, *args, **kwargs)
+                mkfftseg = dict(MKFFTSEG_DEFAULTS, **(entry.get('mkfftseg') or entry.get('waveformFeatures') or {}))
+                data_index = mkfftseg['di']
+                options = entry.get('waveformPreprocess') or {
+                    'channel': 'mean', 'sampleRate': (entry.get('sampleRates') or [mkfftseg['sr']])[0]}
+            if isinstance(preprocess, dict):
+                options = {'channel': preprocess.get('channel', options['channel']),
+                           'sampleRate': preprocess.get('sample_rate', options['sampleRate'])}
+
+            # 変換前のファイルを検証する（サンプリング周波数はそろえるので違っていてよい）
+            if self._validate_waveform_files(files, data_index, check_rates=False) is None:
+                return None
+            prepared = self._preprocess_waveform_files(files, options)
+            if prepared is None:
+                return None
+            result = method(self, prepared, *args, **kwargs)
+            return self._remember_waveform_preprocess(result, options) if role == 'basemap' else result
+        return wrapper
+    return decorator
+
+
+def validating_schema(kind, role):
+    """ベースマップのスキーマを記録し、addplot の入力をアップロード前に検証するデコレータ
+
+    role='basemap' では作成したマップの番号に対応付けて、列名・型オプション・埋め込みの
+    次元数・前処理オプション・mkfftSeg の設定などを client.map_schemas に記録する。
+    role='addplot' では対象のマップのスキーマがあれば、列数・型・次元数・サンプリング
+    周波数などをアップロード前に検証し、合わなければ送らずにエラーにする
+    （preflight=False で検証を省く）。kind='waveform' では両方の role で、バッチの
+    ヘッダの並行検証（client.waveformValidation）もここで行う（preflight=False でも省かない）。
+
+    Args:
+        kind (str): 'dataframe', 'csvform', 'waveform', 'embedding' のいずれか
+        role (str): 'basemap' または 'addplot'
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, data, *args, preflight=True, **kwargs):
+            inspected = None
+            if kind == 'waveform':
+                # 波形ファイルのヘッダはファイルを開く前にここで1回だけ並行して読み、
+                # スキーマの記録と事前検証にもその結果を使う
+                inspected = self._inspect_waveform_batch(role, data, signature, args, kwargs)
+                if inspected is None:
+                    return None
+            if role == 'basemap':
+                entry = self._basemap_schema(kind, data, signature, args, kwargs, inspected)
+                return self._remember_map_schema(method(self, data, *args, **kwargs), entry)
+            if preflight:
+                map_no = self._addplot_target(kind, signature, data, args, kwargs)
+                entry = self.map_schemas.get(map_no) if map_no is not None else None
+                if entry is not None:
+                    try:
+                        problem = check_addplot(entry, kind, data, inspected)
+                    except (OSError, ValueError, TypeError, AttributeError):
+                        problem = None  # 読めない入力の扱いはメソッド本体に任せる
+                    if problem is not None:
+                        print(f"Error: addplot preflight check against map {map_no} failed: {problem}")
+                        return None
+            return method(self, data, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class toorPIA:
     # 属性
     mapNo = None
     shareUrl = None  # シェアURL用の属性を追加
     currentAddPlotNo = None  # 追加：現在の追加プロット番号
     addPlots = None  # 追加：マップに関連する追加プロットのリスト
+    sampleIndices = None  # subsample 指定時にベースマップに使った行の位置
+    dedupeStats = None  # dedupe 指定時の直近の呼び出しでの削減量
+    prunedColumns = None  # prune_columns 指定時に取り除いた列名
+    prunedAttributes = None  # 取り除いた列の値（省メモリな DataFrame）
 
-    def __init__(self, api_key=None, max_busy_wait_min=None):
+    def __init__(self, api_key=None, max_busy_wait_min=None, busy_retry_coordinator=None, api_url=None,
+                 timeout=None, total_timeout=None):
         self.api_key = api_key if api_key else get_api_key()
-        self.session_key = None
+        # 接続先エンドポイント。引数 > 環境変数 TOORPIA_API_URL（カンマ区切りで複数可）の順で決まる。
+        # 複数指定した場合は呼び出しごとに最も健全で空いているエンドポイントへ振り分ける
+        self.endpoints = EndpointPool(api_url if api_url else API_URLS)
+        self._last_endpoint = self.endpoints.endpoints[0]
+        # セッションキーとジョブIDは発行したエンドポイントに紐付けて管理する
+        self._session_keys = {}
+        self._job_endpoints = collections.OrderedDict()
+        self._job_expiry = {}
+        # スレッドごとの直近のリクエスト情報（JobScheduler が 429 の判定に使う）と
+        # 呼び出し中のエンドポイント
+        self._local = threading.local()
         # サーバー混雑 (503 SERVER_BUSY) 再試行の総待ち時間上限（分）。
         # 引数 > 環境変数 TOORPIA_MAX_BUSY_WAIT_MIN > 既定30 の順で決まる。
         # 0 以下を指定すると再試行せず従来どおり即エラーになる
@@ -42,10 +457,222 @@ class toorPIA:
             self.max_busy_wait_min = float(max_busy_wait_min)
         except (TypeError, ValueError):
             self.max_busy_wait_min = 30.0
+        # 503 再試行のタイミングを調整するコーディネーター。既定はプロセス全体で共有され、
+        # 全スレッド・全インスタンスの再送をジッターとトークンバケットで分散させる
+        self.busy_retry_coordinator = busy_retry_coordinator or get_default_coordinator()
+        # 個々の HTTP リクエストのタイムアウト（秒、または (接続, 読み取り) の tuple）。
+        # 引数 > 環境変数 TOORPIA_TIMEOUT（"30" や "10,600"）> 既定 DEFAULT_TIMEOUT の順で決まる
+        if timeout is None:
+            timeout = os.environ.get('TOORPIA_TIMEOUT') or DEFAULT_TIMEOUT
+        self.timeout = _parse_timeout(timeout)
+        # 1回のメソッド呼び出し全体（503 再試行の待ちや入れ子の呼び出しを含む）の上限秒数。None で無制限
+        self.total_timeout = None if total_timeout is None else float(total_timeout)
+        # addplot_sweep() の結果のキャッシュ（既定はこのインスタンスのメモリ上）
+        self.sweep_cache = SweepCache()
+        # basemap_embedding(projection=...) で学習した射影の保存先（マップ番号ごと）。
+        # 既定は TOORPIA_CACHE_DIR（または ~/.cache/toorpia）の下の接続先ごとのディレクトリ
+        self.projections = ProjectionStore.for_server(self.endpoints.endpoints[0].url)
+        # 列名と dtype ごとの weight/type オプションの自動推定結果
+        self.options_cache = OptionInferenceCache()
+        # マップ番号ごとのベースマップのスキーマと前処理オプション（addplot の事前検証に使う）
+        self.map_schemas = MapSchemaCache()
+
+    def _current_endpoint(self):
+        """このスレッドで呼び出し中のエンドポイント（呼び出し外では直近に使ったもの）"""
+        return getattr(self._local, 'endpoint', None) or self._last_endpoint
+
+    @property
+    def api_url(self):
+        """現在のエンドポイントのベースURL"""
+        return self._current_endpoint().url
+
+    @property
+    def session_key(self):
+        """現在のエンドポイントで発行されたセッションキー"""
+        return self._session_keys.get(self.api_url)
+
+    @session_key.setter
+    def session_key(self, value):
+        self._session_keys[self.api_url] = value
+
+    @contextlib.contextmanager
+    def _endpoint_scope(self, pinned_url=None):
+        """ブロック内のリクエストを1つのエンドポイントに送る
+
+        最も外側のスコープで EndpointPool からエンドポイントを選び、入れ子のスコープは
+        それを引き継ぐ。pinned_url を指定した場合は（ジョブの問い合わせなど）その
+        エンドポイントに固定し、フェイルオーバーもしない。
+        """
+        local = self._local
+        previous = getattr(local, 'endpoint', None)
+        previous_pinned = getattr(local, 'endpoint_pinned', False)
+        pinned = self.endpoints.get(pinned_url) if pinned_url is not None else None
+        if pinned is not None:
+            local.endpoint = pinned
+            local.endpoint_pinned = True
+        elif previous is None:
+            local.endpoint = self.endpoints.select()
+            local.endpoint_pinned = False
+        try:
+            yield local.endpoint
+        finally:
+            self._last_endpoint = local.endpoint
+            local.endpoint = previous
+            local.endpoint_pinned = previous_pinned
+
+    @contextlib.contextmanager
+    def _call_scope(self, timeout=None, total_timeout=None, cancel_token=None):
+        """ブロック内のリクエストにタイムアウトと中断トークンを適用する
+
+        入れ子のスコープは外側の設定を引き継ぎ、指定された項目だけを上書きする。
+        全体の期限は外側の期限より延ばせない。
+        """
+        local = self._local
+        previous = getattr(local, 'call', None)
+        call = dict(previous) if previous is not None else {
+            'timeout': None, 'deadline': None, 'cancel_token': None}
+        if previous is None and total_timeout is None:
+            total_timeout = self.total_timeout
+        if timeout is not None:
+            call['timeout'] = _parse_timeout(timeout)
+        if total_timeout is not None:
+            deadline = time.monotonic() + float(total_timeout)
+            call['deadline'] = deadline if call['deadline'] is None else min(call['deadline'], deadline)
+        if cancel_token is not None:
+            call['cancel_token'] = cancel_token
+        local.call = call
+        try:
+            yield call
+        finally:
+            local.call = previous
+
+    def _call_option(self, key):
+        """このスレッドで呼び出し中のメソッドのタイムアウト・中断設定を返す"""
+        call = getattr(self._local, 'call', None)
+        return call.get(key) if call is not None else None
+
+    def _check_call(self):
+        """中断要求と全体の期限を確認し、該当すれば例外を送出する"""
+        token = self._call_option('cancel_token')
+        if token is not None:
+            token.raise_if_cancelled()
+        deadline = self._call_option('deadline')
+        if deadline is not None and time.monotonic() >= deadline:
+            raise requests.exceptions.Timeout("total timeout exceeded")
+
+    def _sleep(self, seconds):
+        """中断トークンが設定されていれば中断可能な形で待つ"""
+        token = self._call_option('cancel_token')
+        if token is None:
+            time.sleep(seconds)
+        elif token.wait(seconds):
+            raise RequestCancelled("request cancelled")
+
+    def _request_timeout(self):
+        """次のリクエストに渡すタイムアウト（全体の期限までの残り時間で頭打ちにする）"""
+        timeout = self._call_option('timeout')
+        if timeout is None:
+            timeout = self.timeout
+        deadline = self._call_option('deadline')
+        if deadline is None:
+            return timeout
+        remaining = max(deadline - time.monotonic(), 0.001)
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        return tuple(remaining if t is None else min(t, remaining) for t in (connect, read))
+
+    def _cancellable_body(self, kwargs):
+        """files / data / json のボディを組み立て、中断・期限を確認しながら送信するボディに差し替える"""
+        token = self._call_option('cancel_token')
+        deadline = self._call_option('deadline')
+        body_keys = [key for key in ('files', 'data', 'json') if kwargs.get(key) is not None]
+        if (token is None and deadline is None) or not body_keys:
+            return kwargs
+        kwargs = dict(kwargs)
+        prepared = requests.Request('POST', 'http://localhost/',
+                                    **{key: kwargs.pop(key) for key in body_keys}).prepare()
+        body = prepared.body.encode('utf-8') if isinstance(prepared.body, str) else (prepared.body or b'')
+        headers = dict(kwargs.get('headers') or {})
+        if 'Content-Type' in prepared.headers:
+            headers['Content-Type'] = prepared.headers['Content-Type']
+        kwargs['headers'] = headers
+        kwargs['data'] = _CancellableBody(body, token, deadline)
+        return kwargs
+
+    def _request(self, method, path, **kwargs):
+        """現在のエンドポイントへ HTTP リクエストを送信する
+
+        URL は現在のエンドポイントから組み立て、headers に 'session-key' がある場合は
+        そのエンドポイントのセッションキーに差し替える。応答時間とステータスは
+        エンドポイントの健全性として記録され、以降の振り分けとサーキットブレーカーに
+        使われる。接続できなかった場合（リクエストがサーバーに届いていない場合）は、
+        固定されていなければ別のエンドポイントに切り替えて送り直す。
+
+        各リクエストにはタイムアウト（呼び出しごとの timeout > クライアントの timeout）を
+        付け、全体の期限 (total_timeout) までの残り時間で頭打ちにする。中断トークンか
+        全体の期限がある場合、ボディはブロックごとに確認しながら送信し、中断・期限切れで
+        送信を打ち切る（RequestCancelled / requests.exceptions.Timeout を送出する）。
+
+        Args:
+            method (str): 'get' / 'post' などの HTTP メソッド
+            path (str): エンドポイントのベースURL以降のパス（"/data/addplot" 等）
+            **kwargs: requests.request に渡す引数
+
+        Returns:
+            requests.Response: サーバーのレスポンス
+        """
+        attempted = set()
+        while True:
+            endpoint = self._current_endpoint()
+            attempted.add(endpoint.url)
+            headers = kwargs.get('headers')
+            if headers is not None and 'session-key' in headers:
+                headers['session-key'] = self.session_key
+            self._check_call()
+            send_kwargs = self._cancellable_body(kwargs)
+            if 'timeout' not in kwargs:
+                send_kwargs = dict(send_kwargs, timeout=self._request_timeout())
+            self.endpoints.begin(endpoint)
+            start = time.monotonic()
+            try:
+                response = requests.request(method, f"{endpoint.url}{path}", **send_kwargs)
+            except _UploadAborted as e:
+                # 中断はエンドポイントの健全性とは無関係なので失敗として数えない
+                self.endpoints.abandon(endpoint)
+                if e.reason == 'cancelled':
+                    raise RequestCancelled("upload cancelled") from None
+                raise requests.exceptions.Timeout("total timeout exceeded during upload") from None
+            except requests.exceptions.ConnectionError as e:
+                self.endpoints.record(endpoint, error=True)
+                # 送信後の切断はサーバーが処理を始めている可能性があるため送り直さない（POST の重複を防ぐ）
+                if not _connect_failed(e) or not self._failover(attempted, needs_session=headers is not None and 'session-key' in headers):
+                    raise
+                print(f"Warning: could not connect to {endpoint.url}; retrying on {self.api_url}.")
+                _rewind_files(kwargs.get('files') or [])
+                continue
+            except requests.exceptions.RequestException:
+                self.endpoints.record(endpoint, error=True)
+                raise
+            self.endpoints.record(endpoint, latency=time.monotonic() - start, status_code=response.status_code)
+            return response
+
+    def _failover(self, attempted, needs_session):
+        """このスレッドの呼び出しを未試行の別エンドポイントに切り替える（切り替えたら True）"""
+        local = self._local
+        if getattr(local, 'endpoint', None) is None or getattr(local, 'endpoint_pinned', False):
+            return False
+        alternative = self.endpoints.select(exclude=attempted)
+        if alternative is None:
+            return False
+        local.endpoint = alternative
+        if needs_session and not self.session_key:
+            self.session_key = self.authenticate()
+            if not self.session_key:
+                return False
+        return True
 
     def authenticate(self):
         """バックエンドにAPIキーを送信して検証させ、セッションキーを取得する"""
-        response = requests.post(f"{API_URL}/auth/login", json={"apiKey": self.api_key})
+        response = self._request('post', "/auth/login", json={"apiKey": self.api_key})
         if response.status_code == 200:
             return response.json().get('sessionKey')
         else:
@@ -63,10 +690,16 @@ class toorPIA:
 
         backend はサーバー全体の同時実行スロットが埋まっている間、同期リクエストと
         待ち行列満杯時の非同期投入を Retry-After ヘッダ付きの 503 で即時拒否する。
-        ここでは Retry-After 秒（無ければ60秒）待って同じリクエストを再送し、
-        総待ち時間が max_busy_wait_min 分を超える場合はあきらめて最後のレスポンスを
-        返す（呼び出し元は従来どおりのエラー処理を行う）。503 を返さない旧バージョンの
-        サーバーでは一切再試行が起きないため、挙動は完全に従来どおり。
+        ここでは Retry-After 秒（無ければ60秒）を基準に busy_retry_coordinator が
+        決めた時間だけ待って同じリクエストを再送し、総待ち時間が max_busy_wait_min 分を
+        超える場合はあきらめて最後のレスポンスを返す（呼び出し元は従来どおりの
+        エラー処理を行う）。既定のコーディネーターはプロセス全体で共有され、多数の
+        スレッドが同時に 503 を受けても再送が一斉に集中しないようジッターと
+        トークンバケットで分散させる。503 を返さない旧バージョンのサーバーでは
+        一切再試行が起きないため、挙動は完全に従来どおり。
+
+        再試行で待った合計秒数は、返すレスポンスの busy_wait_seconds 属性と
+        スレッドごとの直近値 (self._local.last_busy_wait) に記録される。
 
         Args:
             do_request (callable): リクエストを1回実行して requests.Response を返す関数
@@ -78,22 +711,38 @@ class toorPIA:
             達した時点の最後の 503 レスポンス
         """
         deadline = time.monotonic() + self.max_busy_wait_min * 60
+        call_deadline = self._call_option('deadline')
+        waited = 0.0
         while True:
             response = do_request()
             if response.status_code != 503 or self.max_busy_wait_min <= 0:
-                return response
+                return self._record_busy_wait(response, waited)
             try:
                 retry_after = max(1, min(int(float(response.headers.get('Retry-After'))), 600))
             except (TypeError, ValueError):
                 retry_after = 60
-            if time.monotonic() + retry_after > deadline:
+            delay = self.busy_retry_coordinator.reserve(
+                retry_after, deadline if call_deadline is None else min(deadline, call_deadline))
+            if delay is None and call_deadline is not None and call_deadline < deadline:
+                raise requests.exceptions.Timeout("total timeout exceeded while waiting for the busy server")
+            if delay is None:
                 print(f"Server busy (503): maximum wait time ({self.max_busy_wait_min:g} min) exceeded; giving up.")
-                return response
-            print(f"Server busy (503). Retrying in {retry_after}s (waiting up to {self.max_busy_wait_min:g} min in total)...")
-            time.sleep(retry_after)
+                return self._record_busy_wait(response, waited)
+            print(f"Server busy (503). Retrying in {delay:.0f}s (waiting up to {self.max_busy_wait_min:g} min in total)...")
+            self._sleep(delay)
+            waited += delay
             if reset is not None:
                 reset()
 
+    def _record_busy_wait(self, response, waited):
+        """503 再試行で待った合計秒数をレスポンスとスレッドごとの直近値に記録する"""
+        self._local.last_busy_wait = waited
+        try:
+            response.busy_wait_seconds = waited
+        except AttributeError:
+            pass
+        return response
+
     def _handle_job_submission(self, response, parser):
         """?async=true 投入レスポンスを処理し、Job ハンドルを返す
 
@@ -102,9 +751,15 @@ class toorPIA:
         非同期モード未対応の旧サーバーは ?async=true を無視して同期実行の 200 を
         返すため、その場合は同期実行時と同じ返り値をそのまま返す。
         """
+        self._local.last_submission_status = response.status_code
+        self._local.last_submission_retry_after = (getattr(response, 'headers', None) or {}).get('Retry-After')
         if response.status_code == 202:
             body = response.json()
-            return Job(self, body['jobId'], parser)
+            job = Job(self, body['jobId'], parser)
+            # ジョブの問い合わせは投入したエンドポイントに送る
+            job.endpoint = self.api_url
+            self._remember_job_endpoint(job.job_id, job.endpoint)
+            return job
         if response.status_code == 200:
             print("Note: server does not support asynchronous job mode; the request was executed synchronously.")
             return parser(response)
@@ -115,7 +770,22 @@ class toorPIA:
         print(f"Job submission failed. Server responded with error: {error_message}")
         return None
 
-    @pre_authentication
+    def _remember_job_endpoint(self, job_id, endpoint):
+        """ジョブIDと発行したエンドポイントの対応を記録し、保持期限を過ぎた対応を消す"""
+        self._job_endpoints[job_id] = endpoint
+        if len(self._job_endpoints) <= JOB_ENDPOINTS_LIMIT:
+            return
+        now = time.time()
+        for expired_id, expires_at in list(self._job_expiry.items()):
+            if expires_at <= now:
+                self._forget_job(expired_id)
+        while len(self._job_endpoints) > JOB_ENDPOINTS_LIMIT:
+            self._forget_job(next(iter(self._job_endpoints)))
+
+    def _forget_job(self, job_id):
+        self._job_endpoints.pop(job_id, None)
+        self._job_expiry.pop(job_id, None)
+
     def get_job(self, job_id):
         """非同期ジョブ (async_mode=True) の現在の状態を取得する
 
@@ -127,30 +797,69 @@ class toorPIA:
                   expiresAt。status が done のとき httpStatus と result、failed のとき
                   httpStatus と error を含む。result / error は同期実行時のレスポンス
                   ボディと同形)。取得に失敗した場合は None。
-                  結果は完了後24時間（サーバー設定による）保持され、期限後は404となる
+                  結果は完了後24時間（サーバー設定による）保持され、期限後は404となる。
+                  複数エンドポイント構成では、ジョブを発行したエンドポイントに問い合わせる
         """
-        headers = {'Content-Type': 'application/json', 'session-key': self.session_key}
-        try:
-            response = requests.get(f"{API_URL}/jobs/{job_id}", headers=headers)
-            if response.status_code == 401:
-                # 長時間ジョブのポーリング中にセッションが切れることがあるため一度だけ再認証する
-                self.session_key = self.authenticate()
-                if self.session_key:
-                    headers['session-key'] = self.session_key
-                    response = requests.get(f"{API_URL}/jobs/{job_id}", headers=headers)
-        except requests.exceptions.RequestException as e:
-            print(f"Network error while polling job {job_id}: {str(e)}")
-            return None
+        info, _ = self._poll_job(job_id)
+        return info
+
+    def _poll_job(self, job_id, params=None, endpoint=None):
+        """GET /jobs/:jobId を1回実行し、ジョブ情報とレスポンスヘッダを返す
+
+        Job.wait() が Retry-After などのサーバーヒントを読むために使う。
+        発行したエンドポイントの記録は、完了後も結果の保持期限（expiresAt）まで残す。
+        サーバーがジョブを 404 で返したら（期限切れ）記録を消す。
+
+        Args:
+            job_id (str): ジョブID
+            params (dict, optional): クエリパラメータ（ロングポーリング用の wait 等）
+            endpoint (str, optional): ジョブを発行したエンドポイント（Job.endpoint）。
+                省略時は記録から引く
+
+        Returns:
+            tuple: (ジョブ情報の dict または None, レスポンスヘッダ（取得できなければ空 dict）)
+        """
+        # ジョブIDは発行したエンドポイントでのみ有効なため、そのエンドポイントに固定する
+        with self._endpoint_scope(pinned_url=endpoint or self._job_endpoints.get(job_id)):
+            try:
+                if not self.session_key:
+                    self.session_key = self.authenticate()
+                    if not self.session_key:
+                        print("Error: Authentication failed. Cannot proceed.")
+                        return None, {}
+                headers = {'Content-Type': 'application/json', 'session-key': self.session_key}
+                response = self._request('get', f"/jobs/{job_id}", headers=headers, params=params)
+                if response.status_code == 401:
+                    # 長時間ジョブのポーリング中にセッションが切れることがあるため一度だけ再認証する
+                    self.session_key = self.authenticate()
+                    if self.session_key:
+                        headers['session-key'] = self.session_key
+                        response = self._request('get', f"/jobs/{job_id}", headers=headers, params=params)
+            except requests.exceptions.RequestException as e:
+                print(f"Network error while polling job {job_id}: {str(e)}")
+                return None, {}
+        response_headers = getattr(response, 'headers', None) or {}
         if response.status_code == 200:
-            return response.json()
+            info = response.json()
+            if isinstance(info, dict) and job_id in self._job_endpoints:
+                expires_at = _parse_expiry(info.get('expiresAt'))
+                if expires_at is not None:
+                    self._job_expiry[job_id] = expires_at
+            return info, response_headers
+        if response.status_code == 404:
+            self._forget_job(job_id)
         try:
             error_message = response.json().get('message', 'Unknown error')
         except:
             error_message = f"HTTP {response.status_code}"
         print(f"Failed to get job {job_id}. Server responded with error: {error_message}")
-        return None
+        return None, response_headers
 
     @pre_authentication
+    @subsampling('dataframe')
+    @pruning('dataframe')
+    @collapsing_duplicates
+    @validating_schema('dataframe', 'basemap')
     def fit_transform(self, data, label=None, tag=None, description=None, random_seed=42, weight_option_str=None, type_option_str=None, identna_resolution=None, identna_effective_radius=None, identna_er_method=None, identna_knn_k=None, vector_normalization=None, async_mode=False):
         headers = {'Content-Type': 'application/json', 'session-key': self.session_key}
 
@@ -161,7 +870,7 @@ class toorPIA:
             type_option_str = type_option_str or auto_type_option_str
 
         # DataFrame形式で与えられたdataをJSON形式に変換して、バックエンドに送信する
-        data_json = data.to_json(orient='split')  # split形式でJSON文字列に変換
+        data_json = frame_json(data)  # split形式でJSON文字列に変換（日時は ISO 8601）
         data_dict = json.loads(data_json)  # JSON文字列を辞書型に変換
 
         # オプションパラメータを追加
@@ -190,8 +899,8 @@ class toorPIA:
         if vector_normalization is not None:
             data_dict['vector_normalization'] = bool(vector_normalization)
 
-        response = self._post_with_busy_retry(lambda: requests.post(
-            f"{API_URL}/data/fit_transform", json=data_dict, headers=headers,
+        response = self._post_with_busy_retry(lambda: self._request(
+            'post', "/data/fit_transform", json=data_dict, headers=headers,
             params=self._async_params(async_mode)))
         if async_mode:
             return self._handle_job_submission(response, self._handle_fit_transform_response)
@@ -321,8 +1030,8 @@ class toorPIA:
 
             headers = {'session-key': self.session_key}  # Content-Type is auto-set by requests
             response = self._post_with_busy_retry(
-                lambda: requests.post(
-                    f"{API_URL}/data/fit_transform_waveform",
+                lambda: self._request(
+                    'post', "/data/fit_transform_waveform",
                     files=files_to_upload,
                     data=form_data,
                     headers=headers
@@ -460,8 +1169,8 @@ class toorPIA:
             # Send as multipart/form-data (same pattern as fit_transform_waveform)
             headers = {'session-key': self.session_key}  # Content-Type is auto-set by requests
             response = self._post_with_busy_retry(
-                lambda: requests.post(
-                    f"{API_URL}/data/fit_transform_csvform",
+                lambda: self._request(
+                    'post', "/data/fit_transform_csvform",
                     files=files_to_upload,
                     data=form_data,
                     headers=headers
@@ -500,22 +1209,81 @@ class toorPIA:
                     pass
 
     @pre_authentication
+    @pruning('dataframe', 'addplot')
+    @collapsing_duplicates
+    @validating_schema('dataframe', 'addplot')
     def addplot(self, data, *args, weight_option_str=None, type_option_str=None, identna_resolution=None, identna_effective_radius=None, identna_er_method=None, identna_knn_k=None, detabn_max_window=None, detabn_rate_threshold=None, detabn_threshold=None, detabn_print_score=None, async_mode=False):
         headers = {'Content-Type': 'application/json', 'session-key': self.session_key}
 
+        data_dict = self._build_addplot_payload(
+            data, weight_option_str=weight_option_str, type_option_str=type_option_str,
+            identna_resolution=identna_resolution, identna_effective_radius=identna_effective_radius,
+            identna_er_method=identna_er_method, identna_knn_k=identna_knn_k,
+            detabn_max_window=detabn_max_window, detabn_rate_threshold=detabn_rate_threshold,
+            detabn_threshold=detabn_threshold, detabn_print_score=detabn_print_score)
+
+        mapNo = None
+        mapDataDir = None
+
+        for arg in args:
+            if isinstance(arg, int):
+                mapNo = arg
+            elif isinstance(arg, str):
+                mapDataDir = arg
+
+        if mapDataDir is not None:
+            map_no = self.import_map(mapDataDir)
+            if map_no is not None:
+                data_dict['mapNo'] = map_no
+            else:
+                print("Error: Failed to import map from directory.")
+                return None
+        elif mapNo is not None:
+            data_dict['mapNo'] = mapNo
+        elif self.mapNo is not None:
+            data_dict['mapNo'] = self.mapNo
+        else:
+            print("Error: Both mapNo and mapDataDir are undefined.")
+            return None
+
+        response = self._post_with_busy_retry(lambda: self._request(
+            'post', "/data/addplot", json=data_dict, headers=headers,
+            params=self._async_params(async_mode)))
+        if async_mode:
+            return self._handle_job_submission(response, self._handle_addplot_response)
+        return self._handle_addplot_response(response)
+
+    def _build_addplot_payload(self, data, weight_option_str=None, type_option_str=None,
+                               identna_resolution=None, identna_effective_radius=None, identna_er_method=None,
+                               identna_knn_k=None, detabn_max_window=None, detabn_rate_threshold=None,
+                               detabn_threshold=None, detabn_print_score=None):
+        """addplot の JSON ボディ（mapNo を除く）を組み立てる"""
         # DataFrameの型に基づいて自動生成（パラメータが指定されていない場合）
         if weight_option_str is None or type_option_str is None:
             auto_weight_option_str, auto_type_option_str = self._generate_type_weight_options(data)
             weight_option_str = weight_option_str or auto_weight_option_str
             type_option_str = type_option_str or auto_type_option_str
 
-        data_json = data.to_json(orient='split')
+        data_json = frame_json(data)
         data_dict = json.loads(data_json)
-        
+
         # 重み付けオプションと型オプションを設定
         data_dict['weight_option_str'] = weight_option_str
         data_dict['type_option_str'] = type_option_str
-        
+
+        data_dict.update(self._addplot_param_fields(
+            identna_resolution=identna_resolution, identna_effective_radius=identna_effective_radius,
+            identna_er_method=identna_er_method, identna_knn_k=identna_knn_k,
+            detabn_max_window=detabn_max_window, detabn_rate_threshold=detabn_rate_threshold,
+            detabn_threshold=detabn_threshold, detabn_print_score=detabn_print_score))
+        return data_dict
+
+    @staticmethod
+    def _addplot_param_fields(identna_resolution=None, identna_effective_radius=None, identna_er_method=None,
+                              identna_knn_k=None, detabn_max_window=None, detabn_rate_threshold=None,
+                              detabn_threshold=None, detabn_print_score=None):
+        """addplot の JSON ボディに入れる identna / detabn パラメータのフィールドを返す"""
+        data_dict = {}
         # identnaパラメータを追加
         identna_params = {}
         if identna_resolution is not None:
@@ -538,38 +1306,494 @@ class toorPIA:
             data_dict['detabn_threshold'] = detabn_threshold
         if detabn_print_score is not None:
             data_dict['detabn_print_score'] = detabn_print_score
-        
-        mapNo = None
-        mapDataDir = None
+        return data_dict
+
+    @pre_authentication
+    def addplot_chunked(self, data, *args, max_rows=None, max_chunk_bytes=DEFAULT_MAX_CHUNK_BYTES,
+                        max_workers=4, async_mode=False, weight_option_str=None, type_option_str=None,
+                        **addplot_kwargs):
+        """大きな DataFrame を複数の addplot リクエストに分けて送り、結果を1つにまとめる
 
+        addplot() は DataFrame 全体を1つの JSON ボディで送るため、数百万行のデータでは
+        サーバーのアップロード上限 (413) やメモリ使用量の急増を招く。このメソッドは
+        JSON のサイズを見積もってデータを max_chunk_bytes 以下のチャンクに分け、
+        最大 max_workers 件を並行して送信し、結果を元の行順で1つにまとめる。
+
+        重み付け・型オプションはチャンクごとの推定がずれないよう、分割前に全体から
+        1回だけ生成する。各チャンクはサーバー上で別々の追加プロットになり、detabn の
+        異常判定（最大 detabn_max_window 点の連続窓）もチャンクごとに行われる。
+
+        Args:
+            data (pandas.DataFrame): 追加するデータ
+            *args: addplot() と同じ mapNo (int) または mapDataDir (str)
+            max_rows (int, optional): 1チャンクの最大行数
+            max_chunk_bytes (int, optional): 1チャンクの JSON ボディの目安上限（バイト）
+            max_workers (int): 同時に送信するチャンク数（async_mode では同時に
+                投入しておくジョブ数）
+            async_mode (bool): True なら各チャンクを非同期ジョブとして JobScheduler で投入し、
+                完了を待ってからまとめる（長時間の同期接続を避けられる）
+            weight_option_str, type_option_str: addplot() と同じ。省略時は全体から自動生成
+            **addplot_kwargs: addplot() に渡す identna_* / detabn_* パラメータ
+
+        Returns:
+            dict: addplot() と同じキー（xyData は全行分。abnormalityStatus はいずれかの
+                チャンクが abnormal なら abnormal。diagnosticScore の距離集計は全点から
+                再計算）に、addPlotNos（チャンクごとの追加プロット番号）と chunks を加えたもの。
+                いずれかのチャンクが失敗した場合は None
+        """
+        map_args = []
         for arg in args:
-            if isinstance(arg, int):
-                mapNo = arg
-            elif isinstance(arg, str):
-                mapDataDir = arg
+            if isinstance(arg, str):
+                # マップのインポートはチャンクごとではなく1回だけ行う
+                map_no = self.import_map(arg)
+                if map_no is None:
+                    print("Error: Failed to import map from directory.")
+                    return None
+                map_args.append(map_no)
+            else:
+                map_args.append(arg)
+        if not map_args and self.mapNo is None:
+            print("Error: Both mapNo and mapDataDir are undefined.")
+            return None
 
-        if mapDataDir is not None:
-            map_no = self.import_map(mapDataDir)
-            if map_no is not None:
-                data_dict['mapNo'] = map_no
+        if weight_option_str is None or type_option_str is None:
+            auto_weight_option_str, auto_type_option_str = self._generate_type_weight_options(data)
+            weight_option_str = weight_option_str or auto_weight_option_str
+            type_option_str = type_option_str or auto_type_option_str
+        addplot_kwargs.update(weight_option_str=weight_option_str, type_option_str=type_option_str)
+        addplot_kwargs.update(self._inherited_call_options())
+
+        chunks = plan_chunks(data, max_rows=max_rows, max_bytes=max_chunk_bytes)
+        if not chunks:
+            print("Error: data is empty.")
+            return None
+        print(f"Sending {len(data)} rows in {len(chunks)} chunk(s)...")
+
+        with JobScheduler(self, max_active=max_workers) as scheduler:
+            if async_mode:
+                handles = [scheduler.submit('addplot', data.iloc[start:stop], *map_args,
+                                            name=f"addplot chunk {i + 1}/{len(chunks)}", **addplot_kwargs)
+                           for i, (start, stop) in enumerate(chunks)]
             else:
-                print("Error: Failed to import map from directory.")
+                # 同期モード: スケジューラのワーカーを送信用のスレッドプールとして使う
+                handles = [scheduler.submit(
+                    lambda async_mode, start=start, stop=stop: self.addplot(
+                        data.iloc[start:stop], *map_args, **addplot_kwargs),
+                    name=f"addplot chunk {i + 1}/{len(chunks)}")
+                    for i, (start, stop) in enumerate(chunks)]
+
+        results, failed = [], []
+        for i, handle in enumerate(handles):
+            result = self._scheduled_result(handle)
+            if result is None:
+                failed.append(i + 1)
+            results.append(result)
+        if failed:
+            done = [r['addPlotNo'] for r in results if r is not None]
+            print(f"Error: {len(failed)} of {len(chunks)} chunk(s) failed (chunks {failed}). "
+                  f"Add plots already created for the other chunks: {done}")
+            return None
+
+        merged = merge_addplot_results(results)
+        self.currentAddPlotNo = merged['addPlotNo']
+        self.shareUrl = merged['shareUrl']
+        return merged
+
+    @pre_authentication
+    def addplot_fanout(self, data, map_nos, method=None, max_parallel=4, async_mode=False, **kwargs):
+        """同じデータを複数のベースマップに対して並行して addplot し、結果を表にまとめる
+
+        装置やラインごとのベースマップ数十枚に同じデータを当てる場合、addplot_* を
+        マップごとに順に呼ぶと、そのたびに同じデータのシリアライズ（JSON 化・CSV 化と
+        gzip 圧縮）が行われる。このメソッドは入力を1回だけシリアライズし、
+        最大 max_parallel 件ずつ並行して各マップに送信する。
+
+        - 'addplot': データ部分の JSON を1回だけ組み立てて圧縮し、マップごとに mapNo を
+          ボディに加えて送る（dedupe= / preflight= は addplot() と同じ）
+        - 'addplot_embedding': ndarray / DataFrame を1回だけ .csv.gz に変換し、同じファイルを送る
+        - 'addplot_csvform' / 'addplot_waveform': 指定されたファイルをそのまま各マップに送る
+
+        Args:
+            data (pandas.DataFrame, numpy.ndarray, str or list): 追加するデータ（またはファイルパス）
+            map_nos (list): 対象のマップ番号のリスト
+            method (str, optional): 'addplot' / 'addplot_embedding' / 'addplot_csvform' /
+                'addplot_waveform'。省略時は DataFrame なら 'addplot'、ndarray なら
+                'addplot_embedding'（ファイルパスの場合は指定が必要）
+            max_parallel (int): 同時に送信するリクエスト数（async_mode では同時に投入しておく
+                ジョブ数）の上限
+            async_mode (bool): True なら各マップへの addplot を非同期ジョブとして JobScheduler で投入する
+            **kwargs: 各呼び出しに渡す引数（identna_* / detabn_* 等）。'addplot' では
+                マップごとに列が変わりうる prune_columns / keep_columns は指定できない
+
+        Returns:
+            pandas.DataFrame: マップごとに1行の表。列は mapNo, addPlotNo, abnormalityStatus,
+                abnormalityScore, compositeStatus, normalizedDistance, exceedanceRatio,
+                shareUrl, ok（失敗したマップは ok=False で他の列は欠損値）。
+                各マップの返り値全体は table.attrs['results'][mapNo] で参照できる。
+                入力の変換に失敗した場合は None
+        """
+        import pandas as pd  # 結果の表の作成に必要
+
+        map_nos = list(map_nos)
+        if method is None:
+            if isinstance(data, pd.DataFrame):
+                method = 'addplot'
+            elif isinstance(data, np.ndarray):
+                method = 'addplot_embedding'
+            else:
+                print("Error: method must be specified when data is given as file path(s).")
                 return None
-        elif mapNo is not None:
-            data_dict['mapNo'] = mapNo
-        elif self.mapNo is not None:
-            data_dict['mapNo'] = self.mapNo
-        else:
-            print("Error: Both mapNo and mapDataDir are undefined.")
+        if method not in ('addplot', 'addplot_embedding', 'addplot_csvform', 'addplot_waveform'):
+            raise ValueError("method must be 'addplot', 'addplot_embedding', 'addplot_csvform' or 'addplot_waveform'")
+        call_options = self._inherited_call_options()
+
+        temp_csv_path = None
+        try:
+            if method == 'addplot':
+                shared, params = self._shared_addplot(data, map_nos, kwargs)
+                fields = self._addplot_param_fields(**params)
+                send = lambda map_no, async_mode: shared(map_no, fields, async_mode)
+            else:
+                files = data
+                if method == 'addplot_embedding' and not isinstance(data, (str, list)):
+                    temp_csv_path = self._convert_inmemory_embedding(data, kwargs.get('quantization'))
+                    if temp_csv_path is None:
+                        return None
+                    files = [temp_csv_path]
+                func = getattr(self, method)
+                send = lambda map_no, async_mode: func(files, mapNo=map_no, async_mode=async_mode,
+                                                       **kwargs, **call_options)
+
+            print(f"Scoring against {len(map_nos)} map(s) with up to {max_parallel} in parallel...")
+            with JobScheduler(self, max_active=max_parallel) as scheduler:
+                handles = [scheduler.submit(
+                    (lambda async_mode, map_no=map_no: send(map_no, True)) if async_mode
+                    else (lambda async_mode, map_no=map_no: send(map_no, False)),
+                    name=f"{method} mapNo={map_no}") for map_no in map_nos]
+            results = [self._scheduled_result(handle) for handle in handles]
+        finally:
+            if temp_csv_path is not None:
+                try:
+                    os.remove(temp_csv_path)
+                except:
+                    pass
+
+        rows = []
+        for map_no, result in zip(map_nos, results):
+            diagnostic = (result or {}).get('diagnosticScore') or {}
+            distance = diagnostic.get('distance') or {}
+            rows.append({
+                'mapNo': map_no,
+                'addPlotNo': result.get('addPlotNo') if result else None,
+                'abnormalityStatus': result.get('abnormalityStatus') if result else None,
+                'abnormalityScore': result.get('abnormalityScore') if result else None,
+                'compositeStatus': diagnostic.get('compositeStatus'),
+                'normalizedDistance': distance.get('normalizedDistance'),
+                'exceedanceRatio': distance.get('exceedanceRatio'),
+                'shareUrl': result.get('shareUrl') if result else None,
+                'ok': result is not None,
+            })
+        table = pd.DataFrame(rows, columns=['mapNo', 'addPlotNo', 'abnormalityStatus', 'abnormalityScore',
+                                            'compositeStatus', 'normalizedDistance', 'exceedanceRatio',
+                                            'shareUrl', 'ok'])
+        table.attrs['results'] = dict(zip(map_nos, results))
+        return table
+
+    @pre_authentication
+    def addplot_sweep(self, data, param_grid, mapNo=None, method=None,
+                      max_active=JobScheduler.DEFAULT_MAX_ACTIVE, cache=None, **kwargs):
+        """identna / detabn パラメータの組み合わせを非同期ジョブで並行して試し、結果を表にまとめる
+
+        param_grid の全組み合わせについて同じデータを addplot し、異常度と診断スコアを
+        1つの DataFrame に集める。各組み合わせは非同期ジョブとして JobScheduler で投入し、
+        ユーザーごとのアクティブジョブ数上限 (max_active) を守りながら並行に処理するため、
+        100通りのグリッドでも数ジョブ分程度の時間で終わる。
+
+        結果はメソッド・マップ番号・データの内容・パラメータのハッシュをキーにキャッシュし、
+        同じ組み合わせは再投入しない（グリッドを広げて再実行した場合は差分だけ投入する）。
+        入力データのシリアライズ（JSON 化と gzip 圧縮・.csv.gz 変換）は組み合わせの数によらず
+        1回だけ行い、'addplot' では組み合わせごとの mapNo と identna / detabn パラメータを
+        共通部分の JSON の末尾に加えてボディで送る（addplot_fanout() と同じ仕組み）。
+        組み合わせごとにサーバー上に追加プロットが1つずつ作られる点に注意。
+
+        Args:
+            data (pandas.DataFrame, numpy.ndarray, str or list): 追加するデータ（またはファイルパス）
+            param_grid (dict or list): 掃引するパラメータと候補値。例:
+                {'identna_resolution': [50, 100, 200], 'detabn_threshold': [0.1, 0.3, 0.5]}。
+                使えるパラメータは identna_resolution / identna_effective_radius /
+                identna_er_method / identna_knn_k / detabn_max_window /
+                detabn_rate_threshold / detabn_threshold
+            mapNo (int, optional): 対象のマップ番号。省略時は現在の mapNo
+            method (str, optional): addplot_fanout() と同じ。省略時は DataFrame なら 'addplot'、
+                ndarray なら 'addplot_embedding'
+            max_active (int): 同時に投入しておくジョブ数の上限（サーバーの上限に合わせる）
+            cache (SweepCache, str or bool, optional): 結果のキャッシュ。省略時は
+                client.sweep_cache（メモリ上）、文字列はキャッシュを保存する JSON ファイルの
+                パス、False でキャッシュを使わない
+            **kwargs: 全組み合わせに共通の引数（掃引しない detabn_* 等）。'addplot' では
+                dedupe / preflight は使えるが、prune_columns / keep_columns は指定できない
+
+        Returns:
+            pandas.DataFrame: 組み合わせごとに1行の表。パラメータの列に加えて ok, addPlotNo,
+                abnormalityStatus, abnormalityScore, detabnStatus, compositeStatus,
+                meanDistance, normalizedDistance, exceedanceRatio, distanceStatus,
+                cached（キャッシュから得た結果なら True）の列を持つ
+        """
+        import pandas as pd  # 結果の表の作成に必要
+
+        map_no = mapNo if mapNo is not None else self.mapNo
+        if map_no is None:
+            print("Error: Map number is not specified. Please provide mapNo or create a basemap first.")
             return None
+        if method is None:
+            if isinstance(data, pd.DataFrame):
+                method = 'addplot'
+            elif isinstance(data, np.ndarray):
+                method = 'addplot_embedding'
+            else:
+                print("Error: method must be specified when data is given as file path(s).")
+                return None
+        if method not in ('addplot', 'addplot_embedding', 'addplot_csvform', 'addplot_waveform'):
+            raise ValueError("method must be 'addplot', 'addplot_embedding', 'addplot_csvform' or 'addplot_waveform'")
+        if cache is None:
+            cache = self.sweep_cache
+        elif isinstance(cache, str):
+            cache = SweepCache(cache)
+        elif cache is False:
+            cache = None
+
+        combinations = expand_grid(param_grid)
+        fingerprint = fingerprint_data(data)
+        keys = [parameter_hash(method, map_no, fingerprint, dict(kwargs, **combo)) for combo in combinations]
+        summaries = [cache.get(key) if cache is not None else None for key in keys]
+        todo = [i for i, summary in enumerate(summaries) if summary is None]
+        print(f"Parameter sweep: {len(combinations)} combination(s), "
+              f"{len(combinations) - len(todo)} cached, {len(todo)} to submit.")
+
+        call_options = self._inherited_call_options()
+        temp_csv_path = None
+        try:
+            if todo and method == 'addplot':
+                shared, fixed = self._shared_addplot(data, [map_no], kwargs)
+                submit = lambda combo, async_mode: shared(
+                    map_no, self._addplot_param_fields(**dict(fixed, **combo)), async_mode)
+            elif todo:
+                files = data
+                if method == 'addplot_embedding' and not isinstance(data, (str, list)):
+                    temp_csv_path = self._convert_inmemory_embedding(data, kwargs.get('quantization'))
+                    if temp_csv_path is None:
+                        return None
+                    files = [temp_csv_path]
+                func = getattr(self, method)
+                submit = lambda combo, async_mode: func(files, mapNo=map_no, async_mode=async_mode,
+                                                        **dict(kwargs, **combo), **call_options)
+            with JobScheduler(self, max_active=max_active) as scheduler:
+                handles = {i: scheduler.submit(lambda async_mode, combo=combinations[i]: submit(combo, async_mode),
+                                               name=f"sweep {i + 1}/{len(combinations)}")
+                           for i in todo}
+            for i, handle in handles.items():
+                summaries[i] = summarize_result(self._scheduled_result(handle))
+                if cache is not None:
+                    cache.put(keys[i], summaries[i])
+        finally:
+            if temp_csv_path is not None:
+                try:
+                    os.remove(temp_csv_path)
+                except:
+                    pass
+
+        rows = []
+        for i, (combo, summary) in enumerate(zip(combinations, summaries)):
+            rows.append(dict(combo, **summary, cached=i not in todo))
+        return pd.DataFrame(rows)
+
+    def _shared_addplot(self, data, map_nos, kwargs):
+        """addplot と同じ前処理をした JSON ボディを1回だけ作り、マップごとに送る関数を返す
+
+        addplot_fanout / addplot_sweep 用。DataFrame と weight/type オプションの部分は
+        1回だけ JSON にエンコードして gzip の圧縮器に通しておき、送信ごとに変わる mapNo と
+        identna / detabn パラメータは、その JSON の末尾に続けてボディに入れる
+        （圧縮器の状態を複製して残りだけを圧縮するため、行データの圧縮も1回で済む）。
+        dedupe= と preflight= は addplot() のデコレータと同じように扱う。
+
+        Args:
+            data (pandas.DataFrame): 追加するデータ
+            map_nos (list): 送信先のマップ番号（preflight の検証に使う）
+            kwargs (dict): addplot() のキーワード引数
+
+        Returns:
+            tuple: (send(map_no, fields, async_mode), ボディに含めなかった identna_* / detabn_* 引数)
+
+        Raises:
+            ValueError: prune_columns / keep_columns が指定された場合（取り除く列は
+                ベースマップのスキーマによってマップごとに変わるため、1つのボディを共有できない）
+        """
+        import zlib
+
+        kwargs = dict(kwargs)
+        if kwargs.pop('prune_columns', False) or kwargs.pop('keep_columns', None) is not None:
+            raise ValueError("prune_columns / keep_columns cannot be used when one addplot body is shared "
+                             "across requests; drop the columns from the DataFrame before calling")
+        dedupe = kwargs.pop('dedupe', False)
+        preflight = kwargs.pop('preflight', True)
+        options = {k: kwargs.pop(k) for k in ('weight_option_str', 'type_option_str') if k in kwargs}
+        self._addplot_param_fields(**kwargs)  # 未知の引数はここで TypeError にする
+
+        problems = {}
+        for map_no in (map_nos if preflight else ()):
+            entry = self.map_schemas.get(map_no)
+            if entry is None:
+                continue
+            try:
+                problem = check_addplot(entry, 'dataframe', data)
+            except (OSError, ValueError, TypeError, AttributeError):
+                problem = None  # 読めない入力の扱いはサーバーに任せる
+            if problem is not None:
+                problems[map_no] = problem
+
+        upload, started = data, time.monotonic()
+        if dedupe:
+            upload, inverse = collapse_duplicates(data)
+            print(f"Collapsed {len(data)} rows to {len(upload)} distinct rows before upload.")
+        # 末尾の '}' を除いた共通部分。送信ごとのフィールドはこの後に続ける
+        prefix = json.dumps(self._build_addplot_payload(upload, **options)).encode('utf-8')[:-1]
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip 形式
+        body = (prefix, compressor, compressor.compress(prefix))
+        call_options = self._inherited_call_options()
+
+        def send(map_no, fields, async_mode):
+            if map_no in problems:
+                print(f"Error: addplot preflight check against map {map_no} failed: {problems[map_no]}")
+                return None
+            result = self._addplot_serialized(body, dict(fields, mapNo=map_no), async_mode=async_mode,
+                                              **call_options)
+            if dedupe:
+                result = self._expand_duplicates(result, data, upload, inverse, started)
+            return result
+        return send, kwargs
+
+    @pre_authentication
+    def _addplot_serialized(self, body, fields, async_mode=False):
+        """_shared_addplot() が作った共通部分に fields を加えたボディを1つのマップに送信する
 
-        response = self._post_with_busy_retry(lambda: requests.post(
-            f"{API_URL}/data/addplot", json=data_dict, headers=headers,
+        body は (共通部分の JSON, それを通した gzip の圧縮器, 圧縮済みの共通部分)。fields
+        （mapNo と identna / detabn パラメータ）は JSON のフィールドとしてボディの末尾に加え、
+        圧縮器の複製でその部分だけを圧縮する。gzip に未対応のサーバー (415) には圧縮前の
+        ボディを送り直す。
+        """
+        prefix, compressor, compressed_prefix = body
+        suffix = (', ' + json.dumps(fields)[1:]).encode('utf-8')
+        tail = compressor.copy()
+        compressed = compressed_prefix + tail.compress(suffix) + tail.flush()
+        headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip',
+                   'session-key': self.session_key}
+        response = self._post_with_busy_retry(lambda: self._request(
+            'post', "/data/addplot", data=compressed, headers=headers,
             params=self._async_params(async_mode)))
+        if response.status_code == 415:
+            print("Note: server does not accept gzip-compressed addplot bodies; retrying uncompressed.")
+            del headers['Content-Encoding']
+            response = self._post_with_busy_retry(lambda: self._request(
+                'post', "/data/addplot", data=prefix + suffix, headers=headers,
+                params=self._async_params(async_mode)))
         if async_mode:
             return self._handle_job_submission(response, self._handle_addplot_response)
         return self._handle_addplot_response(response)
 
+    def addplot_stream(self, chunks, mapNo=None, method=None, max_in_flight=2, async_mode=False, **kwargs):
+        """DataFrame / ndarray のチャンクの iterator を順に addplot し、結果を順番に返すジェネレータ
+
+        pandas.read_csv(chunksize=...) などで読み込んだチャンクを、最大 max_in_flight 件まで
+        並行してシリアライズ・アップロード・レスポンス処理する。前のチャンクの送信や
+        サーバーでの処理と並行して次のチャンクを読み込むため、ネットワークとサーバーを
+        途切れさせずに使える。送信中のチャンクが max_in_flight 件に達している間は
+        iterator から次のチャンクを読み込まない（バックプレッシャー）ため、
+        メモリ上に保持するチャンクは高々 max_in_flight + 1 件になる。
+
+        Args:
+            chunks (iterable): pandas.DataFrame または 2次元 numpy.ndarray の iterator
+            mapNo (int, optional): 対象のマップ番号。省略時は現在の mapNo
+            method (str, optional): 使用するメソッド 'addplot' または 'addplot_embedding'。
+                省略時は最初のチャンクが ndarray なら 'addplot_embedding'、それ以外は 'addplot'
+            max_in_flight (int): 同時に送信・処理中にしておくチャンク数の上限
+            async_mode (bool): True なら各チャンクを非同期ジョブとして投入して完了を待つ
+            **kwargs: 各チャンクのメソッド呼び出しに渡す引数（identna_* / detabn_* 等。
+                timeout / total_timeout / cancel_token はチャンクごとに適用される）
+
+        Yields:
+            dict: チャンクごとの結果（メソッドの返り値と同じ形）。入力と同じ順で返し、
+                失敗したチャンクでは None
+
+        Example:
+            reader = pd.read_csv("sensor.csv", chunksize=10000)
+            for result in client.addplot_stream(reader, mapNo=12):
+                print(result['abnormalityStatus'])
+        """
+        if mapNo is None:
+            mapNo = self.mapNo
+        if mapNo is None:
+            print("Error: Map number is not specified. Please provide mapNo or create a basemap first.")
+            return
+        iterator = iter(chunks)
+        try:
+            first = next(iterator)
+        except StopIteration:
+            return
+        if method is None:
+            method = 'addplot_embedding' if isinstance(first, np.ndarray) else 'addplot'
+        if method not in ('addplot', 'addplot_embedding'):
+            raise ValueError("method must be 'addplot' or 'addplot_embedding'")
+        func = getattr(self, method)
+
+        def submit(scheduler, chunk, index):
+            if method == 'addplot':
+                call = lambda async_mode: func(chunk, mapNo, async_mode=async_mode, **kwargs)
+            else:
+                call = lambda async_mode: func(chunk, mapNo=mapNo, async_mode=async_mode, **kwargs)
+            if not async_mode:
+                # 同期実行: スケジューラのワーカーを送信用のスレッドとして使う
+                run = call
+                call = lambda async_mode: run(False)
+            return scheduler.submit(call, name=f"{method} chunk {index + 1}")
+
+        scheduler = JobScheduler(self, max_active=max_in_flight)
+        pending = collections.deque()
+        try:
+            pending.append(submit(scheduler, first, 0))
+            index = 1
+            for chunk in iterator:
+                # 送信中が上限に達している間は次のチャンクを読み込まず、先頭の完了を待って返す
+                while len(pending) >= max_in_flight:
+                    yield self._scheduled_result(pending.popleft())
+                pending.append(submit(scheduler, chunk, index))
+                index += 1
+            while pending:
+                yield self._scheduled_result(pending.popleft())
+        finally:
+            # 途中で打ち切られた場合（break 等）は未投入のチャンクを破棄する
+            scheduler.shutdown(wait=False, cancel_pending=True)
+
+    @staticmethod
+    def _scheduled_result(handle):
+        """JobScheduler のハンドルの結果を返す（ネットワークエラーは表示して None）"""
+        try:
+            return handle.result()
+        except requests.exceptions.RequestException as e:
+            print(f"Network error in {handle.name}: {str(e)}")
+            return None
+
+    def _inherited_call_options(self):
+        """呼び出し中のタイムアウト・中断設定を、別スレッドでの呼び出しに引き継ぐ引数にする"""
+        options = {}
+        if self._call_option('timeout') is not None:
+            options['timeout'] = self._call_option('timeout')
+        if self._call_option('cancel_token') is not None:
+            options['cancel_token'] = self._call_option('cancel_token')
+        deadline = self._call_option('deadline')
+        if deadline is not None:
+            options['total_timeout'] = max(deadline - time.monotonic(), 0.0)
+        return options
+
     def _handle_addplot_response(self, response):
         """addplot のレスポンス処理（同期・非同期ジョブ結果の共通処理）"""
         if response.status_code == 200:
@@ -641,6 +1865,9 @@ class toorPIA:
             return None
 
     @pre_authentication
+    @preprocessing_waveform('addplot')
+    @extracting_features('addplot')
+    @validating_schema('waveform', 'addplot')
     def addplot_waveform(self, files, mapNo=None,
                         # identna parameters
                         identna_resolution=None, identna_effective_radius=None,
@@ -662,7 +1889,7 @@ class toorPIA:
         to ensure that basemap and addplot use identical preprocessing parameters.
         
         Args:
-            files (list): List of WAV/CSV file paths
+            files (list): List of WAV/CSV file paths (or toorpia.waveform.WavWindow time windows)
             mapNo (int, optional): Target map number. If None, uses current mapNo
             identna_resolution (int, optional): Custom resolution for identna
             identna_effective_radius (float or "auto", optional): Custom effective radius. "auto" for automatic determination
@@ -719,8 +1946,11 @@ class toorPIA:
             print("Error: files must be a non-empty list of file paths")
             return None
         
-        files_to_upload = []
         for file_path in files:
+            # Time windows of memory-mapped WAV files are uploaded straight from the mapped buffer
+            if isinstance(file_path, WavWindow):
+                continue
+
             if not os.path.exists(file_path):
                 print(f"Error: File not found: {file_path}")
                 return None
@@ -730,10 +1960,14 @@ class toorPIA:
             if ext not in ['.wav', '.csv']:
                 print(f"Error: Unsupported file format: {ext}. Only .wav and .csv files are supported.")
                 return None
-            
-            files_to_upload.append(('files', open(file_path, 'rb')))
-        
+
+        # Every file header has already been read (in parallel) by validating_schema
+        files_to_upload = []
         try:
+            for file_path in files:
+                handle = file_path.open() if isinstance(file_path, WavWindow) else open(file_path, 'rb')
+                files_to_upload.append(('files', handle))
+
             # Prepare identna parameters
             identna_params = {}
             if identna_resolution is not None:
@@ -766,8 +2000,8 @@ class toorPIA:
             
             headers = {'session-key': self.session_key}  # Content-Type is auto-set by requests
             response = self._post_with_busy_retry(
-                lambda: requests.post(
-                    f"{API_URL}/data/addplot_waveform",
+                lambda: self._request(
+                    'post', "/data/addplot_waveform",
                     files=files_to_upload,
                     data=form_data,
                     headers=headers,
@@ -795,6 +2029,70 @@ class toorPIA:
                 except:
                     pass
 
+    @pre_authentication
+    def addplot_waveform_windows(self, path, window_seconds=60.0, overlap_seconds=0.0, mapNo=None,
+                                 max_workers=4, async_mode=False, drop_partial=False, **kwargs):
+        """長い WAV ファイルを時間区間に分け、区間ごとに addplot_waveform して時刻付きの結果を返す
+
+        ファイルはメモリマップし（toorpia.waveform.wav_windows）、各区間は新しい WAV ファイルを
+        書き出さずにマップしたデータから直接アップロードする。最大 max_workers 区間を並行して送る。
+
+        Args:
+            path (str): WAV ファイルのパス
+            window_seconds (float): 区間の長さ（秒）
+            overlap_seconds (float): 隣り合う区間の重なり（秒）
+            mapNo (int, optional): 対象のマップ番号。省略時は現在の mapNo
+            max_workers (int): 同時に送信する区間の数（async_mode では同時に投入しておくジョブ数）
+            async_mode (bool): True なら各区間を非同期ジョブとして JobScheduler で投入し、完了を待つ
+            drop_partial (bool): True なら末尾の window_seconds に満たない区間を送らない
+            **kwargs: addplot_waveform() に渡す identna_* / detabn_* パラメータ
+
+        Returns:
+            list: 時刻順の区間ごとの addplot_waveform の結果に、window（区間の番号）、
+                startSeconds、endSeconds を加えた辞書のリスト（失敗した区間は None）。
+                ファイルを区間に分けられない場合は None
+        """
+        target_mapNo = mapNo if mapNo is not None else self.mapNo
+        if target_mapNo is None:
+            print("Error: Map number is not specified. Please provide mapNo or create a basemap first.")
+            return None
+        try:
+            windows = wav_windows(path, window_seconds, overlap_seconds, drop_partial=drop_partial)
+        except (OSError, ValueError) as e:
+            print(f"Error reading WAV file for windowed addplot: {str(e)}")
+            return None
+        if not windows:
+            print(f"Error: {path} has no audio samples.")
+            return None
+        print(f"Sending {len(windows)} window(s) of {window_seconds:g} s from {os.path.basename(path)}...")
+        kwargs.update(self._inherited_call_options())
+
+        with JobScheduler(self, max_active=max_workers) as scheduler:
+            handles = []
+            for i, window in enumerate(windows):
+                name = f"addplot_waveform window {i + 1}/{len(windows)} ({window.start:g} s)"
+                if async_mode:
+                    handles.append(scheduler.submit('addplot_waveform', [window], mapNo=target_mapNo,
+                                                    name=name, **kwargs))
+                else:
+                    # 同期モード: スケジューラのワーカーを送信用のスレッドプールとして使う
+                    handles.append(scheduler.submit(
+                        lambda async_mode, window=window: self.addplot_waveform(
+                            [window], mapNo=target_mapNo, **kwargs), name=name))
+
+        results, failed = [], []
+        for i, (window, handle) in enumerate(zip(windows, handles)):
+            result = self._scheduled_result(handle)
+            if isinstance(result, dict):
+                result.update(window=i, startSeconds=window.start, endSeconds=window.end)
+            else:
+                failed.append(f"{window.start:g}-{window.end:g} s")
+                result = None
+            results.append(result)
+        if failed:
+            print(f"Error: {len(failed)} of {len(windows)} window(s) failed: {', '.join(failed)}")
+        return results
+
     @pre_authentication
     def list_map(self):
         """
@@ -812,7 +2110,7 @@ class toorPIA:
                 - shareUrl: マップの共有URL
         """
         headers = {'Content-Type': 'application/json', 'session-key': self.session_key}
-        response = requests.get(f"{API_URL}/maps", headers=headers)
+        response = self._request('get', "/maps", headers=headers)
         if response.status_code == 200:
             maps = response.json()
             # 各マップにシェアURLが含まれている場合はそのまま返す
@@ -856,12 +2154,13 @@ class toorPIA:
             map_no = self.mapNo
 
         headers = {'Content-Type': 'application/json', 'session-key': self.session_key}
-        response = requests.get(f"{API_URL}/maps/{map_no}/xy", headers=headers)
+        response = self._request('get', f"/maps/{map_no}/xy", headers=headers)
         if response.status_code == 200:
             result = response.json()
             self.shareUrl = result.get('shareUrl')
             # NumPy配列に変換して返す
             np_array = np.array(result.get('xyData', []))
+            self._merge_server_schema(map_no, result)
             return {
                 'mapNo': result.get('mapNo'),
                 'nRecord': result.get('nRecord'),
@@ -878,6 +2177,147 @@ class toorPIA:
             print(f"Failed to get map XY data. Server responded with error: {error_message}")
             return None
 
+    def _fetch_map_schema(self, map_no):
+        """サーバーに記録されたマップの作成方式をスキーマのキャッシュに反映する（失敗しても何もしない）"""
+        headers = {'Content-Type': 'application/json', 'session-key': self.session_key}
+        try:
+            response = self._request('get', f"/maps/{map_no}/xy", headers=headers)
+            if response.status_code == 200:
+                self._merge_server_schema(map_no, response.json())
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+
+    def _merge_server_schema(self, map_no, result):
+        """get_map_xy のレスポンスの作成方式と次元数をスキーマのキャッシュに反映する
+
+        手元の記録と作成方式が違う場合（別のマップに同じ番号が使われた場合など）は
+        サーバーの情報で置き換える。
+        """
+        method = result.get('processMethod')
+        if method is None:
+            return
+        entry = self.map_schemas.get(map_no)
+        if entry is None or entry.get('processMethod') != method:
+            entry = {'processMethod': method}
+        if method == 'embedding' and result.get('nDimension') is not None:
+            entry.setdefault('nDimension', int(result['nDimension']))
+        self.map_schemas.put(map_no, entry)
+
+    @pre_authentication
+    def local_scorer(self, map_no=None, data=None, export_dir=None, k=8, **options):
+        """
+        ベースマップの入力データと座標から、addplot の一次判定に使う LocalScorer を作る
+
+        座標は get_map_xy() で取得する。data を省略した場合は export_map() で書き出した
+        input/ の CSV（csvform のマップ）をベースマップの入力として読み込む。距離の計算に
+        使う列と重みは、このクライアントで作成したマップなら記録したスキーマ
+        （client.map_schemas）の weight_option_str に従い、それ以外は数値の列をすべて使う。
+
+        Args:
+            map_no (int, optional): マップ番号。指定がない場合は現在のマップ番号を使用
+            data (pandas.DataFrame or numpy.ndarray, optional): ベースマップの作成に使った入力
+                （アップロードした行と同じ順）。省略時は export_map() の input/ を使う
+            export_dir (str, optional): data を省略した場合の書き出し先（省略時は一時ディレクトリ）
+            k (int): 近傍の数
+            **options: LocalScorer に渡すその他の引数（quantile, columns, weights など）
+
+        Returns:
+            LocalScorer: 作成したスコアラー。失敗した場合はNone
+        """
+        import pandas as pd  # 入力の読み込みに必要
+
+        if map_no is None:
+            if self.mapNo is None:
+                print("Error: Map number is not specified. Please provide a map_no or use fit_transform() first.")
+                return None
+            map_no = self.mapNo
+
+        map_xy = self.get_map_xy(map_no)
+        if map_xy is None:
+            return None
+
+        if data is None:
+            import shutil
+            import tempfile
+            directory = export_dir or tempfile.mkdtemp(prefix='toorpia-map-')
+            try:
+                if self.export_map(map_no, directory) is None:
+                    return None
+                paths = sorted(glob.glob(os.path.join(directory, 'input', '*.csv')))
+                if not paths:
+                    print("Error: The exported map has no input/*.csv files. "
+                          "Pass the basemap input data explicitly (data=...).")
+                    return None
+                data = pd.concat([pd.read_csv(p) for p in paths], ignore_index=True)
+            finally:
+                if export_dir is None:
+                    shutil.rmtree(directory, ignore_errors=True)
+
+        entry = self.map_schemas.get(map_no) or {}
+        if 'columns' not in options and entry.get('columns') is not None and not isinstance(data, np.ndarray):
+            names, weights = scoring_columns(entry['columns'], entry.get('weightOptions'),
+                                             entry.get('dropColumns'))
+            options['columns'] = [c for c in names if c in data.columns]
+            options.setdefault('weights', [w for c, w in zip(names, weights) if c in data.columns])
+        options.setdefault('vector_normalization', entry.get('vectorNormalization') is not False)
+        try:
+            return LocalScorer(data, map_xy['xyData'], k=k, **options)
+        except ValueError as e:
+            print(f"Error building local scorer: {str(e)}")
+            return None
+
+    @pre_authentication
+    def normal_area_index(self, map_no=None, export_dir=None, threshold=None, coverage=DEFAULT_COVERAGE,
+                          extent=None, orientation=None):
+        """
+        ベースマップの正常領域（export_map() の normal_area.dat）を読み込み、点が正常領域に
+        入るかを手元でまとめて判定する NormalAreaIndex を作る
+
+        get_addplot() などで取得した座標の判定をサーバーに問い合わせずに繰り返せる。
+        格子の範囲と threshold の既定値には get_map_xy() で取得したベースマップの座標を使う
+        （threshold を省略すると、ベースマップの点の coverage の割合が正常領域に入る値）。
+
+        Args:
+            map_no (int, optional): マップ番号。指定がない場合は現在のマップ番号を使用
+            export_dir (str, optional): マップの書き出し先。既に書き出してあればそれを読む
+                （省略時は一時ディレクトリに書き出す）
+            threshold (float, optional): 正常とみなす格子の値のしきい値（detabn_threshold に相当）
+            coverage (float): threshold を省略した場合に正常領域に含めるベースマップの点の割合
+            extent (tuple, optional): 行列形式の normal_area.dat の格子の範囲 (xmin, xmax, ymin, ymax)
+            orientation (str, optional): 行列形式の normal_area.dat の並び方（toorpia.normal_area.ORIENTATIONS）
+
+        Returns:
+            NormalAreaIndex: 作成した索引。失敗した場合はNone
+        """
+        if map_no is None:
+            if self.mapNo is None:
+                print("Error: Map number is not specified. Please provide a map_no or use fit_transform() first.")
+                return None
+            map_no = self.mapNo
+
+        map_xy = self.get_map_xy(map_no)
+        if map_xy is None:
+            return None
+
+        import shutil
+        import tempfile
+        directory = export_dir or tempfile.mkdtemp(prefix='toorpia-map-')
+        path = os.path.join(directory, 'normal_area.dat')
+        try:
+            if not os.path.exists(path) and self.export_map(map_no, directory) is None:
+                return None
+            if not os.path.exists(path):
+                print(f"Error: Map {map_no} has no normal_area.dat.")
+                return None
+            return NormalAreaIndex.from_file(path, base_xy=map_xy['xyData'], extent=extent, threshold=threshold,
+                                             coverage=coverage, orientation=orientation)
+        except (OSError, ValueError) as e:
+            print(f"Error reading normal area of map {map_no}: {str(e)}")
+            return None
+        finally:
+            if export_dir is None:
+                shutil.rmtree(directory, ignore_errors=True)
+
     @pre_authentication
     def export_map(self, map_no, export_dir):
         """
@@ -906,7 +2346,7 @@ class toorPIA:
         """
         headers = {'session-key': self.session_key}
         
-        response = requests.get(f"{API_URL}/maps/export/{map_no}", headers=headers)
+        response = self._request('get', f"/maps/export/{map_no}", headers=headers)
         if response.status_code == 200:
             response_data = response.json()
             map_data = response_data.get('mapData', {})
@@ -993,7 +2433,7 @@ class toorPIA:
             'mapData': map_data
         }
         
-        response = requests.post(f"{API_URL}/maps/import", headers=headers, json=data_to_send)
+        response = self._request('post', "/maps/import", headers=headers, json=data_to_send)
         
         if response.status_code == 201:
             response_data = response.json()
@@ -1033,7 +2473,7 @@ class toorPIA:
                 - shareUrl: この追加プロットを含むマップの共有URL
         """
         headers = {'Content-Type': 'application/json', 'session-key': self.session_key}
-        response = requests.get(f"{API_URL}/maps/{map_no}/addplots", headers=headers)
+        response = self._request('get', f"/maps/{map_no}/addplots", headers=headers)
         if response.status_code == 200:
             self.addPlots = response.json()
             return self.addPlots
@@ -1043,6 +2483,8 @@ class toorPIA:
             return None
 
     @pre_authentication
+    @pruning('csv_add', 'addplot')
+    @validating_schema('csvform', 'addplot')
     def addplot_csvform(self, files, mapNo=None,
                        # identna parameters
                        identna_resolution=None, identna_effective_radius=None,
@@ -1145,8 +2587,8 @@ class toorPIA:
             
             headers = {'session-key': self.session_key}  # Content-Type is auto-set by requests
             response = self._post_with_busy_retry(
-                lambda: requests.post(
-                    f"{API_URL}/data/addplot_csvform",
+                lambda: self._request(
+                    'post', "/data/addplot_csvform",
                     files=files_to_upload,
                     data=form_data,
                     headers=headers,
@@ -1175,6 +2617,8 @@ class toorPIA:
                     pass
 
     @pre_authentication
+    @projecting('addplot')
+    @validating_schema('embedding', 'addplot')
     def addplot_embedding(self, files, mapNo=None,
                          # identna parameters
                          identna_resolution=None, identna_effective_radius=None,
@@ -1183,7 +2627,9 @@ class toorPIA:
                          detabn_max_window=5, detabn_rate_threshold=1.0,
                          detabn_threshold=None, detabn_print_score=True,
                          # async job mode
-                         async_mode=False):
+                         async_mode=False,
+                         # lossy upload encoding of in-memory input
+                         quantization=None):
         """
         Process embedding data for addplot (additional plot) analysis
 
@@ -1211,6 +2657,8 @@ class toorPIA:
             async_mode (bool, optional): If True, submit in the server's asynchronous job
                 mode (?async=true) and return a Job handle immediately instead of blocking.
                 Call job.wait() to get the same return value as the synchronous call. Default: False.
+            quantization (str, optional): Opt-in lossy encoding of in-memory input before upload,
+                'float16' or 'int8' (see basemap_embedding). Default: None (%.7g).
 
         Returns:
             dict: Dictionary containing:
@@ -1234,7 +2682,7 @@ class toorPIA:
         # ndarray/DataFrame direct input: convert to a temporary CSV file
         temp_csv_path = None
         if not isinstance(files, (str, list)):
-            temp_csv_path = self._convert_inmemory_embedding(files)
+            temp_csv_path = self._convert_inmemory_embedding(files, quantization)
             if temp_csv_path is None:
                 return None
             files = [temp_csv_path]
@@ -1314,6 +2762,491 @@ class toorPIA:
                 except:
                     pass
 
+    def _prepare_subsample(self, data, subsample, kind, kwargs):
+        """subsample オプションに従って入力を縮約する（subsampling デコレータ用）
+
+        ファイルの入力は、選んだ行を元のファイルから1行ずつそのまま（バイト列のまま）コピーした
+        同じ名前のファイルにする（数値の書式・列名・ファイル名は元のまま）。選んだ行が無い
+        ファイルは送らない。
+
+        Returns:
+            tuple: (メソッドに渡す縮約後の入力, 選んだ行の位置, 削除すべき一時ディレクトリ
+                または None)。入力の読み込みに失敗した場合は None
+        """
+        import pandas as pd  # 縮約時のみ必要
+
+        options = {'size': subsample} if isinstance(subsample, (int, float)) else dict(subsample)
+        size = options.pop('size', None)
+        if size is None:
+            raise ValueError("subsample must be a row count, a fraction, or a dict with 'size'")
+        try:
+            if kind == 'csv':
+                paths = [data] if isinstance(data, str) else list(data)
+                tables = [(pd.read_csv(p), True) for p in paths]
+                table = pd.concat([t for t, _ in tables], ignore_index=True)
+                drop_columns = kwargs.get('drop_columns')
+                if drop_columns and 'columns' not in options:
+                    # サーバーで除外される列は代表性の計算にも使わない
+                    options['columns'] = [c for c in table.select_dtypes(include='number').columns
+                                          if c not in drop_columns]
+            elif kind == 'embedding' and isinstance(data, (str, list)):
+                paths = [data] if isinstance(data, str) else list(data)
+                tables = [self._read_embedding_csv(p) for p in paths]
+                table = pd.concat([t for t, _ in tables], ignore_index=True)
+            else:
+                table = data
+        except (OSError, ValueError) as e:
+            print(f"Error reading data for subsampling: {str(e)}")
+            return None
+
+        indices = select_rows(table, size, **options)
+        print(f"Subsampled {len(table)} rows to {len(indices)} "
+              f"({options.get('method', 'coreset')}) before upload.")
+        subset = table[indices] if isinstance(table, np.ndarray) else table.iloc[indices]
+        if table is data:
+            return subset, indices, None
+
+        import shutil
+        import tempfile
+        temp_dir = tempfile.mkdtemp(prefix='toorpia-subsample-')
+        uploads, offset = [], 0
+        try:
+            for path, (part, header) in zip(paths, tables):
+                rows = indices[(indices >= offset) & (indices < offset + len(part))] - offset
+                offset += len(part)
+                if len(rows):
+                    destination = os.path.join(temp_dir, f"{len(uploads)}", os.path.basename(path))
+                    os.makedirs(os.path.dirname(destination))
+                    self._copy_csv_rows(path, destination, rows, header, len(part))
+                    uploads.append(destination)
+        except (OSError, ValueError) as e:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            print(f"Error copying subsampled rows: {str(e)}")
+            return None
+        return uploads, indices, temp_dir
+
+    @staticmethod
+    def _copy_csv_rows(path, destination, rows, header, count):
+        """CSV ファイルのヘッダ行と、rows 番目（0始まり、昇順）のデータ行をそのまま destination に書き出す
+
+        データ行は pandas と同じく空行を除いた行（引用符の中の改行は行の区切りとしない）。
+        .gz のファイルは展開して読み、同じ形式で書き出す。count（pandas で読んだ行数）と
+        データ行の数が合わない場合は ValueError。
+        """
+        import gzip
+
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            raw = f.read()
+        records, pending = [], b''
+        for line in raw.splitlines(keepends=True):
+            pending += line
+            if pending.count(b'"') % 2:
+                continue  # 引用符の中の改行
+            if pending.strip():
+                records.append(pending)
+            pending = b''
+        if pending.strip():
+            records.append(pending)
+        head, records = (records[:1], records[1:]) if header else ([], records)
+        if len(records) != count:
+            raise ValueError(f"'{path}' has {len(records)} data lines but {count} rows were read")
+        newline = b'\r\n' if raw.find(b'\r\n') >= 0 else b'\n'
+        with opener(destination, 'wb') as f:
+            for record in head + [records[i] for i in rows]:
+                f.write(record if record.endswith((b'\n', b'\r')) else record + newline)
+
+    @staticmethod
+    def _read_embedding_csv(path):
+        """埋め込み CSV を読み込み、(DataFrame, ヘッダ行の有無) を返す
+
+        サーバーと同様にヘッダ行の有無を推定する: 2行目以降が数値の列で1行目が
+        数値でなければ、1行目をヘッダとみなす。
+        """
+        import pandas as pd
+
+        table = pd.read_csv(path, header=None)
+        if len(table) < 2:
+            return table, False
+        rest = table.iloc[1:]
+        numeric = [c for c in table.columns if pd.to_numeric(rest[c], errors='coerce').notna().all()]
+        has_header = any(pd.isna(pd.to_numeric(pd.Series([table.iloc[0][c]]), errors='coerce')).iloc[0]
+                         for c in numeric)
+        if has_header:
+            table.columns = table.iloc[0]
+            table = table.iloc[1:].reset_index(drop=True)
+            for c in table.columns[[i for i, c in enumerate(rest.columns) if c in numeric]]:
+                table[c] = pd.to_numeric(table[c])
+        return table, has_header
+
+    @staticmethod
+    def _make_projection(projection, l2_normalization=None):
+        """projection オプション（次元数・分散の割合・dict・EmbeddingProjection）から射影を作る
+
+        射影の前の L2 正規化は、サーバーの l2_normalization（既定 True）に合わせる。
+        """
+        if isinstance(projection, EmbeddingProjection):
+            return projection
+        options = {'n_components': projection} if isinstance(projection, (int, float)) else dict(projection)
+        options.setdefault('normalize', l2_normalization is not False)
+        return EmbeddingProjection(**options)
+
+    def _project_embedding(self, files, projection, id_columns, fit):
+        """埋め込みデータ（ndarray / DataFrame / CSV ファイル）に射影をかける
+
+        先頭の ID 列はそのまま残し、残りの列を射影する。ベースマップと同じ形式
+        （列名付きなら pc1, pc2, ... の列名、列名なしなら ndarray）で返す。
+
+        Returns:
+            numpy.ndarray or pandas.DataFrame: 射影後のデータ。失敗した場合は None
+        """
+        import pandas as pd  # 射影時のみ必要
+
+        try:
+            if isinstance(files, np.ndarray):
+                table, header = files, False
+            elif isinstance(files, (str, list)):
+                paths = [files] if isinstance(files, str) else list(files)
+                tables = [self._read_embedding_csv(p) for p in paths]
+                table, header = pd.concat([t for t, _ in tables], ignore_index=True), tables[0][1]
+            else:
+                table, header = files, True
+
+            ids = None
+            if isinstance(table, np.ndarray):
+                X = table
+            else:
+                if id_columns is None:
+                    # サーバーと同様に先頭の非数値の列を ID 列とみなす
+                    id_columns = 0
+                    for dtype in table.dtypes:
+                        if pd.api.types.is_numeric_dtype(dtype):
+                            break
+                        id_columns += 1
+                ids = table.iloc[:, :id_columns].reset_index(drop=True) if id_columns else None
+                X = table.iloc[:, id_columns or 0:].to_numpy(dtype=float)
+
+            if fit:
+                Z = projection.transform(X) if projection.fitted else projection.fit_transform(X)
+                projection.header = bool(header or ids is not None)
+                projection.id_columns = 0 if ids is None else ids.shape[1]
+            else:
+                Z = projection.transform(X)
+        except (OSError, ValueError) as e:
+            print(f"Error projecting embedding data: {str(e)}")
+            return None
+
+        if not projection.header and ids is None:
+            return Z
+        frame = pd.DataFrame(Z, columns=[f"pc{i + 1}" for i in range(Z.shape[1])])
+        return frame if ids is None else pd.concat([ids, frame], axis=1)
+
+    def _remember_projection(self, result, projection):
+        """作成されたマップの番号に対応付けて射影を保存する（非同期ジョブは完了時に保存）"""
+        if isinstance(result, Job):
+            parser = result._parser
+            result._parser = lambda response: self._remember_projection(parser(response), projection)
+            return result
+        if not isinstance(result, dict) or result.get('mapNo') is None:
+            return result
+        try:
+            self.projections.save(result['mapNo'], projection)
+        except OSError as e:
+            print(f"Warning: could not save projection for map {result['mapNo']}: {str(e)}")
+        result['projection'] = {
+            'method': projection.method,
+            'inputDim': projection.input_dim,
+            'outputDim': projection.output_dim,
+            'explainedVariance': (float(np.sum(projection.explained_variance_ratio))
+                                  if projection.explained_variance_ratio is not None else None),
+        }
+        return result
+
+    def _attach_sample_indices(self, result, indices):
+        """縮約に使った行の位置を結果と client.sampleIndices に記録する（非同期ジョブは完了時に記録）"""
+        if isinstance(result, Job):
+            parser = result._parser
+            result._parser = lambda response: self._attach_sample_indices(parser(response), indices)
+            return result
+        if result is None:
+            return None
+        self.sampleIndices = indices
+        if isinstance(result, dict):
+            result['sampleIndices'] = indices
+        return result
+
+    def _prune_columns(self, kind, data, arguments, prune_columns, keep_columns):
+        """重み 0 の列を取り除く（pruning デコレータ用）
+
+        arguments（元のメソッドの引数）の weight_option_str / type_option_str / drop_columns を
+        取り除いた後の列に合わせて書き換える。未指定（None）のオプションは None のまま
+        にして、取り除いた後のデータから改めて自動生成させる。
+
+        Returns:
+            tuple: (メソッドに渡すデータ, 取り除いた列名, 取り除いた列の DataFrame,
+                削除すべき一時ファイルのパスまたは None)。読み込みに失敗した場合は None
+        """
+        import pandas as pd  # 列の取り除きに必要
+
+        paths = None
+        try:
+            if kind == 'dataframe':
+                table = data
+            else:
+                paths = [data] if isinstance(data, str) else list(data)
+                table = pd.concat([pd.read_csv(p) for p in paths], ignore_index=True)
+        except (OSError, ValueError) as e:
+            print(f"Error reading data for column pruning: {str(e)}")
+            return None
+
+        weight_option_str = arguments.get('weight_option_str')
+        type_option_str = arguments.get('type_option_str')
+        drop_columns = arguments.get('drop_columns')
+        if kind == 'csv_add' and not isinstance(prune_columns, bool):
+            names = [c for c in prune_columns if c in table.columns]
+            positions = [table.columns.get_loc(c) for c in names]
+        else:
+            weights = weight_option_str
+            if weights is None:
+                weights, _ = self._generate_type_weight_options(table)
+            try:
+                positions = zero_weight_columns(table.columns, weights, keep_columns, drop_columns)
+            except ValueError as e:
+                print(f"Error: {str(e)}")
+                return None
+            names = [table.columns[p] for p in positions]
+        if not positions:
+            return data, [], None, None
+
+        pruned = table.drop(columns=names)
+        for name, value in (('weight_option_str', weight_option_str), ('type_option_str', type_option_str)):
+            if value is not None:
+                arguments[name] = reindex_options(value, table.shape[1], positions)
+        if drop_columns:
+            remaining = [c for c in drop_columns if c in pruned.columns]
+            arguments['drop_columns'] = remaining or None
+
+        temp_path = None
+        if paths is None:
+            before, after = estimate_row_bytes(table), estimate_row_bytes(pruned)
+            upload = pruned
+        else:
+            import tempfile
+            fd, temp_path = tempfile.mkstemp(suffix='.csv')
+            os.close(fd)
+            pruned.to_csv(temp_path, index=False)
+            before, after = sum(os.path.getsize(p) for p in paths), os.path.getsize(temp_path)
+            upload = [temp_path]
+        saved = 100.0 * (1 - after / before) if before else 0.0
+        print(f"Pruned {len(names)} zero-weight column(s) before upload ({', '.join(map(str, names))}): "
+              f"~{saved:.0f}% smaller upload.")
+        return upload, names, compact_attributes(table[names]), temp_path
+
+    def _attach_pruned_columns(self, result, names, attributes):
+        """取り除いた列を結果と client.prunedColumns / prunedAttributes に記録する（非同期ジョブは完了時）"""
+        if isinstance(result, Job):
+            parser = result._parser
+            result._parser = lambda response: self._attach_pruned_columns(parser(response), names, attributes)
+            return result
+        if result is None:
+            return None
+        self.prunedColumns = names
+        self.prunedAttributes = attributes
+        if isinstance(result, dict):
+            result['prunedColumns'] = names
+        return result
+
+    def _expand_duplicates(self, result, data, unique, inverse, started):
+        """重複を除いた入力に対する結果を元の行数に展開する（非同期ジョブは完了時に展開）"""
+        if isinstance(result, Job):
+            parser = result._parser
+            result._parser = lambda response: self._expand_duplicates(
+                parser(response), data, unique, inverse, started)
+            return result
+        if result is None:
+            return None
+        stats = dedupe_stats(data, unique, time.monotonic() - started)
+        self.dedupeStats = stats
+        if isinstance(result, dict):
+            result = expand_addplot_result(result, inverse)
+            result['dedupe'] = stats
+            return result
+        return np.asarray(result)[inverse]
+
+    def _basemap_schema(self, kind, data, signature, args, kwargs, inspected=None):
+        """ベースマップ作成の入力と引数からスキーマを作る（validating_schema デコレータ用。失敗時は None）"""
+        try:
+            bound = signature.bind_partial(self, data, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            if kind == 'dataframe':
+                weights, types = self._generate_type_weight_options(data)
+                arguments['weight_option_str'] = arguments.get('weight_option_str') or weights
+                arguments['type_option_str'] = arguments.get('type_option_str') or types
+            return basemap_schema(kind, data, arguments, inspected)
+        except (OSError, ValueError, TypeError, AttributeError):
+            return None
+
+    def _addplot_target(self, kind, signature, data, args, kwargs):
+        """addplot 系メソッドの対象のマップ番号（ディレクトリから取り込む場合は None）"""
+        if kind == 'dataframe':
+            if any(isinstance(arg, str) for arg in args):
+                return None
+            numbers = [arg for arg in args if isinstance(arg, int)]
+            return numbers[-1] if numbers else self.mapNo
+        try:
+            map_no = signature.bind_partial(self, data, *args, **kwargs).arguments.get('mapNo')
+        except TypeError:
+            return None
+        return map_no if map_no is not None else self.mapNo
+
+    def _remember_map_schema(self, result, entry):
+        """作成されたマップの番号に対応付けてスキーマを記録する（非同期ジョブは完了時に記録）"""
+        if isinstance(result, Job):
+            parser = result._parser
+            result._parser = lambda response: self._remember_map_schema(parser(response), entry)
+            return result
+        if result is None or entry is None:
+            return result
+        map_no = result.get('mapNo') if isinstance(result, dict) else self.mapNo
+        if map_no is not None:
+            self.map_schemas.put(map_no, entry)
+        return result
+
+    def _inspect_waveform_batch(self, role, files, signature, args, kwargs):
+        """basemap_waveform / addplot_waveform のファイルのヘッダを並行して検証する（validating_schema 用）
+
+        存在しない・対応していない形式のファイルを含む入力はメソッド本体のエラー処理に任せる。
+
+        Returns:
+            dict: ファイルのパスごとの inspect_waveform_file() の結果（検証しなかった場合は空）。
+                問題があれば表示して None
+        """
+        if not isinstance(files, list) or not files:
+            return {}
+        for path in files:
+            if isinstance(path, WavWindow):
+                continue
+            if not os.path.exists(path) or os.path.splitext(path)[1].lower() not in ('.wav', '.csv'):
+                return {}
+        try:
+            bound = signature.bind_partial(self, files, *args, **kwargs)
+        except TypeError:
+            return {}
+        if role == 'basemap':
+            bound.apply_defaults()
+            data_index = bound.arguments.get('mkfftseg_di')
+        else:
+            map_no = bound.arguments.get('mapNo')
+            map_no = map_no if map_no is not None else self.mapNo
+            entry = (self.map_schemas.get(map_no) if map_no is not None else None) or {}
+            data_index = (entry.get('mkfftseg') or {}).get('di', 1)
+        summary = self._validate_waveform_files(files, data_index)
+        if summary is None:
+            return None
+        return {detail['path']: detail for detail in summary['details']}
+
+    def _validate_waveform_files(self, files, data_index, check_rates=True, sample_rates=None):
+        """波形ファイルのヘッダを並行して検証し、結果を client.waveformValidation に記録する
+
+        Returns:
+            dict: validate_waveform_files の結果。問題があれば表示して None
+        """
+        try:
+            summary = validate_waveform_files(files, data_index=data_index, sample_rates=sample_rates,
+                                              check_rates=check_rates)
+        except ValueError as e:
+            print(f"Error: waveform file validation failed: {str(e)}")
+            return None
+        if summary['files'] < len(files):
+            # 時間区間や前処理した波形（WavWindow）を含むバッチは元のファイルの検証結果を残す
+            return summary
+        self.waveformValidation = summary
+        if summary['wavFiles']:
+            print(f"Validated {summary['files']} waveform file(s): "
+                  f"{summary['totalDurationSeconds']:.1f} s of audio, {summary['totalBytes'] / 1e6:.1f} MB.")
+        return summary
+
+    def _preprocess_waveform_files(self, files, options):
+        """WAV ファイルを1チャンネル・options['sampleRate'] Hz にする（preprocessing_waveform デコレータ用）
+
+        変換した量を client.waveformPreprocessing に記録する。
+
+        Returns:
+            list: 送るファイル（変換した WAV は WavWindow）。変換できなければ表示して None
+        """
+        sample_rate, channel = int(options['sampleRate']), options['channel']
+        prepared = []
+        stats = {'files': len(files), 'converted': 0, 'sampleRate': sample_rate, 'channel': channel,
+                 'inputBytes': 0, 'uploadBytes': 0}
+        try:
+            for path in files:
+                if not isinstance(path, WavWindow) and not str(path).lower().endswith('.wav'):
+                    prepared.append(path)
+                    continue
+                info = path.info if isinstance(path, WavWindow) else wav_format(path)
+                if info['channels'] == 1 and info['sampleRate'] == sample_rate:
+                    prepared.append(path)
+                    continue
+                converted = preprocess_waveform(path, sample_rate, channel)
+                stats['converted'] += 1
+                stats['inputBytes'] += len(path.data) if isinstance(path, WavWindow) else info['dataSize']
+                stats['uploadBytes'] += len(converted.data)
+                prepared.append(converted)
+        except (OSError, ValueError) as e:
+            print(f"Error: waveform preprocessing failed: {str(e)}")
+            return None
+        self.waveformPreprocessing = stats
+        if stats['converted']:
+            print(f"Preprocessed {stats['converted']} WAV file(s) to 1 channel at {sample_rate} Hz: "
+                  f"{stats['inputBytes'] / 1e6:.1f} MB -> {stats['uploadBytes'] / 1e6:.1f} MB.")
+        return prepared
+
+    def _remember_waveform_preprocess(self, result, options):
+        """前処理して作ったマップのスキーマに前処理の設定を記録する（非同期ジョブは完了時に記録）"""
+        if isinstance(result, Job):
+            parser = result._parser
+            result._parser = lambda response: self._remember_waveform_preprocess(parser(response), options)
+            return result
+        if isinstance(result, dict) and result.get('mapNo') is not None:
+            entry = self.map_schemas.get(result['mapNo']) or {'processMethod': 'waveform'}
+            entry['waveformPreprocess'] = dict(options)
+            self.map_schemas.put(result['mapNo'], entry)
+        return result
+
+    def _upload_waveform_features(self, role, features, options, arguments):
+        """クライアント側で作った波形の特徴量を埋め込みとしてアップロードする（extracting_features デコレータ用）
+
+        basemap_waveform / addplot_waveform の引数のうち、basemap_embedding / addplot_embedding が
+        受け付けるもの（identna・detabn・メタデータ・async_mode）を引き継ぐ。
+        """
+        upload = self.basemap_embedding if role == 'basemap' else self.addplot_embedding
+        accepted = inspect.signature(upload).parameters
+        kwargs = {name: value for name, value in arguments.items()
+                  if name in accepted and name not in ('self', 'files')}
+        if role == 'basemap' and arguments.get('vector_normalization') is not None:
+            kwargs['l2_normalization'] = arguments['vector_normalization']
+        summary = {'segments': len(features), 'dimensions': features.shape[1] - 1,
+                   'mkfftseg': dict(options)}
+        print(f"Uploading {summary['segments']} client-side waveform segments "
+              f"x {summary['dimensions']} spectral features.")
+        return self._remember_waveform_features(upload(features, **kwargs), role, summary)
+
+    def _remember_waveform_features(self, result, role, summary):
+        """特徴量で作ったマップのスキーマに mkfftSeg の設定を記録する（非同期ジョブは完了時に記録）"""
+        if isinstance(result, Job):
+            parser = result._parser
+            result._parser = lambda response: self._remember_waveform_features(parser(response), role, summary)
+            return result
+        if not isinstance(result, dict):
+            return result
+        if role == 'basemap' and result.get('mapNo') is not None:
+            entry = self.map_schemas.get(result['mapNo']) or {'processMethod': 'embedding'}
+            entry['waveformFeatures'] = summary['mkfftseg']
+            self.map_schemas.put(result['mapNo'], entry)
+        result['waveformFeatures'] = summary
+        return result
+
     def _handle_basemap_response(self, response, error_prefix):
         """basemap_csvform / basemap_waveform / basemap_embedding のレスポンス処理
         （同期・非同期ジョブ結果の共通処理）
@@ -1344,6 +3277,9 @@ class toorPIA:
             return None
 
     @pre_authentication
+    @subsampling('csv')
+    @pruning('csv')
+    @validating_schema('csvform', 'basemap')
     def basemap_csvform(self, files, weight_option_str=None, type_option_str=None,
                     drop_columns=None, label=None, tag=None, description=None,
                     random_seed=42, identna_resolution=None, identna_effective_radius=None,
@@ -1440,8 +3376,8 @@ class toorPIA:
             # Send as multipart/form-data to new basemap_csvform endpoint
             headers = {'session-key': self.session_key}  # Content-Type is auto-set by requests
             response = self._post_with_busy_retry(
-                lambda: requests.post(
-                    f"{API_URL}/data/basemap_csvform",
+                lambda: self._request(
+                    'post', "/data/basemap_csvform",
                     files=files_to_upload,
                     data=form_data,
                     headers=headers,
@@ -1470,10 +3406,14 @@ class toorPIA:
                     pass
 
     @pre_authentication
+    @subsampling('embedding')
+    @projecting('basemap')
+    @validating_schema('embedding', 'basemap')
     def basemap_embedding(self, files, l2_normalization=None, id_columns=None,
                     label=None, tag=None, description=None,
                     identna_resolution=None, identna_effective_radius=None,
-                    identna_er_method=None, identna_knn_k=None, async_mode=False):
+                    identna_er_method=None, identna_knn_k=None, async_mode=False,
+                    quantization=None):
         """
         Create base map from embedding vectors with unified return structure
 
@@ -1507,6 +3447,9 @@ class toorPIA:
             async_mode (bool, optional): If True, submit in the server's asynchronous job
                 mode (?async=true) and return a Job handle immediately instead of blocking.
                 Call job.wait() to get the same return value as the synchronous call. Default: False.
+            quantization (str, optional): Opt-in lossy encoding of in-memory input before upload:
+                'float16' (relative error <= ~5.4e-4) or 'int8' (per-dimension scale s_j, absolute
+                error <= s_j / 2). File paths are uploaded as-is. Default: None (%.7g).
 
         Returns:
             dict: Dictionary containing:
@@ -1518,7 +3461,7 @@ class toorPIA:
         # ndarray/DataFrame direct input: convert to a temporary CSV file
         temp_csv_path = None
         if not isinstance(files, (str, list)):
-            temp_csv_path = self._convert_inmemory_embedding(files)
+            temp_csv_path = self._convert_inmemory_embedding(files, quantization)
             if temp_csv_path is None:
                 return None
             files = [temp_csv_path]
@@ -1595,6 +3538,9 @@ class toorPIA:
                     pass
 
     @pre_authentication
+    @preprocessing_waveform('basemap')
+    @extracting_features('basemap')
+    @validating_schema('waveform', 'basemap')
     def basemap_waveform(self, files,
                         # mkfftSeg parameters
                         mkfftseg_di=1, mkfftseg_hp=-1.0, mkfftseg_lp=-1.0,
@@ -1646,8 +3592,11 @@ class toorPIA:
             print("Error: files must be a non-empty list of file paths")
             return None
         
-        files_to_upload = []
         for file_path in files:
+            # Preprocessed (downmixed / resampled) waveforms are held in memory
+            if isinstance(file_path, WavWindow):
+                continue
+
             if not os.path.exists(file_path):
                 print(f"Error: File not found: {file_path}")
                 return None
@@ -1657,10 +3606,14 @@ class toorPIA:
             if ext not in ['.wav', '.csv']:
                 print(f"Error: Unsupported file format: {ext}. Only .wav and .csv files are supported.")
                 return None
-            
-            files_to_upload.append(('files', open(file_path, 'rb')))
-        
+
+        # Every file header has already been read (in parallel) by validating_schema
+        files_to_upload = []
         try:
+            for file_path in files:
+                handle = file_path.open() if isinstance(file_path, WavWindow) else open(file_path, 'rb')
+                files_to_upload.append(('files', handle))
+
             # Prepare mkfftSeg options in JSON format
             mkfftseg_options = {
                 'di': int(mkfftseg_di),
@@ -1699,8 +3652,8 @@ class toorPIA:
 
             headers = {'session-key': self.session_key}  # Content-Type is auto-set by requests
             response = self._post_with_busy_retry(
-                lambda: requests.post(
-                    f"{API_URL}/data/basemap_waveform",
+                lambda: self._request(
+                    'post', "/data/basemap_waveform",
                     files=files_to_upload,
                     data=form_data,
                     headers=headers,
@@ -1750,7 +3703,7 @@ class toorPIA:
                 - shareUrl: 追加プロットの共有URL
         """
         headers = {'Content-Type': 'application/json', 'session-key': self.session_key}
-        response = requests.get(f"{API_URL}/maps/{map_no}/addplots/{addplot_no}", headers=headers)
+        response = self._request('get', f"/maps/{map_no}/addplots/{addplot_no}", headers=headers)
         if response.status_code == 200:
             result = response.json()
             self.shareUrl = result.get('shareUrl')
@@ -1812,8 +3765,8 @@ class toorPIA:
         
         # APIリクエスト
         try:
-            response = requests.get(
-                f"{API_URL}/maps/{map_no}/addplots/{addplot_no}/features", 
+            response = self._request(
+                'get', f"/maps/{map_no}/addplots/{addplot_no}/features", 
                 headers=headers,
                 params=params
             )
@@ -1942,72 +3895,20 @@ class toorPIA:
     def _generate_type_weight_options(self, df):
         """
         DataFrameの各列のデータ型に基づいて、-w（重み）と-t（型）のオプション文字列を生成する
-        
+
+        判定は toorpia.schema.infer_type_weight_options（dtype ごとの判定と、文字列列の
+        日付らしさのまとめての判定）で行い、列名と dtype が同じ DataFrame に対しては
+        self.options_cache に保存した結果を再利用する。
+
         Args:
             df (pd.DataFrame): 型情報を取得するDataFrame
-        
+
         Returns:
             tuple: (weight_option_str, type_option_str) - 生成された-wと-tのオプション文字列
         """
-        import pandas as pd
-
-        weight_options = []
-        type_options = []
-        
-        for i, col_name in enumerate(df.columns):
-            col_idx = i + 1  # 列インデックスは1から始まる
-            col_type = df[col_name].dtype
-            
-            # 型に基づいて適切なオプションを決定
-            if pd.api.types.is_datetime64_any_dtype(col_type):
-                type_options.append(f"{col_idx}:date")    # datetime64型用の設定
-                weight_options.append(f"{col_idx}:0")     # datetime64型の重みは0
-            
-            elif pd.api.types.is_float_dtype(col_type):
-                type_options.append(f"{col_idx}:float")   # float型用の設定
-                weight_options.append(f"{col_idx}:1")     # float型の重みは1
-            
-            elif pd.api.types.is_integer_dtype(col_type):
-                type_options.append(f"{col_idx}:int")     # int型用の設定
-                weight_options.append(f"{col_idx}:1")     # int型の重みは1
-            
-            elif pd.api.types.is_string_dtype(col_type) or pd.api.types.is_object_dtype(col_type):
-                # 文字列がdate-likeかどうかをチェック
-                sample = df[col_name].dropna()
-                is_date = False
-                if len(sample) > 0:
-                    try:
-                        pd.to_datetime(sample.head(10), format='mixed')
-                        is_date = True
-                    except (ValueError, TypeError):
-                        pass
-                if is_date:
-                    type_options.append(f"{col_idx}:date")    # 日付文字列型用の設定
-                    weight_options.append(f"{col_idx}:0")     # 日付文字列型の重みは0
-                else:
-                    type_options.append(f"{col_idx}:none")    # 文字列型用の設定
-                    weight_options.append(f"{col_idx}:0")     # 文字列型の重みは0
-            
-            elif pd.api.types.is_categorical_dtype(col_type):
-                type_options.append(f"{col_idx}:enum")    # カテゴリ型用の設定
-                weight_options.append(f"{col_idx}:0")     # カテゴリ型の重みは0
-            
-            elif pd.api.types.is_bool_dtype(col_type):
-                type_options.append(f"{col_idx}:enum")    # ブール型用の設定
-                weight_options.append(f"{col_idx}:0")     # ブール型の重みは0
-            
-            else:
-                # その他の型は未サポートとして扱う
-                type_options.append(f"{col_idx}:none")
-                weight_options.append(f"{col_idx}:0")
-        
-        # コンマ区切りのオプション文字列を生成
-        weight_option_str = ",".join(weight_options) if weight_options else ""
-        type_option_str = ",".join(type_options) if type_options else ""
-        
-        return weight_option_str, type_option_str
+        return self.options_cache.options(df)
 
-    def _convert_inmemory_embedding(self, data):
+    def _convert_inmemory_embedding(self, data, quantization=None):
         """
         Convert in-memory embedding data (2D numpy.ndarray or pandas.DataFrame)
         into a temporary gzip-compressed CSV file (.csv.gz) for multipart upload
@@ -2024,8 +3925,18 @@ class toorPIA:
         coordinates are unaffected. gzip (level 6) further shrinks the numeric
         CSV to roughly 1/2-1/4, reducing upload time accordingly.
 
+        With ``quantization`` the numeric values are first rounded to float16
+        or to per-dimension scaled int8 levels (toorpia.quantization) and
+        written with the fewest digits that identify them uniquely (``%.5g`` /
+        ``%.6g``). The server still receives a plain numeric CSV; the lower
+        precision and the small number of distinct values per column shrink
+        both the text and its gzip output. Purely numeric input is written by
+        table lookup (write_quantized_csv), several times faster than
+        formatting every value.
+
         Args:
             data (numpy.ndarray or pandas.DataFrame): Embedding data (rows=samples, columns=dimensions)
+            quantization (str, optional): None, 'float16' or 'int8'
 
         Returns:
             str: Path of the temporary .csv.gz file, or None on failure.
@@ -2036,6 +3947,10 @@ class toorPIA:
             import tempfile
             import pandas as pd  # pandasはndarray/DataFrame入力時のみ必要
 
+            if quantization not in QUANTIZATIONS:
+                print("Error: quantization must be one of None, 'float16', 'int8'")
+                return None
+            float_format = FLOAT_FORMATS[quantization]
             compression = {'method': 'gzip', 'compresslevel': 6}
             if isinstance(data, np.ndarray):
                 if data.ndim != 2:
@@ -2045,15 +3960,27 @@ class toorPIA:
                 os.close(fd)
                 # headerless output: the server auto-generates the dimension names,
                 # which keeps headerless add data compatible with the basemap's column names
-                pd.DataFrame(data).to_csv(temp_path, index=False, header=False,
-                                          float_format='%.7g', compression=compression)
+                if quantization is not None:
+                    write_quantized_csv(temp_path, data, quantization)
+                else:
+                    pd.DataFrame(data).to_csv(temp_path, index=False, header=False,
+                                              float_format=float_format, compression=compression)
                 return temp_path
             elif isinstance(data, pd.DataFrame):
                 fd, temp_path = tempfile.mkstemp(suffix='.csv.gz')
                 os.close(fd)
+                numeric = data.select_dtypes(include='number').columns
+                if quantization is not None and len(numeric) == data.shape[1]:
+                    header = data.iloc[:0].to_csv(index=False).rstrip('\r\n')
+                    write_quantized_csv(temp_path, data.to_numpy(dtype=float), quantization, header=header)
+                    return temp_path
+                if quantization is not None:
+                    # ID/label columns are left as they are; only the numeric columns are quantized
+                    data = data.copy()
+                    data[numeric] = quantize(data[numeric].to_numpy(dtype=float), quantization)
                 # DataFrame keeps its own header
                 data.to_csv(temp_path, index=False,
-                            float_format='%.7g', compression=compression)
+                            float_format=float_format, compression=compression)
                 return temp_path
             else:
                 print("Error: files must be a file path (string), list of file paths, 2D numpy.ndarray, or pandas.DataFrame")
@@ -2091,7 +4018,7 @@ class toorPIA:
         def _post(paths):
             handles = [('files', open(p, 'rb')) for p in paths]
             try:
-                return requests.post(f"{API_URL}{endpoint}", files=handles,
+                return self._request('post', endpoint, files=handles,
                                      data=form_data, headers=headers, params=params)
             finally:
                 for _, handle in handles:
@@ -1,3 +1,6 @@
 import os
 
-API_URL = os.environ.get('TOORPIA_API_URL', 'https://api.toorpia.com/')
+# カンマ区切りで複数のエンドポイント（バックエンドのレプリカ）を指定できる
+API_URLS = [url.strip() for url in os.environ.get('TOORPIA_API_URL', 'https://api.toorpia.com/').split(',')
+            if url.strip()] or ['https://api.toorpia.com/']
+API_URL = API_URLS[0]
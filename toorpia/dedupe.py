@@ -0,0 +1,75 @@
+import numpy as np
+
+from .chunking import _summarize_distances, estimate_row_bytes
+
+
+def collapse_duplicates(df):
+    """同一の行を1つにまとめる
+
+    各行の内容（インデックスを除く）のハッシュで同一の行を判定し、最初に現れた
+    順に1行ずつ残す。元の行は inverse で復元できる（unique.iloc[inverse] が元の行順）。
+
+    Args:
+        df (pandas.DataFrame): まとめるデータ
+
+    Returns:
+        tuple: (重複を除いた DataFrame, 元の各行に対応する重複除去後の行位置の ndarray)
+    """
+    import pandas as pd  # DataFrame 入力時のみ必要
+
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    _, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    # np.unique はハッシュ順に並べるので、最初に現れた順に並べ替える
+    order = np.argsort(first, kind='stable')
+    rank = np.empty(len(order), dtype=np.intp)
+    rank[order] = np.arange(len(order))
+    return df.iloc[first[order]], rank[inverse.ravel()]
+
+
+def expand_addplot_result(result, inverse):
+    """重複を除いた入力に対する addplot の結果を、元の行順・行数に戻す
+
+    xyData と点ごとの距離（distancesPerPoint / normalizedDistancesPerPoint）を inverse で
+    展開し、距離の集計値は展開後の全点から計算し直す（重複した行はその数だけ数える）。
+    detabn の判定（abnormalityStatus / abnormalityScore / detabn / compositeStatus）は
+    重複を除いた行の並びに対するもので、そのまま残す。
+    """
+    expanded = dict(result)
+    expanded['xyData'] = np.asarray(result['xyData']).reshape(-1, 2)[inverse]
+    diagnostic = result.get('diagnosticScore')
+    distance = diagnostic.get('distance') if diagnostic else None
+    if distance is not None and distance.get('distancesPerPoint') is not None:
+        distance = dict(distance)
+        values = np.asarray(distance['distancesPerPoint'], dtype=float)[inverse]
+        distance['distancesPerPoint'] = values.tolist()
+        if distance.get('normalizedDistancesPerPoint') is not None:
+            normalized = np.asarray(distance['normalizedDistancesPerPoint'], dtype=float)
+            distance['normalizedDistancesPerPoint'] = normalized[inverse].tolist()
+        expanded['diagnosticScore'] = dict(diagnostic, distance=_summarize_distances(distance, values))
+    return expanded
+
+
+def dedupe_stats(df, unique, elapsed):
+    """重複除去による削減量（1回の呼び出し分）
+
+    アップロードのバイト数は行あたりの JSON サイズの見積もり（estimate_row_bytes）から、
+    エンジンの処理時間は行数に比例すると仮定して、実際にかかった時間から見積もる。
+
+    Args:
+        df (pandas.DataFrame): 元のデータ
+        unique (pandas.DataFrame): 重複を除いたデータ
+        elapsed (float): 重複を除いたデータでの呼び出しにかかった秒数
+    """
+    rows, unique_rows = len(df), len(unique)
+    full_bytes = int(round(estimate_row_bytes(df) * rows))
+    uploaded_bytes = int(round(estimate_row_bytes(unique) * unique_rows))
+    return {
+        'rows': rows,
+        'uniqueRows': unique_rows,
+        'duplicateRows': rows - unique_rows,
+        'estimatedBytes': full_bytes,
+        'estimatedBytesUploaded': uploaded_bytes,
+        'estimatedBytesSaved': max(full_bytes - uploaded_bytes, 0),
+        'elapsedSeconds': elapsed,
+        'estimatedSecondsSaved': elapsed * (rows - unique_rows) / unique_rows if unique_rows else 0.0,
+    }
@@ -0,0 +1,180 @@
+import numpy as np
+
+# 距離のしきい値の既定（radiusOfGyration の倍数）。compositeStatus の 'danger' の境界と同じ
+DEFAULT_THRESHOLD_FACTOR = 2.0
+
+
+def basemap_geometry(base_xy):
+    """ベースマップの座標から (重心, radiusOfGyration) を返す
+
+    サーバーと同様に xy.dat（xyData）の座標系で計算する。重心はほぼ原点になる。
+    """
+    base_xy = np.asarray(base_xy, dtype=float).reshape(-1, 2)
+    centroid = base_xy.mean(axis=0)
+    rg = float(np.sqrt(np.mean(np.sum((base_xy - centroid) ** 2, axis=1))))
+    return centroid, rg
+
+
+def point_distances(base_xy, add_xy, centroid=None):
+    """addplot の各点のベースマップ重心からの距離（distancesPerPoint に相当）"""
+    if centroid is None:
+        centroid, _ = basemap_geometry(base_xy)
+    add_xy = np.asarray(add_xy, dtype=float).reshape(-1, 2)
+    return np.hypot(add_xy[:, 0] - centroid[0], add_xy[:, 1] - centroid[1])
+
+
+def _threshold(rg, threshold, threshold_factor):
+    return float(threshold) if threshold is not None else threshold_factor * rg
+
+
+def distance_metrics(base_xy, add_xy, threshold=None, threshold_factor=DEFAULT_THRESHOLD_FACTOR):
+    """1回の addplot の diagnosticScore['distance'] の距離の指標を手元で計算する
+
+    Args:
+        base_xy (array-like): ベースマップの座標（get_map_xy の xyData）
+        add_xy (array-like): addplot の座標（xyData）
+        threshold (float, optional): exceedanceRatio の距離のしきい値
+        threshold_factor (float): threshold を省略した場合の radiusOfGyration の倍数
+
+    Returns:
+        dict: distancesPerPoint, normalizedDistancesPerPoint（ndarray）と meanDistance,
+            distanceStd, radiusOfGyration, normalizedDistance, exceedanceRatio, threshold
+    """
+    centroid, rg = basemap_geometry(base_xy)
+    distances = point_distances(base_xy, add_xy, centroid)
+    limit = _threshold(rg, threshold, threshold_factor)
+    count = len(distances)
+    mean = float(distances.mean()) if count else 0.0
+    return {
+        'distancesPerPoint': distances,
+        'normalizedDistancesPerPoint': distances / rg if rg > 0 else np.zeros(count),
+        'meanDistance': mean,
+        'distanceStd': float(distances.std()) if count else 0.0,
+        'radiusOfGyration': rg,
+        'normalizedDistance': mean / rg if rg > 0 else 0.0,
+        'exceedanceRatio': float(np.mean(distances > limit)) if count else 0.0,
+        'threshold': limit,
+    }
+
+
+def _group_summary(distances, labels, n_groups, rg, limit):
+    """点ごとの距離をグループ（ラベル 0..n_groups-1）ごとに集計する"""
+    # 分散の桁落ちを避けるため、全体の平均を引いた値で和をとる
+    shift = distances.mean() if len(distances) else 0.0
+    centered = distances - shift
+    count = np.bincount(labels, minlength=n_groups).astype(float)
+    total = np.bincount(labels, weights=centered, minlength=n_groups)
+    squares = np.bincount(labels, weights=centered ** 2, minlength=n_groups)
+    exceed = np.bincount(labels, weights=(distances > limit).astype(float), minlength=n_groups)
+    maximum = np.full(n_groups, np.nan)
+    np.fmax.at(maximum, labels, distances)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares / count - mean ** 2, 0.0))
+        mean += shift
+        ratio = exceed / count
+    return _summary(count, mean, std, ratio, maximum, rg, limit)
+
+
+def _summary(count, mean, std, ratio, maximum, rg, limit):
+    return {
+        'count': count.astype(int),
+        'meanDistance': mean,
+        'distanceStd': std,
+        'normalizedDistance': mean / rg if rg > 0 else np.zeros_like(mean),
+        'maxNormalizedDistance': maximum / rg if rg > 0 else np.zeros_like(maximum),
+        'exceedanceRatio': ratio,
+        'radiusOfGyration': rg,
+        'threshold': limit,
+    }
+
+
+def subset_metrics(base_xy, add_xy, groups, threshold=None, threshold_factor=DEFAULT_THRESHOLD_FACTOR):
+    """addplot の点を任意の部分集合（グループ）に分けて距離の指標を計算する
+
+    Args:
+        groups (array-like): 点ごとのグループのラベル（任意の値）、または
+            点の位置の配列のリスト（部分集合どうしは重なってもよい）
+
+    Returns:
+        dict: 'groups'（グループのラベル）と、グループごとの count, meanDistance, distanceStd,
+            normalizedDistance, maxNormalizedDistance, exceedanceRatio の配列
+    """
+    centroid, rg = basemap_geometry(base_xy)
+    distances = point_distances(base_xy, add_xy, centroid)
+    limit = _threshold(rg, threshold, threshold_factor)
+    if isinstance(groups, (list, tuple)) and groups and np.ndim(groups[0]) == 1:
+        # 位置の配列のリスト: 重なりを許すため、部分集合ごとに点を並べ直して集計する
+        positions = [np.asarray(g, dtype=np.intp) for g in groups]
+        labels = np.repeat(np.arange(len(positions)), [len(p) for p in positions])
+        selected = distances[np.concatenate(positions)] if positions else np.empty(0)
+        result = _group_summary(selected, labels, len(positions), rg, limit)
+        result['groups'] = np.arange(len(positions))
+        return result
+    names, labels = np.unique(np.asarray(groups), return_inverse=True)
+    result = _group_summary(distances, labels.ravel(), len(names), rg, limit)
+    result['groups'] = names
+    return result
+
+
+def window_metrics(base_xy, add_xy, window, step=1, threshold=None, threshold_factor=DEFAULT_THRESHOLD_FACTOR):
+    """addplot の点の連続する窓（長さ window、step 点ずつずらす）ごとの距離の指標
+
+    累積和で全窓を一度に計算するため、窓の数や長さによらず O(点数) で済む。
+
+    Returns:
+        dict: 'start'（各窓の先頭の位置）と、窓ごとの count, meanDistance, distanceStd,
+            normalizedDistance, maxNormalizedDistance, exceedanceRatio の配列
+    """
+    window, step = int(window), int(step)
+    if window < 1 or step < 1:
+        raise ValueError("window and step must be positive")
+    centroid, rg = basemap_geometry(base_xy)
+    distances = point_distances(base_xy, add_xy, centroid)
+    limit = _threshold(rg, threshold, threshold_factor)
+    starts = np.arange(0, max(len(distances) - window + 1, 0), step)
+    stops = starts + window
+
+    def windowed_sum(values):
+        cumulative = np.concatenate([[0.0], np.cumsum(values)])
+        return cumulative[stops] - cumulative[starts]
+
+    shift = distances.mean() if len(distances) else 0.0
+    centered = distances - shift
+    count = np.full(len(starts), float(window))
+    mean = windowed_sum(centered) / window
+    std = np.sqrt(np.maximum(windowed_sum(centered ** 2) / window - mean ** 2, 0.0))
+    mean += shift
+    ratio = windowed_sum((distances > limit).astype(float)) / window
+    if len(starts):
+        stride = distances.strides[0]
+        view = np.lib.stride_tricks.as_strided(distances, shape=(len(distances) - window + 1, window),
+                                               strides=(stride, stride), writeable=False)[starts]
+        maximum = view.max(axis=1)
+    else:
+        maximum = np.empty(0)
+    result = _summary(count, mean, std, ratio, maximum, rg, limit)
+    result['start'] = starts
+    return result
+
+
+def addplot_metrics(base_xy, addplots, threshold=None, threshold_factor=DEFAULT_THRESHOLD_FACTOR):
+    """複数の addplot（過去の結果を含む）の距離の指標をまとめて計算する
+
+    しきい値を変えて過去の addplot を評価し直す用途で、サーバーへの問い合わせは行わない。
+
+    Args:
+        addplots (list): addplot の返り値（'xyData' を持つ dict）または座標の配列のリスト
+
+    Returns:
+        dict: addplot ごとの count, meanDistance, distanceStd, normalizedDistance,
+            maxNormalizedDistance, exceedanceRatio の配列
+    """
+    arrays = [np.asarray(a['xyData'] if isinstance(a, dict) else a, dtype=float).reshape(-1, 2)
+              for a in addplots]
+    sizes = [len(a) for a in arrays]
+    labels = np.repeat(np.arange(len(arrays)), sizes)
+    stacked = np.concatenate(arrays) if arrays else np.empty((0, 2))
+    centroid, rg = basemap_geometry(base_xy)
+    distances = point_distances(base_xy, stacked, centroid)
+    return _group_summary(distances, labels, len(arrays), rg, _threshold(rg, threshold, threshold_factor))
@@ -0,0 +1,163 @@
+import random
+import threading
+import time
+
+
+class Endpoint:
+    """API エンドポイント1つ分の健全性の記録とサーキットブレーカーの状態
+
+    Attributes:
+        url (str): ベースURL
+        state (str): 'closed'（正常）、'open'（遮断中）、'half_open'（試験的に1件だけ通す）
+        latency (float): 応答時間の指数移動平均（秒）。未計測なら None
+        busy_rate (float): 503 (SERVER_BUSY) を受けた割合の指数移動平均 (0.0-1.0)
+        in_flight (int): このエンドポイントに送信中のリクエスト数
+        failures (int): 連続失敗回数（接続エラー・500/502/504）
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.state = 'closed'
+        self.latency = None
+        self.busy_rate = 0.0
+        self.in_flight = 0
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def __repr__(self):
+        return f"<toorPIA Endpoint {self.url} state={self.state}>"
+
+    def load(self):
+        """ルーティング用の負荷スコア（小さいほど優先）"""
+        latency = self.latency if self.latency is not None else 0.0
+        # 503 は Retry-After 分（既定60秒）の待ちを伴うため、応答時間より重く扱う
+        return (latency + 0.05) * (1 + 20 * self.busy_rate) * (1 + self.in_flight)
+
+
+class EndpointPool:
+    """複数の API エンドポイント（バックエンドのレプリカ）へのリクエスト振り分け
+
+    各リクエストは、遮断されていないエンドポイントのうち負荷スコア（応答時間の
+    移動平均 × 503 の頻度 × 送信中の件数）が最も小さいものに送られる。
+    接続エラーや 500/502/504 が failure_threshold 回続いたエンドポイントは
+    サーキットブレーカーで遮断し、recovery_timeout 秒後に1件だけ試験的に
+    リクエストを通して（half-open）、成功すれば復帰させる。
+    全エンドポイントが遮断中の場合は、最も早く遮断されたものを試す。
+
+    Args:
+        urls (list): ベースURLのリスト
+        failure_threshold (int): 遮断するまでの連続失敗回数
+        recovery_timeout (float): 遮断から再試行（half-open）までの秒数
+        alpha (float): 応答時間と 503 頻度の指数移動平均の重み
+    """
+
+    # ブレーカーの失敗として数えるステータスコード（503 は混雑として負荷スコアにのみ反映）
+    FAILURE_STATUS_CODES = (500, 502, 504)
+
+    def __init__(self, urls, failure_threshold=3, recovery_timeout=30.0, alpha=0.2):
+        if isinstance(urls, str):
+            urls = [urls]
+        urls = [url for url in urls if url]
+        if not urls:
+            raise ValueError("at least one API endpoint URL is required")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.failure_threshold = max(int(failure_threshold), 1)
+        self.recovery_timeout = float(recovery_timeout)
+        self.alpha = float(alpha)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def get(self, url):
+        """URL に対応する Endpoint を返す（プールに無い URL なら None）"""
+        for endpoint in self.endpoints:
+            if endpoint.url == url:
+                return endpoint
+        return None
+
+    def select(self, exclude=()):
+        """次のリクエストを送るエンドポイントを選ぶ
+
+        Args:
+            exclude (iterable): 候補から除外する URL（フェイルオーバー時に試行済みのもの）
+
+        Returns:
+            Endpoint: 選ばれたエンドポイント。除外後に候補が無い場合は None
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e.url not in exclude]
+            if not candidates:
+                return None
+            available = []
+            for endpoint in candidates:
+                if endpoint.state == 'closed':
+                    available.append(endpoint)
+                elif (endpoint.state == 'open' and now - endpoint.opened_at >= self.recovery_timeout
+                      and not endpoint._probing):
+                    available.append(endpoint)
+            if not available:
+                # すべて遮断中: 最も早く遮断されたものを試す
+                chosen = min(candidates, key=lambda e: e.opened_at or 0.0)
+            else:
+                best = min(e.load() for e in available)
+                chosen = random.choice([e for e in available if e.load() == best])
+            if chosen.state == 'open':
+                chosen.state = 'half_open'
+                chosen._probing = True
+            return chosen
+
+    def begin(self, endpoint):
+        """リクエスト送信開始を記録する"""
+        with self._lock:
+            endpoint.in_flight += 1
+
+    def record(self, endpoint, latency=None, status_code=None, error=False):
+        """リクエストの結果を記録し、ブレーカーの状態を更新する
+
+        Args:
+            endpoint (Endpoint): 送信先
+            latency (float, optional): 応答までの秒数
+            status_code (int, optional): レスポンスのステータスコード
+            error (bool): 接続エラー等でレスポンスが得られなかった場合 True
+        """
+        with self._lock:
+            endpoint.in_flight = max(endpoint.in_flight - 1, 0)
+            if latency is not None:
+                if endpoint.latency is None:
+                    endpoint.latency = latency
+                else:
+                    endpoint.latency += self.alpha * (latency - endpoint.latency)
+            if status_code is not None:
+                busy = 1.0 if status_code == 503 else 0.0
+                endpoint.busy_rate += self.alpha * (busy - endpoint.busy_rate)
+            failed = error or status_code in self.FAILURE_STATUS_CODES
+            if failed:
+                endpoint.failures += 1
+                if endpoint.state == 'half_open' or endpoint.failures >= self.failure_threshold:
+                    endpoint.state = 'open'
+                    endpoint.opened_at = time.monotonic()
+            else:
+                endpoint.failures = 0
+                endpoint.state = 'closed'
+                endpoint.opened_at = None
+            endpoint._probing = False
+
+    def abandon(self, endpoint):
+        """送信を途中で打ち切ったリクエストの終了を記録する（健全性は更新しない）"""
+        with self._lock:
+            endpoint.in_flight = max(endpoint.in_flight - 1, 0)
+            if endpoint.state == 'half_open':
+                # 試験リクエストが結果を出さなかったので、次の試験を待つ状態に戻す
+                endpoint.state = 'open'
+            endpoint._probing = False
+
+    def status(self):
+        """各エンドポイントの状態を表示・監視用の dict のリストで返す"""
+        with self._lock:
+            return [{
+                'url': e.url, 'state': e.state, 'latency': e.latency,
+                'busyRate': e.busy_rate, 'inFlight': e.in_flight, 'failures': e.failures,
+            } for e in self.endpoints]
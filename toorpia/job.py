@@ -1,4 +1,5 @@
 import json
+import random
 import time
 
 
@@ -21,6 +22,116 @@ class _JobHttpResponse:
         return json.dumps(self._body, ensure_ascii=False)
 
 
+def _parse_seconds(value):
+    """Retry-After / etaSeconds などの秒数表現を float に変換する（解釈できなければ None）"""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return seconds if seconds >= 0 else None
+
+
+class AdaptivePolling:
+    """Job.wait() のポーリング間隔を決める適応的な戦略
+
+    投入直後は短い間隔（initial_interval 秒）で問い合わせ、ジョブが続く間は
+    backoff 倍ずつ max_interval 秒まで間隔を広げる。各間隔には ±jitter の
+    ランダムな揺らぎを加え、多数のジョブを同時に待つ場合にポーリングが
+    同じ瞬間に揃わないようにする。
+
+    サーバーが以下のヒントを返す場合はそれを優先する:
+        - Retry-After ヘッダ / ボディの retryAfter: その秒数より早くは再問い合わせしない
+        - ボディの etaSeconds: 完了見込み時刻に合わせて次の問い合わせを行う
+        - ボディの progress (0.0-1.0、1 を超える値は百分率とみなす):
+          実行開始からの経過時間と進捗率から残り時間を推定する
+
+    long_poll=True のときは GET /jobs/:jobId に ?wait=<long_poll_timeout> を付けて
+    問い合わせる。ロングポーリング対応サーバーは状態が変わるまで応答を保留するため、
+    保留された（応答に長く掛かった）場合は待たずに次の問い合わせを行う。
+    未対応サーバーはパラメータを無視して即応答するので、通常の間隔制御に戻る。
+
+    Example:
+        result = job.wait(polling=AdaptivePolling(max_interval=60, long_poll=True))
+    """
+
+    # Retry-After として受け付ける最大秒数（_post_with_busy_retry と同じ上限）
+    MAX_RETRY_AFTER = 600
+
+    def __init__(self, initial_interval=0.5, max_interval=30.0, backoff=1.5, jitter=0.2,
+                 long_poll=False, long_poll_timeout=30):
+        self.initial_interval = float(initial_interval)
+        self.max_interval = max(float(max_interval), self.initial_interval)
+        self.backoff = max(float(backoff), 1.0)
+        self.jitter = min(max(float(jitter), 0.0), 1.0)
+        self.long_poll = bool(long_poll)
+        self.long_poll_timeout = long_poll_timeout
+        self.reset()
+
+    def reset(self):
+        """新しいジョブの待機を始める前に内部状態を初期化する"""
+        self._interval = self.initial_interval
+        self._running_since = None
+
+    def request_params(self):
+        """問い合わせ時に付けるクエリパラメータ（ロングポーリング用）"""
+        if self.long_poll:
+            return {'wait': str(int(self.long_poll_timeout))}
+        return None
+
+    def next_interval(self, status, info=None, headers=None, elapsed=0.0):
+        """直近の問い合わせ結果から、次の問い合わせまでの待ち時間（秒）を返す
+
+        Args:
+            status (str): 直近のジョブステータス（問い合わせ失敗時は None）
+            info (dict, optional): 直近の GET /jobs/:jobId レスポンスボディ
+            headers (dict, optional): 直近のレスポンスヘッダ
+            elapsed (float): 直近の問い合わせに掛かった秒数
+
+        Returns:
+            float: 次の問い合わせまでの待ち時間（秒）
+        """
+        info = info or {}
+        now = time.monotonic()
+        if status == 'running' and self._running_since is None:
+            self._running_since = now
+
+        # ロングポーリングでサーバーが応答を保留した場合は、すぐに次の問い合わせを行う
+        if self.long_poll and status is not None and elapsed >= 0.5 * float(self.long_poll_timeout):
+            return 0.0
+
+        interval = self._interval
+        self._interval = min(self._interval * self.backoff, self.max_interval)
+
+        eta = _parse_seconds(info.get('etaSeconds'))
+        if eta is None:
+            eta = self._eta_from_progress(info.get('progress'), now)
+        if eta is not None:
+            interval = min(max(eta, self.initial_interval), self.max_interval)
+
+        if self.jitter > 0:
+            interval *= random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+        retry_after = _parse_seconds((headers or {}).get('Retry-After'))
+        if retry_after is None:
+            retry_after = _parse_seconds(info.get('retryAfter'))
+        if retry_after is not None:
+            interval = max(interval, min(retry_after, self.MAX_RETRY_AFTER))
+        return interval
+
+    def _eta_from_progress(self, progress, now):
+        """進捗率と実行開始からの経過時間から残り秒数を推定する"""
+        try:
+            progress = float(progress)
+        except (TypeError, ValueError):
+            return None
+        if progress > 1:
+            progress /= 100.0
+        if self._running_since is None or not 0 < progress < 1:
+            return None
+        running = now - self._running_since
+        return running * (1 - progress) / progress
+
+
 class Job:
     """?async=true で投入した非同期ジョブのハンドル
 
@@ -40,8 +151,10 @@ class Job:
         self.client = client
         self.job_id = job_id
         self.type = job_type
+        self.endpoint = None  # ジョブを発行したエンドポイントのベースURL
         self.status = 'queued'
         self.raw = None  # 直近の GET /jobs/:jobId レスポンスボディ
+        self.headers = {}  # 直近の GET /jobs/:jobId レスポンスヘッダ
         self._parser = parser
         self._result = None
         self._parsed = False
@@ -49,14 +162,18 @@ class Job:
     def __repr__(self):
         return f"<toorPIA Job {self.job_id} type={self.type} status={self.status}>"
 
-    def refresh(self):
+    def refresh(self, params=None):
         """ジョブの現在の状態を1回問い合わせて反映する
 
+        Args:
+            params (dict, optional): 問い合わせに付けるクエリパラメータ（ロングポーリング用）
+
         Returns:
             str: 現在のステータス ('queued', 'running', 'done', 'failed')。
                  問い合わせに失敗した場合は None
         """
-        info = self.client.get_job(self.job_id)
+        info, headers = self.client._poll_job(self.job_id, params=params, endpoint=self.endpoint)
+        self.headers = headers
         if info is None:
             return None
         self.raw = info
@@ -85,22 +202,40 @@ class Job:
             self._parsed = True
         return self._result
 
-    def wait(self, poll_interval=5, timeout=None):
+    def wait(self, poll_interval=None, timeout=None, polling=None, cancel_token=None):
         """完了までポーリングし、同期実行時と同じ形の結果を返す
 
         Args:
-            poll_interval (float): ポーリング間隔（秒、デフォルト5秒）
+            poll_interval (float, optional): 固定のポーリング間隔（秒）。省略時は
+                AdaptivePolling による適応的な間隔（最初は短く、徐々に最大30秒まで
+                広げる。サーバーの Retry-After / etaSeconds / progress も反映）になる
             timeout (float, optional): 最大待ち時間（秒）。None で無制限。
                 超過してもジョブ自体はサーバー側で継続し、後から result() や
                 client.get_job() で結果を取得できる（結果保持は完了後24時間）
+            polling (AdaptivePolling, optional): 間隔制御の戦略を明示的に指定する。
+                poll_interval と同時に指定した場合は poll_interval が優先される
+            cancel_token (CancelToken, optional): 別スレッドから cancel() されると待機を
+                すぐに打ち切る。タイムアウトと同様、ジョブ自体はサーバー側で継続する
 
         Returns:
-            同期実行時と同じ返り値。タイムアウトまたはジョブ失敗時は None
+            同期実行時と同じ返り値。タイムアウト・中断またはジョブ失敗時は None
         """
+        if poll_interval is None:
+            polling = polling if polling is not None else AdaptivePolling()
+            polling.reset()
+            params = polling.request_params()
+        else:
+            polling = None
+            params = None
         start = time.monotonic()
         failures = 0
         while True:
-            status = self.refresh()
+            if cancel_token is not None and cancel_token.cancelled:
+                print(f"Cancelled: stopped waiting for job {self.job_id} (status: {self.status}).")
+                return None
+            poll_start = time.monotonic()
+            status = self.refresh(params=params)
+            poll_elapsed = time.monotonic() - poll_start
             if status is None:
                 failures += 1
                 if failures >= self.MAX_CONSECUTIVE_POLL_FAILURES:
@@ -113,4 +248,15 @@ class Job:
             if timeout is not None and time.monotonic() - start >= timeout:
                 print(f"Timeout: Job {self.job_id} did not finish within {timeout} seconds (status: {self.status}).")
                 return None
-            time.sleep(poll_interval)
+            if polling is None:
+                delay = poll_interval
+            else:
+                delay = polling.next_interval(status, self.raw if status is not None else None,
+                                              self.headers, poll_elapsed)
+            if timeout is not None:
+                delay = min(delay, max(timeout - (time.monotonic() - start), 0))
+            if delay > 0:
+                if cancel_token is None:
+                    time.sleep(delay)
+                else:
+                    cancel_token.wait(delay)
@@ -0,0 +1,188 @@
+import numpy as np
+
+# 正常とみなす距離のしきい値を決めるベースマップ内の kNN 距離の分位点
+DEFAULT_QUANTILE = 0.99
+# しきい値の推定に使うベースマップの行数の上限
+BASELINE_ROWS = 5000
+# KD 木を使う次元数の上限（これより高次元では総当たりの行列積のほうが速い）
+KDTREE_MAX_DIMENSIONS = 16
+
+
+def _brute_force_knn(index_points, queries, k, block_rows=1024):
+    """NumPy だけでの k 近傍探索（scipy が無い場合）。(距離, 位置) を近い順に返す"""
+    k = min(k, len(index_points))
+    norms = np.einsum('ij,ij->i', index_points, index_points)
+    distances = np.empty((len(queries), k))
+    positions = np.empty((len(queries), k), dtype=np.intp)
+    for start in range(0, len(queries), block_rows):
+        block = queries[start:start + block_rows]
+        squared = block @ index_points.T
+        squared *= -2.0
+        squared += norms
+        squared += np.einsum('ij,ij->i', block, block)[:, None]
+        nearest = np.argpartition(squared, k - 1, axis=1)[:, :k] if k < len(index_points) else \
+            np.tile(np.arange(len(index_points)), (len(block), 1))
+        nearest_sq = np.take_along_axis(squared, nearest, axis=1)
+        order = np.argsort(nearest_sq, axis=1)
+        positions[start:start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:start + len(block)] = np.sqrt(np.maximum(np.take_along_axis(nearest_sq, order, axis=1), 0))
+    return distances, positions
+
+
+def scoring_columns(columns, weight_option_str=None, drop_columns=None):
+    """ベースマップの列と weight_option_str から、距離の計算に使う列とその重みを返す
+
+    重み 0 の列と drop_columns は使わない。weight_option_str に現れない列の重みは 1。
+    """
+    from .pruning import parse_option_str
+
+    weights = parse_option_str(weight_option_str)
+    drop = set(drop_columns or ())
+    names, values = [], []
+    for position, name in enumerate(columns):
+        weight = float(weights.get(position + 1, 1))
+        if name not in drop and weight != 0.0:
+            names.append(name)
+            values.append(weight)
+    return names, values
+
+
+def abnormality_status(flags, max_window=5, rate_threshold=1.0):
+    """点ごとの異常判定から、detabn と同じ考え方（連続する窓の中の異常点の割合）で全体の状態を返す
+
+    長さ max_window（点数が少なければ全点）の連続する窓のいずれかで異常点の割合が
+    rate_threshold 以上なら 'abnormal'、そうでなければ 'normal'。点がなければ 'unknown'。
+    """
+    flags = np.asarray(flags, dtype=float)
+    if len(flags) == 0:
+        return 'unknown'
+    window = max(1, min(int(max_window), len(flags)))
+    sums = np.convolve(flags, np.ones(window), mode='valid')
+    return 'abnormal' if np.any(sums / window >= rate_threshold - 1e-12) else 'normal'
+
+
+class LocalScorer:
+    """ベースマップの入力データと座標から addplot の結果を手元で近似する kNN スコアラー
+
+    サーバーの addplot が返る前の一次判定用。ベースマップの各行を列ごとに標準化して
+    （weights を掛け、vector_normalization なら行ごとに L2 正規化して）KD 木に入れ、新しい行の
+    k 近傍から座標（近傍の座標の距離の逆数による重み付き平均）と正常からの距離を求める。
+    KD 木には scipy.spatial.cKDTree を使い、scipy が無い場合と KDTREE_MAX_DIMENSIONS を超える
+    次元では NumPy の行列積による総当たりで探索する。
+
+    Args:
+        data (pandas.DataFrame or numpy.ndarray): ベースマップの入力（行は xy と同じ順）
+        xy (numpy.ndarray): ベースマップの座標（get_map_xy の xyData）
+        k (int): 近傍の数
+        columns (list, optional): 使う列（DataFrame は列名、ndarray は位置）。既定は数値の列すべて
+        weights (list, optional): columns ごとの重み
+        vector_normalization (bool): 標準化の後に行ごとに L2 正規化する（サーバーの既定に合わせる）
+        quantile (float): 正常とみなす距離のしきい値にする、ベースマップ内の kNN 距離の分位点
+        seed (int): しきい値の推定に使う行を選ぶ乱数の種
+    """
+
+    def __init__(self, data, xy, k=8, columns=None, weights=None, vector_normalization=True,
+                 quantile=DEFAULT_QUANTILE, seed=0):
+        xy = np.asarray(xy, dtype=float)
+        if columns is None:
+            columns = self._numeric_columns(data)
+        self.columns = list(columns)
+        X = self._select(data)
+        if len(X) != len(xy):
+            raise ValueError(f"basemap data has {len(X)} rows but xyData has {len(xy)}")
+        if len(X) < 2:
+            raise ValueError("at least 2 basemap rows are required")
+        self.k = max(1, min(int(k), len(X) - 1))
+        self.xy = xy
+        self.mean = np.nanmean(X, axis=0)
+        std = np.nanstd(X, axis=0)
+        self.scale = np.where(std > 0, std, 1.0)
+        self.weights = np.ones(X.shape[1]) if weights is None else np.asarray(weights, dtype=float)
+        self.vector_normalization = vector_normalization
+        self.points = self._features(X)
+        self._tree = self._build_tree(self.points)
+
+        # しきい値: ベースマップ内の各点から（自身を除く）k 近傍までの平均距離の分位点
+        rng = np.random.default_rng(seed)
+        rows = np.arange(len(X)) if len(X) <= BASELINE_ROWS else \
+            np.sort(rng.choice(len(X), BASELINE_ROWS, replace=False))
+        distances, _ = self._query(self.points[rows], self.k + 1)
+        self.baseline = distances[:, 1:].mean(axis=1)
+        self.threshold = float(np.quantile(self.baseline, quantile)) or 1.0
+
+    @staticmethod
+    def _numeric_columns(data):
+        if isinstance(data, np.ndarray):
+            return list(range(data.shape[1]))
+        import pandas as pd
+        return [c for c in data.columns if pd.api.types.is_numeric_dtype(data[c].dtype)
+                and not pd.api.types.is_bool_dtype(data[c].dtype)]
+
+    def _select(self, data):
+        if isinstance(data, np.ndarray):
+            return np.asarray(data[:, self.columns], dtype=float)
+        missing = [c for c in self.columns if c not in data.columns]
+        if missing:
+            raise ValueError(f"missing columns: {', '.join(map(str, missing))}")
+        return data[self.columns].to_numpy(dtype=float)
+
+    def _features(self, X):
+        Z = (X - self.mean) / self.scale * self.weights
+        Z = np.nan_to_num(Z)  # 欠損値は平均（標準化後の 0）とみなす
+        if self.vector_normalization:
+            norms = np.linalg.norm(Z, axis=1, keepdims=True)
+            Z = Z / np.where(norms > 0, norms, 1.0)
+        return np.ascontiguousarray(Z)
+
+    @staticmethod
+    def _build_tree(points):
+        if points.shape[1] > KDTREE_MAX_DIMENSIONS:
+            return None
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            return None
+        return cKDTree(points)
+
+    def _query(self, queries, k):
+        if self._tree is not None:
+            distances, positions = self._tree.query(queries, k=k)
+            return distances.reshape(len(queries), -1), positions.reshape(len(queries), -1)
+        return _brute_force_knn(self.points, queries, k)
+
+    def score(self, data, max_window=5, rate_threshold=1.0):
+        """新しい行の近似座標と正常からの距離を返す
+
+        Args:
+            data (pandas.DataFrame or numpy.ndarray): addplot する行（ベースマップと同じ列）
+            max_window (int): 全体の状態の判定に使う連続する窓の長さ（detabn_max_window に相当）
+            rate_threshold (float): 窓の中の異常点の割合のしきい値（detabn_rate_threshold に相当）
+
+        Returns:
+            dict:
+                - xyData: 近似座標（各行は [x, y]）
+                - distance: k 近傍までの平均距離
+                - score: distance / threshold（1 を超えると正常の範囲外）
+                - abnormal: 点ごとの判定（score > 1）
+                - abnormalityRate: 正常の範囲外の点の割合
+                - abnormalityStatus: 'normal' / 'abnormal'（点がなければ 'unknown'）
+        """
+        queries = self._features(self._select(data))
+        if len(queries) == 0:
+            empty = np.empty(0)
+            return {'xyData': np.empty((0, 2)), 'distance': empty, 'score': empty,
+                    'abnormal': empty.astype(bool), 'abnormalityRate': 0.0, 'abnormalityStatus': 'unknown'}
+        distances, positions = self._query(queries, self.k)
+        inverse = 1.0 / np.maximum(distances, 1e-12)
+        xy = np.einsum('ij,ijk->ik', inverse, self.xy[positions]) / inverse.sum(axis=1, keepdims=True)
+        mean_distance = distances.mean(axis=1)
+        score = mean_distance / self.threshold
+        abnormal = score > 1.0
+        return {
+            'xyData': xy,
+            'distance': mean_distance,
+            'score': score,
+            'abnormal': abnormal,
+            'abnormalityRate': float(abnormal.mean()),
+            'abnormalityStatus': abnormality_status(abnormal, max_window, rate_threshold),
+        }
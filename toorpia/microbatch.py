@@ -0,0 +1,201 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from .chunking import split_addplot_result
+
+
+class _PendingBatch:
+    """mapNo ごとに溜めている送信待ちの行"""
+
+    def __init__(self):
+        self.items = []  # (rows, future, submitted_at)
+        self.rows = 0
+        self.first_at = None
+
+
+class AddplotMicroBatcher:
+    """少量の行ごとの addplot 呼び出しを mapNo ごとにまとめて送信するゲートウェイ
+
+    エッジデバイスから数行ずつ届くデータを1件ずつ addplot_embedding すると、毎回の
+    往復と一時ファイル書き込みのコストでスループットが大きく落ちる。このクラスは
+    submit() された行を mapNo ごとに溜め、max_rows 行に達するか、最初の行が届いてから
+    max_latency_ms ミリ秒経った時点で1回の addplot にまとめて送信する。結果は
+    split_addplot_result() で各呼び出し元の行範囲に切り分けて、submit() が返した
+    Future に設定する。
+
+    各呼び出し元の結果の xyData と distancesPerPoint は自分の行だけを含み、距離の
+    集計値も自分の行から計算し直される。abnormalityStatus / abnormalityScore /
+    compositeStatus はバッチ全体に対する判定（detabn は連続する点の窓で判定するため）
+    であり、batchOffset / batchRows でバッチ内の位置がわかる。バッチは1回の addplot
+    なので、サーバー上では1つの追加プロットになる。
+
+    Args:
+        client (toorPIA): 送信に使うクライアント
+        max_rows (int): 1バッチの最大行数。達した時点ですぐに送信する
+        max_latency_ms (float): 最初の行が届いてから送信するまでの最大待ち時間（ミリ秒）
+        method (str): 'addplot_embedding'（行は ndarray）または 'addplot'（行は DataFrame）
+        max_in_flight (int): 同時に送信中にしておくバッチ数の上限
+        **addplot_kwargs: 各バッチのメソッド呼び出しに渡す引数（identna_* / detabn_* 等）
+
+    Example:
+        with AddplotMicroBatcher(client, max_rows=500, max_latency_ms=100) as batcher:
+            future = batcher.submit(vector, mapNo=12)   # 1行（1次元）または複数行
+            result = future.result()
+            print(result['diagnosticScore']['distance']['distancesPerPoint'])
+    """
+
+    def __init__(self, client, max_rows=256, max_latency_ms=50, method='addplot_embedding',
+                 max_in_flight=4, **addplot_kwargs):
+        if method not in ('addplot', 'addplot_embedding'):
+            raise ValueError("method must be 'addplot' or 'addplot_embedding'")
+        if int(max_rows) < 1:
+            raise ValueError("max_rows must be at least 1")
+        self.client = client
+        self.max_rows = int(max_rows)
+        self.max_latency = float(max_latency_ms) / 1000.0
+        self.method = method
+        self.addplot_kwargs = addplot_kwargs
+        self._executor = ThreadPoolExecutor(max_workers=int(max_in_flight),
+                                            thread_name_prefix="toorpia-microbatch")
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._closed = False
+        self._stats = {'submitted': 0, 'batches': 0, 'rows': 0, 'failedBatches': 0,
+                       'totalLatency': 0.0, 'maxLatency': 0.0, 'results': 0}
+        self._flusher = threading.Thread(target=self._flush_loop, name="toorpia-microbatch-flusher",
+                                         daemon=True)
+        self._flusher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, rows, mapNo=None):
+        """行を送信待ちに追加する
+
+        Args:
+            rows (numpy.ndarray or pandas.DataFrame): 追加する行。1次元の ndarray は1行として扱う
+            mapNo (int, optional): 対象のマップ番号。省略時は client.mapNo
+
+        Returns:
+            concurrent.futures.Future: 結果（この行の分だけに切り分けた addplot の返り値。
+                送信に失敗した場合は None）が設定される Future
+        """
+        if mapNo is None:
+            mapNo = self.client.mapNo
+        if mapNo is None:
+            raise ValueError("mapNo is not specified and the client has no current map")
+        if self.method == 'addplot_embedding':
+            rows = np.asarray(rows, dtype=float)
+            if rows.ndim == 1:
+                rows = rows.reshape(1, -1)
+            if rows.ndim != 2:
+                raise ValueError("rows must be a 1D or 2D array")
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("cannot submit to a micro-batcher that has been closed")
+            batch = self._pending.setdefault(mapNo, _PendingBatch())
+            if batch.first_at is None:
+                batch.first_at = time.monotonic()
+            batch.items.append((rows, future, time.monotonic()))
+            batch.rows += len(rows)
+            self._stats['submitted'] += 1
+            if batch.rows >= self.max_rows:
+                self._dispatch(mapNo)
+            else:
+                self._cond.notify()
+        return future
+
+    def flush(self):
+        """溜まっている行をすべてすぐに送信する"""
+        with self._cond:
+            for mapNo in list(self._pending):
+                self._dispatch(mapNo)
+
+    def close(self, wait=True):
+        """溜まっている行を送信して受け付けを終了する
+
+        Args:
+            wait (bool): True なら送信中のバッチの完了まで待つ
+        """
+        with self._cond:
+            self._closed = True
+            for mapNo in list(self._pending):
+                self._dispatch(mapNo)
+            self._cond.notify()
+        self._flusher.join()
+        self._executor.shutdown(wait=wait)
+
+    def stats(self):
+        """バッチ化の集計値を返す
+
+        Returns:
+            dict: submitted（submit 回数）、batches（送信したバッチ数）、rows（送信した行数）、
+                failedBatches、meanBatchRows、meanLatencyMs / maxLatencyMs
+                （submit から結果が設定されるまでの時間）
+        """
+        with self._cond:
+            s = dict(self._stats)
+        results = s.pop('results')
+        s['meanBatchRows'] = s['rows'] / s['batches'] if s['batches'] else 0.0
+        s['meanLatencyMs'] = s.pop('totalLatency') / results * 1000 if results else 0.0
+        s['maxLatencyMs'] = s.pop('maxLatency') * 1000
+        return s
+
+    def _flush_loop(self):
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                next_deadline = None
+                for mapNo, batch in list(self._pending.items()):
+                    deadline = batch.first_at + self.max_latency
+                    if deadline <= now:
+                        self._dispatch(mapNo)
+                    elif next_deadline is None or deadline < next_deadline:
+                        next_deadline = deadline
+                self._cond.wait(None if next_deadline is None else next_deadline - now)
+
+    def _dispatch(self, mapNo):
+        """mapNo の送信待ちを取り出して送信スレッドに渡す（_cond を保持した状態で呼ぶ）"""
+        batch = self._pending.pop(mapNo, None)
+        if batch is None or not batch.items:
+            return
+        self._stats['batches'] += 1
+        self._stats['rows'] += batch.rows
+        self._executor.submit(self._send, mapNo, batch.items)
+
+    def _send(self, mapNo, items):
+        sizes = [len(rows) for rows, _, _ in items]
+        try:
+            if self.method == 'addplot_embedding':
+                data = np.vstack([rows for rows, _, _ in items])
+                result = self.client.addplot_embedding(data, mapNo=mapNo, **self.addplot_kwargs)
+            else:
+                import pandas as pd  # DataFrame の行を送る場合のみ必要
+                data = pd.concat([rows for rows, _, _ in items], ignore_index=True)
+                result = self.client.addplot(data, mapNo, **self.addplot_kwargs)
+            parts = split_addplot_result(result, sizes) if result is not None else [None] * len(items)
+        except BaseException as e:
+            with self._cond:
+                self._stats['failedBatches'] += 1
+            for _, future, _ in items:
+                future.set_exception(e)
+            return
+        if result is None:
+            with self._cond:
+                self._stats['failedBatches'] += 1
+        done = time.monotonic()
+        with self._cond:
+            for _, _, submitted_at in items:
+                latency = done - submitted_at
+                self._stats['results'] += 1
+                self._stats['totalLatency'] += latency
+                self._stats['maxLatency'] = max(self._stats['maxLatency'], latency)
+        for (_, future, _), part in zip(items, parts):
+            future.set_result(part)
@@ -0,0 +1,294 @@
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .waveform import MKFFTSEG_DEFAULTS, WavWindow
+
+# overflow の方式
+OVERFLOW_POLICIES = ('drop', 'coalesce')
+
+
+class _Window:
+    """送信待ちの窓（連続する複数の窓をまとめたものを含む）"""
+
+    def __init__(self, seq, start, samples, ready_at):
+        self.seqs = [seq]
+        self.start = start  # 先頭のサンプル位置（監視の開始からの通算）
+        self.samples = samples
+        self.ready_at = [ready_at]  # 各窓の最後のサンプルが届いた時刻
+
+    @property
+    def stop(self):
+        return self.start + len(self.samples)
+
+    def merge(self, other):
+        """直後の（重なってもよい）窓を連結する。間が空いている場合は False"""
+        if other.start > self.stop or other.start < self.start:
+            return False
+        self.samples = np.concatenate([self.samples, other.samples[self.stop - other.start:]])
+        self.seqs += other.seqs
+        self.ready_at += other.ready_at
+        return True
+
+
+class WaveformMonitor:
+    """ライブ音声をリングバッファに溜め、一定の長さの窓ごとに addplot_waveform してイベントとして返すモニター
+
+    サウンドカードやネットワークから届くサンプルを feed() で渡すと、ベースマップの mkfftSeg の
+    設定（窓長 wl・重なり ol）の区間が segments_per_window 個ちょうど入る長さの窓を切り出し、
+    次の窓が区間の並びを途切れなく引き継ぐようにずらしていく。窓は 16 bit PCM の WAV として
+    最大 max_in_flight 件まで並行して送る。
+
+    サーバーの処理が追いつかず送信待ちが max_pending 件を超えると、overflow に従って
+    'drop' では古い窓を捨て（イベント type='dropped'）、'coalesce' では連続する窓を
+    max_coalesce 件までつなげて1回の addplot にまとめる。結果は完了順に events() から
+    取り出せ、各イベントには窓の時刻と、窓の最後のサンプルが届いてから結果が出るまでの
+    時間（latencyMs）が付く。
+
+    Args:
+        client (toorPIA): 送信に使うクライアント
+        mapNo (int, optional): 対象のマップ番号。省略時は client.mapNo
+        sample_rate (int, optional): 入力のサンプリング周波数。省略時はベースマップの WAV の
+            サンプリング周波数（なければ mkfftseg_sr）
+        channels (int): 入力のチャンネル数
+        segments_per_window (int): 1つの窓に入れる mkfftSeg の区間の数
+        window_samples (int, optional): 窓の長さ（サンプル数）。指定すると segments_per_window より優先
+        hop_samples (int, optional): 窓をずらす幅（サンプル数）。省略時は区間の並びが続く幅
+        max_in_flight (int): 同時に送信中にしておく窓の数
+        max_pending (int): 送信待ちにしておく窓の数の上限
+        overflow (str): 'drop' または 'coalesce'
+        max_coalesce (int): 'coalesce' で1回の送信にまとめる窓の数の上限
+        buffer_seconds (float): リングバッファの長さ（秒）。窓の2つ分より短ければ2つ分にする
+        on_event (callable, optional): イベントごとに（送信スレッドから）呼ぶ関数
+        **addplot_kwargs: addplot_waveform() に渡す identna_* / detabn_* パラメータ
+
+    Example:
+        with WaveformMonitor(client, mapNo=12, overflow='coalesce') as monitor:
+            for block in sound_card_blocks():      # float32 の [-1, 1]
+                monitor.feed(block)
+                for event in monitor.poll():
+                    print(event['startSeconds'], event['abnormalityStatus'], event['latencyMs'])
+    """
+
+    def __init__(self, client, mapNo=None, sample_rate=None, channels=1, segments_per_window=8,
+                 window_samples=None, hop_samples=None, max_in_flight=2, max_pending=1, overflow='drop',
+                 max_coalesce=4, buffer_seconds=10.0, on_event=None, **addplot_kwargs):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.client = client
+        self.mapNo = mapNo if mapNo is not None else client.mapNo
+        if self.mapNo is None:
+            raise ValueError("mapNo is not specified and the client has no current map")
+        entry = client.map_schemas.get(self.mapNo) or {}
+        mkfftseg = dict(MKFFTSEG_DEFAULTS, **(entry.get('mkfftseg') or entry.get('waveformFeatures') or {}))
+        if sample_rate is None:
+            sample_rate = (entry.get('sampleRates') or [mkfftseg['sr']])[0]
+        self.sample_rate = int(sample_rate)
+        self.channels = int(channels)
+
+        # 窓は mkfftSeg の区間（長さ wl、ずらし幅 step）が segments_per_window 個ちょうど入る長さにする
+        wl = int(mkfftseg['wl'])
+        step = max(1, int(round(wl * (1.0 - float(mkfftseg['ol']) / 100.0))))
+        segments = max(1, int(segments_per_window))
+        self.window_samples = int(window_samples) if window_samples else wl + (segments - 1) * step
+        self.hop_samples = int(hop_samples) if hop_samples else (segments * step if not window_samples
+                                                                 else self.window_samples)
+        if self.window_samples < 1 or self.hop_samples < 1:
+            raise ValueError("window_samples and hop_samples must be positive")
+
+        self.max_in_flight = int(max_in_flight)
+        self.max_pending = max(1, int(max_pending))
+        self.overflow = overflow
+        self.max_coalesce = max(1, int(max_coalesce))
+        self.on_event = on_event
+        self.addplot_kwargs = addplot_kwargs
+
+        capacity = max(int(float(buffer_seconds) * self.sample_rate), 2 * max(self.window_samples, self.hop_samples))
+        self._ring = np.zeros((capacity, self.channels), dtype=np.float32)
+        self._written = 0       # これまでに書き込んだサンプル数
+        self._next_start = 0    # 次の窓の先頭のサンプル位置
+        self._seq = 0
+
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+        self._in_flight = 0
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        self._events = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="toorpia-monitor")
+        self._stats = {'samples': 0, 'windows': 0, 'uploads': 0, 'dropped': 0, 'coalesced': 0, 'failed': 0}
+        self._latencies = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def feed(self, samples):
+        """入力のサンプルをリングバッファに追加し、揃った窓を送信待ちにする
+
+        Args:
+            samples (array-like): [-1, 1] の float のサンプル。形状 (サンプル数,) または
+                (サンプル数, チャンネル数)
+        """
+        if self._closed:
+            raise RuntimeError("cannot feed a monitor that has been closed")
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1, self.channels)
+        capacity = len(self._ring)
+        while len(samples):
+            # まだ窓にしていないサンプルを上書きしない分だけ書き込む
+            room = min(capacity, capacity - (self._written - self._next_start))
+            part, samples = samples[:room], samples[room:]
+            position = self._written % capacity
+            first = min(len(part), capacity - position)
+            self._ring[position:position + first] = part[:first]
+            self._ring[:len(part) - first] = part[first:]
+            self._written += len(part)
+            self._stats['samples'] += len(part)
+            self._cut_windows()
+
+    def _cut_windows(self):
+        while self._next_start + self.window_samples <= self._written:
+            start = self._next_start
+            position = start % len(self._ring)
+            indices = (position + np.arange(self.window_samples)) % len(self._ring)
+            window = _Window(self._seq, start, self._ring[indices], time.monotonic())
+            self._seq += 1
+            self._next_start += self.hop_samples
+            self._stats['windows'] += 1
+            self._enqueue(window)
+
+    def _enqueue(self, window):
+        dropped = []
+        with self._lock:
+            last = self._pending[-1] if self._pending else None
+            if (self.overflow == 'coalesce' and last is not None and len(self._pending) >= self.max_pending
+                    and len(last.seqs) < self.max_coalesce and last.merge(window)):
+                self._stats['coalesced'] += 1
+            else:
+                self._pending.append(window)
+                while len(self._pending) > self.max_pending:
+                    dropped.append(self._pending.popleft())
+                    self._stats['dropped'] += len(dropped[-1].seqs)
+            self._dispatch()
+        for window in dropped:
+            self._emit(self._event(window, 'dropped', None))
+
+    def _dispatch(self):
+        """送信中が max_in_flight 件未満なら送信待ちの古い窓から送る（_lock を保持した状態で呼ぶ）"""
+        while self._pending and self._in_flight < self.max_in_flight:
+            window = self._pending.popleft()
+            self._in_flight += 1
+            self._stats['uploads'] += 1
+            self._executor.submit(self._send, window)
+
+    def _send(self, window):
+        try:
+            upload = WavWindow.from_samples(window.samples, self.sample_rate, name='live.wav',
+                                            start_seconds=window.start / self.sample_rate)
+            result = self.client.addplot_waveform([upload], mapNo=self.mapNo, **self.addplot_kwargs)
+        except Exception as e:
+            print(f"Error sending monitor window: {str(e)}")
+            result = None
+        event = self._event(window, 'result', result)
+        with self._lock:
+            if result is None:
+                self._stats['failed'] += 1
+            self._latencies.extend(event['latenciesMs'])
+            self._in_flight -= 1
+            self._dispatch()
+            self._idle.notify_all()
+        self._emit(event)
+
+    def _event(self, window, kind, result):
+        now = time.monotonic()
+        latencies = [(now - ready) * 1000 for ready in window.ready_at]
+        event = {
+            'type': kind,
+            'windows': list(window.seqs),
+            'startSeconds': window.start / self.sample_rate,
+            'endSeconds': window.stop / self.sample_rate,
+            'result': result,
+            'abnormalityStatus': result.get('abnormalityStatus') if isinstance(result, dict) else None,
+            'abnormalityScore': result.get('abnormalityScore') if isinstance(result, dict) else None,
+            'latencyMs': max(latencies),
+            'latenciesMs': latencies,
+        }
+        return event
+
+    def _emit(self, event):
+        self._events.put(event)
+        if self.on_event is not None:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                print(f"Error in monitor on_event callback: {str(e)}")
+
+    def poll(self):
+        """これまでに出たイベントを待たずに返す"""
+        events = []
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                return events
+            if event is None:
+                self._events.put(None)  # events() の終わりの印は残す
+                return events
+            events.append(event)
+
+    def events(self, timeout=None):
+        """イベントを出た順に返すジェネレータ。close() の後、残りのイベントを返し終えると終わる
+
+        Args:
+            timeout (float, optional): 次のイベントを待つ最大秒数。超えたら終わる
+        """
+        while True:
+            try:
+                event = self._events.get(timeout=timeout)
+            except queue.Empty:
+                return
+            if event is None:
+                return
+            yield event
+
+    def close(self, wait=True):
+        """受け付けを終了する（窓にならない末尾のサンプルは送らない）
+
+        Args:
+            wait (bool): True なら送信待ちと送信中の窓の結果が出るまで待つ
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if not wait:
+                for window in self._pending:
+                    self._stats['dropped'] += len(window.seqs)
+                self._pending.clear()
+            while wait and (self._pending or self._in_flight):
+                self._idle.wait()
+        self._executor.shutdown(wait=wait)
+        self._events.put(None)
+
+    def stats(self):
+        """監視の集計値を返す
+
+        Returns:
+            dict: samples（受け取ったサンプル数）、windows（切り出した窓の数）、uploads（送信回数）、
+                dropped（捨てた窓の数）、coalesced（他の窓にまとめた窓の数）、failed（失敗した送信）、
+                meanLatencyMs / p95LatencyMs / maxLatencyMs（窓の最後のサンプルが届いてから
+                結果が出るまで）
+        """
+        with self._lock:
+            s = dict(self._stats)
+            latencies = np.asarray(self._latencies)
+        s['meanLatencyMs'] = float(latencies.mean()) if len(latencies) else 0.0
+        s['p95LatencyMs'] = float(np.percentile(latencies, 95)) if len(latencies) else 0.0
+        s['maxLatencyMs'] = float(latencies.max()) if len(latencies) else 0.0
+        return s
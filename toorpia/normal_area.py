@@ -0,0 +1,202 @@
+import re
+import warnings
+
+import numpy as np
+
+from .local_scoring import abnormality_status
+
+# しきい値を省略した場合に正常領域に含めるベースマップの点の割合（detabn の coverage の既定）
+DEFAULT_COVERAGE = 0.90
+
+# 座標を持たない行列形式のファイルの並び方と、(行は y、列は x の昇順) の格子にする変換
+# 'y-up': 各行が y（先頭の行が最小の y）、列が x / 'y-down': 先頭の行が最大の y（画像の並び）
+# 'transposed': 各行が x、列が y / 'transposed-y-down': 各行が x、列が y の降順
+ORIENTATIONS = {
+    'y-up': lambda values: values,
+    'y-down': lambda values: values[::-1],
+    'transposed': lambda values: values.T,
+    'transposed-y-down': lambda values: values.T[::-1],
+}
+
+_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?|[-+]?(?:nan|inf)', re.IGNORECASE)
+
+
+def parse_normal_area(text):
+    """normal_area.dat の内容を読み取り、(values, x_nodes, y_nodes) を返す
+
+    次の形式を受け付ける（区切りは空白・カンマ・タブのいずれでもよい）:
+
+    - 1行に "x y 値" の3列（gnuplot の splot 形式。空行によるブロック区切りも可）。
+      格子点の座標はファイルから決まる
+    - 1行に格子の1行分の値を並べた行列形式。格子点の座標は持たないので None を返す
+
+    '#' や '%' で始まる行と数値を含まない行（列名など）は読み飛ばす。
+
+    Returns:
+        tuple: values（形状 (ny, nx)、行は y、列は x の昇順）と、x / y の格子点の座標（行列形式では None）
+    """
+    rows = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped[0] in '#%':
+            continue
+        tokens = _NUMBER.findall(stripped)
+        if not tokens or len(tokens) < len([t for t in re.split(r'[\s,;]+', stripped) if t]):
+            continue  # 数値以外を含む行（列名など）
+        rows.append([float(t) for t in tokens])
+    if not rows:
+        raise ValueError("no numeric rows in normal area data")
+
+    widths = {len(r) for r in rows}
+    if widths == {3} and len(rows) > 3:
+        table = np.asarray(rows)
+        x_nodes, x_index = np.unique(table[:, 0], return_inverse=True)
+        y_nodes, y_index = np.unique(table[:, 1], return_inverse=True)
+        # 格子点を埋め尽くさない3列の表は、3列の行列として扱う
+        if len(x_nodes) * len(y_nodes) == len(table):
+            values = np.full((len(y_nodes), len(x_nodes)), np.nan)
+            values[y_index.ravel(), x_index.ravel()] = table[:, 2]
+            return values, x_nodes, y_nodes
+    if len(widths) != 1:
+        raise ValueError(f"rows have different numbers of values: {sorted(widths)}")
+    return np.asarray(rows), None, None
+
+
+class NormalAreaIndex:
+    """正常領域の格子（normal_area.dat）から、点が正常領域に入るかを O(1) で引く索引
+
+    各点を最も近い格子点に割り当て、その値が threshold を超えれば正常とみなす
+    （detabn と同じ判定）。格子の外の点は正常領域の外とする。
+
+    Args:
+        values (numpy.ndarray): 格子点の値。形状 (ny, nx)、行は y、列は x の昇順
+        x_nodes (array-like): x 方向の格子点の座標（等間隔）
+        y_nodes (array-like): y 方向の格子点の座標（等間隔）
+        threshold (float): 正常とみなす値のしきい値
+    """
+
+    def __init__(self, values, x_nodes, y_nodes, threshold):
+        self.values = np.nan_to_num(np.asarray(values, dtype=float))
+        self.x_nodes = np.asarray(x_nodes, dtype=float)
+        self.y_nodes = np.asarray(y_nodes, dtype=float)
+        if self.values.shape != (len(self.y_nodes), len(self.x_nodes)):
+            raise ValueError(f"grid of shape {self.values.shape} does not match "
+                             f"{len(self.y_nodes)} x {len(self.x_nodes)} nodes")
+        self.threshold = float(threshold)
+        self.bitmap = self.values > self.threshold
+
+    @classmethod
+    def from_file(cls, path, base_xy=None, extent=None, threshold=None, coverage=DEFAULT_COVERAGE,
+                  orientation=None):
+        """normal_area.dat を読み込む
+
+        行列形式のファイルは座標を持たないため、extent と orientation を指定する。省略すると
+        base_xy から推定し（範囲はベースマップの点の外接矩形、向きは点の値が最も高くなるもの）、
+        推定した値を UserWarning で知らせる。推定はサーバーの格子と一致する保証がない。
+
+        Args:
+            path (str): normal_area.dat のパス
+            base_xy (array-like, optional): ベースマップの座標。行列形式の格子の範囲と向きの推定、
+                および threshold を省略した場合のしきい値の決定に使う
+            extent (tuple, optional): 行列形式の格子の範囲 (xmin, xmax, ymin, ymax)。
+                省略時は base_xy の範囲（警告を出す）
+            threshold (float, optional): 正常とみなす値のしきい値。省略時は base_xy の点の
+                coverage の割合が正常領域に入る値
+            coverage (float): threshold を省略した場合に正常領域に含める base_xy の点の割合
+            orientation (str, optional): 行列形式の並び方（ORIENTATIONS のキー）。
+                省略時は base_xy から推定する（警告を出す）
+        """
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            values, x_nodes, y_nodes = parse_normal_area(f.read())
+        base_xy = None if base_xy is None else np.asarray(base_xy, dtype=float).reshape(-1, 2)
+
+        if orientation is not None and orientation not in ORIENTATIONS:
+            raise ValueError(f"unknown orientation {orientation!r}; use one of {sorted(ORIENTATIONS)}")
+        if x_nodes is None:
+            if extent is None:
+                if base_xy is None:
+                    raise ValueError("a matrix-form normal area needs extent= or base_xy= for its coordinates")
+                extent = (base_xy[:, 0].min(), base_xy[:, 0].max(), base_xy[:, 1].min(), base_xy[:, 1].max())
+                warnings.warn(f"'{path}' has no grid coordinates; assuming extent="
+                              f"({', '.join(f'{v:.6g}' for v in extent)}) from the basemap's bounding box. "
+                              "Pass extent= to set it explicitly.", UserWarning, stacklevel=2)
+            xmin, xmax, ymin, ymax = map(float, extent)
+            if orientation is None:
+                if base_xy is None:
+                    raise ValueError("a matrix-form normal area needs orientation= or base_xy= to orient it")
+                orientation = cls._orient(values, base_xy, extent)
+                warnings.warn(f"'{path}' has no grid coordinates; guessed orientation={orientation!r} from the "
+                              "basemap points. Pass orientation= to set it explicitly.", UserWarning, stacklevel=2)
+            values = ORIENTATIONS[orientation](values)
+            x_nodes = np.linspace(xmin, xmax, values.shape[1])
+            y_nodes = np.linspace(ymin, ymax, values.shape[0])
+
+        if threshold is None:
+            if base_xy is None:
+                raise ValueError("pass threshold= or base_xy= to derive the normal-area threshold")
+            lookup = cls(values, x_nodes, y_nodes, np.inf)
+            threshold = float(np.quantile(lookup.lookup(base_xy), 1.0 - coverage))
+            threshold = np.nextafter(threshold, -np.inf)  # ちょうどその値の点も正常領域に含める
+        return cls(values, x_nodes, y_nodes, threshold)
+
+    @classmethod
+    def _orient(cls, values, base_xy, extent):
+        """座標を持たない行列の向き（ORIENTATIONS のキー）を、ベースマップの点の値が最も高くなるものに決める"""
+        names = list(ORIENTATIONS) if values.shape[0] == values.shape[1] else ['y-up', 'y-down']
+        xmin, xmax, ymin, ymax = map(float, extent)
+        scores = []
+        for name in names:
+            candidate = ORIENTATIONS[name](values)
+            lookup = cls(candidate, np.linspace(xmin, xmax, candidate.shape[1]),
+                         np.linspace(ymin, ymax, candidate.shape[0]), np.inf)
+            scores.append(lookup.lookup(base_xy).mean())
+        return names[int(np.argmax(scores))]
+
+    def _cells(self, xy):
+        xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+        cols, inside_x = self._axis_index(xy[:, 0], self.x_nodes)
+        rows, inside_y = self._axis_index(xy[:, 1], self.y_nodes)
+        return rows, cols, inside_x & inside_y
+
+    @staticmethod
+    def _axis_index(coordinates, nodes):
+        if len(nodes) == 1:
+            return np.zeros(len(coordinates), dtype=np.intp), np.isfinite(coordinates)
+        step = (nodes[-1] - nodes[0]) / (len(nodes) - 1)
+        position = np.rint((coordinates - nodes[0]) / step)
+        inside = (position >= 0) & (position <= len(nodes) - 1)
+        return np.clip(np.nan_to_num(position), 0, len(nodes) - 1).astype(np.intp), inside
+
+    def lookup(self, xy):
+        """各点の最も近い格子点の値（格子の外は 0）"""
+        rows, cols, inside = self._cells(xy)
+        return np.where(inside, self.values[rows, cols], 0.0)
+
+    def contains(self, xy):
+        """各点が正常領域に入るか（bool の配列）"""
+        rows, cols, inside = self._cells(xy)
+        return inside & self.bitmap[rows, cols]
+
+    def classify(self, xy, max_window=5, rate_threshold=1.0):
+        """点の列をまとめて判定する
+
+        手元の格子による近似で、サーバーの addplot の判定（detabn）が正となる。特に threshold を
+        省略して作った索引は、しきい値をベースマップの点の coverage から決めているため、
+        サーバーの detabn のしきい値とは異なり、判定が食い違うことがある。
+
+        Args:
+            xy (array-like): 点の座標（addplot / get_addplot の xyData など）
+            max_window (int): 全体の状態の判定に使う連続する窓の長さ（detabn_max_window に相当）
+            rate_threshold (float): 窓の中の正常領域外の点の割合のしきい値（detabn_rate_threshold に相当）
+
+        Returns:
+            dict: normal（点ごとの判定）、values（点ごとの格子の値）、abnormalityRate、abnormalityStatus
+        """
+        values = self.lookup(xy)
+        normal = self.contains(xy)
+        return {
+            'normal': normal,
+            'values': values,
+            'abnormalityRate': float(np.mean(~normal)) if len(normal) else 0.0,
+            'abnormalityStatus': abnormality_status(~normal, max_window, rate_threshold),
+        }
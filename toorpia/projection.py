@@ -0,0 +1,198 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+# EmbeddingProjection の次元削減の方法
+PROJECTION_METHODS = ('pca', 'random')
+
+
+def default_cache_dir():
+    """クライアント側のキャッシュの置き場所（環境変数 TOORPIA_CACHE_DIR > ~/.cache/toorpia）"""
+    return os.environ.get('TOORPIA_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'toorpia')
+
+
+class EmbeddingProjection:
+    """幅の広い埋め込みベクトルをアップロード前に低次元へ射影する変換
+
+    basemap_embedding(projection=...) でベースマップ作成時に学習し、マップ番号ごとに
+    ProjectionStore に保存される。同じマップへの addplot_embedding はこれを自動で適用する。
+
+    - 'pca': 主成分分析。学習には最大 max_fit_rows 行の無作為な部分集合を使う。
+      n_components が全次元に比べて小さいときは乱択 SVD（べき乗反復2回）で求める
+    - 'random': ガウス乱数行列によるランダム射影（Johnson-Lindenstrauss）。学習は不要で、
+      seed から同じ行列を作る
+
+    Args:
+        method (str): 'pca' または 'random'
+        n_components (int or float): 射影後の次元数。'pca' では 1 未満の float で
+            残す分散の割合（例 0.95）も指定できる
+        seed (int): 乱数のシード
+        normalize (bool): 射影の前に各ベクトルを L2 正規化する（サーバーの
+            l2_normalization と同じ前処理を射影の前にかける）
+        max_fit_rows (int): 'pca' の学習に使う最大行数
+    """
+
+    def __init__(self, method='pca', n_components=256, seed=0, normalize=True, max_fit_rows=20000):
+        if method not in PROJECTION_METHODS:
+            raise ValueError(f"method must be one of {', '.join(PROJECTION_METHODS)}")
+        if isinstance(n_components, float) and not (0 < n_components < 1 and method == 'pca'):
+            raise ValueError("a float n_components (variance ratio) must be in (0, 1) and needs method='pca'")
+        self.method = method
+        self.n_components = n_components
+        self.seed = seed
+        self.normalize = bool(normalize)
+        self.max_fit_rows = int(max_fit_rows)
+        self.mean = None
+        self.components = None  # (射影後の次元数, 元の次元数)
+        self.explained_variance_ratio = None
+        # ベースマップのアップロード形式（addplot で同じ形式に揃える）:
+        # 列名付きで送ったか、先頭の ID 列の数
+        self.header = None
+        self.id_columns = 0
+
+    @property
+    def fitted(self):
+        return self.components is not None
+
+    @property
+    def input_dim(self):
+        return None if self.components is None else self.components.shape[1]
+
+    @property
+    def output_dim(self):
+        return None if self.components is None else self.components.shape[0]
+
+    def _prepare(self, X):
+        X = np.asarray(X, dtype=float)
+        if X.ndim != 2:
+            raise ValueError("embedding data must be 2-dimensional (rows=samples, columns=dimensions)")
+        if self.normalize:
+            norms = np.linalg.norm(X, axis=1, keepdims=True)
+            X = X / np.where(norms > 0, norms, 1.0)
+        return X
+
+    def fit(self, X):
+        """射影を学習する（'random' は乱数行列を作るだけ）"""
+        X = self._prepare(X)
+        n, d = X.shape
+        rng = np.random.default_rng(self.seed)
+        if self.method == 'random':
+            k = min(int(self.n_components), d)
+            self.mean = np.zeros(d)
+            self.components = rng.standard_normal((k, d)) / np.sqrt(k)
+            return self
+
+        sample = X if n <= self.max_fit_rows else X[rng.choice(n, self.max_fit_rows, replace=False)]
+        self.mean = sample.mean(axis=0)
+        centered = sample - self.mean
+        total_variance = float((centered ** 2).sum())
+        rank = min(centered.shape)
+        if isinstance(self.n_components, float) or int(self.n_components) * 4 > rank:
+            _, s, vt = np.linalg.svd(centered, full_matrices=False)
+        else:
+            s, vt = _randomized_svd(centered, int(self.n_components), rng)
+        ratio = s ** 2 / total_variance if total_variance > 0 else np.zeros(len(s))
+        if isinstance(self.n_components, float):
+            k = int(np.searchsorted(np.cumsum(ratio), self.n_components) + 1)
+        else:
+            k = int(self.n_components)
+        k = max(min(k, len(s)), 1)
+        self.components = vt[:k]
+        self.explained_variance_ratio = ratio[:k]
+        return self
+
+    def transform(self, X):
+        """学習した射影をかける"""
+        if not self.fitted:
+            raise ValueError("projection is not fitted")
+        X = self._prepare(X)
+        if X.shape[1] != self.input_dim:
+            raise ValueError(f"projection expects {self.input_dim} dimensions, got {X.shape[1]}")
+        return (X - self.mean) @ self.components.T
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+    def save(self, path):
+        """射影を .npz ファイルに保存する（一時ファイル経由で置き換える）"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.npz')
+        os.close(fd)
+        try:
+            np.savez(tmp, method=self.method, n_components=self.n_components, seed=self.seed,
+                     normalize=self.normalize, mean=self.mean, components=self.components,
+                     explained_variance_ratio=(self.explained_variance_ratio
+                                               if self.explained_variance_ratio is not None else np.zeros(0)),
+                     header=bool(self.header), id_columns=int(self.id_columns))
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as f:
+            n_components = f['n_components'].item()
+            projection = cls(str(f['method']), n_components, seed=int(f['seed']), normalize=bool(f['normalize']))
+            projection.mean = f['mean']
+            projection.components = f['components']
+            ratio = f['explained_variance_ratio']
+            projection.explained_variance_ratio = ratio if len(ratio) else None
+            projection.header = bool(f['header'])
+            projection.id_columns = int(f['id_columns'])
+        return projection
+
+
+def _randomized_svd(X, k, rng, oversample=10, power_iterations=2):
+    """上位 k 個の特異値と右特異ベクトル（Halko らの乱択 SVD）"""
+    q = min(k + oversample, min(X.shape))
+    Y = X @ rng.standard_normal((X.shape[1], q))
+    for _ in range(power_iterations):
+        Y, _ = np.linalg.qr(Y)
+        Y = X @ (X.T @ Y)
+    Q, _ = np.linalg.qr(Y)
+    _, s, vt = np.linalg.svd(Q.T @ X, full_matrices=False)
+    return s[:k], vt[:k]
+
+
+class ProjectionStore:
+    """マップ番号ごとの EmbeddingProjection をローカルに保存する
+
+    Args:
+        directory (str): 保存先のディレクトリ（最初の保存時に作成する）
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @classmethod
+    def for_server(cls, api_url, cache_dir=None):
+        """接続先ごとのディレクトリ（<cache_dir>/projections/<URL のハッシュ>）を使うストア"""
+        key = hashlib.sha256(api_url.rstrip('/').encode()).hexdigest()[:16]
+        return cls(os.path.join(cache_dir or default_cache_dir(), 'projections', key))
+
+    def path(self, map_no):
+        return os.path.join(self.directory, f"map-{int(map_no)}.npz")
+
+    def save(self, map_no, projection):
+        projection.save(self.path(map_no))
+
+    def load(self, map_no):
+        """保存された射影を返す（無ければ None）"""
+        path = self.path(map_no)
+        if not os.path.exists(path):
+            return None
+        try:
+            return EmbeddingProjection.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: could not read projection for map {map_no}: {str(e)}")
+            return None
+
+    def remove(self, map_no):
+        try:
+            os.remove(self.path(map_no))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,71 @@
+def parse_option_str(option_str):
+    """'1:0,2:1,3:float' 形式のオプション文字列を {列番号(1始まり): 値} の dict にする"""
+    options = {}
+    for item in (option_str or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        index, sep, value = item.partition(':')
+        if not sep or not index.strip().isdigit():
+            raise ValueError(f"invalid option entry '{item}' (expected '<column>:<value>')")
+        options[int(index)] = value.strip()
+    return options
+
+
+def format_option_str(options):
+    return ",".join(f"{index}:{value}" for index, value in sorted(options.items()))
+
+
+def zero_weight_columns(columns, weight_option_str, keep_columns=None, drop_columns=None):
+    """重み 0 の列（と drop_columns）のうち keep_columns に含まれない列の位置（0始まり）を返す
+
+    weight_option_str に現れない列は重みが分からないので残す。
+    """
+    weights = parse_option_str(weight_option_str)
+    keep = set(keep_columns or ())
+    drop = set(drop_columns or ())
+    pruned = []
+    for position, name in enumerate(columns):
+        if name in keep:
+            continue
+        weight = weights.get(position + 1)
+        if name in drop or (weight is not None and float(weight) == 0.0):
+            pruned.append(position)
+    return pruned
+
+
+def reindex_options(option_str, n_columns, pruned):
+    """列を取り除いた後の列番号に合わせてオプション文字列を書き換える
+
+    Args:
+        option_str (str): 元の列番号（1始まり）のオプション文字列
+        n_columns (int): 元の列数
+        pruned (list): 取り除いた列の位置（0始まり）
+    """
+    if option_str is None:
+        return None
+    removed = set(pruned)
+    renumber = {}
+    for position in range(n_columns):
+        if position not in removed:
+            renumber[position + 1] = len(renumber) + 1
+    options = parse_option_str(option_str)
+    return format_option_str({renumber[i]: v for i, v in options.items() if i in renumber})
+
+
+def compact_attributes(df, max_category_ratio=0.5):
+    """取り除いた列を手元に残すための省メモリな DataFrame
+
+    重複の多い文字列の列はカテゴリ型にし、数値の列は値を保ったまま最小の型に縮める。
+    """
+    import pandas as pd
+
+    compact = df.copy()
+    for name in compact.columns:
+        column = compact[name]
+        if pd.api.types.is_object_dtype(column.dtype) or pd.api.types.is_string_dtype(column.dtype):
+            if len(column) and column.nunique(dropna=True) <= max_category_ratio * len(column):
+                compact[name] = column.astype('category')
+        elif pd.api.types.is_integer_dtype(column.dtype):
+            compact[name] = pd.to_numeric(column, downcast='integer')
+    return compact
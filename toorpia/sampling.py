@@ -0,0 +1,195 @@
+import numpy as np
+
+# select_rows() が対応する縮約の方法
+SAMPLING_METHODS = ('random', 'stratified', 'coreset', 'grid')
+
+
+def select_rows(data, size, method='coreset', seed=0, strata=None, columns=None):
+    """ベースマップ作成前に、データを代表する行の部分集合を選ぶ
+
+    数百万行の冗長なベースラインを数万行程度に縮約してからアップロードするために使う。
+    選ばなかった行は、後から addplot_* で同じマップに対して評価できる。
+
+    - 'random': 一様な無作為抽出
+    - 'stratified': 層ごとの比率を保った層化抽出（各層から最低1行）。strata を省略すると
+      非数値の列の値の組み合わせ、それも無ければ第1主成分の10分位を層とする
+    - 'coreset': k-means のコアセット（センシティビティ・サンプリング）。小さな k-means で
+      クラスタ中心を求め、中心から遠い点と小さなクラスタの点ほど選ばれやすくする。
+      一様抽出では落ちやすい稀な領域や外れた領域も残る
+    - 'grid': 格子密度に基づく抽出。主成分（最大3次元）の格子でセルごとの点数を数え、
+      点の多いセルほど選ばれにくくする（重み 1/点数。空でない各セルから同程度の行数を選ぶ）。
+      密集した領域を間引き、疎な領域を残す
+
+    Args:
+        data (pandas.DataFrame or numpy.ndarray): 縮約するデータ（行 = サンプル）
+        size (int or float): 選ぶ行数。0 より大きく 1 以下の float は全体に対する割合（1.0 で全行）
+        method (str): 'random' / 'stratified' / 'coreset' / 'grid'
+        seed (int): 乱数のシード（同じシードなら同じ行が選ばれる）
+        strata (str or array-like, optional): 'stratified' の層。列名または行ごとのラベル
+        columns (list, optional): 距離の計算に使う列（DataFrame のみ）。省略時は数値列すべて
+
+    Returns:
+        numpy.ndarray: 選んだ行の位置（0始まり、昇順）
+    """
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f"method must be one of {', '.join(SAMPLING_METHODS)}")
+    n = len(data)
+    if isinstance(size, float) and 0 < size <= 1:
+        size = int(round(size * n))
+    elif isinstance(size, float) and not size.is_integer():
+        raise ValueError("size must be a row count or a fraction in (0, 1]")
+    size = int(size)
+    if size <= 0:
+        raise ValueError("size must be positive")
+    if size >= n:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+
+    if method == 'random':
+        indices = rng.choice(n, size, replace=False)
+    elif method == 'stratified':
+        indices = _stratified(_strata_labels(data, strata, columns, rng), size, rng)
+    elif method == 'coreset':
+        indices = _coreset(_feature_matrix(data, columns), size, rng)
+    else:
+        indices = _grid_density(_feature_matrix(data, columns), size, rng)
+    return np.sort(indices)
+
+
+def _feature_matrix(data, columns=None):
+    """数値列を標準化した float の行列にする（欠損値は列の平均で埋める）"""
+    if isinstance(data, np.ndarray):
+        X = np.asarray(data, dtype=float)
+    else:
+        frame = data[columns] if columns is not None else data.select_dtypes(include='number')
+        if frame.shape[1] == 0:
+            raise ValueError("no numeric columns to compute distances on")
+        X = frame.to_numpy(dtype=float)
+    if X.ndim == 1:
+        X = X.reshape(-1, 1)
+    X = X.copy()
+    mean = np.nanmean(X, axis=0)
+    mean = np.where(np.isnan(mean), 0.0, mean)
+    missing = np.isnan(X)
+    if missing.any():
+        X[missing] = np.take(mean, np.nonzero(missing)[1])
+    std = X.std(axis=0)
+    return (X - mean) / np.where(std > 0, std, 1.0)
+
+
+def _weighted_sample(weights, size, rng):
+    """重みに比例した非復元抽出（Efraimidis-Spirakis 法。キー log(u)/w の上位 size 件）"""
+    weights = np.asarray(weights, dtype=float)
+    with np.errstate(divide='ignore'):
+        keys = np.log(rng.random(len(weights))) / np.where(weights > 0, weights, 0.0)
+    keys[~np.isfinite(keys)] = -np.inf
+    return np.argpartition(-keys, size - 1)[:size]
+
+
+def _principal_components(X, k, rng, max_rows=20000):
+    """先頭 k 個の主成分への射影（主軸は最大 max_rows 行の部分集合から求める）"""
+    sample = X if len(X) <= max_rows else X[rng.choice(len(X), max_rows, replace=False)]
+    mean = sample.mean(axis=0)
+    _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+    return (X - mean) @ vt[:k].T
+
+
+def _kmeans(X, k, rng, max_rows=10000, iterations=10):
+    """部分集合上の k-means++ 初期化と Lloyd 法でクラスタ中心を求める"""
+    sample = X if len(X) <= max_rows else X[rng.choice(len(X), max_rows, replace=False)]
+    centers = [sample[rng.integers(len(sample))]]
+    d2 = ((sample - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = d2.sum()
+        if total <= 0:
+            break
+        centers.append(sample[rng.choice(len(sample), p=d2 / total)])
+        d2 = np.minimum(d2, ((sample - centers[-1]) ** 2).sum(axis=1))
+    centers = np.array(centers)
+    for _ in range(iterations):
+        labels, _ = _assign(sample, centers)
+        for j in range(len(centers)):
+            members = sample[labels == j]
+            if len(members):
+                centers[j] = members.mean(axis=0)
+    return centers
+
+
+def _assign(X, centers, block=65536):
+    """各点に最も近い中心の番号とその二乗距離を返す（メモリを抑えるためブロックごとに計算）"""
+    labels = np.empty(len(X), dtype=np.intp)
+    d2 = np.empty(len(X))
+    center_norms = (centers ** 2).sum(axis=1)
+    for start in range(0, len(X), block):
+        part = X[start:start + block]
+        dist = (part ** 2).sum(axis=1)[:, None] - 2 * part @ centers.T + center_norms[None, :]
+        labels[start:start + block] = dist.argmin(axis=1)
+        d2[start:start + block] = np.maximum(dist.min(axis=1), 0.0)
+    return labels, d2
+
+
+def _coreset(X, size, rng):
+    k = int(np.clip(np.sqrt(size), 1, 100))
+    centers = _kmeans(X, k, rng)
+    labels, d2 = _assign(X, centers)
+    cluster_sizes = np.bincount(labels, minlength=len(centers))
+    # センシティビティの上界: 中心からの二乗距離の寄与と、所属クラスタの小ささの寄与
+    total = d2.sum()
+    sensitivity = 1.0 / (len(centers) * cluster_sizes[labels])
+    if total > 0:
+        sensitivity = sensitivity + d2 / total
+    return _weighted_sample(sensitivity, size, rng)
+
+
+def _grid_density(X, size, rng):
+    dims = min(X.shape[1], 3)
+    Z = X if X.shape[1] <= 3 else _principal_components(X, dims, rng)
+    bins = int(np.clip(round(size ** (1.0 / dims)), 2, 64))
+    low, high = Z.min(axis=0), Z.max(axis=0)
+    span = np.where(high > low, high - low, 1.0)
+    cells = np.minimum(((Z - low) / span * bins).astype(np.intp), bins - 1)
+    cell_ids = np.ravel_multi_index(tuple(cells.T), (bins,) * dims)
+    _, inverse, counts = np.unique(cell_ids, return_inverse=True, return_counts=True)
+    return _weighted_sample(1.0 / counts[inverse.ravel()], size, rng)
+
+
+def _strata_labels(data, strata, columns, rng):
+    """層化抽出の層のラベル（整数）を返す"""
+    if isinstance(strata, str):
+        strata = data[strata]
+    if strata is not None:
+        _, labels = np.unique(np.asarray(strata).astype(str), return_inverse=True)
+        return labels.ravel()
+    if not isinstance(data, np.ndarray):
+        categorical = list(data.select_dtypes(exclude='number').columns)
+        if categorical:
+            return data.groupby(categorical, sort=False, dropna=False).ngroup().to_numpy()
+    component = _principal_components(_feature_matrix(data, columns), 1, rng)[:, 0]
+    edges = np.quantile(component, np.linspace(0, 1, 11)[1:-1])
+    return np.searchsorted(edges, component)
+
+
+def _stratified(labels, size, rng):
+    """各層の行数に比例して割り当て（最大剰余法。size が層の数以上なら各層最低1行）、層内は無作為に選ぶ"""
+    _, inverse, counts = np.unique(labels, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    n = len(labels)
+    base = np.zeros(len(counts), dtype=np.intp)
+    remaining = size
+    if size >= len(counts):
+        base[:] = 1
+        remaining -= len(counts)
+    capacity = counts - base
+    share = capacity * remaining / capacity.sum() if capacity.sum() else np.zeros(len(counts))
+    alloc = np.floor(share).astype(np.intp)
+    leftover = remaining - alloc.sum()
+    if leftover > 0:
+        order = np.argsort(-(share - alloc), kind='stable')
+        alloc[order[:leftover]] += 1
+    alloc = np.minimum(base + alloc, counts)
+    # 無作為な順に並べたうえで層ごとにまとめ、各層の先頭 alloc 件をとる
+    order = rng.permutation(n)
+    order = order[np.argsort(inverse[order], kind='stable')]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(n) - starts[inverse[order]]
+    return order[rank < alloc[inverse[order]]]
@@ -0,0 +1,284 @@
+import copy
+import itertools
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from .job import AdaptivePolling, Job
+
+
+class ScheduledJob:
+    """JobScheduler.submit() が返すハンドル
+
+    キュー投入からサーバーでの完了までを追跡する。result() で完了を待つと、
+    同期実行時と同じ返り値（失敗時は None）が得られる。
+
+    Attributes:
+        name (str): 表示用の名前
+        priority (int): 優先度（大きいほど先に投入される）
+        job (Job): サーバーへ投入済みの場合はそのジョブハンドル
+        submit_attempts (int): 投入を試みた回数（429 による再投入を含む）
+    """
+
+    def __init__(self, name, priority, call):
+        self.name = name
+        self.priority = priority
+        self.job = None
+        self.submit_attempts = 0
+        self.enqueued_at = time.monotonic()
+        self.started_at = None  # 投入スロットを得た時刻
+        self.finished_at = None
+        self._call = call
+        self._future = Future()
+
+    def __repr__(self):
+        state = 'done' if self.done() else ('running' if self.started_at is not None else 'queued')
+        return f"<toorPIA ScheduledJob {self.name} priority={self.priority} state={state}>"
+
+    @property
+    def queue_wait(self):
+        """投入スロットを得るまでのキュー待ち時間（秒）。未開始なら現在までの待ち時間"""
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+    @property
+    def run_time(self):
+        """スロットを得てから完了までの時間（秒）。未完了の場合は None"""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def done(self):
+        return self._future.done()
+
+    def cancel(self):
+        """まだ投入されていない場合に限りキャンセルする。キャンセルできたら True"""
+        return self._future.cancel()
+
+    def result(self, timeout=None):
+        """完了を待って結果を返す（同期実行時と同じ返り値。失敗時は None）"""
+        return self._future.result(timeout)
+
+
+class JobScheduler:
+    """ユーザーごとのアクティブジョブ数上限を守りながら非同期ジョブを投入するスケジューラ
+
+    サーバーは1ユーザーあたり同時に queued/running にできるジョブ数を制限しており
+    （既定5件）、超過分の投入は 429 で拒否される。このスケジューラは常に最大
+    max_active 件のジョブだけをサーバーに投入し、1件完了するとすぐに次の
+    ジョブを優先度順に投入する。429 が返った場合はジッター付きの指数バックオフ
+    （Retry-After ヘッダがあればそれ以上）で再投入する。
+
+    submit() には async_mode=True で呼び出せるクライアントメソッド名（または
+    async_mode キーワードを受け取る callable）と引数を渡す。
+
+    Example:
+        with JobScheduler(client, max_active=5) as scheduler:
+            handles = [scheduler.submit('addplot_csvform', [path], mapNo=12)
+                       for path in paths]
+        results = [h.result() for h in handles]
+        print(scheduler.stats())
+    """
+
+    DEFAULT_MAX_ACTIVE = 5
+
+    def __init__(self, client, max_active=DEFAULT_MAX_ACTIVE, max_submit_retries=8,
+                 retry_base=5.0, retry_max=120.0, polling=None):
+        """
+        Args:
+            client (toorPIA): ジョブを投入するクライアント
+            max_active (int): 同時にサーバーへ投入しておくジョブ数の上限
+            max_submit_retries (int): 429 を受けたときに再投入する最大回数
+            retry_base (float): 429 再投入のバックオフ初期値（秒）
+            retry_max (float): 429 再投入のバックオフ上限（秒）
+            polling (AdaptivePolling, optional): 完了待ちに使うポーリング戦略の雛形
+                （ジョブごとに複製して使う）。省略時は AdaptivePolling の既定値
+        """
+        if int(max_active) < 1:
+            raise ValueError("max_active must be at least 1")
+        self.client = client
+        self.max_active = int(max_active)
+        self.max_submit_retries = int(max_submit_retries)
+        self.retry_base = float(retry_base)
+        self.retry_max = float(retry_max)
+        self.polling = polling
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._closed = False
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        self._stats = {
+            'submitted': 0, 'completed': 0, 'failed': 0, 'cancelled': 0, 'retries429': 0,
+            'inFlight': 0, 'totalQueueWait': 0.0, 'maxQueueWait': 0.0, 'totalRunTime': 0.0,
+        }
+        self._first_enqueue = None
+        self._last_finish = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(wait=True)
+
+    def submit(self, method, *args, priority=0, name=None, **kwargs):
+        """ジョブをキューに追加する
+
+        Args:
+            method (str or callable): クライアントメソッド名（'addplot_csvform' 等）または
+                async_mode キーワードを受け取る callable
+            *args, **kwargs: メソッドに渡す引数（async_mode は自動で True になる）
+            priority (int): 優先度。大きいほど先に投入される（同じ優先度は投入順）
+            name (str, optional): 表示用の名前
+
+        Returns:
+            ScheduledJob: 完了を待てるハンドル
+        """
+        func = getattr(self.client, method) if isinstance(method, str) else method
+        kwargs['async_mode'] = True
+        seq = next(self._seq)
+        if name is None:
+            name = f"{getattr(func, '__name__', 'job')}#{seq}"
+        handle = ScheduledJob(name, priority, lambda: func(*args, **kwargs))
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("cannot submit to a scheduler that has been shut down")
+            if self._first_enqueue is None:
+                self._first_enqueue = handle.enqueued_at
+            self._pending += 1
+            self._start_workers()
+        self._queue.put((-priority, seq, handle))
+        return handle
+
+    def join(self, timeout=None):
+        """キュー内と実行中の全ジョブが終わるまで待つ。タイムアウトした場合は False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending > 0:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """新規投入を締め切り、ワーカーを停止する
+
+        Args:
+            wait (bool): True なら残りのジョブの完了まで待つ
+            cancel_pending (bool): True ならまだ投入されていないジョブをキャンセルする
+        """
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+        if cancel_pending:
+            drained = []
+            while True:
+                try:
+                    drained.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            for _, _, handle in drained:
+                if handle.cancel():
+                    self._finish(handle, 'cancelled')
+        for _ in workers:
+            # 番兵はどの実ジョブよりも後に取り出される
+            self._queue.put((float('inf'), next(self._seq), None))
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def stats(self):
+        """スループットとキュー待ちの集計値を返す
+
+        Returns:
+            dict: submitted / completed / failed / cancelled（件数）、retries429（429 による
+                再投入回数）、inFlight（投入中の件数）、queued（キュー内の件数）、
+                meanQueueWait / maxQueueWait（秒）、meanRunTime（秒）、
+                throughputPerMin（完了件数 / 分。最初の投入から最後の完了まで）
+        """
+        with self._lock:
+            s = dict(self._stats)
+            finished = s['completed'] + s['failed']
+            started = s['submitted']
+            s['queued'] = self._pending - s['inFlight']
+            s['meanQueueWait'] = s.pop('totalQueueWait') / started if started else 0.0
+            s['meanRunTime'] = s.pop('totalRunTime') / finished if finished else 0.0
+            elapsed = (self._last_finish - self._first_enqueue) if self._last_finish is not None else 0.0
+            s['throughputPerMin'] = finished / elapsed * 60 if elapsed > 0 else 0.0
+        return s
+
+    def _start_workers(self):
+        while len(self._workers) < self.max_active:
+            worker = threading.Thread(target=self._worker, name=f"toorpia-scheduler-{len(self._workers)}",
+                                      daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _worker(self):
+        while True:
+            _, _, handle = self._queue.get()
+            if handle is None:
+                return
+            if not handle._future.set_running_or_notify_cancel():
+                self._finish(handle, 'cancelled')
+                continue
+            handle.started_at = time.monotonic()
+            with self._lock:
+                wait = handle.queue_wait
+                self._stats['submitted'] += 1
+                self._stats['inFlight'] += 1
+                self._stats['totalQueueWait'] += wait
+                self._stats['maxQueueWait'] = max(self._stats['maxQueueWait'], wait)
+            try:
+                result = self._run(handle)
+            except BaseException as e:
+                handle.finished_at = time.monotonic()
+                handle._future.set_exception(e)
+                self._finish(handle, 'failed', started=True)
+                continue
+            handle.finished_at = time.monotonic()
+            handle._future.set_result(result)
+            self._finish(handle, 'completed' if result is not None else 'failed', started=True)
+
+    def _run(self, handle):
+        """ジョブを投入し（429 の間は再投入）、完了まで待って結果を返す"""
+        local = self.client._local
+        while True:
+            local.last_submission_status = None
+            local.last_submission_retry_after = None
+            handle.submit_attempts += 1
+            submitted = handle._call()
+            if isinstance(submitted, Job):
+                handle.job = submitted
+                polling = copy.copy(self.polling) if self.polling is not None else AdaptivePolling()
+                return submitted.wait(polling=polling)
+            if submitted is not None or getattr(local, 'last_submission_status', None) != 429:
+                # 非同期未対応サーバーでの同期実行結果、または 429 以外のエラー (None)
+                return submitted
+            if handle.submit_attempts > self.max_submit_retries:
+                print(f"Error: {handle.name} was rejected with 429 {handle.submit_attempts} times. Giving up.")
+                return None
+            with self._lock:
+                self._stats['retries429'] += 1
+            delay = min(self.retry_max, self.retry_base * 2 ** (handle.submit_attempts - 1))
+            delay *= random.uniform(0.5, 1.0)
+            try:
+                delay = max(delay, float(local.last_submission_retry_after))
+            except (TypeError, ValueError):
+                pass
+            print(f"Active job limit reached (429). Resubmitting {handle.name} in {delay:.1f}s...")
+            time.sleep(delay)
+
+    def _finish(self, handle, outcome, started=False):
+        with self._idle:
+            self._stats[outcome] += 1
+            if started:
+                self._stats['inFlight'] -= 1
+                self._stats['totalRunTime'] += handle.run_time or 0.0
+                self._last_finish = handle.finished_at
+            self._pending -= 1
+            self._idle.notify_all()
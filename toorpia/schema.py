@@ -0,0 +1,392 @@
+import collections
+import json
+import os
+import threading
+
+import numpy as np
+
+from .utils.files import write_json_atomic
+
+# 日付らしさの判定に使う、列ごとの先頭からの非欠損値の数
+DATE_SAMPLE_SIZE = 10
+
+
+def _dtype_option(dtype):
+    """dtype だけで決まる (型, 重み) を返す。文字列・object 型（日付らしさの判定が必要）は None"""
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'date', 0       # datetime64型
+    if pd.api.types.is_float_dtype(dtype):
+        return 'float', 1
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'int', 1
+    if pd.api.types.is_string_dtype(dtype) or pd.api.types.is_object_dtype(dtype):
+        return None            # 日付文字列なら date、それ以外は none（いずれも重み0）
+    if isinstance(dtype, pd.CategoricalDtype):
+        return 'enum', 0
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'enum', 0
+    return 'none', 0           # その他の型は未サポートとして扱う
+
+
+def _is_date_column(column):
+    """1列の日付らしさ（先頭の非欠損値がすべて日付として解釈できるか）"""
+    import pandas as pd
+
+    sample = column.dropna()
+    if len(sample) == 0:
+        return False
+    try:
+        pd.to_datetime(sample.head(DATE_SAMPLE_SIZE), format='mixed')
+        return True
+    except (ValueError, TypeError, OverflowError):
+        return False
+
+
+def date_like_columns(df, positions, head_rows=100):
+    """文字列・object 型の列（位置 positions）のうち日付らしい列の位置の集合を返す
+
+    各列の先頭 DATE_SAMPLE_SIZE 個の非欠損値を全列分まとめて1回の pd.to_datetime で解析し、
+    解析できなかった値を含む列を日付でないと判定する。先頭 head_rows 行に非欠損値が
+    足りない列と、まとめての解析が例外になった場合は1列ずつ判定する。
+    """
+    import pandas as pd
+
+    if not positions:
+        return set()
+    positions = list(positions)
+    head = df.iloc[:head_rows, positions].to_numpy(dtype=object)
+    present = pd.notna(head)
+    taken = present & (np.cumsum(present, axis=0) <= DATE_SAMPLE_SIZE)
+    counts = taken.sum(axis=0)
+    full = df.iloc[:, positions].notna().sum().to_numpy() if len(df) > head_rows else counts
+    # 先頭だけでは標本が足りない列は1列ずつ判定する
+    fallback = [i for i in range(len(positions)) if counts[i] < min(DATE_SAMPLE_SIZE, full[i])]
+
+    rows, cols = np.nonzero(taken)
+    date_like = set()
+    try:
+        parsed = pd.to_datetime(pd.Series(head[rows, cols], dtype=object), format='mixed', errors='coerce')
+        failed = np.bincount(cols[parsed.isna().to_numpy()], minlength=len(positions))
+        for i in range(len(positions)):
+            if counts[i] > 0 and failed[i] == 0 and i not in fallback:
+                date_like.add(positions[i])
+    except (ValueError, TypeError, OverflowError):
+        fallback = range(len(positions))
+    for i in fallback:
+        if _is_date_column(df.iloc[:, positions[i]]):
+            date_like.add(positions[i])
+    return date_like
+
+
+def infer_type_weight_options(df):
+    """DataFrame の各列の型から weight_option_str / type_option_str を推定する
+
+    dtype ごとに1回だけ判定し、文字列・object 型の列の日付らしさはまとめて判定する。
+
+    Returns:
+        tuple: (weight_option_str, type_option_str)
+    """
+    decisions = {}
+    options = []
+    pending = []
+    for position, dtype in enumerate(df.dtypes):
+        if dtype not in decisions:
+            decisions[dtype] = _dtype_option(dtype)
+        option = decisions[dtype]
+        if option is None:
+            pending.append(position)
+        options.append(option)
+    for position in pending:
+        options[position] = ('none', 0)
+    for position in date_like_columns(df, pending):
+        options[position] = ('date', 0)
+
+    weight_option_str = ",".join(f"{i + 1}:{weight}" for i, (_, weight) in enumerate(options))
+    type_option_str = ",".join(f"{i + 1}:{kind}" for i, (kind, _) in enumerate(options))
+    return weight_option_str, type_option_str
+
+
+def schema_signature(df):
+    """列名と dtype の組み合わせ（推定結果のキャッシュのキー）"""
+    return tuple(map(str, df.columns)), tuple(map(str, df.dtypes))
+
+
+class OptionInferenceCache:
+    """列名と dtype が同じ DataFrame に対する weight/type オプションの推定結果のキャッシュ
+
+    同じスキーマで addplot を繰り返す場合に推定を丸ごと省く。日付らしさは値にも依存するが、
+    同じスキーマなら最初の判定を使い続ける。
+
+    Args:
+        max_entries (int): 保持するスキーマの数（古いものから捨てる）
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def options(self, df):
+        """推定結果を返す（キャッシュに無ければ推定して保存する）"""
+        key = schema_signature(df)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        result = infer_type_weight_options(df)
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# マップの作成方式ごとの対応する addplot メソッド
+ADDPLOT_METHODS = {
+    'dataframe': 'addplot',
+    'csvform': 'addplot_csvform',
+    'waveform': 'addplot_waveform',
+    'embedding': 'addplot_embedding',
+}
+
+
+def _peek_rows(path, n=2):
+    """CSV（.csv.gz を含む）の先頭 n 行だけを読んでフィールドのリストで返す"""
+    import csv
+    import gzip
+    import itertools
+
+    opener = gzip.open if path.lower().endswith('.gz') else open
+    with opener(path, 'rt', newline='', encoding='utf-8', errors='replace') as f:
+        return [row for row in itertools.islice(csv.reader(f), n) if row]
+
+
+def _is_number(token):
+    try:
+        float(token)
+        return True
+    except ValueError:
+        return False
+
+
+def table_columns(data):
+    """DataFrame またはファイル（先頭行のみ読む）の列名のリスト"""
+    if isinstance(data, str):
+        rows = _peek_rows(data, 1)
+        return rows[0] if rows else []
+    return [str(c) for c in data.columns]
+
+
+def embedding_dimensions(data, id_columns=None):
+    """埋め込み入力（ndarray / DataFrame / ファイル）の (次元数, ID 列数) を返す
+
+    ファイルは先頭の2行だけを読み、サーバーと同様に2行目の先頭の非数値の列を
+    ID 列とみなす（id_columns を指定した場合はそれを使う）。
+    """
+    import pandas as pd
+
+    if isinstance(data, np.ndarray):
+        return data.shape[1] - (id_columns or 0), id_columns or 0
+    if isinstance(data, str):
+        rows = _peek_rows(data, 2)
+        if not rows:
+            return 0, 0
+        values = rows[-1]
+        if id_columns is None:
+            id_columns = 0
+            for token in values:
+                if _is_number(token):
+                    break
+                id_columns += 1
+        return len(values) - id_columns, id_columns
+    if id_columns is None:
+        id_columns = 0
+        for dtype in data.dtypes:
+            if pd.api.types.is_numeric_dtype(dtype):
+                break
+            id_columns += 1
+    return data.shape[1] - id_columns, id_columns
+
+
+def wav_sample_rate(path):
+    """WAV ファイルの fmt チャンクからサンプリング周波数を読む（読めなければ None）"""
+    from .waveform import wav_format
+
+    try:
+        return wav_format(path)['sampleRate']
+    except (OSError, ValueError):
+        return None
+
+
+def basemap_schema(kind, data, arguments, inspected=None):
+    """ベースマップ作成時の入力と引数から、addplot の事前検証に使うスキーマを作る
+
+    Args:
+        kind (str): 'dataframe', 'csvform', 'waveform', 'embedding' のいずれか
+        data: アップロードする入力（DataFrame、ファイルのパス（のリスト）、ndarray）
+        arguments (dict): 作成メソッドの引数（既定値を含む）
+        inspected (dict, optional): 読み込み済みの波形ファイルのヘッダ情報
+            （パスごとの toorpia.waveform.inspect_waveform_file() の結果）
+    """
+    paths = [data] if isinstance(data, str) else (list(data) if isinstance(data, list) else None)
+    entry = {'processMethod': kind}
+    if kind in ('dataframe', 'csvform'):
+        entry['columns'] = table_columns(data if paths is None else paths[0])
+        entry['weightOptions'] = arguments.get('weight_option_str')
+        entry['typeOptions'] = arguments.get('type_option_str')
+        if arguments.get('drop_columns'):
+            entry['dropColumns'] = list(arguments['drop_columns'])
+        entry['vectorNormalization'] = arguments.get('vector_normalization')
+    elif kind == 'embedding':
+        sample = data if paths is None else paths[0]
+        entry['nDimension'], detected = embedding_dimensions(sample, arguments.get('id_columns'))
+        entry['idColumns'] = arguments.get('id_columns')
+        entry['detectedIdColumns'] = detected
+        entry['l2Normalization'] = arguments.get('l2_normalization')
+    elif kind == 'waveform':
+        entry['mkfftseg'] = {name[len('mkfftseg_'):]: value for name, value in arguments.items()
+                             if name.startswith('mkfftseg_')}
+        # 前処理した波形（WavWindow）は自身のサンプリング周波数を使う
+        inspected = inspected or {}
+        rates = {getattr(p, 'sample_rate', None) or
+                 (inspected[p].get('sampleRate') if p in inspected else wav_sample_rate(p)) for p in paths
+                 if hasattr(p, 'sample_rate') or p.lower().endswith('.wav')}
+        entry['sampleRates'] = sorted(rate for rate in rates if rate is not None)
+    return entry
+
+
+def check_addplot(entry, kind, data, inspected=None):
+    """ベースマップのスキーマに対して addplot の入力を検証する
+
+    ファイルは先頭の数行（WAV はヘッダ）だけを読む。inspected（パスごとの
+    toorpia.waveform.inspect_waveform_file() の結果）にある波形ファイルは読み直さない。
+
+    Returns:
+        str: 問題の説明。問題がなければ None
+    """
+    import pandas as pd
+
+    method = entry.get('processMethod')
+    if method is not None and method != kind:
+        return (f"the map was created with processMethod '{method}'; "
+                f"use {ADDPLOT_METHODS.get(method, 'the matching addplot method')}() instead of "
+                f"{ADDPLOT_METHODS[kind]}()")
+    inputs = [data] if isinstance(data, str) else (list(data) if isinstance(data, list) else [data])
+
+    if kind in ('dataframe', 'csvform') and entry.get('columns') is not None:
+        expected = entry['columns']
+        types = {}
+        if entry.get('typeOptions'):
+            from .pruning import parse_option_str
+            types = parse_option_str(entry['typeOptions'])
+        for item in inputs:
+            columns = table_columns(item)
+            name = f"'{item}'" if isinstance(item, str) else "input"
+            if len(columns) != len(expected):
+                missing = [c for c in expected if c not in columns]
+                unexpected = [c for c in columns if c not in expected]
+                detail = "".join([f"; missing: {', '.join(map(str, missing))}" if missing else "",
+                                  f"; unexpected: {', '.join(map(str, unexpected))}" if unexpected else ""])
+                return f"{name} has {len(columns)} columns but the basemap has {len(expected)}{detail}"
+            if isinstance(item, str):
+                continue
+            for position, dtype in enumerate(item.dtypes):
+                kind_option = types.get(position + 1)
+                if kind_option in ('float', 'int') and not (pd.api.types.is_numeric_dtype(dtype)
+                                                            and not pd.api.types.is_bool_dtype(dtype)):
+                    return (f"column '{columns[position]}' has dtype {dtype} "
+                            f"but the basemap uses it as {kind_option}")
+
+    elif kind == 'embedding' and entry.get('nDimension') is not None:
+        for item in inputs:
+            dims, _ = embedding_dimensions(item, entry.get('idColumns'))
+            if dims != entry['nDimension']:
+                name = f"'{item}'" if isinstance(item, str) else "input"
+                return f"{name} has {dims} embedding dimensions but the basemap has {entry['nDimension']}"
+
+    elif kind == 'waveform':
+        rates = entry.get('sampleRates') or []
+        data_index = (entry.get('mkfftseg') or {}).get('di')
+        for item in inputs:
+            # WavWindow（時間区間やライブ入力の窓）は自身のサンプリング周波数で調べる
+            window_rate = getattr(item, 'sample_rate', None)
+            item = getattr(item, 'path', item)
+            detail = (inspected or {}).get(item) if window_rate is None else None
+            if window_rate is not None or item.lower().endswith('.wav'):
+                if window_rate is not None:
+                    rate = window_rate
+                else:
+                    rate = detail.get('sampleRate') if detail is not None else wav_sample_rate(item)
+                if rates and rate is not None and rate not in rates:
+                    return (f"'{item}' is sampled at {rate} Hz but the basemap WAV files use "
+                            f"{', '.join(f'{r} Hz' for r in rates)}")
+            elif data_index is not None and detail is None:
+                rows = _peek_rows(item, 1)
+                if rows and len(rows[0]) < int(data_index):
+                    return (f"'{item}' has {len(rows[0])} columns but the basemap reads "
+                            f"column {data_index} (mkfftseg_di)")
+    return None
+
+
+class MapSchemaCache:
+    """マップ番号ごとのベースマップのスキーマと前処理オプションのキャッシュ
+
+    addplot 系メソッドはアップロード前にこのスキーマで入力を検証する。メモリ上に
+    保持し、path を指定した場合は JSON ファイルにも保存して別プロセスでも使う。
+
+    Args:
+        path (str, optional): キャッシュを保存する JSON ファイルのパス
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not read map schema cache {path}: {str(e)}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, map_no):
+        with self._lock:
+            return str(map_no) in self._entries
+
+    def get(self, map_no):
+        with self._lock:
+            entry = self._entries.get(str(map_no))
+            return dict(entry) if entry is not None else None
+
+    def put(self, map_no, entry):
+        with self._lock:
+            self._entries[str(map_no)] = dict(entry)
+            if self.path is not None:
+                self._save()
+
+    def remove(self, map_no):
+        with self._lock:
+            if self._entries.pop(str(map_no), None) is not None and self.path is not None:
+                self._save()
+
+    def _save(self):
+        try:
+            write_json_atomic(self.path, self._entries)
+        except OSError as e:
+            print(f"Warning: could not write map schema cache {self.path}: {str(e)}")
@@ -0,0 +1,147 @@
+import hashlib
+import itertools
+import json
+import os
+import threading
+
+import numpy as np
+
+from .utils.files import write_json_atomic
+
+# addplot_sweep() で掃引できるパラメータ（addplot / addplot_* 共通の引数名）
+SWEEP_PARAMETERS = (
+    'identna_resolution', 'identna_effective_radius', 'identna_er_method', 'identna_knn_k',
+    'detabn_max_window', 'detabn_rate_threshold', 'detabn_threshold',
+)
+
+
+def expand_grid(param_grid):
+    """パラメータグリッドを組み合わせのリストに展開する
+
+    Args:
+        param_grid (dict or list): {'identna_resolution': [50, 100], ...} のような
+            パラメータ名から候補値のリストへの dict（全組み合わせに展開する）、
+            またはそのような dict のリスト（各 dict を展開して連結する）
+
+    Returns:
+        list: パラメータ名から値への dict のリスト
+    """
+    grids = [param_grid] if isinstance(param_grid, dict) else list(param_grid)
+    combinations = []
+    for grid in grids:
+        unknown = set(grid) - set(SWEEP_PARAMETERS)
+        if unknown:
+            raise ValueError(f"unsupported sweep parameter(s): {', '.join(sorted(unknown))}")
+        names = sorted(grid)
+        values = [v if isinstance(v, (list, tuple, np.ndarray)) else [v] for v in (grid[n] for n in names)]
+        for combo in itertools.product(*values):
+            combinations.append({name: _plain(value) for name, value in zip(names, combo)})
+    return combinations
+
+
+def _plain(value):
+    """NumPy のスカラーを JSON にできる Python の値にする"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def fingerprint_data(data):
+    """入力データ（DataFrame / ndarray / ファイルパス）の内容のハッシュを返す"""
+    digest = hashlib.sha256()
+    if isinstance(data, np.ndarray):
+        array = np.ascontiguousarray(data)
+        digest.update(f"ndarray:{array.dtype.str}:{array.shape}".encode())
+        digest.update(array.tobytes())
+    elif isinstance(data, (str, list)):
+        for path in ([data] if isinstance(data, str) else data):
+            digest.update(f"file:{os.path.basename(path)}".encode())
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+    else:
+        import pandas as pd  # DataFrame 入力時のみ必要
+        digest.update(json.dumps([str(c) for c in data.columns]).encode())
+        digest.update(json.dumps([str(t) for t in data.dtypes]).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def parameter_hash(method, map_no, data_fingerprint, params):
+    """キャッシュのキー: メソッド・マップ番号・データ・パラメータの組み合わせのハッシュ"""
+    key = json.dumps({'method': method, 'mapNo': map_no, 'data': data_fingerprint, 'params': params},
+                     sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def summarize_result(result):
+    """addplot の返り値から掃引結果の表の1行分（JSON にできる値）を取り出す"""
+    if result is None:
+        return {'ok': False}
+    diagnostic = result.get('diagnosticScore') or {}
+    distance = diagnostic.get('distance') or {}
+    detabn = diagnostic.get('detabn') or {}
+    return {
+        'ok': True,
+        'addPlotNo': result.get('addPlotNo'),
+        'abnormalityStatus': result.get('abnormalityStatus'),
+        'abnormalityScore': result.get('abnormalityScore'),
+        'detabnStatus': detabn.get('status'),
+        'compositeStatus': diagnostic.get('compositeStatus'),
+        'meanDistance': distance.get('meanDistance'),
+        'normalizedDistance': distance.get('normalizedDistance'),
+        'exceedanceRatio': distance.get('exceedanceRatio'),
+        'distanceStatus': distance.get('status'),
+    }
+
+
+class SweepCache:
+    """addplot_sweep() の結果をパラメータのハッシュごとに保持するキャッシュ
+
+    メモリ上に保持し、path を指定した場合は JSON ファイルにも保存して
+    次回以降（別プロセスを含む）に再利用する。失敗した組み合わせは保存しない。
+
+    Args:
+        path (str, optional): キャッシュを保存する JSON ファイルのパス
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path is not None and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not read sweep cache {path}: {str(e)}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def put(self, key, summary):
+        if not summary.get('ok'):
+            return
+        with self._lock:
+            self._entries[key] = dict(summary)
+            if self.path is not None:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            if self.path is not None:
+                self._save()
+
+    def _save(self):
+        try:
+            write_json_atomic(self.path, self._entries)
+        except OSError as e:
+            print(f"Warning: could not write sweep cache {self.path}: {str(e)}")
@@ -0,0 +1,27 @@
+import json
+import os
+import tempfile
+
+
+def write_json_atomic(path, data):
+    """data を JSON にして path に書き込む（同じディレクトリの一時ファイルに書いてから置き換える）
+
+    書き込み中に中断されても、path には前回の内容か今回の内容のどちらかが残る。
+    JSON にできない値は str() で文字列にする。
+
+    Raises:
+        OSError: 書き込みまたは置き換えに失敗した場合（一時ファイルは削除する）
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
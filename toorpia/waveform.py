@@ -0,0 +1,686 @@
+import io
+import math
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+# mkfftSeg の窓関数（mkfftseg_wf）
+WINDOW_FUNCTIONS = {
+    'hanning': np.hanning,
+    'hamming': np.hamming,
+}
+# mkfftseg_nm=0（自動）のときの特徴量の次元数の目安。帯域内のビン数がこれを超えないように平均する
+AUTO_FEATURE_BINS = 512
+# 一度に FFT にかけるサンプル数の目安（メモリ使用量の上限）
+FFT_BLOCK_SAMPLES = 1 << 24
+
+# WAV の fmt チャンクの形式コード
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# validate_waveform_files のヘッダを並行して読むスレッド数の既定
+VALIDATION_WORKERS = 8
+# resample でブロックごとに FFT するときに前後に重ねるサンプル数（ブロックの境目の誤差を抑える）
+RESAMPLE_MARGIN = 16384
+# resample で周波数を下げるときに、新しいナイキスト周波数の手前で滑らかに 0 にする帯域の割合
+RESAMPLE_ROLLOFF = 0.05
+
+# mkfftSeg のオプションの既定値（basemap_waveform の引数の既定と同じ）
+MKFFTSEG_DEFAULTS = {'di': 1, 'hp': -1.0, 'lp': -1.0, 'nm': 0, 'ol': 50.0, 'sr': 48000,
+                     'wf': 'hanning', 'wl': 65536}
+
+
+def wav_format(path):
+    """WAV ファイルのヘッダ（RIFF の fmt / data チャンク）を読む
+
+    Returns:
+        dict: format（形式コード）, channels, sampleRate, bitsPerSample, blockAlign, dataOffset,
+            dataSize（実際に読めるバイト数）, declaredDataSize（ヘッダに書かれたバイト数）と、
+            fact チャンクがあれば factFrames（サンプル数）
+
+    Raises:
+        ValueError: WAV として読めない場合
+    """
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+            raise ValueError(f"'{path}' is not a RIFF/WAVE file")
+        info = fact = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"'{path}' has no data chunk")
+            chunk_id, size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'fmt ':
+                fmt = f.read(size)
+                if len(fmt) < 16:
+                    raise ValueError(f"'{path}' has a truncated fmt chunk")
+                code, channels, rate, _, align, bits = struct.unpack('<HHIIHH', fmt[:16])
+                if code == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    code = struct.unpack('<H', fmt[24:26])[0]  # SubFormat GUID の先頭
+                info = {'format': code, 'channels': channels, 'sampleRate': rate, 'bitsPerSample': bits,
+                        'blockAlign': align}
+                if size & 1:
+                    f.seek(1, 1)
+            elif chunk_id == b'fact' and size >= 4:
+                # 圧縮形式のサンプル数（fmt より前に置かれることもある）
+                fact = struct.unpack('<I', f.read(4))[0]
+                f.seek(size - 4 + (size & 1), 1)
+            elif chunk_id == b'data':
+                if info is None:
+                    raise ValueError(f"'{path}' has a data chunk before its fmt chunk")
+                if fact is not None:
+                    info['factFrames'] = fact
+                offset = f.tell()
+                # 書き込み途中のファイルなどで data のサイズが実際より大きい場合はファイル末尾まで
+                info['dataOffset'] = offset
+                info['declaredDataSize'] = size
+                info['dataSize'] = min(size, os.path.getsize(path) - offset)
+                return info
+            else:
+                f.seek(size + (size & 1), 1)
+
+
+def _sample_dtype(info, path):
+    code, bits = info['format'], info['bitsPerSample']
+    if code == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        return np.dtype('<f4' if bits == 32 else '<f8')
+    if code == WAVE_FORMAT_PCM and bits in (8, 16, 24, 32):
+        return np.dtype({8: 'u1', 16: '<i2', 24: 'u1', 32: '<i4'}[bits])  # 24 bit は3バイトずつ組み立てる
+    raise ValueError(f"'{path}' uses an unsupported WAV encoding (format {code}, {bits} bit)")
+
+
+def _decode(raw, info, dtype):
+    """data チャンクのバイト列（uint8 の配列）を形状 (サンプル数, チャンネル数) の float64 にする"""
+    code, bits, channels = info['format'], info['bitsPerSample'], max(info['channels'], 1)
+    if bits == 24:
+        triplets = np.asarray(raw).reshape(-1, 3).astype(np.int32)
+        values = (triplets[:, 0] | (triplets[:, 1] << 8) | (triplets[:, 2] << 16)) << 8 >> 8
+        samples = values / float(1 << 23)
+    else:
+        values = np.frombuffer(raw, dtype=dtype)
+        if bits == 8 and code == WAVE_FORMAT_PCM:
+            samples = (values.astype(np.float64) - 128.0) / 128.0
+        elif code == WAVE_FORMAT_PCM:
+            samples = values / float(1 << (bits - 1))
+        else:
+            samples = values.astype(np.float64)
+    return samples.reshape(-1, channels)
+
+
+def _map_data(path, info):
+    """data チャンクをメモリマップした uint8 の配列（読み取り専用）"""
+    block = info['bitsPerSample'] // 8 * max(info['channels'], 1)
+    size = info['dataSize'] // block * block
+    if size == 0:
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='r', offset=info['dataOffset'], shape=(size,))
+
+
+def inspect_waveform_file(path, data_index=1):
+    """WAV / CSV ファイルのヘッダだけを読み、アップロード前の検証に使う情報を返す
+
+    WAV は RIFF のチャンク構成・形式・サンプリング周波数・チャンネル数・ビット深度と、
+    data チャンクの長さから再生時間を求める。ヘッダに書かれた長さより短い（途中で切れた）
+    ファイルや、サンプルのない・形式が壊れたファイルはエラーにする。CSV は先頭の2行だけを読み、
+    data_index 番目（mkfftseg_di）の列があるかを調べる（再生時間は None）。
+
+    Returns:
+        dict: path, kind（'wav' / 'csv'）, bytes と、WAV では format, sampleRate, channels,
+            bitsPerSample, frames, durationSeconds（長さのわからない圧縮形式では None）
+
+    Raises:
+        ValueError: 読めない・壊れている・列の足りないファイル
+    """
+    try:
+        size = os.path.getsize(path)
+        if not path.lower().endswith('.wav'):
+            from .schema import _is_number, _peek_rows
+
+            rows = _peek_rows(path, 2)
+            if not rows:
+                raise ValueError(f"'{path}' is empty")
+            if len(rows[-1]) < int(data_index) or not _is_number(rows[-1][int(data_index) - 1]):
+                raise ValueError(f"'{path}' has no numeric column {data_index} (mkfftseg_di)")
+            return {'path': path, 'kind': 'csv', 'bytes': size, 'durationSeconds': None}
+        info = wav_format(path)
+    except OSError as e:
+        raise ValueError(f"cannot read '{path}': {e.strerror or str(e)}")
+
+    if info['channels'] < 1 or info['sampleRate'] < 1 or info['blockAlign'] < 1:
+        raise ValueError(f"'{path}' has an invalid fmt chunk ({info['channels']} channel(s), "
+                         f"{info['sampleRate']} Hz, block align {info['blockAlign']})")
+    if info['dataSize'] < info['declaredDataSize']:
+        raise ValueError(f"'{path}' is truncated: its data chunk declares {info['declaredDataSize']} bytes "
+                         f"but only {info['dataSize']} are present")
+    if info['dataSize'] < info['blockAlign']:
+        raise ValueError(f"'{path}' has no audio samples")
+    # 非圧縮の形式はブロック数がサンプル数。圧縮形式は fact チャンクがあればそのサンプル数
+    if info['format'] in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+        frames = info['dataSize'] // info['blockAlign']
+    else:
+        frames = info.get('factFrames')
+    return {'path': path, 'kind': 'wav', 'bytes': size, 'format': info['format'],
+            'sampleRate': info['sampleRate'], 'channels': info['channels'],
+            'bitsPerSample': info['bitsPerSample'], 'frames': frames,
+            'durationSeconds': frames / info['sampleRate'] if frames is not None else None}
+
+
+def validate_waveform_files(files, data_index=1, sample_rates=None, max_workers=VALIDATION_WORKERS,
+                            check_rates=True):
+    """波形ファイルのバッチのヘッダを並行して読み、アップロード前にまとめて検証する
+
+    各ファイルは inspect_waveform_file() でヘッダだけを読む。WAV のサンプリング周波数が
+    ファイルの間で（sample_rates を指定した場合はそれとも）一致しなければエラーにする。
+    問題が見つかった時点で残りのファイルの読み込みを取りやめる。
+
+    Args:
+        files (list): WAV / CSV ファイルのパス（WavWindow は検証済みとして読み飛ばす）
+        data_index (int): CSV で使う列（mkfftseg_di）
+        sample_rates (list, optional): 許すサンプリング周波数（ベースマップの WAV のものなど）
+        max_workers (int): ヘッダを並行して読むスレッド数
+        check_rates (bool): False ならサンプリング周波数の一致を調べない（アップロード前にリサンプリングする場合）
+
+    Returns:
+        dict: files（ファイル数）、wavFiles、csvFiles、sampleRates、channels、bitsPerSample、
+            totalDurationSeconds（WAV の再生時間の合計。長さのわからない圧縮形式は含まない）、
+            totalBytes、details（ファイルごとの情報）
+
+    Raises:
+        ValueError: 最初に見つかった問題
+    """
+    paths = [f for f in files if not isinstance(f, WavWindow)]
+    details = [None] * len(paths)
+    allowed = set(sample_rates or ())
+    with ThreadPoolExecutor(max_workers=max(1, min(int(max_workers), len(paths) or 1))) as executor:
+        futures = {executor.submit(inspect_waveform_file, path, data_index): i for i, path in enumerate(paths)}
+        first_rate = None
+        try:
+            for future in as_completed(futures):
+                detail = future.result()
+                details[futures[future]] = detail
+                rate = detail.get('sampleRate')
+                if rate is None or not check_rates:
+                    continue
+                if allowed and rate not in allowed:
+                    raise ValueError(f"'{detail['path']}' is sampled at {rate} Hz but the basemap WAV files use "
+                                     f"{', '.join(f'{r} Hz' for r in sorted(allowed))}")
+                if first_rate is None:
+                    first_rate = detail
+                elif rate != first_rate['sampleRate']:
+                    raise ValueError(f"'{detail['path']}' is sampled at {rate} Hz but '{first_rate['path']}' "
+                                     f"is sampled at {first_rate['sampleRate']} Hz")
+        except ValueError:
+            for future in futures:
+                future.cancel()
+            raise
+
+    wav = [d for d in details if d['kind'] == 'wav']
+    return {
+        'files': len(details),
+        'wavFiles': len(wav),
+        'csvFiles': len(details) - len(wav),
+        'sampleRates': sorted({d['sampleRate'] for d in wav}),
+        'channels': sorted({d['channels'] for d in wav}),
+        'bitsPerSample': sorted({d['bitsPerSample'] for d in wav}),
+        'totalDurationSeconds': float(sum(d['durationSeconds'] or 0.0 for d in wav)),
+        'totalBytes': int(sum(d['bytes'] for d in details)),
+        'details': details,
+    }
+
+
+def read_wav(path):
+    """WAV ファイルのサンプルを読む（PCM 8/16/24/32 bit と 32/64 bit 浮動小数点）
+
+    Returns:
+        tuple: (samples, sample_rate)。samples は形状 (サンプル数, チャンネル数) の float64 で、
+            整数 PCM は [-1, 1) に換算する
+
+    Raises:
+        ValueError: 対応していない形式の場合
+    """
+    info = wav_format(path)
+    dtype = _sample_dtype(info, path)
+    return _decode(_map_data(path, info), info, dtype), info['sampleRate']
+
+
+class _WindowStream(io.RawIOBase):
+    """WAV のヘッダとメモリマップしたデータの一部を、1つのファイルとして読ませる読み取り専用ストリーム"""
+
+    def __init__(self, name, header, data):
+        self.name = name
+        self._parts = [memoryview(header), memoryview(data).cast('B')]
+        self._size = sum(len(part) for part in self._parts)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._size}[whence]
+        self._position = min(max(base + offset, 0), self._size)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def readinto(self, buffer):
+        target = memoryview(buffer).cast('B')
+        written, position = 0, self._position
+        for part in self._parts:
+            if position >= len(part):
+                position -= len(part)
+                continue
+            count = min(len(part) - position, len(target) - written)
+            target[written:written + count] = part[position:position + count]
+            written += count
+            position = 0
+            if written == len(target):
+                break
+        self._position += written
+        return written
+
+
+class WavWindow:
+    """長い WAV ファイルの一部の時間区間
+
+    サンプルは wav_windows() がメモリマップしたデータのビューで、コピーしない。
+    addplot_waveform() のファイルのリストにパスの代わりに渡すと、元のヘッダの形式の
+    WAV としてこのビューから直接アップロードする。
+
+    Attributes:
+        path (str): 元の WAV ファイルのパス
+        start (float): 区間の先頭の時刻（秒）
+        duration (float): 区間の長さ（秒）
+        sample_rate (int): サンプリング周波数
+        data (numpy.ndarray): 区間の data チャンクのバイト列（uint8 のビュー）
+    """
+
+    def __init__(self, path, info, data, start_frame, name=None):
+        self.path = path
+        self.name = name
+        self.info = info
+        self.data = data
+        self.sample_rate = info['sampleRate']
+        block = info['bitsPerSample'] // 8 * max(info['channels'], 1)
+        self.start = start_frame / self.sample_rate
+        self.duration = len(data) // block / self.sample_rate
+
+    @classmethod
+    def from_samples(cls, samples, sample_rate, name='stream.wav', start_seconds=0.0, filename=None):
+        """メモリ上のサンプル（[-1, 1] の float。形状 (サンプル数,) または (サンプル数, チャンネル数)）から
+        16 bit PCM の区間を作る（ライブ入力の窓や前処理した波形の送信用）。filename を指定すると
+        アップロードするファイル名を "名前@先頭の秒数s.wav" の代わりにそれにする"""
+        samples = np.asarray(samples, dtype=float)
+        samples = samples.reshape(len(samples), -1)
+        info = {'format': WAVE_FORMAT_PCM, 'channels': samples.shape[1], 'sampleRate': int(sample_rate),
+                'bitsPerSample': 16}
+        return cls(name, info, _pcm16(samples).reshape(-1).view(np.uint8), int(round(start_seconds * sample_rate)),
+                   filename)
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    @property
+    def filename(self):
+        if self.name is not None:
+            return self.name
+        stem = os.path.splitext(os.path.basename(self.path))[0]
+        return f"{stem}@{self.start:g}s.wav"
+
+    def header(self):
+        """区間を1つの WAV ファイルにするヘッダ（元の形式・チャンネル数・サンプリング周波数）"""
+        info = self.info
+        channels, bits = max(info['channels'], 1), info['bitsPerSample']
+        align = channels * bits // 8
+        fmt = struct.pack('<HHIIHH', info['format'], channels, self.sample_rate, self.sample_rate * align,
+                          align, bits)
+        return (b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt) + 8 + len(self.data)) + b'WAVE'
+                + b'fmt ' + struct.pack('<I', len(fmt)) + fmt + b'data' + struct.pack('<I', len(self.data)))
+
+    def open(self):
+        """区間を WAV ファイルとして読むファイルオブジェクト（サンプルはコピーせずに読む）"""
+        return io.BufferedReader(_WindowStream(self.filename, self.header(), self.data))
+
+    def samples(self):
+        """区間のサンプル（形状 (サンプル数, チャンネル数) の float64）"""
+        return _decode(self.data, self.info, _sample_dtype(self.info, self.path))
+
+
+def wav_windows(path, window_seconds, overlap_seconds=0.0, drop_partial=False):
+    """長い WAV ファイルをメモリマップし、重なりのある時間区間（WavWindow）に分ける
+
+    ファイル全体を読み込まず、各区間は1つのメモリマップのビューを指す。
+
+    Args:
+        path (str): WAV ファイルのパス
+        window_seconds (float): 区間の長さ（秒）
+        overlap_seconds (float): 隣り合う区間の重なり（秒）
+        drop_partial (bool): True なら末尾の window_seconds に満たない区間を含めない
+
+    Returns:
+        list: 時刻順の WavWindow のリスト
+    """
+    info = wav_format(path)
+    _sample_dtype(info, path)  # 対応していない形式はここでエラーにする
+    rate = info['sampleRate']
+    length = int(round(float(window_seconds) * rate))
+    step = length - int(round(float(overlap_seconds) * rate))
+    if length < 1 or step < 1:
+        raise ValueError("window_seconds must be positive and longer than overlap_seconds")
+    data = _map_data(path, info)
+    block = info['bitsPerSample'] // 8 * max(info['channels'], 1)
+    frames = len(data) // block
+    if frames == 0:
+        return []
+    starts = list(range(0, max(frames - length, 0) + 1, step))
+    if frames > length and starts[-1] + length < frames:
+        starts.append(starts[-1] + step)  # 末尾の window_seconds に満たない区間
+    windows = [WavWindow(path, info, data[start * block:min(start + length, frames) * block], start)
+               for start in starts]
+    if drop_partial:
+        windows = [w for w in windows if len(w.data) == length * block]
+    return windows
+
+
+def read_waveform(path, data_index=1, sample_rate=48000):
+    """WAV / CSV ファイル（または WavWindow）から1本の波形を読む
+
+    WAV は全チャンネルの平均（モノラル化）、CSV は data_index 番目（1始まり、mkfftseg_di）の
+    列を使う。CSV の先頭行が数値でなければ列名とみなす。
+
+    Returns:
+        tuple: (signal, sample_rate)。CSV のサンプリング周波数は sample_rate（mkfftseg_sr）
+    """
+    if isinstance(path, WavWindow) or path.lower().endswith('.wav'):
+        samples, rate = (path.samples(), path.sample_rate) if isinstance(path, WavWindow) else read_wav(path)
+        return samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0], rate
+
+    import pandas as pd
+    from .schema import _is_number, _peek_rows
+
+    rows = _peek_rows(path, 1)
+    if not rows or len(rows[0]) < int(data_index):
+        raise ValueError(f"'{path}' has no column {data_index} (mkfftseg_di)")
+    header = None if _is_number(rows[0][int(data_index) - 1]) else 0
+    column = pd.read_csv(path, header=header, usecols=[int(data_index) - 1]).iloc[:, 0]
+    return pd.to_numeric(column, errors='coerce').to_numpy(dtype=float), int(sample_rate)
+
+
+def downmix(samples, channel='mean'):
+    """形状 (サンプル数, チャンネル数) のサンプルを1チャンネルにする
+
+    channel='mean' は全チャンネルの平均（read_waveform と同じ）、整数は 1 始まりのチャンネル番号。
+    """
+    samples = np.asarray(samples)
+    if samples.ndim == 1:
+        return samples
+    if channel == 'mean':
+        return samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    index = int(channel)
+    if not 1 <= index <= samples.shape[1]:
+        raise ValueError(f"channel {channel} is out of range for {samples.shape[1]} channel(s)")
+    return samples[:, index - 1]
+
+
+def _pcm16(samples):
+    """[-1, 1] の float のサンプルを 16 bit PCM（リトルエンディアン）にする"""
+    return np.round(np.clip(samples, -1.0, 32767 / 32768) * 32768).astype('<i2')
+
+
+def _fft_resample(signal, length):
+    """signal を長さ length に FFT でリサンプリングする
+
+    周波数を下げる場合は新しいナイキスト周波数より上を捨て、その手前の RESAMPLE_ROLLOFF の
+    帯域を余弦で 0 に近づける（急な切り口による長いリンギングを防ぐ）。
+    """
+    spectrum = np.fft.rfft(signal)
+    if len(signal) % 2 == 0:
+        spectrum[-1] = 0.0  # ナイキスト周波数の成分は正負の周波数に分けられない
+    bins = length // 2 + 1
+    if bins <= len(spectrum):
+        spectrum = spectrum[:bins]
+        edge = bins - 1
+        first = int(edge * (1.0 - RESAMPLE_ROLLOFF))
+        if edge > first:
+            spectrum[first:] *= 0.5 * (1.0 + np.cos(np.pi * np.arange(edge - first + 1) / (edge - first)))
+        spectrum[-1] = 0.0
+    else:
+        spectrum = np.concatenate([spectrum, np.zeros(bins - len(spectrum), dtype=spectrum.dtype)])
+    return np.fft.irfft(spectrum, length) * (length / len(signal))
+
+
+def _resampled_length(frames, source_rate, target_rate):
+    """frames サンプルを source_rate Hz から target_rate Hz にしたときのサンプル数"""
+    if source_rate == target_rate:
+        return frames
+    return max(1, int(round(frames * target_rate / source_rate)))
+
+
+def _resample_blocks(read, frames, source_rate, target_rate):
+    """read(low, high) で読める frames サンプルの1チャンネルの波形をブロックごとにリサンプリングし、
+    (出力の位置, そのブロックの出力) を順に返す
+
+    FFT_BLOCK_SAMPLES より長い波形は、前後に RESAMPLE_MARGIN サンプルずつ重ねたブロックごとに
+    変換してつなぐ（ブロックの長さは変換後の長さがちょうど整数のサンプル数になる倍数にする）。
+    一度に読むのは1ブロック分だけなので、呼び出し側は出力を好きな形式のバッファに書き込める。
+    """
+    if source_rate == target_rate:
+        for start in range(0, frames, FFT_BLOCK_SAMPLES):
+            yield start, np.asarray(read(start, min(frames, start + FFT_BLOCK_SAMPLES)), dtype=float)
+        return
+    divisor = math.gcd(source_rate, target_rate)
+    up, down = target_rate // divisor, source_rate // divisor
+    length = _resampled_length(frames, source_rate, target_rate)
+    # 長さを down の倍数にそろえ（末尾は最後のサンプルで埋める）、出力（各ブロックの出力）が
+    # ちょうど up / down 倍の長さになるようにする（そろえないと時間軸がわずかに伸び縮みする）
+    total = frames + -frames % down
+
+    def padded(low, high):
+        part = np.asarray(read(low, min(high, frames)), dtype=float)
+        if high > frames:
+            part = np.concatenate([part, np.full(high - frames, part[-1])])
+        return part
+
+    if total <= FFT_BLOCK_SAMPLES:
+        yield 0, _fft_resample(padded(0, total), total // down * up)[:length]
+        return
+
+    # FFT する長さ（前後の重なりを含む）は down × 2 のべき乗にそろえる（FFT が速い長さ）
+    span = down << max(0, (FFT_BLOCK_SAMPLES // 2 // down).bit_length() - 1)
+    margin = min(-(-RESAMPLE_MARGIN // down) * down, span // 4 // down * down)
+    block = span - 2 * margin
+    for start in range(0, total, block):
+        low = max(0, min(start - margin, total - span))
+        high = min(total, low + span)
+        part = _fft_resample(padded(low, high), (high - low) // down * up)
+        position, offset = start // down * up, (start - low) // down * up
+        count = min((min(start + block, total) - start) // down * up, length - position)
+        if count > 0:
+            yield position, part[offset:offset + count]
+
+
+def resample(signal, source_rate, target_rate):
+    """1チャンネルの波形を source_rate Hz から target_rate Hz に FFT でリサンプリングする
+
+    スペクトルを target_rate のナイキスト周波数で切る（折り返しのない理想的な低域通過）。
+    長い波形はブロックごとに変換してつなぐ（_resample_blocks）。
+
+    Returns:
+        numpy.ndarray: round(len(signal) * target_rate / source_rate) サンプルの float64 の波形
+    """
+    signal = np.asarray(signal)
+    source_rate, target_rate = int(source_rate), int(target_rate)
+    if source_rate < 1 or target_rate < 1:
+        raise ValueError("sample rates must be positive")
+    if source_rate == target_rate or len(signal) == 0:
+        return signal.astype(float)
+    output = np.empty(_resampled_length(len(signal), source_rate, target_rate))
+    for position, part in _resample_blocks(lambda low, high: signal[low:high], len(signal), source_rate, target_rate):
+        output[position:position + len(part)] = part
+    return output
+
+
+def preprocess_waveform(path, sample_rate=48000, channel='mean'):
+    """WAV ファイル（または WavWindow）を1チャンネル・sample_rate Hz の 16 bit PCM の WavWindow にする
+
+    data チャンクはメモリマップし、リサンプリングのブロックごとに必要な範囲だけを（FFT_BLOCK_SAMPLES
+    ずつ）読んで downmix() する。変換したブロックはそのまま 16 bit PCM の出力に書き込むため、
+    元のファイル全体の float の波形は作らない（メモリは出力の PCM と1ブロック分の作業領域）。
+    アップロードするファイル名は元のファイル名のまま。
+
+    Args:
+        path (str or WavWindow): WAV ファイルのパスまたは時間区間
+        sample_rate (int): 変換後のサンプリング周波数（mkfftseg_sr）
+        channel (str or int): 'mean'（全チャンネルの平均）または 1 始まりのチャンネル番号
+    """
+    if isinstance(path, WavWindow):
+        info, data, name, start = path.info, path.data, path.filename, path.start
+        source = path.path
+    else:
+        info = wav_format(path)
+        data, name, start, source = _map_data(path, info), os.path.basename(path), 0.0, path
+    dtype = _sample_dtype(info, source)
+    block = info['bitsPerSample'] // 8 * max(info['channels'], 1)
+    frames = len(data) // block
+    if frames == 0:
+        raise ValueError(f"'{source}' has no audio samples")
+    source_rate, sample_rate = int(info['sampleRate']), int(sample_rate)
+    if sample_rate < 1:
+        raise ValueError("sample rates must be positive")
+    step = max(1, FFT_BLOCK_SAMPLES // max(info['channels'], 1))
+
+    def read(low, high):
+        mono = np.empty(high - low)
+        for first in range(low, high, step):
+            last = min(high, first + step)
+            mono[first - low:last - low] = downmix(_decode(data[first * block:last * block], info, dtype), channel)
+        return mono
+
+    pcm = np.empty(_resampled_length(frames, source_rate, sample_rate), dtype='<i2')
+    for position, part in _resample_blocks(read, frames, source_rate, sample_rate):
+        pcm[position:position + len(part)] = _pcm16(part)
+    mono = {'format': WAVE_FORMAT_PCM, 'channels': 1, 'sampleRate': sample_rate, 'bitsPerSample': 16}
+    return WavWindow(source, mono, pcm.view(np.uint8), int(round(start * sample_rate)), name)
+
+
+def frame_signal(signal, window_length, overlap):
+    """波形を長さ window_length、重なり overlap（%）の区間に分ける（コピーしないビュー）
+
+    波形が window_length より短い場合は末尾を 0 で埋めた1区間とする。
+    """
+    signal = np.ascontiguousarray(signal, dtype=float)
+    window_length = int(window_length)
+    step = max(1, int(round(window_length * (1.0 - float(overlap) / 100.0))))
+    if len(signal) < window_length:
+        signal = np.concatenate([signal, np.zeros(window_length - len(signal))])
+    count = 1 + (len(signal) - window_length) // step
+    stride = signal.strides[0]
+    return np.lib.stride_tricks.as_strided(signal, shape=(count, window_length),
+                                           strides=(step * stride, stride), writeable=False), step
+
+
+def band_average(spectra, frequencies, hp=-1.0, lp=-1.0, nm=0):
+    """振幅スペクトルを hp〜lp の帯域に絞り、周波数方向に nm ビンずつ平均する
+
+    hp / lp が 0 以下なら、その側の制限はない。nm=0 は帯域内のビン数が
+    AUTO_FEATURE_BINS 以下になる幅を選ぶ。端の余ったビンは最後の平均に含めない。
+
+    Returns:
+        tuple: (特徴量（形状 (区間数, 次元数)）, 各次元の中心周波数)
+    """
+    keep = np.ones(len(frequencies), dtype=bool)
+    if hp is not None and hp > 0:
+        keep &= frequencies >= hp
+    if lp is not None and lp > 0:
+        keep &= frequencies <= lp
+    spectra, frequencies = spectra[:, keep], frequencies[keep]
+    if spectra.shape[1] == 0:
+        raise ValueError(f"no FFT bins between hp={hp} and lp={lp}")
+    bins = spectra.shape[1]
+    nm = int(nm) if nm and int(nm) > 0 else math.ceil(bins / AUTO_FEATURE_BINS)
+    nm = min(nm, bins)
+    usable = bins // nm * nm
+    averaged = spectra[:, :usable].reshape(len(spectra), -1, nm).mean(axis=2)
+    centers = frequencies[:usable].reshape(-1, nm).mean(axis=1)
+    return averaged, centers
+
+
+def mkfftseg_features(signal, sample_rate, wl=65536, ol=50.0, wf='hanning', hp=-1.0, lp=-1.0, nm=0):
+    """mkfftSeg と同じ区間分割と FFT で、波形を区間ごとの振幅スペクトルの特徴量にする
+
+    長さ wl・重なり ol % の区間に窓関数 wf をかけて実 FFT し、振幅スペクトル
+    （振幅 A の正弦波のピークが A になるよう 2|X|/Σw で換算）を hp〜lp Hz に絞って
+    nm ビンずつ平均する。区間はまとめて（FFT_BLOCK_SAMPLES ごとに）変換する。
+
+    Returns:
+        tuple: (features, frequencies, starts)。features は形状 (区間数, 次元数)、
+            frequencies は各次元の中心周波数、starts は各区間の先頭のサンプル位置
+    """
+    if wf not in WINDOW_FUNCTIONS:
+        raise ValueError(f"wf must be one of {', '.join(WINDOW_FUNCTIONS)}")
+    if len(signal) == 0:
+        raise ValueError("the waveform has no samples")
+    wl = int(wl)
+    frames, step = frame_signal(np.nan_to_num(signal), wl, ol)
+    window = WINDOW_FUNCTIONS[wf](wl)
+    scale = 2.0 / window.sum()
+    frequencies = np.fft.rfftfreq(wl, d=1.0 / float(sample_rate))
+
+    block = max(1, FFT_BLOCK_SAMPLES // wl)
+    parts = []
+    centers = None
+    for start in range(0, len(frames), block):
+        spectra = np.abs(np.fft.rfft(frames[start:start + block] * window, axis=1)) * scale
+        averaged, centers = band_average(spectra, frequencies, hp, lp, nm)
+        parts.append(averaged)
+    return np.concatenate(parts), centers, np.arange(len(frames)) * step
+
+
+def extract_features(files, options=None):
+    """WAV / CSV ファイルを mkfftSeg のオプションで特徴量の表にする
+
+    Args:
+        files (list): WAV / CSV ファイルのパスまたは WavWindow
+        options (dict, optional): mkfftSeg のオプション（di, hp, lp, nm, ol, sr, wf, wl）。
+            省略したものは MKFFTSEG_DEFAULTS
+
+    Returns:
+        pandas.DataFrame: 先頭の 'segment' 列（"ファイル名@先頭の秒数"）と、区間ごとの特徴量の列
+            （列名は中心周波数 "f<Hz>"）
+
+    Raises:
+        ValueError: WAV のサンプリング周波数が options['sr'] と違う場合（周波数ビンが
+            ファイルごとにずれるため。すべてのファイルが同じ周波数でなければならない）
+    """
+    import pandas as pd
+
+    options = dict(MKFFTSEG_DEFAULTS, **(options or {}))
+    tables = []
+    columns = None
+    for path in files:
+        signal, rate = read_waveform(path, options['di'], options['sr'])
+        if rate != int(options['sr']):
+            name = path.filename if isinstance(path, WavWindow) else path
+            raise ValueError(f"'{name}' is sampled at {rate} Hz but the features use {int(options['sr'])} Hz "
+                             "(mkfftseg_sr); resample the files or use preprocess=True")
+        features, frequencies, starts = mkfftseg_features(
+            signal, rate, wl=options['wl'], ol=options['ol'], wf=options['wf'],
+            hp=options['hp'], lp=options['lp'], nm=options['nm'])
+        columns = columns or [f"f{frequency:.6g}" for frequency in frequencies]
+        table = pd.DataFrame(features, columns=columns)
+        # 時間区間（WavWindow）の区間の時刻は元のファイルの先頭からの秒数にする
+        name, offset = (os.path.basename(path.path), path.start) if isinstance(path, WavWindow) else \
+            (os.path.basename(path), 0.0)
+        table.insert(0, 'segment', [f"{name}@{offset + start / rate:.6g}s" for start in starts])
+        tables.append(table)
+    if not tables:
+        raise ValueError("no waveform files")
+    return pd.concat(tables, ignore_index=True)